@@ -0,0 +1,47 @@
+-- Migration: 016_api_pricing_sync.sql
+-- Description: Make api_pricing the single source of truth for usage costs
+-- Date: December 2025
+--
+-- The buffered usage sink (scripts/usage_sink.py) loads rates from this table
+-- once per process instead of the PRICING dicts that were copied into
+-- rag_query_agent.py, generate_biography.py and log_api_usage.py. This adds
+-- the models those dicts knew about that were never seeded here.
+
+-- ============================================
+-- MISSING MODEL RATES
+-- ============================================
+
+INSERT INTO api_pricing (provider, model, endpoint, input_price_per_million_cents, output_price_per_million_cents, notes) VALUES
+-- Groq Llama 4
+('groq', 'llama-4-scout-17b-16e-instruct', 'chat', 11, 34, 'Groq Llama 4 Scout - $0.11/M in, $0.34/M out'),
+('groq', 'llama-4-maverick-17b-128e-instruct', 'chat', 50, 77, 'Groq Llama 4 Maverick - $0.50/M in, $0.77/M out'),
+
+-- Cohere Command A
+('cohere', 'command-a-03-2025', 'chat', 250, 1000, 'Cohere Command A - $2.50/M in, $10.00/M out'),
+
+-- OpenAI / Anthropic (tracked for future use)
+('openai', 'gpt-4o', 'chat', 250, 1000, 'OpenAI GPT-4o'),
+('openai', 'gpt-4o-mini', 'chat', 15, 60, 'OpenAI GPT-4o mini'),
+('anthropic', 'claude-3-5-sonnet', 'chat', 300, 1500, 'Anthropic Claude 3.5 Sonnet'),
+('anthropic', 'claude-3-haiku', 'chat', 25, 125, 'Anthropic Claude 3 Haiku')
+ON CONFLICT (provider, model, endpoint, effective_from) DO NOTHING;
+
+-- ============================================
+-- RERANK PER-REQUEST RATE
+-- ============================================
+
+-- Rerank is $2/1000 searches. cost_cents is an integer column, and every
+-- script has been recording 2 per rerank call; keep that so historical rows
+-- and new rows add up the same way in the cost dashboards.
+UPDATE api_pricing
+SET price_per_request_cents = 2,
+    notes = 'Cohere Rerank v3.5 - $2/1000 searches (recorded as 2 per request)'
+WHERE provider = 'cohere' AND model = 'rerank-v3.5';
+
+-- Pricing lookups by the usage sink
+CREATE INDEX IF NOT EXISTS idx_api_pricing_current
+    ON api_pricing(provider, model, effective_from DESC);
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 016_api_pricing_sync', '{"version": "016"}');
@@ -0,0 +1,72 @@
+-- Migration 017: Document Chunks for Passage-Level Retrieval
+-- Stores overlapping, page/heading-aware text chunks with their own embeddings
+-- so long documents (insurance policies, tax returns) are searchable passage by
+-- passage instead of through a single whole-document vector.
+
+-- ============================================
+-- DOCUMENT CHUNKS TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id SERIAL PRIMARY KEY,
+
+    -- Document reference
+    document_id INTEGER NOT NULL REFERENCES family_documents(id) ON DELETE CASCADE,
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+
+    -- Position within the document
+    chunk_index INTEGER NOT NULL,
+    page_number INTEGER,              -- From "--- Page N ---" markers, NULL for plain text
+    heading TEXT,                     -- Nearest heading above the chunk, if detected
+    char_start INTEGER NOT NULL,      -- Offsets into family_documents.content
+    char_end INTEGER NOT NULL,
+
+    -- Chunk text and embedding
+    content TEXT NOT NULL,
+    embedding vector(1024),
+    embedding_model TEXT DEFAULT 'embed-v4.0',
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+    CONSTRAINT unique_document_chunk UNIQUE (document_id, chunk_index)
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+-- Vector similarity search (HNSW, same settings as document_pages)
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+    USING hnsw (embedding vector_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+-- Lookup by document (re-chunking, cascade deletes)
+CREATE INDEX IF NOT EXISTS idx_document_chunks_document ON document_chunks(document_id);
+
+-- Lookup by tenant for filtering
+CREATE INDEX IF NOT EXISTS idx_document_chunks_tenant ON document_chunks(tenant_id);
+
+-- ============================================
+-- CHUNK COUNT ON DOCUMENTS
+-- ============================================
+
+-- Documents embedded before this migration have chunk_count = 0 and are still
+-- searched through family_documents.embedding until they are re-chunked.
+ALTER TABLE family_documents
+    ADD COLUMN IF NOT EXISTS chunk_count INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_unchunked
+    ON family_documents(tenant_id)
+    WHERE COALESCE(chunk_count, 0) = 0;
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE document_chunks IS 'Overlapping passage-level text chunks with embeddings - used by chunk retrieval in rag_query_agent';
+COMMENT ON COLUMN document_chunks.embedding IS 'Cohere Embed v4 embedding of title + heading + chunk text (1024 dimensions)';
+COMMENT ON COLUMN family_documents.chunk_count IS 'Number of rows in document_chunks; 0 means document-level retrieval only';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 017_document_chunks', '{"version": "017"}');
@@ -0,0 +1,48 @@
+-- Migration 018: Full-Text Search Columns for Hybrid Retrieval
+-- Adds generated tsvector columns + GIN indexes on documents and chunks so the
+-- lexical leg of hybrid search (scripts/hybrid_search.py) is an index lookup
+-- instead of a LOWER(content) LIKE '%...%' sequential scan.
+--
+-- OCR output from scanned PDFs and images is stored in family_documents.content
+-- by embed_document_from_storage, so it is covered by the same column.
+
+-- ============================================
+-- FAMILY DOCUMENTS
+-- ============================================
+
+-- Title weighted above body so identifier/name hits in the title rank first.
+-- Content is capped to stay well inside the 1MB tsvector limit.
+ALTER TABLE family_documents
+    ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('english', LEFT(COALESCE(content, ''), 500000)), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_search_tsv
+    ON family_documents USING gin (search_tsv);
+
+-- ============================================
+-- DOCUMENT CHUNKS
+-- ============================================
+
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(heading, '')), 'A') ||
+        setweight(to_tsvector('english', content), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_search_tsv
+    ON document_chunks USING gin (search_tsv);
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON COLUMN family_documents.search_tsv IS 'Full-text vector (title A, content B) for the lexical leg of hybrid search';
+COMMENT ON COLUMN document_chunks.search_tsv IS 'Full-text vector (heading A, content B) for the lexical leg of hybrid chunk search';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 018_hybrid_search', '{"version": "018"}');
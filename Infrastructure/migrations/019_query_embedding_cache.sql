@@ -0,0 +1,48 @@
+-- Migration 019: Query Embedding Cache
+-- Persistent tier of scripts/embedding_cache.py. Repeated search queries
+-- (suggestion chips, follow-ups, stress tests) reuse a stored query embedding
+-- instead of making another Cohere embed call.
+
+-- ============================================
+-- QUERY EMBEDDING CACHE TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS query_embedding_cache (
+    -- sha256 of normalized text + model + input_type + output_dimension.
+    -- The query text itself is not stored: the table is shared by all tenants.
+    cache_key TEXT PRIMARY KEY,
+
+    model TEXT NOT NULL,
+    input_type TEXT NOT NULL,
+    output_dimension INTEGER,          -- NULL = model default
+
+    -- Dimension varies with output_dimension, so no typmod here
+    embedding vector NOT NULL,
+
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+-- LRU eviction scans
+CREATE INDEX IF NOT EXISTS idx_query_embedding_cache_last_used
+    ON query_embedding_cache(last_used_at);
+
+-- TTL eviction scans
+CREATE INDEX IF NOT EXISTS idx_query_embedding_cache_created
+    ON query_embedding_cache(created_at);
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE query_embedding_cache IS 'Cached Cohere query embeddings keyed by a hash of the normalized query text and embedding settings';
+COMMENT ON COLUMN query_embedding_cache.hit_count IS 'Times served from this tier; with the in-process counters gives the cache hit rate';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 019_query_embedding_cache', '{"version": "019"}');
@@ -0,0 +1,107 @@
+-- Migration 020: Semantic Answer Cache for the RAG Agent
+-- Stores document-grounded agent answers per tenant and visibility scope so a
+-- repeated question ("What's our home insurance deductible?") is answered from
+-- the cache instead of re-running tool calling, search, rerank and generation.
+--
+-- Entries are removed automatically when a document they cite is updated or
+-- deleted, and when the tenant adds a new document (which may change the
+-- answer). Document versioning and rollback both rewrite the family_documents
+-- row, so they are covered by the update trigger.
+
+-- ============================================
+-- ANSWER CACHE TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS answer_cache (
+    id SERIAL PRIMARY KEY,
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+
+    -- Visibility class of the asker ('admin', 'adult:12', 'everyone', ...)
+    -- so answers never leak documents across visibility levels
+    scope TEXT NOT NULL,
+    model TEXT NOT NULL,                 -- Requested model
+
+    query_text TEXT NOT NULL,
+    query_embedding vector(1024) NOT NULL,
+
+    -- Cached response
+    answer TEXT NOT NULL,
+    sources JSONB NOT NULL DEFAULT '[]',
+    page_sources JSONB NOT NULL DEFAULT '[]',
+    tool_calls JSONB NOT NULL DEFAULT '[]',
+    confidence REAL,
+    model_used TEXT,
+
+    -- family_documents ids cited by sources/page_sources (for invalidation)
+    document_ids INTEGER[] NOT NULL DEFAULT '{}',
+
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+-- Lookups scan one tenant/scope/model partition (small), ordered by distance
+CREATE INDEX IF NOT EXISTS idx_answer_cache_lookup
+    ON answer_cache(tenant_id, scope, model);
+
+-- Invalidation by cited document
+CREATE INDEX IF NOT EXISTS idx_answer_cache_documents
+    ON answer_cache USING gin (document_ids);
+
+CREATE INDEX IF NOT EXISTS idx_answer_cache_expires
+    ON answer_cache(expires_at);
+
+-- ============================================
+-- INVALIDATION TRIGGERS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION invalidate_answer_cache_for_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM answer_cache WHERE tenant_id = NEW.tenant_id;
+        RETURN NEW;
+    END IF;
+
+    DELETE FROM answer_cache WHERE document_ids @> ARRAY[OLD.id];
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_answer_cache_document_change ON family_documents;
+CREATE TRIGGER trg_answer_cache_document_change
+    AFTER UPDATE ON family_documents
+    FOR EACH ROW
+    WHEN (OLD IS DISTINCT FROM NEW)
+    EXECUTE FUNCTION invalidate_answer_cache_for_document();
+
+DROP TRIGGER IF EXISTS trg_answer_cache_document_delete ON family_documents;
+CREATE TRIGGER trg_answer_cache_document_delete
+    AFTER DELETE ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION invalidate_answer_cache_for_document();
+
+DROP TRIGGER IF EXISTS trg_answer_cache_document_insert ON family_documents;
+CREATE TRIGGER trg_answer_cache_document_insert
+    AFTER INSERT ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION invalidate_answer_cache_for_document();
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE answer_cache IS 'Semantic cache of rag_query_agent answers, invalidated by triggers on family_documents';
+COMMENT ON COLUMN answer_cache.scope IS 'Visibility class of the asker - answers are only reused within the same class';
+COMMENT ON COLUMN answer_cache.document_ids IS 'Cited family_documents ids; any update/delete of these rows deletes the entry';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 020_answer_cache', '{"version": "020"}');
@@ -0,0 +1,110 @@
+-- Migration 021: Category Centroids for Auto-Categorization
+-- Running sum of document embeddings per tenant and category, kept current by
+-- triggers on family_documents. scripts/category_centroids.py loads them as one
+-- matrix and classifies a new document with a single matrix-vector product,
+-- replacing the scan of raw embeddings across all tenants.
+--
+-- Global centroids are not stored separately: they are the sum over tenants,
+-- aggregated at load time, so inserts only ever lock their own tenant's rows.
+
+-- ============================================
+-- CATEGORY CENTROIDS TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS category_centroids (
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+
+    -- Sum of the embeddings (centroid = embedding_sum / doc_count)
+    embedding_sum vector(1024) NOT NULL,
+    doc_count INTEGER NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, category)
+);
+
+-- ============================================
+-- MAINTENANCE TRIGGER
+-- ============================================
+
+CREATE OR REPLACE FUNCTION update_category_centroids()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.embedding IS NOT DISTINCT FROM NEW.embedding
+       AND OLD.category IS NOT DISTINCT FROM NEW.category
+       AND OLD.tenant_id IS NOT DISTINCT FROM NEW.tenant_id THEN
+        RETURN NEW;
+    END IF;
+
+    -- Remove the old contribution
+    IF TG_OP IN ('UPDATE', 'DELETE')
+       AND OLD.embedding IS NOT NULL AND OLD.tenant_id IS NOT NULL AND OLD.category IS NOT NULL THEN
+        UPDATE category_centroids
+        SET embedding_sum = embedding_sum - OLD.embedding,
+            doc_count = doc_count - 1,
+            updated_at = NOW()
+        WHERE tenant_id = OLD.tenant_id AND category = OLD.category;
+
+        DELETE FROM category_centroids
+        WHERE tenant_id = OLD.tenant_id AND category = OLD.category AND doc_count <= 0;
+    END IF;
+
+    -- Add the new contribution
+    IF TG_OP IN ('INSERT', 'UPDATE')
+       AND NEW.embedding IS NOT NULL AND NEW.tenant_id IS NOT NULL AND NEW.category IS NOT NULL THEN
+        INSERT INTO category_centroids (tenant_id, category, embedding_sum, doc_count)
+        VALUES (NEW.tenant_id, NEW.category, NEW.embedding, 1)
+        ON CONFLICT (tenant_id, category) DO UPDATE
+        SET embedding_sum = category_centroids.embedding_sum + EXCLUDED.embedding_sum,
+            doc_count = category_centroids.doc_count + 1,
+            updated_at = NOW();
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_category_centroids_insert ON family_documents;
+CREATE TRIGGER trg_category_centroids_insert
+    AFTER INSERT ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_category_centroids();
+
+DROP TRIGGER IF EXISTS trg_category_centroids_update ON family_documents;
+CREATE TRIGGER trg_category_centroids_update
+    AFTER UPDATE OF embedding, category, tenant_id ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_category_centroids();
+
+DROP TRIGGER IF EXISTS trg_category_centroids_delete ON family_documents;
+CREATE TRIGGER trg_category_centroids_delete
+    AFTER DELETE ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_category_centroids();
+
+-- ============================================
+-- BACKFILL
+-- ============================================
+
+-- Same statement as category_centroids.rebuild_centroids()
+DELETE FROM category_centroids;
+INSERT INTO category_centroids (tenant_id, category, embedding_sum, doc_count)
+SELECT tenant_id, category, SUM(embedding), COUNT(*)
+FROM family_documents
+WHERE embedding IS NOT NULL AND tenant_id IS NOT NULL AND category IS NOT NULL
+GROUP BY tenant_id, category;
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE category_centroids IS 'Per-tenant running sums of document embeddings by category, used for auto-categorization';
+COMMENT ON COLUMN category_centroids.embedding_sum IS 'Sum of family_documents.embedding for the tenant/category; divide by doc_count for the centroid';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 021_category_centroids', '{"version": "021"}');
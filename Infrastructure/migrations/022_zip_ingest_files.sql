@@ -0,0 +1,39 @@
+-- Migration 022: ZIP Ingestion Progress
+-- Per-file outcome of scripts/process_zip_upload.py. Rows are written in the
+-- same transaction as each batch of documents, so a failed or timed-out upload
+-- can be re-run with the same archive and only the files not yet imported are
+-- processed again.
+
+-- ============================================
+-- ZIP INGEST FILES TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS zip_ingest_files (
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    archive_sha256 TEXT NOT NULL,        -- Identifies the uploaded archive
+    filename TEXT NOT NULL,              -- Path inside the archive
+
+    status TEXT NOT NULL CHECK (status IN ('success', 'failed', 'skipped')),
+    document_id INTEGER REFERENCES family_documents(id) ON DELETE SET NULL,
+    detail TEXT,                         -- Error or skip reason
+
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, archive_sha256, filename)
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_zip_ingest_files_updated
+    ON zip_ingest_files(updated_at);
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE zip_ingest_files IS 'Per-file progress of bulk ZIP uploads; lets a re-run skip files already imported';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 022_zip_ingest_files', '{"version": "022"}');
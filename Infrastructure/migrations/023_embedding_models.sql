@@ -0,0 +1,84 @@
+-- Migration 023: Embedding Model Registry
+-- Records which embedding model produced every stored vector and which model
+-- is active for each vector space, so a model upgrade can be rolled out by
+-- scripts/reembed_embeddings.py (shadow column + atomic cutover) instead of
+-- mixing vectors from different models in one index.
+--
+-- Vector spaces ("targets"):
+--   text  - family_documents.embedding and document_chunks.embedding, which are
+--           searched together with one query embedding, plus
+--           family_documents.image_embedding and voice_notes.embedding, which
+--           are compared with the same text query embeddings
+--   pages - document_pages.embedding (page images, searched with text queries)
+
+-- ============================================
+-- REGISTRY TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS embedding_models (
+    id SERIAL PRIMARY KEY,
+    target TEXT NOT NULL CHECK (target IN ('text', 'pages')),
+    model TEXT NOT NULL,
+    output_dimension INTEGER,            -- NULL = model default
+
+    -- active: used by ingestion and search; pending: being backfilled into
+    -- the shadow column; retired: replaced
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('active', 'pending', 'retired')),
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    activated_at TIMESTAMP WITH TIME ZONE,
+    retired_at TIMESTAMP WITH TIME ZONE
+);
+
+-- At most one active and one pending model per target
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_models_active
+    ON embedding_models(target) WHERE status = 'active';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_models_pending
+    ON embedding_models(target) WHERE status = 'pending';
+
+-- Current models. Page embeddings are pinned to 1024 dimensions to match
+-- document_pages.embedding vector(1024).
+INSERT INTO embedding_models (target, model, output_dimension, status, activated_at)
+SELECT t.target, 'embed-v4.0', 1024, 'active', NOW()
+FROM (VALUES ('text'), ('pages')) AS t(target)
+WHERE NOT EXISTS (
+    SELECT 1 FROM embedding_models m WHERE m.target = t.target AND m.status = 'active'
+);
+
+-- ============================================
+-- MODEL COLUMN ON EVERY VECTOR TABLE
+-- ============================================
+
+-- NULL means "unknown model": the re-embedding job treats it as stale
+ALTER TABLE family_documents ADD COLUMN IF NOT EXISTS embedding_model TEXT;
+
+-- Every script that writes metadata has always embedded with embed-v4.0 at 1024.
+-- Rows without metadata include the old bulk ZIP path (embed-english-v3.0)
+-- and stay unknown until re-embedded.
+UPDATE family_documents
+SET embedding_model = 'embed-v4.0'
+WHERE embedding IS NOT NULL AND embedding_model IS NULL AND metadata IS NOT NULL;
+
+ALTER TABLE family_documents ADD COLUMN IF NOT EXISTS image_embedding_model TEXT;
+
+-- embed_image has always embedded with embed-v4.0 at 1024
+UPDATE family_documents
+SET image_embedding_model = 'embed-v4.0'
+WHERE image_embedding IS NOT NULL AND image_embedding_model IS NULL;
+
+-- Writers set the model explicitly; an INSERT that does not is recorded as unknown
+ALTER TABLE document_chunks ALTER COLUMN embedding_model DROP DEFAULT;
+ALTER TABLE document_pages ALTER COLUMN embedding_model DROP DEFAULT;
+ALTER TABLE voice_notes ALTER COLUMN embedding_model DROP DEFAULT;
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE embedding_models IS 'Embedding model per vector space (text, pages); ingestion and search use the active row';
+COMMENT ON COLUMN family_documents.embedding_model IS 'Model that produced embedding; NULL = unknown (re-embedded by reembed_embeddings)';
+COMMENT ON COLUMN family_documents.image_embedding_model IS 'Model that produced image_embedding; NULL = unknown (re-embedded by reembed_embeddings)';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 023_embedding_models', '{"version": "023"}');
@@ -0,0 +1,32 @@
+-- Migration 024: Images in the Blob Store
+-- Page thumbnails and document images move out of Postgres into the
+-- content-addressed blob store (scripts/blob_store.py). Rows keep the SHA-256
+-- of the image; search results return a URL instead of ~50-100 KB of base64.
+--
+-- Existing rows keep their base64 until `blob_store` main(action="migrate")
+-- moves them (it clears page_image and rewrites data: URLs in image_url).
+-- Readers fall back to the inline image while a row has no hash.
+
+-- ============================================
+-- HASH COLUMNS
+-- ============================================
+
+ALTER TABLE document_pages ADD COLUMN IF NOT EXISTS page_image_hash TEXT;
+ALTER TABLE family_documents ADD COLUMN IF NOT EXISTS image_hash TEXT;
+
+-- Progress of the move (rows still holding inline images)
+CREATE INDEX IF NOT EXISTS idx_document_pages_inline_image
+    ON document_pages(id)
+    WHERE page_image IS NOT NULL AND page_image_hash IS NULL;
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON COLUMN document_pages.page_image_hash IS 'SHA-256 of the page thumbnail in the blob store (pages/ prefix); page_image is NULL once set';
+COMMENT ON COLUMN document_pages.page_image IS 'Legacy inline base64 thumbnail; moved to the blob store by blob_store migrate';
+COMMENT ON COLUMN family_documents.image_hash IS 'SHA-256 of the document image in the blob store (images/ prefix); image_url holds its URL';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 024_blob_store_images', '{"version": "024"}');
@@ -0,0 +1,61 @@
+-- Migration 025: Indexed Duplicate Detection
+-- Exact duplicate checks used metadata->>'content_hash', which has no index,
+-- so every upload scanned the tenant's documents. The hash now lives in an
+-- indexed column, and a SimHash fingerprint per document (split into four
+-- indexed 16-bit bands) finds near-duplicates such as re-scans of the same
+-- paper. Maintained by scripts/document_fingerprints.py.
+
+-- ============================================
+-- CONTENT HASH COLUMN
+-- ============================================
+
+-- Already present where migration 010 was applied to this table
+ALTER TABLE family_documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+UPDATE family_documents
+SET content_hash = metadata->>'content_hash'
+WHERE content_hash IS NULL AND metadata ? 'content_hash';
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_content_hash
+    ON family_documents(tenant_id, content_hash)
+    WHERE content_hash IS NOT NULL;
+
+-- ============================================
+-- FINGERPRINTS TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS document_fingerprints (
+    document_id INTEGER PRIMARY KEY REFERENCES family_documents(id) ON DELETE CASCADE,
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    content_hash TEXT,                   -- family_documents.content_hash when fingerprinted
+
+    -- 64-bit SimHash of word 3-shingles; NULL for documents too short to fingerprint
+    simhash BIGINT,
+    band0 INTEGER,                       -- bits 0-15
+    band1 INTEGER,                       -- bits 16-31
+    band2 INTEGER,                       -- bits 32-47
+    band3 INTEGER,                       -- bits 48-63
+
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+-- Near-duplicate candidates: any band equal (BitmapOr over the four)
+CREATE INDEX IF NOT EXISTS idx_document_fingerprints_band0 ON document_fingerprints(tenant_id, band0);
+CREATE INDEX IF NOT EXISTS idx_document_fingerprints_band1 ON document_fingerprints(tenant_id, band1);
+CREATE INDEX IF NOT EXISTS idx_document_fingerprints_band2 ON document_fingerprints(tenant_id, band2);
+CREATE INDEX IF NOT EXISTS idx_document_fingerprints_band3 ON document_fingerprints(tenant_id, band3);
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE document_fingerprints IS 'SimHash per document for near-duplicate detection; backfilled by document_fingerprints main(action="backfill")';
+COMMENT ON COLUMN family_documents.content_hash IS 'SHA-256 of normalized title + content; exact duplicate detection';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 025_document_fingerprints', '{"version": "025"}');
@@ -0,0 +1,95 @@
+-- Migration 026: Ingest Job Queue
+-- Uploads used to be processed inside the Windmill job the upload started
+-- (OCR, tagging, embedding and extraction while the browser waited). Upload
+-- endpoints now insert a job here and return; scripts/ingest_worker.py claims
+-- jobs with FOR UPDATE SKIP LOCKED, so any number of workers can run side by
+-- side. Follow-up stages (data extraction, timeline events) are jobs of their
+-- own, queued when the ingest job that created the document completes.
+-- Queue functions live in scripts/ingest_queue.py.
+
+-- ============================================
+-- INGEST JOBS TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,  -- NULL until known (forwarded email)
+    document_id INTEGER REFERENCES family_documents(id) ON DELETE CASCADE,
+
+    stage TEXT NOT NULL CHECK (stage IN (
+        'storage_upload',                -- embed_document_from_storage
+        'email_forward',                 -- process_email_forward
+        'zip_upload',                    -- process_zip_upload
+        'voice_note',                    -- transcribe_voice_note
+        'extract_data',                  -- extract_document_data
+        'timeline_events'                -- generate_timeline_events
+    )),
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN (
+        'pending',                       -- waiting for run_after
+        'processing',                    -- claimed by locked_by
+        'completed',                     -- handler returned a result
+        'failed',                        -- handler reported a failure (not retried)
+        'dead'                           -- retries exhausted (dead letter)
+    )),
+    priority INTEGER NOT NULL DEFAULT 0, -- Higher runs first within a tenant
+
+    payload JSONB NOT NULL DEFAULT '{}', -- Arguments for the stage's script
+    result JSONB,                        -- The script's return value
+
+    -- Retries
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+
+    -- Lease held by the worker running the job
+    locked_by TEXT,
+    locked_at TIMESTAMP WITH TIME ZONE,
+
+    parent_job_id BIGINT REFERENCES ingest_jobs(id) ON DELETE SET NULL,
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
+-- ============================================
+-- INDEXES
+-- ============================================
+
+-- Claim: runnable jobs
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_pending
+    ON ingest_jobs(run_after, id)
+    WHERE status = 'pending';
+
+-- Per-tenant backpressure and running counts
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_tenant_active
+    ON ingest_jobs(tenant_id, status)
+    WHERE status IN ('pending', 'processing');
+
+-- Expired leases
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_processing
+    ON ingest_jobs(locked_at)
+    WHERE status = 'processing';
+
+-- Follow-up jobs of an upload (get_ingest_job)
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_parent
+    ON ingest_jobs(parent_job_id)
+    WHERE parent_job_id IS NOT NULL;
+
+-- Retention cleanup
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_completed
+    ON ingest_jobs(completed_at)
+    WHERE status IN ('completed', 'failed');
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE ingest_jobs IS 'Durable ingest queue; claimed by scripts/ingest_worker.py with FOR UPDATE SKIP LOCKED';
+COMMENT ON COLUMN ingest_jobs.status IS 'pending -> processing -> completed | failed, or back to pending with backoff until max_attempts, then dead';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 026_ingest_jobs', '{"version": "026"}');
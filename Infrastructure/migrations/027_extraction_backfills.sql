@@ -0,0 +1,55 @@
+-- Migration 027: Extraction Backfill Checkpoints
+-- extract_document_data.extract_batch ran one document at a time and kept
+-- no progress, so an interrupted re-extraction (reextract_v1) started over.
+-- Batches now run concurrently and record, per scope, the last document id
+-- they finished; the next run resumes after it. A scope is one tenant (or
+-- all tenants for operator backfills), a mode and an optional category.
+-- Used by scripts/extract_document_data.py and scripts/backfill_extracted_data.py.
+
+-- ============================================
+-- CHECKPOINT TABLE
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS extraction_backfills (
+    id SERIAL PRIMARY KEY,
+    scope TEXT NOT NULL UNIQUE,          -- "<tenant_id|all>:<mode>:<category|*>"
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,  -- NULL = all tenants
+    mode VARCHAR(20) NOT NULL
+        CHECK (mode IN ('missing', 'reextract_v1')),
+    category VARCHAR(50),
+
+    -- Documents are processed in id order; everything <= this id is done
+    last_document_id INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    failed_document_ids INTEGER[] NOT NULL DEFAULT '{}',  -- Most recent failures (capped)
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+
+    status VARCHAR(20) NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'paused', 'completed')),
+    last_error TEXT,
+
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_extraction_backfills_tenant
+    ON extraction_backfills(tenant_id);
+
+-- Keyset scans for the two modes, in id order
+CREATE INDEX IF NOT EXISTS idx_family_documents_extraction_missing
+    ON family_documents(tenant_id, id)
+    WHERE extracted_data IS NULL OR extracted_data = '{}'::jsonb;
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON TABLE extraction_backfills IS 'Resume points for extract_document_data batch and cross-tenant backfills';
+COMMENT ON COLUMN extraction_backfills.status IS 'running while batches remain; paused when a run stopped on provider rate limits; completed when no documents remain after last_document_id';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 027_extraction_backfills', '{"version": "027"}');
@@ -0,0 +1,58 @@
+-- Migration 028: Incremental Re-Embedding and Delta-Encoded Versions
+-- Editing a document re-embedded the whole text even for a one-line fix,
+-- and every version kept a full copy of the content. Chunks now carry a
+-- hash of their embedded text so edits only embed chunks that changed, the
+-- whole-document vector is refreshed once edits add up to a meaningful
+-- share of the text, and versions are stored as compressed line deltas
+-- against the previous version with a periodic full snapshot.
+-- Used by scripts/document_chunks.py and scripts/version_store.py.
+
+-- ============================================
+-- CHUNK HASHES
+-- ============================================
+
+-- SHA-256 of chunk_embedding_text(chunk) without the title; NULL for chunks
+-- written before this migration (hashed from their columns on first edit)
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_hash TEXT;
+
+-- Characters changed by edits since the document vector was last embedded
+ALTER TABLE family_documents
+    ADD COLUMN IF NOT EXISTS embedding_drift_chars INTEGER NOT NULL DEFAULT 0;
+
+-- ============================================
+-- DELTA-ENCODED VERSIONS
+-- ============================================
+
+-- Full snapshots keep using content; delta rows store content_delta instead
+ALTER TABLE document_versions ALTER COLUMN content DROP NOT NULL;
+
+ALTER TABLE document_versions
+    ADD COLUMN IF NOT EXISTS content_delta BYTEA,       -- zlib-compressed line delta
+    ADD COLUMN IF NOT EXISTS base_version INTEGER,      -- Version the delta applies to
+    ADD COLUMN IF NOT EXISTS content_length INTEGER;    -- Characters in the full content
+
+ALTER TABLE document_versions DROP CONSTRAINT IF EXISTS document_versions_content_stored;
+ALTER TABLE document_versions ADD CONSTRAINT document_versions_content_stored
+    CHECK (content IS NOT NULL OR (content_delta IS NOT NULL AND base_version IS NOT NULL));
+
+UPDATE document_versions SET content_length = length(content)
+WHERE content_length IS NULL AND content IS NOT NULL;
+
+-- Migration 010's helpers read and write content directly: on delta rows
+-- get_document_versions() previews NULL and rollback_document_to_version()
+-- violates document_versions_content_stored. Versions are created, listed
+-- and rolled back through scripts/version_store.py instead.
+DROP FUNCTION IF EXISTS rollback_document_to_version(UUID, INTEGER, UUID);
+DROP FUNCTION IF EXISTS get_document_versions(UUID);
+DROP FUNCTION IF EXISTS create_document_version(UUID, TEXT, TEXT, TEXT, INTEGER, TEXT, TEXT, TEXT, UUID);
+
+-- ============================================
+-- COMMENTS
+-- ============================================
+
+COMMENT ON COLUMN document_chunks.chunk_hash IS 'Hash of the embedded chunk text; unchanged chunks keep their embedding on edit';
+COMMENT ON COLUMN document_versions.content_delta IS 'Delta against base_version (see scripts/version_store.py); content is NULL for delta rows';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 028_incremental_reembedding', '{"version": "028"}');
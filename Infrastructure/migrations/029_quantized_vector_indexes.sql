@@ -0,0 +1,58 @@
+-- Migration 029: Quantized Vector Indexes
+-- Every searched vector column is a float32 vector(1024) with a float HNSW
+-- index, so the hot index grows by 4 KB per document, chunk and page. These
+-- HNSW expression indexes over half-precision and binary-quantized casts of
+-- the same columns give searches a much smaller first stage; the shortlist
+-- is then rescored with the float vectors in the table (precision= on the
+-- search scripts, scripts/vector_quantization.py).
+--
+-- No columns are added: the casts are computed from the stored vectors, so
+-- writers are unchanged and the indexes can never drift from the data.
+-- Requires pgvector 0.7.0+ (halfvec, bit, binary_quantize).
+--
+-- voice_notes.embedding is not searched by any script yet and gets no
+-- quantized index until it is.
+
+-- ============================================
+-- HALF PRECISION (halfvec, cosine) - 2x smaller
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_embedding_half ON family_documents
+    USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_image_embedding_half ON family_documents
+    USING hnsw ((image_embedding::halfvec(1024)) halfvec_cosine_ops)
+    WHERE image_embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_half ON document_chunks
+    USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_pages_embedding_half ON document_pages
+    USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+-- ============================================
+-- BINARY (bit, Hamming) - 32x smaller
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_embedding_bit ON family_documents
+    USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_image_embedding_bit ON family_documents
+    USING hnsw ((binary_quantize(image_embedding)::bit(1024)) bit_hamming_ops)
+    WHERE image_embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_bit ON document_chunks
+    USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_pages_embedding_bit ON document_pages
+    USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+    WHERE embedding IS NOT NULL;
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 029_quantized_vector_indexes', '{"version": "029"}');
@@ -0,0 +1,31 @@
+-- Migration 030: Matryoshka Coarse-to-Fine Indexes
+-- embed-v4.0 is Matryoshka-trained: the leading 256 dimensions of its
+-- 1024-d embeddings are a usable embedding on their own. These HNSW
+-- expression indexes over subvector(embedding, 1, 256) are 4x smaller than
+-- the full-dimension indexes, so the hot index fits in shared_buffers; the
+-- "coarse" search precision shortlists on them and re-ranks the shortlist
+-- on the stored 1024-d vectors (scripts/vector_quantization.py).
+--
+-- The 256-d vectors are computed from the stored embeddings rather than
+-- kept in extra columns, so ingest is unchanged.
+-- Requires pgvector 0.7.0+ (subvector).
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_embedding_coarse ON family_documents
+    USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_family_documents_image_embedding_coarse ON family_documents
+    USING hnsw ((subvector(image_embedding, 1, 256)::vector(256)) vector_cosine_ops)
+    WHERE image_embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_coarse ON document_chunks
+    USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_document_pages_embedding_coarse ON document_pages
+    USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops)
+    WHERE embedding IS NOT NULL;
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 030_matryoshka_coarse_indexes', '{"version": "030"}');
@@ -0,0 +1,139 @@
+-- Migration 031: Per-Tenant Vector Buckets
+-- Vector searches walk one global HNSW graph per table and filter on
+-- tenant_id afterwards (hnsw.iterative_scan = strict_order keeps them from
+-- coming back short). With thousands of families a small tenant traverses
+-- everyone else's graph, and recall drops as the filter gets more selective.
+--
+-- Every tenant is assigned a vector bucket (hash of its id into 16 buckets;
+-- large tenants can be moved to a dedicated bucket, see
+-- scripts/vector_partitions.py). Searched rows carry their tenant's bucket,
+-- and each bucket has its own partial HNSW index, so a tenant's search
+-- traverses a graph 1/16th the size containing its own rows. Tenants with
+-- only a few thousand vectors skip HNSW altogether and are scanned exactly.
+--
+-- This is list partitioning of the indexes rather than of the tables:
+-- declaratively partitioning family_documents would put the bucket into its
+-- primary key, and the foreign keys referencing family_documents(id)
+-- (chunks, pages, shares, versions, ...) would all have to become
+-- composite. Partial indexes give the same per-bucket graphs and leave the
+-- global indexes in place for unscoped and quantized searches.
+
+-- ============================================
+-- TENANT BUCKETS
+-- ============================================
+
+ALTER TABLE tenants
+    ADD COLUMN IF NOT EXISTS vector_bucket SMALLINT;
+
+UPDATE tenants
+SET vector_bucket = abs(hashtext(id::text)) % 16
+WHERE vector_bucket IS NULL;
+
+CREATE OR REPLACE FUNCTION assign_tenant_vector_bucket()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.vector_bucket IS NULL THEN
+        NEW.vector_bucket := abs(hashtext(NEW.id::text)) % 16;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tenants_vector_bucket ON tenants;
+CREATE TRIGGER trg_tenants_vector_bucket
+    BEFORE INSERT ON tenants
+    FOR EACH ROW
+    EXECUTE FUNCTION assign_tenant_vector_bucket();
+
+-- ============================================
+-- ROW BUCKETS
+-- ============================================
+
+ALTER TABLE family_documents ADD COLUMN IF NOT EXISTS vector_bucket SMALLINT;
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS vector_bucket SMALLINT;
+ALTER TABLE document_pages ADD COLUMN IF NOT EXISTS vector_bucket SMALLINT;
+
+UPDATE family_documents d SET vector_bucket = t.vector_bucket
+FROM tenants t WHERE t.id = d.tenant_id AND d.vector_bucket IS DISTINCT FROM t.vector_bucket;
+
+UPDATE document_chunks c SET vector_bucket = t.vector_bucket
+FROM tenants t WHERE t.id = c.tenant_id AND c.vector_bucket IS DISTINCT FROM t.vector_bucket;
+
+UPDATE document_pages p SET vector_bucket = t.vector_bucket
+FROM tenants t WHERE t.id = p.tenant_id AND p.vector_bucket IS DISTINCT FROM t.vector_bucket;
+
+-- Rows take their tenant's bucket when written
+CREATE OR REPLACE FUNCTION set_row_vector_bucket()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT vector_bucket INTO NEW.vector_bucket FROM tenants WHERE id = NEW.tenant_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_family_documents_vector_bucket ON family_documents;
+CREATE TRIGGER trg_family_documents_vector_bucket
+    BEFORE INSERT OR UPDATE OF tenant_id ON family_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION set_row_vector_bucket();
+
+DROP TRIGGER IF EXISTS trg_document_chunks_vector_bucket ON document_chunks;
+CREATE TRIGGER trg_document_chunks_vector_bucket
+    BEFORE INSERT OR UPDATE OF tenant_id ON document_chunks
+    FOR EACH ROW
+    EXECUTE FUNCTION set_row_vector_bucket();
+
+DROP TRIGGER IF EXISTS trg_document_pages_vector_bucket ON document_pages;
+CREATE TRIGGER trg_document_pages_vector_bucket
+    BEFORE INSERT OR UPDATE OF tenant_id ON document_pages
+    FOR EACH ROW
+    EXECUTE FUNCTION set_row_vector_bucket();
+
+-- Moving a tenant to another bucket moves its rows
+CREATE OR REPLACE FUNCTION move_tenant_vector_bucket()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE family_documents SET vector_bucket = NEW.vector_bucket WHERE tenant_id = NEW.id;
+    UPDATE document_chunks SET vector_bucket = NEW.vector_bucket WHERE tenant_id = NEW.id;
+    UPDATE document_pages SET vector_bucket = NEW.vector_bucket WHERE tenant_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tenants_move_vector_bucket ON tenants;
+CREATE TRIGGER trg_tenants_move_vector_bucket
+    AFTER UPDATE OF vector_bucket ON tenants
+    FOR EACH ROW
+    WHEN (OLD.vector_bucket IS DISTINCT FROM NEW.vector_bucket)
+    EXECUTE FUNCTION move_tenant_vector_bucket();
+
+-- ============================================
+-- PER-BUCKET HNSW INDEXES
+-- ============================================
+-- Same definition as the global indexes plus the bucket predicate; searches
+-- add "AND vector_bucket = <n>" as a literal so the planner can match them.
+
+DO $$
+DECLARE
+    bucket INTEGER;
+    tbl TEXT;
+BEGIN
+    FOR bucket IN 0..15 LOOP
+        FOREACH tbl IN ARRAY ARRAY['family_documents', 'document_chunks', 'document_pages'] LOOP
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON %I USING hnsw (embedding vector_cosine_ops) '
+                'WHERE embedding IS NOT NULL AND vector_bucket = %s',
+                'idx_' || tbl || '_embedding_bucket' || bucket, tbl, bucket
+            );
+        END LOOP;
+    END LOOP;
+END $$;
+
+COMMENT ON COLUMN tenants.vector_bucket IS 'HNSW index bucket for this tenant''s vectors (0-15 hashed, 16+ dedicated) - see vector_partitions.py';
+COMMENT ON COLUMN family_documents.vector_bucket IS 'Copy of tenants.vector_bucket, maintained by trigger';
+COMMENT ON COLUMN document_chunks.vector_bucket IS 'Copy of tenants.vector_bucket, maintained by trigger';
+COMMENT ON COLUMN document_pages.vector_bucket IS 'Copy of tenants.vector_bucket, maintained by trigger';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 031_tenant_vector_buckets', '{"version": "031"}');
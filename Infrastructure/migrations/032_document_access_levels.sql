@@ -0,0 +1,102 @@
+-- Migration 032: Document Access Levels
+-- Search scripts filtered visibility with string comparisons
+-- (COALESCE(visibility, 'everyone') IN (...) OR (visibility = 'private' AND
+-- assigned_to = ...)) applied after the vector scan. For teens and children,
+-- whose visible set is a small part of a tenant's documents, the HNSW scan
+-- walked far past the rows it could return.
+--
+-- visibility is now also stored as a compact access_level, copied onto
+-- document_chunks; searches filter the tenant's bucket index (migration
+-- 031) on the member's level and fetch their private and shared documents
+-- exactly (scripts/document_access.py).
+-- Documents can also be shared with individual members, whatever their
+-- visibility (family_document_shares).
+
+-- ============================================
+-- ACCESS LEVEL
+-- ============================================
+-- 0 = everyone, 1 = adults_only, 2 = admins_only, 3 = private
+-- A member sees levels up to their own (child/teen 0, adult 1, admin all),
+-- plus private documents assigned to them and documents shared with them.
+
+ALTER TABLE family_documents
+    ADD COLUMN IF NOT EXISTS access_level SMALLINT GENERATED ALWAYS AS (
+        CASE COALESCE(visibility, 'everyone')
+            WHEN 'adults_only' THEN 1
+            WHEN 'admins_only' THEN 2
+            WHEN 'private' THEN 3
+            ELSE 0
+        END
+    ) STORED;
+
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS access_level SMALLINT NOT NULL DEFAULT 0;
+
+UPDATE document_chunks c SET access_level = d.access_level
+FROM family_documents d
+WHERE d.id = c.document_id AND c.access_level IS DISTINCT FROM d.access_level;
+
+-- Chunks take their document's level when written
+CREATE OR REPLACE FUNCTION set_chunk_access_level()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT access_level INTO NEW.access_level FROM family_documents WHERE id = NEW.document_id;
+    NEW.access_level := COALESCE(NEW.access_level, 0);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_document_chunks_access_level ON document_chunks;
+CREATE TRIGGER trg_document_chunks_access_level
+    BEFORE INSERT OR UPDATE OF document_id ON document_chunks
+    FOR EACH ROW
+    EXECUTE FUNCTION set_chunk_access_level();
+
+-- ...and follow visibility changes
+CREATE OR REPLACE FUNCTION propagate_document_access_level()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE document_chunks SET access_level = NEW.access_level
+    WHERE document_id = NEW.id AND access_level IS DISTINCT FROM NEW.access_level;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_family_documents_access_level ON family_documents;
+CREATE TRIGGER trg_family_documents_access_level
+    AFTER UPDATE OF visibility ON family_documents
+    FOR EACH ROW
+    WHEN (OLD.access_level IS DISTINCT FROM NEW.access_level)
+    EXECUTE FUNCTION propagate_document_access_level();
+
+-- Private documents are fetched per member
+CREATE INDEX IF NOT EXISTS idx_family_documents_private
+    ON family_documents(tenant_id, assigned_to)
+    WHERE access_level = 3;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_private
+    ON document_chunks(tenant_id)
+    WHERE access_level = 3;
+
+-- ============================================
+-- PER-MEMBER SHARES
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS family_document_shares (
+    document_id INTEGER NOT NULL REFERENCES family_documents(id) ON DELETE CASCADE,
+    member_id INTEGER NOT NULL REFERENCES family_members(id) ON DELETE CASCADE,
+    shared_by INTEGER REFERENCES family_members(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (member_id, document_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_family_document_shares_document
+    ON family_document_shares(document_id);
+
+COMMENT ON COLUMN family_documents.access_level IS '0 everyone, 1 adults_only, 2 admins_only, 3 private - generated from visibility';
+COMMENT ON COLUMN document_chunks.access_level IS 'Copy of family_documents.access_level, maintained by trigger';
+COMMENT ON TABLE family_document_shares IS 'Documents shared with individual family members regardless of visibility - see document_access.py';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 032_document_access_levels', '{"version": "032"}');
@@ -0,0 +1,34 @@
+-- Migration 033: Document Neighbors
+-- get_related_documents ran a self-join ordered by d2.embedding <=> d1.embedding
+-- on every document view. The top-K most similar documents of each document
+-- are now stored here, computed in bulk per tenant and kept current by the
+-- ingest, update and delete scripts (scripts/document_neighbors.py), so the
+-- related panel is a primary-key lookup. The same graph gives "similar
+-- documents" clusters and near-duplicate warnings.
+--
+-- Existing tenants are filled by document_neighbors main(action="rebuild");
+-- until then get_related_documents falls back to the live query.
+
+CREATE TABLE IF NOT EXISTS document_neighbors (
+    document_id INTEGER NOT NULL REFERENCES family_documents(id) ON DELETE CASCADE,
+    neighbor_id INTEGER NOT NULL REFERENCES family_documents(id) ON DELETE CASCADE,
+    tenant_id UUID NOT NULL,
+    similarity REAL NOT NULL,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (document_id, neighbor_id),
+    CHECK (document_id <> neighbor_id)
+);
+
+-- Documents whose lists contain a given document (refreshed when it changes)
+CREATE INDEX IF NOT EXISTS idx_document_neighbors_neighbor
+    ON document_neighbors(neighbor_id);
+
+-- Tenant rebuilds and clustering
+CREATE INDEX IF NOT EXISTS idx_document_neighbors_tenant
+    ON document_neighbors(tenant_id, similarity DESC);
+
+COMMENT ON TABLE document_neighbors IS 'Top-K most similar documents per document (cosine similarity of family_documents.embedding) - see document_neighbors.py';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 033_document_neighbors', '{"version": "033"}');
@@ -0,0 +1,25 @@
+-- Migration 034: Drop Embedding Model Reset Triggers
+-- Migration 023 reset embedding_model to NULL whenever an UPDATE replaced an
+-- embedding without changing the model column. A re-embed with the same
+-- model that names it explicitly (SET embedding = ..., embedding_model =
+-- <same>) looked identical to the trigger, so every normal re-embed was
+-- marked "unknown model": reembed_embeddings re-embedded those rows again,
+-- process_pdf_pages treated the pages as unprocessed, and the drift check
+-- in document_chunks.reembed_changed_content re-embedded the whole
+-- document on every edit.
+--
+-- Every writer sets embedding_model itself, so the triggers are dropped.
+-- scripts/test_embedding_model_writes.py checks same-model re-embeds.
+
+DROP TRIGGER IF EXISTS trg_family_documents_embedding_model ON family_documents;
+DROP TRIGGER IF EXISTS trg_document_chunks_embedding_model ON document_chunks;
+DROP TRIGGER IF EXISTS trg_document_pages_embedding_model ON document_pages;
+
+DROP FUNCTION IF EXISTS reset_unknown_embedding_model();
+
+-- Rows already marked unknown this way are re-embedded once by
+-- reembed_embeddings (run) with the active model, which records it.
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 034_drop_embedding_model_reset', '{"version": "034"}');
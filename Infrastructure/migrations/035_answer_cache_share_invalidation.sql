@@ -0,0 +1,58 @@
+-- Migration 035: Answer Cache Invalidation for Document Shares
+-- Cached agent answers are kept per visibility scope ('adult:<id>',
+-- 'member:<id>', see scripts/answer_cache.py). Sharing a document with a
+-- member (family_document_shares, migration 032) or revoking the share
+-- changes what that member can see, but left their cached answers in
+-- place: a revoked member kept getting answers quoting the document, and a
+-- new share kept serving a stale "not found".
+--
+-- Mirrors the family_documents triggers of migration 020: a share or
+-- unshare drops the tenant's entries citing the document and every entry
+-- in the member's scopes.
+
+CREATE OR REPLACE FUNCTION invalidate_answer_cache_for_share()
+RETURNS TRIGGER AS $$
+DECLARE
+    share_row family_document_shares%ROWTYPE;
+    share_tenant UUID;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        share_row := OLD;
+    ELSE
+        share_row := NEW;
+    END IF;
+
+    -- NULL when the share goes with its document; the delete trigger on
+    -- family_documents has already dropped the entries citing it
+    SELECT tenant_id INTO share_tenant FROM family_documents WHERE id = share_row.document_id;
+    IF share_tenant IS NOT NULL THEN
+        DELETE FROM answer_cache
+        WHERE tenant_id = share_tenant
+          AND (document_ids @> ARRAY[share_row.document_id]
+               OR scope IN ('adult:' || share_row.member_id, 'member:' || share_row.member_id));
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_answer_cache_share_insert ON family_document_shares;
+CREATE TRIGGER trg_answer_cache_share_insert
+    AFTER INSERT ON family_document_shares
+    FOR EACH ROW
+    EXECUTE FUNCTION invalidate_answer_cache_for_share();
+
+DROP TRIGGER IF EXISTS trg_answer_cache_share_delete ON family_document_shares;
+CREATE TRIGGER trg_answer_cache_share_delete
+    AFTER DELETE ON family_document_shares
+    FOR EACH ROW
+    EXECUTE FUNCTION invalidate_answer_cache_for_share();
+
+COMMENT ON TABLE answer_cache IS 'Semantic cache of rag_query_agent answers, invalidated by triggers on family_documents and family_document_shares';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 035_answer_cache_share_invalidation', '{"version": "035"}');
@@ -0,0 +1,16 @@
+-- Migration 036: Private Blob URLs
+-- family_documents.image_url held a permanent public blob store URL for
+-- images moved out of Postgres (migration 024). The bucket is now private
+-- and readers sign a short-lived URL from image_hash (scripts/blob_store.py),
+-- so the stored URLs are dropped. image_url keeps only legacy values for
+-- rows without a hash.
+
+UPDATE family_documents
+SET image_url = NULL
+WHERE image_hash IS NOT NULL;
+
+COMMENT ON COLUMN family_documents.image_hash IS 'SHA-256 of the image in the private blob store; URLs are signed on read';
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 036_private_blob_urls', '{"version": "036"}');
@@ -0,0 +1,27 @@
+-- Migration 037: Drop Per-Level HNSW Indexes
+-- Migration 032 added HNSW indexes per access level (idx_<table>_embedding_
+-- everyone / _adults) covering every tenant. A teen's or child's search in
+-- a tenant above VECTOR_EXACT_SCAN_MAX_ROWS has both "vector_bucket = <n>"
+-- and "access_level = 0", and only one partial index can serve it: when
+-- the planner picked the level index the search walked every tenant's
+-- graph again, which the bucket indexes of migration 031 had removed.
+--
+-- The level is now only a filter on the bucket index (pgvector's iterative
+-- scan keeps it from coming back short), so the level indexes are dropped.
+-- scripts/test_access_level_plans.py EXPLAINs a level-0 search and checks
+-- that it uses idx_<table>_embedding_bucket<n>.
+
+DROP INDEX IF EXISTS idx_family_documents_embedding_everyone;
+DROP INDEX IF EXISTS idx_family_documents_embedding_adults;
+DROP INDEX IF EXISTS idx_document_chunks_embedding_everyone;
+DROP INDEX IF EXISTS idx_document_chunks_embedding_adults;
+
+-- Shadow copies left by a model migration started before this one
+DROP INDEX IF EXISTS idx_family_documents_embedding_next_everyone;
+DROP INDEX IF EXISTS idx_family_documents_embedding_next_adults;
+DROP INDEX IF EXISTS idx_document_chunks_embedding_next_everyone;
+DROP INDEX IF EXISTS idx_document_chunks_embedding_next_adults;
+
+-- Log this migration
+INSERT INTO system_logs (level, category, message, metadata)
+VALUES ('info', 'system', 'Applied migration 037_drop_access_level_indexes', '{"version": "037"}');
@@ -295,6 +295,65 @@ describe('WindmillClient', () => {
     });
   });
 
+  describe('Ingest Queue', () => {
+    it('should queue a storage upload and poll for its result', async () => {
+      vi.useFakeTimers();
+      vi.mocked(global.fetch)
+        .mockResolvedValueOnce({
+          ok: true,
+          json: () => Promise.resolve({ success: true, job_id: 42, status: 'pending', queue_position: 0 }),
+        } as Response)
+        .mockResolvedValueOnce({
+          ok: true,
+          json: () => Promise.resolve({
+            success: true,
+            job: { id: 42, status: 'completed', result: { document_id: 7, is_duplicate: false } },
+          }),
+        } as Response);
+
+      const pending = client.embedDocumentFromStorage({
+        storage_path: 'tenant/doc.pdf',
+        title: 'Test Doc',
+        tenant_id: 'tenant-001',
+      });
+      await vi.advanceTimersByTimeAsync(2000);
+      const result = await pending;
+      vi.useRealTimers();
+
+      expect(global.fetch).toHaveBeenNthCalledWith(
+        1,
+        expect.stringContaining('/jobs/run_wait_result/p/f/chatbot/enqueue_ingest'),
+        expect.objectContaining({
+          method: 'POST',
+          body: JSON.stringify({
+            stage: 'storage_upload',
+            tenant_id: 'tenant-001',
+            args: { storage_path: 'tenant/doc.pdf', title: 'Test Doc', tenant_id: 'tenant-001' },
+          }),
+        })
+      );
+      expect(global.fetch).toHaveBeenNthCalledWith(
+        2,
+        expect.stringContaining('/jobs/run_wait_result/p/f/chatbot/get_ingest_job'),
+        expect.objectContaining({
+          body: JSON.stringify({ job_id: 42, tenant_id: 'tenant-001' }),
+        })
+      );
+      expect(result.document_id).toBe(7);
+    });
+
+    it('should throw when the queue is full', async () => {
+      vi.mocked(global.fetch).mockResolvedValueOnce({
+        ok: true,
+        json: () => Promise.resolve({ success: false, error: 'The ingest queue is full', retry_after: 120 }),
+      } as Response);
+
+      await expect(
+        client.processZipUpload({ storage_path: 'tenant/archive.zip', tenant_id: 'tenant-001' })
+      ).rejects.toThrow('The ingest queue is full');
+    });
+  });
+
   describe('Family Members', () => {
     it('should list family members', async () => {
       const mockMembers = {
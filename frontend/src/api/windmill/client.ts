@@ -51,6 +51,11 @@ import type {
   EmbedImageResult,
   EmbedDocumentFromStorageArgs,
   EmbedDocumentFromStorageResult,
+  // Ingest queue types
+  IngestStage,
+  EnqueueIngestArgs,
+  EnqueueIngestResult,
+  GetIngestJobResult,
   // Document sharing types
   SharePermission,
   ShareDocumentResult,
@@ -116,6 +121,8 @@ import type {
 } from './types';
 
 const WINDMILL_TOKEN = import.meta.env.VITE_WINDMILL_TOKEN || '';
+const INGEST_POLL_INTERVAL_MS = 2000;
+const INGEST_TIMEOUT_MS = 15 * 60 * 1000;
 const WORKSPACE = import.meta.env.VITE_WINDMILL_WORKSPACE || 'archevi';
 
 export class WindmillClient {
@@ -208,7 +215,7 @@ export class WindmillClient {
    * Events emitted:
    * - thinking: {status: "started"} - AI is processing
    * - search: {status: "started"|"complete", query, count?, sources?} - Document search
-   * - answer: {status: "started"|"complete", content?} - Answer generation
+   * - answer: {status: "started"|"complete", content?} | {chunk} - Answer generation, streamed in chunks
    * - complete: Full result object
    * - error: {message, retry_after?}
    *
@@ -380,13 +387,7 @@ export class WindmillClient {
    * Transcribe a voice note and embed it for RAG queries
    */
   async transcribeVoiceNote(args: TranscribeVoiceNoteArgs): Promise<TranscribeVoiceNoteResult> {
-    return this.request<TranscribeVoiceNoteResult>(
-      '/jobs/run_wait_result/p/f/chatbot/transcribe_voice_note',
-      {
-        method: 'POST',
-        body: JSON.stringify(args),
-      }
-    );
+    return this.runIngestJob<TranscribeVoiceNoteResult>('voice_note', args.tenant_id, args);
   }
 
   /**
@@ -410,13 +411,7 @@ export class WindmillClient {
    * Windmill fetches, extracts text, and embeds.
    */
   async embedDocumentFromStorage(args: EmbedDocumentFromStorageArgs): Promise<EmbedDocumentFromStorageResult> {
-    return this.request<EmbedDocumentFromStorageResult>(
-      '/jobs/run_wait_result/p/f/chatbot/embed_document_from_storage',
-      {
-        method: 'POST',
-        body: JSON.stringify(args),
-      }
-    );
+    return this.runIngestJob<EmbedDocumentFromStorageResult>('storage_upload', args.tenant_id, args);
   }
 
   /**
@@ -813,8 +808,20 @@ export class WindmillClient {
    * Process a ZIP file containing multiple documents for batch embedding
    */
   async processZipUpload(args: ProcessZipUploadArgs): Promise<ProcessZipUploadResult> {
-    return this.request<ProcessZipUploadResult>(
-      '/jobs/run_wait_result/p/f/chatbot/process_zip_upload',
+    return this.runIngestJob<ProcessZipUploadResult>('zip_upload', args.tenant_id, args);
+  }
+
+  // ============================================
+  // Ingest Queue
+  // ============================================
+
+  /**
+   * Queue an upload (or a follow-up stage for a document) for the ingest worker.
+   * Returns immediately with the job ID; poll getIngestJob for the outcome.
+   */
+  async enqueueIngest(args: EnqueueIngestArgs): Promise<EnqueueIngestResult> {
+    return this.request<EnqueueIngestResult>(
+      '/jobs/run_wait_result/p/f/chatbot/enqueue_ingest',
       {
         method: 'POST',
         body: JSON.stringify(args),
@@ -822,6 +829,48 @@ export class WindmillClient {
     );
   }
 
+  /**
+   * Get the status of a queued ingest job (result included once finished)
+   */
+  async getIngestJob<T = unknown>(jobId: number, tenantId: string): Promise<GetIngestJobResult<T>> {
+    return this.request<GetIngestJobResult<T>>(
+      '/jobs/run_wait_result/p/f/chatbot/get_ingest_job',
+      {
+        method: 'POST',
+        body: JSON.stringify({ job_id: jobId, tenant_id: tenantId }),
+      }
+    );
+  }
+
+  /**
+   * Queue an upload and poll until the ingest worker has finished it.
+   * Resolves with the stage script's result (including results that report
+   * success: false); throws if the queue is full, the job is dead-lettered
+   * after its retries, or it does not finish within INGEST_TIMEOUT_MS.
+   */
+  private async runIngestJob<T>(stage: IngestStage, tenantId: string, args: object): Promise<T> {
+    const queued = await this.enqueueIngest({ stage, tenant_id: tenantId, args });
+    if (!queued.success || !queued.job_id) {
+      throw new Error(queued.error || 'Failed to queue upload');
+    }
+
+    const deadline = Date.now() + INGEST_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, INGEST_POLL_INTERVAL_MS));
+      const { job, error } = await this.getIngestJob<T>(queued.job_id, tenantId);
+      if (!job) {
+        throw new Error(error || 'Upload job not found');
+      }
+      if (job.status === 'completed' || job.status === 'failed') {
+        return job.result as T;
+      }
+      if (job.status === 'dead') {
+        throw new Error(job.last_error || 'Upload processing failed');
+      }
+    }
+    throw new Error('Upload is still processing; check back shortly');
+  }
+
   // ============================================
   // Smart Data Extraction
   // ============================================
@@ -79,6 +79,13 @@ export type {
   // Branding types
   BrandingConfig,
   GetTenantBrandingArgs,
+  // Ingest queue types
+  IngestStage,
+  IngestJobStatus,
+  IngestJob,
+  EnqueueIngestArgs,
+  EnqueueIngestResult,
+  GetIngestJobResult,
 } from './types';
 export { DOCUMENT_CATEGORIES, DOCUMENT_VISIBILITY, MEMBER_TYPES, TENANT_PLANS } from './types';
 export {
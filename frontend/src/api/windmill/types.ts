@@ -31,8 +31,9 @@ export interface RAGStreamVisualSearchData {
 }
 
 export interface RAGStreamAnswerData {
-  status: 'started' | 'complete';
+  status?: 'started' | 'complete';
   content?: string;
+  chunk?: string;  // Streamed answer text (coalesced tokens), sent between started and complete
 }
 
 export interface RAGStreamCompleteData {
@@ -113,7 +114,9 @@ export interface PageSource {
   document_title: string;
   page_number: number;
   similarity: number;
-  page_image?: string;  // Base64 encoded JPEG thumbnail
+  page_image_url?: string | null;  // Signed thumbnail URL (expires after about an hour)
+  page_image_hash?: string | null; // Blob store hash the URL is signed from
+  page_image?: string | null;      // Legacy base64 JPEG (pages not yet moved to the blob store)
   ocr_text?: string;    // OCR text from page (first 500 chars)
   type: 'page';         // Discriminator for UI
 }
@@ -586,6 +589,9 @@ export interface UpdateDocumentResult {
   message?: string;
   document_id?: number;
   re_embedded?: boolean;
+  chunks_embedded?: number;
+  chunks_reused?: number;
+  document_embedded?: boolean;
   tokens_used?: number;
   error?: string;
 }
@@ -946,7 +952,10 @@ export interface AdminListDocumentsResult {
 
 // Bulk ZIP upload types
 export interface ProcessZipUploadArgs {
-  zip_content_base64: string;
+  /** Small archives only (enqueue_ingest rejects inline ZIPs over 1 MB) */
+  zip_content_base64?: string;
+  /** ZIP already in Supabase Storage (streamed server-side instead of base64) */
+  storage_path?: string;
   tenant_id: string;
   default_category?: DocumentCategory;
   auto_categorize?: boolean;
@@ -965,10 +974,13 @@ export interface ZipFileResult {
   content_length?: number;
   error?: string;
   reason?: string;
+  /** Imported by an earlier run of the same archive */
+  resumed?: boolean;
 }
 
 export interface ProcessZipUploadResult {
   success: boolean;
+  archive_sha256?: string;
   total_files: number;
   processed: number;
   failed: number;
@@ -977,6 +989,62 @@ export interface ProcessZipUploadResult {
   error?: string;
 }
 
+// ============================================
+// Ingest Queue Types
+// ============================================
+
+export type IngestStage =
+  | 'storage_upload'
+  | 'zip_upload'
+  | 'voice_note'
+  | 'extract_data'
+  | 'timeline_events';
+
+export type IngestJobStatus = 'pending' | 'processing' | 'completed' | 'failed' | 'dead';
+
+export interface EnqueueIngestArgs {
+  stage: IngestStage;
+  tenant_id: string;
+  /** Arguments of the stage's script */
+  args: object;
+  /** Follow-up stages queued for the new document once it is stored */
+  then?: Array<'extract_data' | 'timeline_events'>;
+  user_id?: number;
+}
+
+export interface EnqueueIngestResult {
+  success: boolean;
+  job_id?: number;
+  status?: IngestJobStatus;
+  queue_position?: number;
+  error?: string;
+  /** Seconds to wait when the queue is full */
+  retry_after?: number;
+}
+
+export interface IngestJob<T = unknown> {
+  id: number;
+  stage: IngestStage | 'email_forward';
+  status: IngestJobStatus;
+  queue_position?: number;
+  attempts: number;
+  max_attempts: number;
+  document_id: number | null;
+  /** The stage script's return value, once finished */
+  result: T | null;
+  last_error: string | null;
+  follow_ups: Array<{ id: number; stage: IngestStage; status: IngestJobStatus }>;
+  created_at: string;
+  started_at: string | null;
+  completed_at: string | null;
+}
+
+export interface GetIngestJobResult<T = unknown> {
+  success: boolean;
+  job: IngestJob<T> | null;
+  error?: string;
+}
+
 // ============================================
 // Smart Data Extraction Types
 // ============================================
@@ -1695,6 +1763,8 @@ export interface GenerateTimelineEventsArgs {
   document_id: number;
   tenant_id: string;
   user_id?: number;
+  /** Regenerate: delete the document's extracted events first (otherwise they are returned as-is) */
+  replace?: boolean;
 }
 
 export interface GenerateTimelineEventsResult {
@@ -338,7 +338,8 @@ interface PageSourceProps extends React.HTMLAttributes<HTMLDivElement> {
   documentTitle?: string;
   pageNumber?: number;
   similarity?: number;
-  pageImage?: string;  // Base64 encoded JPEG
+  pageImageUrl?: string | null;  // Thumbnail URL (blob store)
+  pageImage?: string | null;     // Legacy base64 encoded JPEG
   ocrText?: string;
   onViewPage?: () => void;
 }
@@ -350,6 +351,7 @@ export function PageSource({
   documentTitle,
   pageNumber,
   similarity,
+  pageImageUrl,
   pageImage,
   ocrText,
   onViewPage,
@@ -357,6 +359,7 @@ export function PageSource({
 }: PageSourceProps) {
   const [isExpanded, setIsExpanded] = useState(false);
   const [imageLoaded, setImageLoaded] = useState(false);
+  const imageSrc = pageImageUrl || (pageImage ? `data:image/jpeg;base64,${pageImage}` : null);
 
   return (
     <Collapsible open={isExpanded} onOpenChange={setIsExpanded}>
@@ -397,10 +400,10 @@ export function PageSource({
         <CollapsibleContent>
           <div className="px-3 pb-3">
             {/* Page thumbnail */}
-            {pageImage && (
+            {imageSrc && (
               <div className="mb-2 rounded-md overflow-hidden border bg-muted/20">
                 <img
-                  src={`data:image/jpeg;base64,${pageImage}`}
+                  src={imageSrc}
                   alt={`Page ${pageNumber} of ${documentTitle}`}
                   className={cn(
                     "w-full h-auto max-h-64 object-contain transition-opacity",
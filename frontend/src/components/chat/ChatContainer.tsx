@@ -89,6 +89,8 @@ export function ChatContainer() {
 
     // Track if we received a terminal event (complete or error)
     let receivedTerminalEvent = false;
+    // Answer text accumulated from streamed answer chunks
+    let streamedAnswer = '';
 
     try {
       // Build conversation history from recent messages (last 10 exchanges)
@@ -160,6 +162,13 @@ export function ChatContainer() {
             const answerData = event.data as RAGStreamAnswerData;
             if (answerData.status === 'started') {
               setStreamStatus('answering');
+              streamedAnswer = '';
+            } else if (answerData.chunk) {
+              // Append streamed tokens as they arrive
+              streamedAnswer += answerData.chunk;
+              updateMessage(assistantMessage.id, {
+                content: streamedAnswer,
+              });
             } else if (answerData.status === 'complete' && answerData.content) {
               // Update with complete answer
               updateMessage(assistantMessage.id, {
@@ -113,6 +113,7 @@ export function ChatMessage({ message }: ChatMessageProps) {
                 documentTitle={page.document_title}
                 pageNumber={page.page_number}
                 similarity={page.similarity}
+                pageImageUrl={page.page_image_url}
                 pageImage={page.page_image}
                 ocrText={page.ocr_text}
               />
@@ -33,6 +33,7 @@ import {
 import { windmill, DOCUMENT_CATEGORIES, DOCUMENT_VISIBILITY, type DocumentCategory, type DocumentVisibility } from '@/api/windmill';
 import type { ZipFileResult } from '@/api/windmill/types';
 import { useAuthStore } from '@/store/auth-store';
+import { uploadFile } from '@/lib/supabase';
 import { toast } from 'sonner';
 
 interface BulkZipUploadProps {
@@ -97,24 +98,17 @@ export function BulkZipUpload({ onSuccess }: BulkZipUploadProps) {
     setUploadState('reading');
 
     try {
-      // Read file as base64
-      const base64Content = await new Promise<string>((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onload = () => {
-          const result = reader.result as string;
-          // Remove data URL prefix
-          const base64 = result.split(',')[1];
-          resolve(base64);
-        };
-        reader.onerror = () => reject(new Error('Failed to read file'));
-        reader.readAsDataURL(selectedFile);
-      });
+      // Upload the ZIP to Storage; the ingest job only carries its path
+      const uploadResult = await uploadFile(selectedFile, tenantId);
+      if ('error' in uploadResult) {
+        throw new Error(`Failed to upload ZIP file: ${uploadResult.error}`);
+      }
 
       setUploadState('uploading');
 
       // Call the bulk upload API
       const result = await windmill.processZipUpload({
-        zip_content_base64: base64Content,
+        storage_path: uploadResult.path,
         tenant_id: tenantId,
         default_category: defaultCategory as DocumentCategory || 'general',
         auto_categorize: true,
@@ -318,11 +312,11 @@ export function BulkZipUpload({ onSuccess }: BulkZipUploadProps) {
               <Loader2 className="h-12 w-12 animate-spin text-primary" />
               <div className="text-center">
                 <p className="font-medium">
-                  {uploadState === 'reading' ? 'Reading ZIP file...' : 'Processing documents...'}
+                  {uploadState === 'reading' ? 'Uploading ZIP file...' : 'Processing documents...'}
                 </p>
                 <p className="text-sm text-muted-foreground">
                   {uploadState === 'reading'
-                    ? 'Preparing files for upload'
+                    ? 'Sending the archive to storage'
                     : 'AI is categorizing and embedding documents'}
                 </p>
               </div>
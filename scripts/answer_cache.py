@@ -0,0 +1,250 @@
+# answer_cache.py
+# Windmill Python library - Semantic answer cache for the RAG agent
+# Path: f/chatbot/answer_cache
+#
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+#   - httpx
+
+"""
+Semantic Answer Cache for Archevi
+=================================
+
+Lets rag_query_agent answer a repeated question without re-running tool
+calling, search, rerank and two LLM calls. A cached answer is reused when:
+
+- the tenant, visibility scope and requested model match exactly, and
+- the new question's embedding is within ANSWER_CACHE_MIN_SIMILARITY
+  (cosine) of the cached question, and
+- the entry has not expired (ANSWER_CACHE_TTL_HOURS)
+
+Only document-grounded answers to standalone questions (no conversation
+history) are stored. Page sources are stored with page_image_hash only:
+thumbnail URLs are signed and expire (blob_store.py), so they are signed
+again when a cached answer is served. Triggers from migration 020 delete entries whose
+cited documents are updated, versioned or deleted, and all of a tenant's
+entries when it adds a document.
+
+Usage:
+    from answer_cache import visibility_scope, lookup_answer, store_answer
+
+    scope = visibility_scope(user_member_type, user_member_id)
+    cached = lookup_answer(tenant_id, scope, model, query_embedding)
+
+Windmill Script Configuration:
+- Path: f/chatbot/answer_cache
+- This is a library module; main() reports stats or purges a tenant
+"""
+
+from typing import Optional
+import json
+import os
+
+from blob_store import blob_urls
+from db_pool import get_connection
+
+
+MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+TTL_HOURS = int(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+
+
+def visibility_scope(user_member_type: Optional[str], user_member_id: Optional[int]) -> str:
+    """
+    Name the set of documents a user can see, mirroring the visibility
+    filter used by search: users in the same scope see the same documents.
+    """
+    if user_member_type == 'admin':
+        return 'admin'
+    if user_member_type == 'adult':
+        return f"adult:{user_member_id}" if user_member_id is not None else 'adult'
+    if user_member_type:
+        # teen/child share the 'everyone' + own-private filter
+        return f"member:{user_member_id}" if user_member_id is not None else 'everyone'
+    return 'everyone'
+
+
+def cited_document_ids(sources: list, page_sources: list) -> list[int]:
+    """family_documents ids cited by an agent result."""
+    ids = set()
+    for source in sources or []:
+        try:
+            ids.add(int(source["id"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    for page in page_sources or []:
+        if page.get("document_id") is not None:
+            ids.add(int(page["document_id"]))
+    return sorted(ids)
+
+
+def cacheable_page_sources(page_sources: list) -> list:
+    """Page sources without thumbnail URLs or inline images (kept: page_image_hash)."""
+    return [
+        {key: value for key, value in page.items() if key not in ("page_image_url", "page_image")}
+        for page in page_sources or []
+    ]
+
+
+def sign_page_sources(page_sources: list) -> list:
+    """Cached page sources with freshly signed thumbnail URLs."""
+    pages = cacheable_page_sources(page_sources)
+    image_urls = blob_urls([page.get("page_image_hash") for page in pages], "pages")
+    for page, image_url in zip(pages, image_urls):
+        page["page_image_url"] = image_url
+    return pages
+
+
+def lookup_answer(
+    tenant_id: str,
+    scope: str,
+    model: str,
+    query_embedding,
+    min_similarity: float = MIN_SIMILARITY
+) -> Optional[dict]:
+    """
+    Return the closest cached answer above min_similarity, or None.
+
+    Errors are swallowed - a cache problem must never fail a query.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, answer, sources, page_sources, tool_calls, confidence, model_used,
+                       1 - (query_embedding <=> %s::vector) AS similarity
+                FROM answer_cache
+                WHERE tenant_id = %s::uuid
+                  AND scope = %s
+                  AND model = %s
+                  AND expires_at > NOW()
+                ORDER BY query_embedding <=> %s::vector
+                LIMIT 1
+            """, (query_embedding, tenant_id, scope, model, query_embedding))
+            row = cursor.fetchone()
+
+            if row is None or float(row[7]) < min_similarity:
+                cursor.close()
+                return None
+
+            cursor.execute(
+                "UPDATE answer_cache SET hit_count = hit_count + 1 WHERE id = %s",
+                (row[0],)
+            )
+            conn.commit()
+            cursor.close()
+
+        return {
+            "cache_id": row[0],
+            "answer": row[1],
+            "sources": row[2] or [],
+            "page_sources": sign_page_sources(row[3]),
+            "tool_calls": row[4] or [],
+            "confidence": float(row[5]) if row[5] is not None else 0.0,
+            "model": row[6],
+            "similarity": round(float(row[7]), 4),
+        }
+    except Exception as e:
+        print(f"[answer_cache] Lookup failed: {e}")
+        return None
+
+
+def store_answer(
+    tenant_id: str,
+    scope: str,
+    model: str,
+    query_text: str,
+    query_embedding,
+    result: dict,
+    ttl_hours: int = TTL_HOURS
+) -> Optional[int]:
+    """
+    Cache an agent result if it cites at least one document.
+
+    Returns:
+        answer_cache.id, or None if not cached
+    """
+    document_ids = cited_document_ids(result.get("sources"), result.get("page_sources"))
+    if not document_ids or not result.get("answer"):
+        return None
+
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO answer_cache (
+                    tenant_id, scope, model, query_text, query_embedding,
+                    answer, sources, page_sources, tool_calls, confidence, model_used,
+                    document_ids, expires_at
+                ) VALUES (
+                    %s::uuid, %s, %s, %s, %s::vector,
+                    %s, %s::jsonb, %s::jsonb, %s::jsonb, %s, %s,
+                    %s, NOW() + make_interval(hours => %s)
+                )
+                RETURNING id
+            """, (
+                tenant_id, scope, model, query_text, query_embedding,
+                result["answer"],
+                json.dumps(result.get("sources") or []),
+                json.dumps(cacheable_page_sources(result.get("page_sources"))),
+                json.dumps(result.get("tool_calls") or []),
+                result.get("confidence"),
+                result.get("model"),
+                document_ids,
+                ttl_hours
+            ))
+            cache_id = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
+        return cache_id
+    except Exception as e:
+        print(f"[answer_cache] Store failed: {e}")
+        return None
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "stats", tenant_id: Optional[str] = None) -> dict:
+    """
+    Inspect or clear the answer cache.
+
+    Args:
+        action: "stats" (entries and hits) or "purge" (delete entries;
+            expired entries only when no tenant_id is given)
+        tenant_id: Optional tenant to restrict to
+
+    Returns:
+        dict with stats or the number of deleted entries
+    """
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        tenant_filter = "WHERE tenant_id = %s::uuid" if tenant_id else ""
+        params = (tenant_id,) if tenant_id else ()
+
+        if action == "stats":
+            cursor.execute(f"""
+                SELECT COUNT(*),
+                       COUNT(*) FILTER (WHERE expires_at > NOW()),
+                       COALESCE(SUM(hit_count), 0)
+                FROM answer_cache
+                {tenant_filter}
+            """, params)
+            entries, live, hits = cursor.fetchone()
+            cursor.close()
+            return {"success": True, "entries": entries, "live_entries": live, "total_hits": int(hits)}
+
+        if action == "purge":
+            if tenant_id:
+                cursor.execute("DELETE FROM answer_cache WHERE tenant_id = %s::uuid", params)
+            else:
+                cursor.execute("DELETE FROM answer_cache WHERE expires_at <= NOW()")
+            deleted = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            return {"success": True, "deleted": deleted}
+
+        cursor.close()
+    raise ValueError("action must be 'stats' or 'purge'")
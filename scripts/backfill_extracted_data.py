@@ -0,0 +1,111 @@
+# backfill_extracted_data.py
+# Windmill Python script - Resumable extracted-data backfill
+# Path: f/chatbot/backfill_extracted_data
+#
+# requirements:
+#   - cohere
+#   - psycopg2-binary
+#   - wmill
+#   - httpx
+
+"""
+Extracted-Data Backfill for Archevi
+===================================
+
+Operator entry point for extract_document_data.extract_batch: extracts
+documents that have no extracted_data ("missing") or still have the v1
+format without an items array (reextract_v1), for one tenant or all
+tenants, `concurrency` documents at a time.
+
+Progress is checkpointed per scope in extraction_backfills (migration 027).
+Schedule `run` (or call it repeatedly) until it reports completed; a run
+that was interrupted, ran out of time or was paused by Cohere rate limits
+continues after the last finished document. Cohere calls are paced by
+rate_limiter.provider_throttle (COHERE_CALLS_PER_MINUTE per worker).
+
+Args:
+    action (str): "run" or "status"
+    tenant_id (str): Tenant UUID; omit with all_tenants=True for every tenant
+    all_tenants (bool): Backfill across all tenants (operators only)
+    reextract_v1 (bool): Re-extract v1-format data instead of filling missing data
+    category (str): Optional category filter
+    limit (int): Maximum documents per run (default 500)
+    concurrency (int): Documents extracted at once (default EXTRACT_BATCH_CONCURRENCY)
+    max_seconds (int): Time budget for "run" (default 240)
+    restart (bool): Discard the checkpoint and start from the first document
+
+Returns:
+    dict: run counts and checkpoint state, or the checkpoints for "status"
+"""
+
+from typing import Optional
+
+from db_pool import get_connection
+from extract_document_data import BATCH_CONCURRENCY, extract_batch
+
+
+def status(tenant_id: Optional[str] = None) -> dict:
+    """Checkpoints, most recently updated first."""
+    query = """
+        SELECT scope, tenant_id::text, mode, category, last_document_id,
+               processed, succeeded, failed, failed_document_ids, tokens_used,
+               status, last_error, started_at, updated_at, completed_at
+        FROM extraction_backfills
+    """
+    params = []
+    if tenant_id:
+        query += " WHERE tenant_id = %s::uuid"
+        params.append(tenant_id)
+    query += " ORDER BY updated_at DESC"
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        columns = [c[0] for c in cursor.description]
+        rows = cursor.fetchall()
+        cursor.close()
+
+    backfills = []
+    for row in rows:
+        backfill = dict(zip(columns, row))
+        for key in ("started_at", "updated_at", "completed_at"):
+            if backfill[key]:
+                backfill[key] = backfill[key].isoformat()
+        backfills.append(backfill)
+    return {"success": True, "backfills": backfills}
+
+
+def main(
+    action: str = "run",
+    tenant_id: Optional[str] = None,
+    all_tenants: bool = False,
+    reextract_v1: bool = False,
+    category: Optional[str] = None,
+    limit: int = 500,
+    concurrency: Optional[int] = None,
+    max_seconds: int = 240,
+    restart: bool = False
+) -> dict:
+    """Run or inspect an extracted-data backfill (see module docstring)."""
+    if action == "status":
+        return status(tenant_id)
+    if action != "run":
+        raise ValueError("action must be 'run' or 'status'")
+    if not tenant_id and not all_tenants:
+        raise ValueError("tenant_id is required unless all_tenants=True")
+
+    result = extract_batch(
+        tenant_id=tenant_id,
+        limit=limit,
+        category=category,
+        reextract_v1=reextract_v1,
+        concurrency=concurrency or BATCH_CONCURRENCY,
+        max_seconds=max_seconds,
+        restart=restart,
+    )
+    # Operators need the failures, not a row per document
+    result["failed_documents"] = [
+        {"document_id": r["document_id"], "tenant_id": r["tenant_id"], "error": r["error"]}
+        for r in result.pop("results") if not r["success"]
+    ]
+    return {"success": True, **result}
@@ -0,0 +1,543 @@
+# blob_store.py
+# Windmill Python library - Content-addressed image storage
+# Path: f/chatbot/blob_store
+#
+# requirements:
+#   - httpx
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Content-Addressed Blob Store for Archevi
+========================================
+
+Page thumbnails (document_pages) and document images (family_documents)
+used to be stored in Postgres as base64 JPEG text and shipped through
+every search result. They now live in a blob store, keyed by the SHA-256
+of their bytes; rows keep only the hash (migration 024).
+
+Thumbnails belong to private, adults-only and admins-only documents, so
+the store is never public. Search results carry short-lived URLs created
+when the result is built (blob_url / blob_urls), after the visibility
+filter has run:
+
+Backends (BLOB_BACKEND):
+- "supabase" (default) - private Supabase Storage bucket BLOB_BUCKET;
+  signed URLs, created in one request per result set
+- "s3"                 - private S3-compatible bucket (boto3, credentials
+  from the f/chatbot/s3_* variables); presigned URLs
+- "local"              - files under BLOB_LOCAL_ROOT, returned inline as
+  data: URLs (nothing is served over HTTP)
+
+Signed URLs expire after BLOB_URL_TTL_SECONDS (default 1 hour) and are
+reused within a process while more than half of that remains, so repeated
+searches hit the browser cache. Deleting a document or narrowing its
+visibility therefore stops access within the TTL. Blobs no longer
+referenced by any row are deleted by delete_document and by the scheduled
+main(action="gc").
+
+Usage:
+    from blob_store import put_blob, blob_urls
+
+    digest = put_blob(jpeg_bytes, prefix="pages")
+    # store digest in page_image_hash; return blob_urls(hashes, "pages") to clients
+
+Windmill Script Configuration:
+- Path: f/chatbot/blob_store
+- main(action="migrate") moves base64 images out of Postgres,
+  action="gc" deletes unreferenced blobs, action="secure" makes the
+  bucket private
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+import base64
+import calendar
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+import wmill
+
+from db_pool import get_connection
+
+
+BACKEND = os.getenv("BLOB_BACKEND", "supabase")
+BUCKET = os.getenv("BLOB_BUCKET", "page-images")
+LOCAL_ROOT = os.getenv("BLOB_LOCAL_ROOT", "/srv/blobs")
+URL_TTL_SECONDS = int(os.getenv("BLOB_URL_TTL_SECONDS", "3600"))
+GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "86400"))  # Uploads not yet referenced by a row
+
+CACHE_CONTROL = f"private, max-age={URL_TTL_SECONDS}"
+UPLOAD_WORKERS = 8
+DELETE_BATCH_SIZE = 1000
+URL_CACHE_MAX = 10000
+
+# Rows referencing each prefix: (table, hash column)
+BLOB_REFERENCES = {
+    "pages": ("document_pages", "page_image_hash"),
+    "images": ("family_documents", "image_hash"),
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+# key -> (signed url, expires_at)
+_url_cache: dict = {}
+_url_cache_lock = threading.Lock()
+
+
+def blob_hash(data: bytes) -> str:
+    """Content address of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_key(digest: str, prefix: str = "pages", extension: str = ".jpg") -> str:
+    """Object key: fanned out by the first two hex digits."""
+    return f"{prefix}/{digest[:2]}/{digest}{extension}"
+
+
+def key_digest(key: str) -> str:
+    """Hash part of an object key."""
+    return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def decode_image_text(value: str) -> bytes:
+    """Bytes of a stored base64 image (bare or data: URL)."""
+    if value.startswith("data:"):
+        value = value.split(",", 1)[1]
+    return base64.b64decode(value)
+
+
+class LocalBlobStore:
+    """Files under a local directory; URLs are inline data: URLs."""
+
+    cache_urls = False
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def signed_urls(self, keys: list[str]) -> list[str]:
+        return [
+            f"data:image/jpeg;base64,{base64.b64encode(self.get(key)).decode('utf-8')}"
+            for key in keys
+        ]
+
+    def delete(self, keys: list[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        for directory, _, files in os.walk(self._path(prefix)):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield key, os.path.getmtime(path)
+
+    def make_private(self) -> None:
+        pass
+
+
+class SupabaseBlobStore:
+    """Private Supabase Storage bucket (the storage the upload flow already uses)."""
+
+    cache_urls = True
+
+    def __init__(self, supabase_url: str, service_key: str, bucket: str):
+        self.base_url = supabase_url.rstrip("/")
+        self.bucket = bucket
+        self.client = httpx.Client(
+            timeout=30.0,
+            headers={"Authorization": f"Bearer {service_key}", "apikey": service_key}
+        )
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        response = self.client.post(
+            f"{self.base_url}/storage/v1/object/{self.bucket}/{key}",
+            content=data,
+            headers={
+                "Content-Type": content_type,
+                "cache-control": f"max-age={URL_TTL_SECONDS}",
+                "x-upsert": "false"
+            }
+        )
+        # Same key means same bytes, so an existing object is success
+        if response.status_code in (400, 409) and "uplicate" in response.text:
+            return
+        response.raise_for_status()
+
+    def get(self, key: str) -> bytes:
+        response = self.client.get(f"{self.base_url}/storage/v1/object/{self.bucket}/{key}")
+        response.raise_for_status()
+        return response.content
+
+    def signed_urls(self, keys: list[str]) -> list[str]:
+        response = self.client.post(
+            f"{self.base_url}/storage/v1/object/sign/{self.bucket}",
+            json={"expiresIn": URL_TTL_SECONDS, "paths": keys}
+        )
+        response.raise_for_status()
+        signed = {
+            item["path"]: f"{self.base_url}/storage/v1{item['signedURL']}"
+            for item in response.json() if item.get("signedURL")
+        }
+        return [signed.get(key) for key in keys]
+
+    def delete(self, keys: list[str]) -> None:
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.client.request(
+                "DELETE", f"{self.base_url}/storage/v1/object/{self.bucket}",
+                json={"prefixes": keys[start:start + DELETE_BATCH_SIZE]}
+            )
+            response.raise_for_status()
+
+    def _list_level(self, prefix: str) -> Iterator[dict]:
+        offset = 0
+        while True:
+            response = self.client.post(
+                f"{self.base_url}/storage/v1/object/list/{self.bucket}",
+                json={"prefix": prefix, "limit": 1000, "offset": offset}
+            )
+            response.raise_for_status()
+            entries = response.json()
+            yield from entries
+            if len(entries) < 1000:
+                return
+            offset += len(entries)
+
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        # Two levels: <prefix>/<xx>/<digest>.jpg
+        for folder in self._list_level(prefix):
+            if folder.get("id"):
+                continue
+            for entry in self._list_level(f"{prefix}/{folder['name']}"):
+                if not entry.get("id"):
+                    continue
+                created = entry.get("created_at") or ""
+                try:
+                    modified = calendar.timegm(time.strptime(created[:19], "%Y-%m-%dT%H:%M:%S"))
+                except ValueError:
+                    modified = time.time()
+                yield f"{prefix}/{folder['name']}/{entry['name']}", modified
+
+    def make_private(self) -> None:
+        response = self.client.put(
+            f"{self.base_url}/storage/v1/bucket/{self.bucket}",
+            json={"id": self.bucket, "name": self.bucket, "public": False}
+        )
+        response.raise_for_status()
+
+
+class S3BlobStore:
+    """Private S3-compatible bucket (AWS S3, R2, MinIO...)."""
+
+    cache_urls = True
+
+    def __init__(self, endpoint: Optional[str], access_key: str, secret_key: str, bucket: str):
+        import boto3  # Only needed for this backend
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint or None,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data,
+            ContentType=content_type, CacheControl=CACHE_CONTROL
+        )
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def signed_urls(self, keys: list[str]) -> list[str]:
+        # Presigning is local computation, no request per URL
+        return [
+            self.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=URL_TTL_SECONDS
+            )
+            for key in keys
+        ]
+
+    def delete(self, keys: list[str]) -> None:
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]], "Quiet": True}
+            )
+
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/"):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["LastModified"].timestamp()
+
+    def make_private(self) -> None:
+        self.client.put_public_access_block(
+            Bucket=self.bucket,
+            PublicAccessBlockConfiguration={
+                "BlockPublicAcls": True, "IgnorePublicAcls": True,
+                "BlockPublicPolicy": True, "RestrictPublicBuckets": True
+            }
+        )
+
+
+def get_blob_store():
+    """Return the process-wide store for BLOB_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BACKEND == "local":
+                    _store = LocalBlobStore(LOCAL_ROOT)
+                elif BACKEND == "s3":
+                    _store = S3BlobStore(
+                        os.getenv("BLOB_S3_ENDPOINT"),
+                        wmill.get_variable("f/chatbot/s3_access_key"),
+                        wmill.get_variable("f/chatbot/s3_secret_key"),
+                        BUCKET
+                    )
+                elif BACKEND == "supabase":
+                    _store = SupabaseBlobStore(
+                        wmill.get_variable("f/chatbot/supabase_url"),
+                        wmill.get_variable("f/chatbot/supabase_service_key"),
+                        BUCKET
+                    )
+                else:
+                    raise ValueError(f"Unknown BLOB_BACKEND: {BACKEND}")
+    return _store
+
+
+def put_blob(data: bytes, prefix: str = "pages", content_type: str = "image/jpeg") -> str:
+    """Store a blob (no-op if already stored) and return its hash."""
+    digest = blob_hash(data)
+    get_blob_store().put(blob_key(digest, prefix), data, content_type)
+    return digest
+
+
+def put_blobs(items: list[bytes], prefix: str = "pages", content_type: str = "image/jpeg") -> list[str]:
+    """Store several blobs concurrently; returns hashes in input order."""
+    if len(items) <= 1:
+        return [put_blob(data, prefix, content_type) for data in items]
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(items))) as pool:
+        return list(pool.map(lambda data: put_blob(data, prefix, content_type), items))
+
+
+def get_blob(digest: str, prefix: str = "pages") -> bytes:
+    """Read a blob by hash."""
+    return get_blob_store().get(blob_key(digest, prefix))
+
+
+def blob_urls(digests: list[Optional[str]], prefix: str = "pages") -> list[Optional[str]]:
+    """
+    Short-lived URLs for blobs (None where there is no hash), signed in one
+    batch. Only call after the caller's visibility filter has run.
+    """
+    store = get_blob_store()
+    keys = [blob_key(digest, prefix) if digest else None for digest in digests]
+    now = time.time()
+    urls = {}
+    if store.cache_urls:
+        with _url_cache_lock:
+            for key in filter(None, keys):
+                cached = _url_cache.get(key)
+                # Reuse while more than half the TTL remains
+                if cached and cached[1] - now > URL_TTL_SECONDS / 2:
+                    urls[key] = cached[0]
+
+    missing = list(dict.fromkeys(key for key in keys if key and key not in urls))
+    if missing:
+        signed = store.signed_urls(missing)
+        urls.update(zip(missing, signed))
+        if store.cache_urls:
+            with _url_cache_lock:
+                if len(_url_cache) > URL_CACHE_MAX:
+                    _url_cache.clear()
+                for key, url in zip(missing, signed):
+                    if url:
+                        _url_cache[key] = (url, now + URL_TTL_SECONDS)
+    return [urls.get(key) if key else None for key in keys]
+
+
+def blob_url(digest: Optional[str], prefix: str = "pages") -> Optional[str]:
+    """Short-lived URL for one blob, or None without a hash."""
+    return blob_urls([digest], prefix)[0]
+
+
+def delete_unreferenced(digests: list[str], prefix: str = "pages") -> int:
+    """
+    Delete the given blobs that no row references any more (e.g. after a
+    document is deleted). Returns how many were deleted.
+    """
+    digests = list({digest for digest in digests if digest})
+    if not digests:
+        return 0
+    table, column = BLOB_REFERENCES[prefix]
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} = ANY(%s)", (digests,))
+        referenced = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+    unreferenced = [digest for digest in digests if digest not in referenced]
+    if unreferenced:
+        keys = [blob_key(digest, prefix) for digest in unreferenced]
+        get_blob_store().delete(keys)
+        with _url_cache_lock:
+            for key in keys:
+                _url_cache.pop(key, None)
+    return len(unreferenced)
+
+
+def collect_garbage(max_seconds: int = 240) -> dict:
+    """
+    Delete blobs older than GC_GRACE_SECONDS that no row references. The
+    grace period covers uploads whose row is not committed yet.
+    """
+    deadline = time.time() + max_seconds
+    cutoff = time.time() - GC_GRACE_SECONDS
+    store = get_blob_store()
+    deleted = {}
+    for prefix, (table, column) in BLOB_REFERENCES.items():
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+            referenced = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        candidates = []
+        for key, modified in store.list(prefix):
+            if time.time() > deadline:
+                break
+            if modified < cutoff and key_digest(key) not in referenced:
+                candidates.append(key_digest(key))
+        # Re-checked against the table right before deleting
+        deleted[prefix] = delete_unreferenced(candidates, prefix)
+    return deleted
+
+
+def migrate_inline_images(batch_size: int = 200, max_seconds: int = 240) -> dict:
+    """
+    Move base64 images still stored in Postgres into the blob store, in id
+    order and committing per batch. Safe to re-run until "remaining" is 0.
+    """
+    deadline = time.time() + max_seconds
+    moved = {"pages": 0, "images": 0}
+
+    # Page thumbnails: page_image -> page_image_hash
+    last_id = 0
+    while time.time() < deadline:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, page_image FROM document_pages
+                WHERE page_image IS NOT NULL AND page_image_hash IS NULL AND id > %s
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.close()
+                break
+            digests = put_blobs([decode_image_text(row[1]) for row in rows], "pages")
+            cursor.executemany(
+                "UPDATE document_pages SET page_image_hash = %s, page_image = NULL WHERE id = %s",
+                [(digest, row[0]) for digest, row in zip(digests, rows)]
+            )
+            conn.commit()
+            cursor.close()
+        last_id = rows[-1][0]
+        moved["pages"] += len(rows)
+
+    # Document images: data: URL in image_url -> image_hash
+    last_id = 0
+    while time.time() < deadline:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, image_url FROM family_documents
+                WHERE image_url LIKE 'data:%%' AND id > %s
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.close()
+                break
+            digests = put_blobs([decode_image_text(row[1]) for row in rows], "images")
+            cursor.executemany(
+                "UPDATE family_documents SET image_hash = %s, image_url = NULL WHERE id = %s",
+                [(digest, row[0]) for digest, row in zip(digests, rows)]
+            )
+            conn.commit()
+            cursor.close()
+        last_id = rows[-1][0]
+        moved["images"] += len(rows)
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM document_pages WHERE page_image IS NOT NULL AND page_image_hash IS NULL),
+                (SELECT COUNT(*) FROM family_documents WHERE image_url LIKE 'data:%%')
+        """)
+        remaining_pages, remaining_images = cursor.fetchone()
+        cursor.close()
+
+    return {
+        "moved": moved,
+        "remaining": {"pages": remaining_pages, "images": remaining_images}
+    }
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "migrate", batch_size: int = 200, max_seconds: int = 240) -> dict:
+    """
+    Maintain the blob store.
+
+    Args:
+        action: "migrate" (move base64 images out of Postgres; schedule until
+            nothing remains, then VACUUM FULL document_pages to return the space),
+            "gc" (delete unreferenced blobs; schedule daily),
+            "secure" (make the bucket private)
+        batch_size: Rows per batch
+        max_seconds: Time budget for one run
+
+    Returns:
+        dict with the action's results
+    """
+    if action == "migrate":
+        return {"success": True, "backend": BACKEND, **migrate_inline_images(batch_size, max_seconds)}
+    if action == "gc":
+        return {"success": True, "backend": BACKEND, "deleted": collect_garbage(max_seconds)}
+    if action == "secure":
+        get_blob_store().make_private()
+        return {"success": True, "backend": BACKEND, "bucket": BUCKET}
+    raise ValueError("action must be 'migrate', 'gc' or 'secure'")
@@ -0,0 +1,166 @@
+# category_centroids.py
+# Windmill Python library - Centroid-based category classification
+# Path: f/chatbot/category_centroids
+#
+# requirements:
+#   - numpy
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Category Centroids for Archevi
+==============================
+
+Embedding step of `auto_categorize` in the embed scripts. Per-tenant sums
+of document embeddings by category live in `category_centroids` and are
+maintained by triggers on `family_documents` (migration 021).
+
+For a tenant, each category is represented by the tenant's own centroid
+once it has MIN_TENANT_DOCS documents in that category, otherwise by the
+global centroid (all tenants). The centroids are loaded as one normalized
+numpy matrix (cached per tenant for CENTROID_CACHE_TTL_SECS) and a document
+is classified with a single matrix-vector product.
+
+Usage:
+    from category_centroids import classify_embedding
+
+    match = classify_embedding(conn, tenant_id, embedding)
+    if match:
+        category, similarity = match
+
+Windmill Script Configuration:
+- Path: f/chatbot/category_centroids
+- This is a library module; main() rebuilds the table from family_documents
+"""
+
+from typing import Optional
+import os
+import threading
+import time
+
+import numpy as np
+
+from db_pool import get_connection
+
+
+MIN_TENANT_DOCS = int(os.getenv("CATEGORY_CENTROID_MIN_TENANT_DOCS", "3"))
+CACHE_TTL_SECONDS = float(os.getenv("CENTROID_CACHE_TTL_SECS", "300"))
+
+# tenant_id -> (loaded_at, categories, normalized centroid matrix)
+_cache: dict = {}
+_cache_lock = threading.Lock()
+
+
+def load_centroids(conn, tenant_id: Optional[str]) -> tuple[list[str], Optional[np.ndarray]]:
+    """
+    Load one centroid per category for a tenant.
+
+    Returns:
+        (categories, matrix) where matrix row i is the unit-length centroid
+        of categories[i]; matrix is None when there are no centroids yet.
+    """
+    cache_key = tenant_id or ""
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached and time.time() - cached[0] < CACHE_TTL_SECONDS:
+            return cached[1], cached[2]
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT category,
+               SUM(embedding_sum) FILTER (WHERE tenant_id = %s::uuid),
+               COALESCE(SUM(doc_count) FILTER (WHERE tenant_id = %s::uuid), 0),
+               SUM(embedding_sum),
+               SUM(doc_count)
+        FROM category_centroids
+        GROUP BY category
+        ORDER BY category
+    """, (tenant_id, tenant_id))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    categories = []
+    vectors = []
+    for category, tenant_sum, tenant_count, global_sum, global_count in rows:
+        if tenant_sum is not None and tenant_count >= MIN_TENANT_DOCS:
+            vector = np.asarray(tenant_sum, dtype=np.float32)
+        elif global_sum is not None and global_count > 0:
+            vector = np.asarray(global_sum, dtype=np.float32)
+        else:
+            continue
+        # Direction is all that matters for cosine, so no need to divide by count
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            continue
+        categories.append(category)
+        vectors.append(vector / norm)
+
+    matrix = np.vstack(vectors) if vectors else None
+    with _cache_lock:
+        _cache[cache_key] = (time.time(), categories, matrix)
+    return categories, matrix
+
+
+def classify_embedding(
+    conn,
+    tenant_id: Optional[str],
+    embedding
+) -> Optional[tuple[str, float]]:
+    """
+    Closest category centroid to an embedding.
+
+    Returns:
+        (category, cosine similarity), or None if no centroids exist
+    """
+    categories, matrix = load_centroids(conn, tenant_id)
+    if matrix is None:
+        return None
+
+    query = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm == 0 or query.shape[0] != matrix.shape[1]:
+        return None
+
+    similarities = matrix @ (query / norm)
+    best = int(np.argmax(similarities))
+    return categories[best], float(similarities[best])
+
+
+def rebuild_centroids() -> int:
+    """Recompute all sums from family_documents (clears float drift). Returns rows."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM category_centroids")
+        cursor.execute("""
+            INSERT INTO category_centroids (tenant_id, category, embedding_sum, doc_count)
+            SELECT tenant_id, category, SUM(embedding), COUNT(*)
+            FROM family_documents
+            WHERE embedding IS NOT NULL AND tenant_id IS NOT NULL AND category IS NOT NULL
+            GROUP BY tenant_id, category
+        """)
+        rows = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    with _cache_lock:
+        _cache.clear()
+    return rows
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "rebuild") -> dict:
+    """
+    Maintain the category centroid table.
+
+    Args:
+        action: "rebuild" (recompute from family_documents)
+
+    Returns:
+        dict with the number of tenant/category rows
+    """
+    if action == "rebuild":
+        return {"success": True, "rows": rebuild_centroids()}
+    raise ValueError("action must be 'rebuild'")
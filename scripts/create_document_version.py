@@ -1,11 +1,14 @@
 """
 Create a new version of an existing document.
 
-Used when updating a document to preserve history.
+Used when updating a document to preserve history. The version is stored
+as a compressed delta against the previous one where that is smaller
+(version_store.py).
 """
 
 from typing import TypedDict, Optional
 import wmill
+from version_store import store_version
 
 
 class CreateVersionResult(TypedDict):
@@ -111,24 +114,20 @@ def main(
             else:
                 change_summary = f"Content updated"
 
-        # Create version record
-        cursor.execute("""
-            INSERT INTO document_versions (
-                document_id, version_number, title, content, content_hash,
-                file_size_bytes, storage_path, change_summary, change_type, created_by
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
+        # Create version record (delta against the previous version)
+        store_version(
+            conn,
             document_id,
             next_version,
             title,
             content,
             new_hash,
-            file_size_bytes,
-            storage_path,
-            change_summary,
-            change_type,
-            user_id
-        ))
+            file_size_bytes=file_size_bytes,
+            storage_path=storage_path,
+            change_summary=change_summary,
+            change_type=change_type,
+            created_by=user_id
+        )
 
         # Update the main document
         cursor.execute("""
@@ -0,0 +1,282 @@
+# db_pool.py
+# Windmill Python library - Shared pooled PostgreSQL access
+# Path: f/chatbot/db_pool
+#
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Shared PostgreSQL Connection Pool for Archevi
+=============================================
+
+This module provides a process-wide psycopg2 connection pool for every script
+that talks to the `f/chatbot/postgres_db` resource. Connections are opened once
+per worker process and reused across calls, so hot paths (agent turns, search,
+usage logging) no longer pay a TCP + TLS + auth handshake per query.
+
+Each pooled connection:
+- has pgvector types registered once (no per-request register_vector round trip)
+- runs with a server-side statement_timeout
+- is health-checked with SELECT 1 when it has been idle for a while
+- is rolled back on return so no transaction leaks to the next caller
+
+Usage:
+    from db_pool import get_connection
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        conn.commit()
+
+Configuration (environment variables):
+    DB_POOL_MIN_CONN            Connections opened eagerly (default 1)
+    DB_POOL_MAX_CONN            Upper bound per process (default 10)
+    DB_STATEMENT_TIMEOUT_MS     Server-side statement timeout (default 30000)
+    DB_CONNECT_TIMEOUT          Connect timeout in seconds (default 10)
+    DB_HEALTH_CHECK_IDLE_SECS   Idle time before a checkout is pinged (default 30)
+
+Windmill Script Configuration:
+- Path: f/chatbot/db_pool
+- This is a library module, not a standalone script
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import atexit
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+import wmill
+
+
+DEFAULT_RESOURCE = "f/chatbot/postgres_db"
+
+POOL_CONFIG = {
+    "min_conn": int(os.getenv("DB_POOL_MIN_CONN", "1")),
+    "max_conn": int(os.getenv("DB_POOL_MAX_CONN", "10")),
+    "statement_timeout_ms": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000")),
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+    "health_check_idle_secs": float(os.getenv("DB_HEALTH_CHECK_IDLE_SECS", "30")),
+    "checkout_timeout_secs": float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT_SECS", "10")),
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers its pool bookkeeping."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vector_registered = False
+        self.last_used = time.monotonic()
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def _connect_kwargs(postgres_db: dict) -> dict:
+    """Build psycopg2.connect kwargs from a Windmill postgresql resource."""
+    return {
+        "host": postgres_db['host'],
+        "port": postgres_db['port'],
+        "dbname": postgres_db['dbname'],
+        "user": postgres_db['user'],
+        "password": postgres_db['password'],
+        "sslmode": postgres_db.get('sslmode', 'disable'),
+        "connect_timeout": POOL_CONFIG["connect_timeout"],
+        "application_name": "archevi-windmill",
+        "options": f"-c statement_timeout={POOL_CONFIG['statement_timeout_ms']}",
+        # TCP keepalives so idle pooled connections survive NAT/proxy timeouts
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+        "connection_factory": PooledConnection,
+    }
+
+
+def get_pool(resource_path: str = DEFAULT_RESOURCE) -> ThreadedConnectionPool:
+    """Return the process-wide pool for a Windmill postgres resource, creating it on first use."""
+    pool = _pools.get(resource_path)
+    if pool is not None and not pool.closed:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(resource_path)
+        if pool is None or pool.closed:
+            postgres_db = wmill.get_resource(resource_path)
+            pool = ThreadedConnectionPool(
+                POOL_CONFIG["min_conn"],
+                POOL_CONFIG["max_conn"],
+                **_connect_kwargs(postgres_db)
+            )
+            _pools[resource_path] = pool
+        return pool
+
+
+def _is_healthy(conn) -> bool:
+    """Ping a connection that has been idle long enough to be suspect."""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - getattr(conn, 'last_used', 0)
+    if idle < POOL_CONFIG["health_check_idle_secs"]:
+        return True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _checkout(pool: ThreadedConnectionPool):
+    """Get a healthy connection, waiting briefly if the pool is exhausted."""
+    deadline = time.monotonic() + POOL_CONFIG["checkout_timeout_secs"]
+    while True:
+        try:
+            conn = pool.getconn()
+        except PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+            continue
+
+        if _is_healthy(conn):
+            return conn
+
+        # Broken connection - drop it and try again with a fresh one
+        pool.putconn(conn, close=True)
+
+
+def _checkin(pool: ThreadedConnectionPool, conn) -> None:
+    """Return a connection to the pool, discarding it if it is unusable."""
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        if conn.autocommit:
+            conn.autocommit = False
+        conn.last_used = time.monotonic()
+        pool.putconn(conn)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, close=True)
+
+
+@contextmanager
+def get_connection(
+    register_vector: bool = True,
+    autocommit: bool = False,
+    resource_path: str = DEFAULT_RESOURCE
+) -> Iterator[PooledConnection]:
+    """
+    Borrow a pooled connection for the duration of a `with` block.
+
+    Args:
+        register_vector: Register pgvector adapters (done once per connection)
+        autocommit: Put the connection in autocommit mode for this checkout
+        resource_path: Windmill postgres resource to connect to
+
+    The connection is rolled back (never closed) when the block exits, so
+    callers must commit explicitly. Do not call conn.close() on it.
+    """
+    pool = get_pool(resource_path)
+    conn = _checkout(pool)
+    try:
+        if register_vector and not conn.vector_registered:
+            from pgvector.psycopg2 import register_vector as _register_vector
+            _register_vector(conn)
+            conn.commit()
+            conn.vector_registered = True
+        if autocommit:
+            conn.autocommit = True
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        _checkin(pool, conn)
+
+
+def pool_stats(resource_path: str = DEFAULT_RESOURCE) -> dict:
+    """Report pool occupancy for health checks and debugging."""
+    pool = _pools.get(resource_path)
+    if pool is None or pool.closed:
+        return {"initialized": False}
+    return {
+        "initialized": True,
+        "min_conn": pool.minconn,
+        "max_conn": pool.maxconn,
+        "idle": len(pool._pool),
+        "in_use": len(pool._used),
+        "statement_timeout_ms": POOL_CONFIG["statement_timeout_ms"],
+    }
+
+
+def health_check(resource_path: str = DEFAULT_RESOURCE) -> dict:
+    """Run SELECT 1 through the pool and report latency plus pool stats."""
+    start = time.time()
+    try:
+        with get_connection(register_vector=False, resource_path=resource_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+        return {
+            "status": "up",
+            "response_time_ms": int((time.time() - start) * 1000),
+            "pool": pool_stats(resource_path),
+        }
+    except Exception as e:
+        return {
+            "status": "down",
+            "response_time_ms": int((time.time() - start) * 1000),
+            "error": str(e),
+            "pool": pool_stats(resource_path),
+        }
+
+
+def close_all() -> None:
+    """Close every pool in this process (registered as an atexit hook)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            if not pool.closed:
+                pool.closeall()
+        _pools.clear()
+
+
+atexit.register(close_all)
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(resource_path: Optional[str] = None) -> dict:
+    """
+    Check pooled database connectivity.
+
+    Windmill Entry Point - allows probing the shared pool from Windmill.
+
+    Args:
+        resource_path: Postgres resource to check (default f/chatbot/postgres_db)
+
+    Returns:
+        dict with status, response_time_ms and pool stats
+    """
+    return health_check(resource_path or DEFAULT_RESOURCE)
@@ -3,6 +3,7 @@
 # Path: f/chatbot/delete_document
 #
 # requirements:
+#   - numpy
 #   - psycopg2-binary
 #   - wmill
 #   - httpx
@@ -23,6 +24,8 @@ Returns:
 
 import psycopg2
 import wmill
+from document_neighbors import referrers, refresh_documents
+from blob_store import delete_unreferenced
 
 
 def main(document_id: int) -> dict:
@@ -48,7 +51,7 @@ def main(document_id: int) -> dict:
 
         # Get document title before deleting (for confirmation message)
         cursor.execute("""
-            SELECT title FROM family_documents WHERE id = %s
+            SELECT title, image_hash FROM family_documents WHERE id = %s
         """, (document_id,))
 
         row = cursor.fetchone()
@@ -57,17 +60,36 @@ def main(document_id: int) -> dict:
             conn.close()
             return {"success": False, "error": "Document not found"}
 
-        title = row[0]
+        title, image_hash = row
 
-        # Delete the document (cascades to document_metadata via FK)
+        # Page thumbnails go with the rows (FK cascade); their blobs are removed after commit
+        cursor.execute("""
+            SELECT page_image_hash FROM document_pages
+            WHERE document_id = %s AND page_image_hash IS NOT NULL
+        """, (document_id,))
+        page_hashes = [r[0] for r in cursor.fetchall()]
+
+        # Documents that list this one as related are refreshed after it goes
+        affected = referrers(conn, document_id)
+
+        # Delete the document (cascades to document_metadata and document_neighbors via FK)
         cursor.execute("""
             DELETE FROM family_documents WHERE id = %s
         """, (document_id,))
+        refresh_documents(conn, affected)
 
         conn.commit()
         cursor.close()
         conn.close()
 
+        # Blobs are shared by content hash: only unreferenced ones are deleted.
+        # A failure here leaves them to blob_store gc.
+        try:
+            delete_unreferenced(page_hashes, "pages")
+            delete_unreferenced([image_hash], "images")
+        except Exception as e:
+            print(f"Blob cleanup for document {document_id} failed: {e}")
+
         return {
             "success": True,
             "message": f"Document '{title}' has been deleted",
@@ -0,0 +1,241 @@
+# document_access.py
+# Windmill Python library - Document visibility filters and per-member shares
+# Path: f/chatbot/document_access
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Document Access for Archevi
+===========================
+
+One place that decides which documents a family member can see. Migration
+032 stores visibility as family_documents.access_level (copied onto
+document_chunks) and adds per-member shares:
+
+    level 0 everyone      - every member
+    level 1 adults_only   - adults and admins
+    level 2 admins_only   - admins
+    level 3 private       - admins and the member it is assigned to
+
+Members also see documents shared with them (family_document_shares),
+whatever their level; sharing or unsharing drops the member's cached
+answers (migration 035). Without a member type only level 0 is visible.
+
+access_filter() returns the "AND ..." clause for a search plus vector
+scopes for hybrid_search.hybrid_cte: the vector leg scans the tenant's
+bucket index (vector_partitions.py) filtered on the member's level, and
+fetches the member's private and shared documents exactly. There is no
+per-level index: one spanning all tenants would compete with the bucket
+index for the same query (migration 037), and
+scripts/test_access_level_plans.py checks the plan with EXPLAIN.
+
+Usage:
+    from document_access import access_filter
+
+    visibility_filter, visibility_params, vector_scopes = access_filter(
+        cursor, tenant_id, user_member_type, user_member_id, alias="d"
+    )
+    cte_sql, cte_params = hybrid_cte(
+        ..., where_sql=f"d.tenant_id = %s::uuid {visibility_filter}",
+        where_params=[tenant_id] + visibility_params, vector_scopes=vector_scopes
+    )
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_access
+- main() shares, unshares or lists a member's shared documents
+"""
+
+from typing import Optional
+
+from db_pool import get_connection
+
+
+ACCESS_LEVELS = {"everyone": 0, "adults_only": 1, "admins_only": 2, "private": 3}
+PRIVATE_LEVEL = ACCESS_LEVELS["private"]
+
+# Highest level per member type; admins are unrestricted
+MEMBER_LEVELS = {"adult": 1, "teen": 0, "child": 0}
+
+# Predicate on access_level per member level
+LEVEL_PREDICATES = {0: "= 0", 1: "<= 1"}
+
+
+def member_level(user_member_type: Optional[str]) -> Optional[int]:
+    """Highest access level a member type sees (None = everything)."""
+    if user_member_type == 'admin':
+        return None
+    if not user_member_type:
+        return 0
+    return MEMBER_LEVELS.get(user_member_type, 0)
+
+
+def shared_document_ids(cursor, tenant_id: str, member_id: Optional[int]) -> list[int]:
+    """Documents of the tenant shared with a member."""
+    if member_id is None:
+        return []
+    cursor.execute("""
+        SELECT s.document_id
+        FROM family_document_shares s
+        JOIN family_documents d ON d.id = s.document_id
+        WHERE s.member_id = %s AND d.tenant_id = %s::uuid
+    """, (member_id, tenant_id))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def personal_clause(
+    alias: str,
+    user_member_id: Optional[int],
+    shared_ids: Optional[list] = None,
+    id_column: str = "id",
+    assigned_alias: Optional[str] = None
+) -> tuple[str, list]:
+    """Private documents assigned to the member or shared with them ("" if none)."""
+    parts, params = [], []
+    if user_member_id is not None:
+        parts.append(
+            f"({alias}.access_level = {PRIVATE_LEVEL} AND {assigned_alias or alias}.assigned_to = %s)"
+        )
+        params.append(user_member_id)
+    if shared_ids:
+        parts.append(f"{alias}.{id_column} = ANY(%s)")
+        params.append(list(shared_ids))
+    return (f"({' OR '.join(parts)})" if parts else ""), params
+
+
+def visibility_filter(
+    alias: str,
+    user_member_type: Optional[str],
+    user_member_id: Optional[int],
+    shared_ids: Optional[list] = None,
+    id_column: str = "id",
+    assigned_alias: Optional[str] = None
+) -> tuple[str, list]:
+    """
+    "AND (...)" clause over `alias` for the documents a member can see.
+
+    Args:
+        alias: Row alias carrying access_level (family_documents or document_chunks)
+        id_column: Column of `alias` holding the family_documents id
+            ("document_id" for chunks)
+        assigned_alias: Alias of the family_documents row when `alias` is a chunk
+    """
+    level = member_level(user_member_type)
+    if level is None:
+        return "", []
+    level_clause = f"{alias}.access_level {LEVEL_PREDICATES[level]}"
+    clause, params = personal_clause(alias, user_member_id, shared_ids, id_column, assigned_alias)
+    if not clause:
+        return f"AND {level_clause}", []
+    return f"AND ({level_clause} OR {clause})", params
+
+
+def access_filter(
+    cursor,
+    tenant_id: str,
+    user_member_type: Optional[str],
+    user_member_id: Optional[int],
+    alias: str = "d",
+    id_column: str = "id",
+    assigned_alias: Optional[str] = None,
+    shared_ids: Optional[list] = None
+) -> tuple[str, list, Optional[list]]:
+    """
+    Visibility filter (see visibility_filter) and vector scopes for a
+    member's search. shared_ids is looked up when not given.
+
+    Returns:
+        (filter_sql, filter_params, vector_scopes) - vector_scopes is a list
+        of (sql, params, exact) for hybrid_cte: the member's level as a
+        filter on the HNSW scan, and their private and shared documents
+        scanned exactly. None when a single scan is enough (admins, no member).
+    """
+    level = member_level(user_member_type)
+    if level is None:
+        return "", [], None
+
+    if shared_ids is None:
+        shared_ids = shared_document_ids(cursor, tenant_id, user_member_id)
+    filter_sql, filter_params = visibility_filter(
+        alias, user_member_type, user_member_id, shared_ids, id_column, assigned_alias
+    )
+    clause, params = personal_clause(alias, user_member_id, shared_ids, id_column, assigned_alias)
+    if not clause:
+        return filter_sql, filter_params, None
+    level_clause = f"{alias}.access_level {LEVEL_PREDICATES[level]}"
+    return filter_sql, filter_params, [(f"AND {level_clause}", [], False), (f"AND {clause}", params, True)]
+
+
+def can_access_document(
+    cursor,
+    document_id: int,
+    tenant_id: str,
+    user_member_type: Optional[str],
+    user_member_id: Optional[int]
+) -> bool:
+    """Whether a member can see a document (same rules as search)."""
+    shared_ids = shared_document_ids(cursor, tenant_id, user_member_id)
+    clause, params = visibility_filter("d", user_member_type, user_member_id, shared_ids)
+    cursor.execute(
+        f"SELECT 1 FROM family_documents d WHERE d.id = %s AND d.tenant_id = %s::uuid {clause}",
+        [document_id, tenant_id] + params
+    )
+    return cursor.fetchone() is not None
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(
+    action: str,
+    tenant_id: str,
+    member_id: int,
+    document_id: Optional[int] = None,
+    shared_by: Optional[int] = None
+) -> dict:
+    """
+    Manage documents shared with a family member.
+
+    Args:
+        action: "share", "unshare" or "list"
+        tenant_id: Tenant UUID (the document must belong to it)
+        member_id: family_members.id of the recipient
+        document_id: family_documents.id (share/unshare)
+        shared_by: family_members.id of the sharer (share)
+
+    Returns:
+        dict: {success, document_ids} for list, {success, shared|unshared} otherwise
+    """
+    if action not in ("share", "unshare", "list"):
+        raise ValueError(f"Unknown action: {action}")
+    if action != "list" and document_id is None:
+        raise ValueError("document_id is required")
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        if action == "list":
+            document_ids = shared_document_ids(cursor, tenant_id, member_id)
+            cursor.close()
+            return {"success": True, "document_ids": document_ids}
+
+        if action == "share":
+            cursor.execute("""
+                INSERT INTO family_document_shares (document_id, member_id, shared_by)
+                SELECT id, %s, %s FROM family_documents
+                WHERE id = %s AND tenant_id = %s::uuid
+                ON CONFLICT (member_id, document_id) DO NOTHING
+            """, (member_id, shared_by, document_id, tenant_id))
+            result = {"success": True, "shared": cursor.rowcount > 0}
+        else:
+            cursor.execute("""
+                DELETE FROM family_document_shares s
+                USING family_documents d
+                WHERE s.document_id = d.id AND d.tenant_id = %s::uuid
+                  AND s.document_id = %s AND s.member_id = %s
+            """, (tenant_id, document_id, member_id))
+            result = {"success": True, "unshared": cursor.rowcount > 0}
+        conn.commit()
+        cursor.close()
+    return result
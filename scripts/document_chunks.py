@@ -0,0 +1,571 @@
+# document_chunks.py
+# Windmill Python library - Chunk-level embeddings and retrieval
+# Path: f/chatbot/document_chunks
+#
+# requirements:
+#   - cohere
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Document Chunking for Archevi
+=============================
+
+Splits long documents into overlapping, structure-aware passages, embeds
+them in batches at ingest time and retrieves them at query time, so a
+question about page 14 of an insurance policy is matched against page 14
+rather than against one vector for the whole policy.
+
+Chunking rules:
+- chunks never cross a "--- Page N ---" boundary (as written by the PDF
+  extractors), so every chunk knows its page
+- a detected heading starts a new chunk and is remembered as its section
+- chunks prefer to end at paragraph breaks once they reach the target size
+- consecutive chunks on a page overlap by CHUNK_OVERLAP_CHARS
+
+Edits go through reembed_changed_content(): chunks are matched to the stored
+ones by chunk_hash (their embedded text without the title), so only chunks
+whose text changed are embedded again. The whole-document vector is
+re-embedded once edits since its last embed reach DOCUMENT_REEMBED_DRIFT of
+the text; title-only edits embed nothing.
+
+Usage:
+    from document_chunks import build_chunks, embed_chunks, store_chunks
+
+    chunks = build_chunks(content)
+    embeddings, tokens = embed_chunks(co, chunks, title=title)
+    store_chunks(conn, document_id, tenant_id, chunks, embeddings)
+
+    # After an edit (no commit):
+    stats = reembed_changed_content(conn, co, document_id, tenant_id, title, new_content)
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_chunks
+- This is a library module; main() re-chunks an existing document
+"""
+
+from difflib import SequenceMatcher
+from typing import Optional
+import hashlib
+import os
+import re
+
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection
+from document_neighbors import update_document_neighbors
+from embedding_registry import active_model
+from hybrid_search import hybrid_cte
+from vector_partitions import plan_vector_search
+
+
+CHUNK_TARGET_CHARS = 1200
+CHUNK_MAX_CHARS = 2000
+CHUNK_OVERLAP_CHARS = 200
+EMBED_BATCH_SIZE = 96  # Cohere embed limit per request
+
+# Share of the text edited since the last whole-document embed before it is redone
+DOCUMENT_REEMBED_DRIFT = float(os.getenv("DOCUMENT_REEMBED_DRIFT", "0.1"))
+EDIT_DIFF_MAX_CHARS = 20000  # Larger edits are sized by length instead of diffed
+
+PAGE_MARKER = re.compile(r'^--- Page (\d+) ---[ \t]*$', re.MULTILINE)
+LINE_PATTERN = re.compile(r'[^\n]+')
+SENTENCE_END = re.compile(r'[.!?]["\')\]]?\s+')
+NUMBERED_HEADING = re.compile(
+    r'^(?:(?:section|article|part|schedule|chapter|appendix)\s+[\dIVXA-Z]+|\d+(?:\.\d+)*[.)]?\s+[A-Z])',
+    re.IGNORECASE
+)
+
+
+def _split_pages(text: str) -> list[tuple[Optional[int], int, int]]:
+    """Return (page_number, start, end) spans using the extractor's page markers."""
+    markers = list(PAGE_MARKER.finditer(text))
+    if not markers:
+        return [(None, 0, len(text))]
+
+    spans = []
+    if text[:markers[0].start()].strip():
+        spans.append((None, 0, markers[0].start()))
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        spans.append((int(marker.group(1)), marker.end(), end))
+    return spans
+
+
+def _is_heading(line: str) -> bool:
+    """Heuristic heading detection for extracted PDF/OCR text and markdown."""
+    line = line.strip()
+    if not line or len(line) > 80:
+        return False
+    if line.startswith('#'):
+        return True
+    if line.endswith('.') or line.endswith(','):
+        return False
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 4 and all(c.isupper() for c in letters):
+        return True
+    if NUMBERED_HEADING.match(line) and len(line.split()) <= 10:
+        return True
+    return line.endswith(':') and len(line) <= 60
+
+
+def _split_long_line(text: str, start: int, end: int) -> list[tuple[int, int]]:
+    """Break a line longer than CHUNK_MAX_CHARS at sentence (or word) boundaries."""
+    spans = []
+    while end - start > CHUNK_MAX_CHARS:
+        window_end = start + CHUNK_TARGET_CHARS
+        cut = None
+        for match in SENTENCE_END.finditer(text, start + CHUNK_TARGET_CHARS // 2, window_end):
+            cut = match.end()
+        if cut is None:
+            space = text.rfind(' ', start + 1, window_end)
+            cut = space + 1 if space > start else window_end
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, end))
+    return spans
+
+
+def _overlap_start(text: str, chunk_start: int, chunk_end: int, next_start: int) -> int:
+    """Where the next chunk starts so it repeats the tail of the previous one."""
+    floor = max(chunk_start + 1, chunk_end - CHUNK_OVERLAP_CHARS)
+    if floor >= next_start:
+        return next_start
+    # Prefer starting the overlap on a sentence, then on a word
+    match = SENTENCE_END.search(text, floor, next_start)
+    if match and match.end() < next_start:
+        return match.end()
+    space = text.find(' ', floor, next_start)
+    return space + 1 if space != -1 else next_start
+
+
+def build_chunks(text: str) -> list[dict]:
+    """
+    Split document text into overlapping, page- and heading-aware chunks.
+
+    Returns:
+        list of dicts with chunk_index, page_number, heading, char_start,
+        char_end and content (text[char_start:char_end])
+    """
+    chunks: list[dict] = []
+    if not text or not text.strip():
+        return chunks
+
+    def emit(start: int, end: int, page: Optional[int], heading: Optional[str]):
+        content = text[start:end].strip()
+        if content:
+            chunks.append({
+                "chunk_index": len(chunks),
+                "page_number": page,
+                "heading": heading,
+                "char_start": start,
+                "char_end": end,
+                "content": content,
+            })
+
+    heading: Optional[str] = None
+    for page_number, page_start, page_end in _split_pages(text):
+        cur_start: Optional[int] = None
+        cur_end = page_start
+        cur_heading = heading
+        prev_line_end = page_start
+
+        for line in LINE_PATTERN.finditer(text, page_start, page_end):
+            if not line.group().strip():
+                continue
+            paragraph_break = '\n\n' in text[prev_line_end:line.start()] or \
+                text[prev_line_end:line.start()].count('\n') > 1
+            prev_line_end = line.end()
+
+            if _is_heading(line.group()):
+                if cur_start is not None:
+                    emit(cur_start, cur_end, page_number, cur_heading)
+                    cur_start = None
+                heading = line.group().strip().lstrip('#').strip().rstrip(':').strip() or heading
+
+            for span_start, span_end in _split_long_line(text, line.start(), line.end()):
+                if cur_start is None:
+                    cur_start, cur_heading = span_start, heading
+                else:
+                    size = span_end - cur_start
+                    if size > CHUNK_MAX_CHARS or (paragraph_break and cur_end - cur_start >= CHUNK_TARGET_CHARS):
+                        emit(cur_start, cur_end, page_number, cur_heading)
+                        cur_start = _overlap_start(text, cur_start, cur_end, span_start)
+                        cur_heading = heading
+                cur_end = span_end
+                paragraph_break = False
+
+        if cur_start is not None:
+            emit(cur_start, cur_end, page_number, cur_heading)
+
+    return chunks
+
+
+def chunk_embedding_text(chunk: dict, title: Optional[str] = None) -> str:
+    """Text sent to the embedder/reranker: chunk prefixed with its document context."""
+    header = []
+    if title:
+        header.append(f"title: {title}")
+    if chunk.get("heading"):
+        header.append(f"section: {chunk['heading']}")
+    if chunk.get("page_number"):
+        header.append(f"page: {chunk['page_number']}")
+    header.append(f"content: {chunk['content']}")
+    return "\n".join(header)
+
+
+def chunk_hash(chunk: dict) -> str:
+    """Identity of a chunk's embedded text. The title is left out so renames keep embeddings."""
+    return hashlib.sha256(chunk_embedding_text(chunk).encode("utf-8")).hexdigest()
+
+
+def embed_chunks(
+    co,
+    chunks: list[dict],
+    title: Optional[str] = None,
+    model: Optional[str] = None,
+    output_dimension: Optional[int] = None
+) -> tuple[list, int]:
+    """
+    Embed chunks with Cohere in batches of EMBED_BATCH_SIZE.
+
+    model/output_dimension default to the registry's active text model.
+
+    Returns:
+        (embeddings in chunk order, billed input tokens)
+    """
+    if model is None:
+        model, output_dimension = active_model("text")
+    embeddings: list = []
+    tokens_used = 0
+    for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+        batch = chunks[i:i + EMBED_BATCH_SIZE]
+        texts = [chunk_embedding_text(c, title) for c in batch]
+        response = co.embed(
+            texts=texts,
+            model=model,
+            input_type="search_document",
+            embedding_types=["float"],
+            output_dimension=output_dimension
+        )
+        embeddings.extend(response.embeddings.float_)
+        if response.meta and response.meta.billed_units:
+            tokens_used += int(response.meta.billed_units.input_tokens or 0)
+        else:
+            tokens_used += sum(len(t.split()) for t in texts)
+    return embeddings, tokens_used
+
+
+def store_chunks(
+    conn,
+    document_id: int,
+    tenant_id: str,
+    chunks: list[dict],
+    embeddings: list,
+    embedding_model: Optional[str] = None
+) -> int:
+    """
+    Replace a document's chunks inside the caller's transaction (no commit).
+    embedding_model is the model passed to embed_chunks (default: active).
+
+    Returns:
+        number of chunks written
+    """
+    if embedding_model is None:
+        embedding_model = active_model("text")[0]
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM document_chunks WHERE document_id = %s", (document_id,))
+    if chunks:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO document_chunks
+                (document_id, tenant_id, chunk_index, page_number, heading,
+                 char_start, char_end, content, embedding, embedding_model, chunk_hash)
+            VALUES %s
+            """,
+            [
+                (document_id, tenant_id, c["chunk_index"], c["page_number"], c["heading"],
+                 c["char_start"], c["char_end"], c["content"], embedding, embedding_model,
+                 chunk_hash(c))
+                for c, embedding in zip(chunks, embeddings)
+            ],
+            template="(%s, %s::uuid, %s, %s, %s, %s, %s, %s, %s::vector, %s, %s)",
+            page_size=100
+        )
+    cursor.execute(
+        "UPDATE family_documents SET chunk_count = %s WHERE id = %s",
+        (len(chunks), document_id)
+    )
+    cursor.close()
+    return len(chunks)
+
+
+def _edit_size(added: str, removed: list[str], removed_chars: int) -> int:
+    """Approximate characters changed between removed and replacement chunk text."""
+    old = "".join(removed)
+    if not old or not added or len(old) + len(added) > EDIT_DIFF_MAX_CHARS:
+        return max(len(added), removed_chars)
+    # Overlap between neighbouring chunks is counted twice; close enough for a threshold
+    matched = sum(block.size for block in SequenceMatcher(None, old, added, autojunk=False).get_matching_blocks())
+    return max(len(old), len(added)) - matched
+
+
+def reembed_changed_content(
+    conn,
+    co,
+    document_id: int,
+    tenant_id: str,
+    title: Optional[str],
+    content: str
+) -> dict:
+    """
+    Re-chunk a document after its content was edited, inside the caller's
+    transaction (no commit). Call after family_documents.content is updated.
+
+    Chunks whose hash matches a stored chunk embedded with the active model
+    keep that embedding; only new or changed chunks are embedded. The
+    document vector is re-embedded when it is missing, from another model,
+    or edits since it was embedded (embedding_drift_chars) reach
+    DOCUMENT_REEMBED_DRIFT of the content. Its related-documents lists
+    follow a re-embed (document_neighbors.py).
+
+    Returns:
+        dict with chunks, chunks_embedded, chunks_reused, document_embedded, tokens_used
+    """
+    model, output_dimension = active_model("text")
+    cursor = conn.cursor()
+
+    # Legacy chunks have no hash; hash them from their columns instead.
+    # Old text is kept to size the edit against the chunks that replace it.
+    cursor.execute("""
+        SELECT chunk_hash, content, heading, page_number, length(content), embedding
+        FROM document_chunks
+        WHERE document_id = %s AND embedding_model = %s AND embedding IS NOT NULL
+    """, (document_id, model))
+    stored = {}
+    stored_text = {}
+    for stored_hash, old_text, heading, page_number, length, embedding in cursor.fetchall():
+        if stored_hash is None:
+            stored_hash = chunk_hash({"content": old_text, "heading": heading, "page_number": page_number})
+        stored[stored_hash] = (embedding, length)
+        stored_text[stored_hash] = old_text
+
+    chunks = build_chunks(content)
+    hashes = [chunk_hash(c) for c in chunks]
+    changed = [c for c, h in zip(chunks, hashes) if h not in stored]
+    new_embeddings, tokens_used = (
+        embed_chunks(co, changed, title, model, output_dimension) if changed else ([], 0)
+    )
+    new_by_hash = dict(zip((chunk_hash(c) for c in changed), new_embeddings))
+    embeddings = [new_by_hash[h] if h in new_by_hash else stored[h][0] for h in hashes]
+    count = store_chunks(conn, document_id, tenant_id, chunks, embeddings, model)
+
+    kept = set(hashes)
+    removed = [h for h in stored if h not in kept]
+    drift = _edit_size(
+        "".join(c["content"] for c in changed),
+        [stored_text.get(h, "") for h in removed],
+        sum(stored[h][1] or 0 for h in removed)
+    )
+
+    cursor.execute("""
+        SELECT embedding IS NULL, embedding_model, COALESCE(embedding_drift_chars, 0)
+        FROM family_documents WHERE id = %s
+    """, (document_id,))
+    missing, document_model, previous_drift = cursor.fetchone()
+    drift += previous_drift
+
+    document_embedded = bool(content) and (
+        missing or document_model != model or drift >= DOCUMENT_REEMBED_DRIFT * len(content)
+    )
+    if document_embedded:
+        response = co.embed(
+            texts=[content],
+            model=model,
+            input_type="search_document",
+            embedding_types=["float"],
+            output_dimension=output_dimension
+        )
+        if response.meta and response.meta.billed_units:
+            tokens_used += int(response.meta.billed_units.input_tokens or 0)
+        else:
+            tokens_used += len(content.split())
+        cursor.execute("""
+            UPDATE family_documents
+            SET embedding = %s::vector, embedding_model = %s, embedding_drift_chars = 0
+            WHERE id = %s
+        """, (list(response.embeddings.float_[0]), model, document_id))
+        update_document_neighbors(conn, document_id)
+    else:
+        cursor.execute(
+            "UPDATE family_documents SET embedding_drift_chars = %s WHERE id = %s",
+            (drift, document_id)
+        )
+    cursor.close()
+
+    return {
+        "chunks": count,
+        "chunks_embedded": len(changed),
+        "chunks_reused": count - len(changed),
+        "document_embedded": document_embedded,
+        "tokens_used": tokens_used
+    }
+
+
+def search_chunks(
+    cursor,
+    query_embedding,
+    query_text: str,
+    tenant_id: str,
+    visibility_filter: str = "",
+    visibility_params: Optional[list] = None,
+    limit: int = 40,
+    precision: str = "full",
+    vector_scopes: Optional[list] = None
+) -> list[dict]:
+    """
+    Hybrid (vector + full-text, RRF-fused) chunk search joined to the
+    visible parent documents, best first.
+
+    visibility_filter and vector_scopes come from document_access.access_filter
+    (alias "dc", id_column "document_id", assigned_alias "fd"). precision selects a
+    quantized first stage (see vector_quantization.py); small tenants are
+    scanned exactly and others search their bucket's index
+    (vector_partitions.py).
+    """
+    precision, bucket_filter = plan_vector_search(cursor, tenant_id, "document_chunks", precision, "dc")
+    cte_sql, cte_params = hybrid_cte(
+        from_sql="document_chunks dc JOIN family_documents fd ON fd.id = dc.document_id",
+        id_expr="dc.id",
+        tsv_expr="dc.search_tsv",
+        where_sql=f"dc.tenant_id = %s::uuid {visibility_filter}",
+        where_params=[tenant_id] + list(visibility_params or []),
+        query_text=query_text,
+        distance_sql="dc.embedding <=> %s::vector",
+        distance_params=[query_embedding],
+        vector_where=f"dc.embedding IS NOT NULL {bucket_filter}",
+        candidates=limit,
+        precision=precision,
+        vector_columns=["dc.embedding"],
+        vector_scopes=vector_scopes,
+    )
+    cursor.execute(cte_sql + """
+        SELECT dc.document_id, fd.title, dc.content, fd.category, fd.extracted_data,
+               dc.chunk_index, dc.page_number, dc.heading,
+               fused.distance, fused.rrf_score
+        FROM fused
+        JOIN document_chunks dc ON dc.id = fused.id
+        JOIN family_documents fd ON fd.id = dc.document_id
+        ORDER BY fused.rrf_score DESC
+        LIMIT %s
+    """, cte_params + [limit])
+
+    return [
+        {
+            "document_id": row[0],
+            "title": row[1],
+            "content": row[2],
+            "category": row[3],
+            "extracted_data": row[4] or {},
+            "chunk_index": row[5],
+            "page_number": row[6],
+            "heading": row[7],
+            "distance": float(row[8]) if row[8] is not None else None,
+            "rrf_score": float(row[9]),
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+def group_chunks_by_document(
+    scored_chunks: list[dict],
+    max_documents: int = 5,
+    max_chunks_per_document: int = 3
+) -> list[dict]:
+    """
+    Collapse relevance-ordered chunks into per-document results.
+
+    Each document keeps its best chunks (in document order for readability),
+    and is ranked by its best chunk's relevance.
+    """
+    documents: dict = {}
+    for chunk in scored_chunks:
+        doc_id = str(chunk["document_id"])
+        doc = documents.get(doc_id)
+        if doc is None:
+            if len(documents) >= max_documents:
+                continue
+            doc = documents[doc_id] = {
+                "id": doc_id,
+                "title": chunk["title"],
+                "category": chunk["category"],
+                "extracted_data": chunk.get("extracted_data") or {},
+                "relevance": chunk["relevance"],
+                "chunks": [],
+            }
+        if len(doc["chunks"]) < max_chunks_per_document:
+            doc["chunks"].append(chunk)
+
+    results = []
+    for doc in documents.values():
+        ordered = sorted(doc["chunks"], key=lambda c: c.get("chunk_index") or 0)
+        parts = []
+        for c in ordered:
+            label = f"[Page {c['page_number']}] " if c.get("page_number") else ""
+            parts.append(f"{label}{c['content']}")
+        doc["content"] = "\n...\n".join(parts)
+        doc["chunks"] = [
+            {
+                "chunk_index": c.get("chunk_index"),
+                "page_number": c.get("page_number"),
+                "heading": c.get("heading"),
+                "relevance": c["relevance"],
+            }
+            for c in ordered
+        ]
+        results.append(doc)
+    return results
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(document_id: int, tenant_id: str) -> dict:
+    """
+    Re-chunk and re-embed an existing document (backfill for documents
+    embedded before chunking existed, or after content edits).
+
+    Args:
+        document_id: family_documents.id
+        tenant_id: UUID for data isolation
+
+    Returns:
+        dict with document_id, chunks, tokens_used
+    """
+    import cohere
+    import wmill
+
+    co = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT title, content FROM family_documents WHERE id = %s AND tenant_id = %s::uuid",
+            (document_id, tenant_id)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        if not row:
+            raise ValueError(f"Document {document_id} not found")
+
+        title, content = row
+        chunks = build_chunks(content or "")
+        model, output_dimension = active_model("text")
+        embeddings, tokens_used = embed_chunks(co, chunks, title, model, output_dimension)
+        count = store_chunks(conn, document_id, tenant_id, chunks, embeddings, model)
+        conn.commit()
+
+    return {"document_id": document_id, "chunks": count, "tokens_used": tokens_used}
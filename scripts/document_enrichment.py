@@ -0,0 +1,356 @@
+# document_enrichment.py
+# Windmill Python library - Single-pass document enrichment
+# Path: f/chatbot/document_enrichment
+#
+# requirements:
+#   - cohere
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Single-Pass Document Enrichment for Archevi
+===========================================
+
+An upload used to read the same content in up to four model calls: a
+co.chat for tags and a co.embed for categorization at ingest, then
+extract_document_data (co.chat) and generate_timeline_events (Groq) when
+the user opened those features. enrich_document() asks one Cohere chat
+call, constrained by a JSON schema, for all of it:
+
+- category (from the caller's allowed list; the keyword/centroid guess,
+  computed from the ingest embedding, is passed in as a hint)
+- tags
+- expiry / renewal / due dates
+- extracted items, summary and document type (extract_document_data format)
+- timeline events (generate_timeline_events format)
+
+The ingest scripts store the result in the same transaction as the
+document: tags and dates in metadata, items in extracted_data (so
+extract_document_data answers from the stored data), and events in
+timeline_events (store_enrichment), which generate_timeline_events then
+returns instead of extracting again.
+
+Usage:
+    from document_enrichment import enrich_document, store_enrichment
+
+    enrichment = enrich_document(co, content, title, categories, category_hint, tenant_id)
+    ...  # INSERT the document with enrichment["tags"] / ["expiry_dates"]
+    store_enrichment(cursor, tenant_id, document_id, enrichment)
+    conn.commit()
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_enrichment
+- This is a library module (no main)
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import json
+import time
+
+import cohere
+import psycopg2
+
+from extract_document_data import CATEGORY_HINTS, DATA_TYPES, extract_patterns, organize_extracted_data
+from usage_sink import record_usage
+
+
+CONTENT_MAX_CHARS = 8000
+SHORT_CONTENT_CHARS = 4000  # Below this the small model is enough
+SMALL_MODEL = "command-r7b-12-2024"
+LARGE_MODEL = "command-a-03-2025"
+
+EVENT_TYPES = [
+    'birth', 'death', 'wedding', 'anniversary', 'graduation', 'medical', 'legal',
+    'financial', 'insurance', 'purchase', 'travel', 'milestone', 'photo', 'other'
+]
+DATE_TYPES = ['expiry', 'validity', 'renewal', 'due_date', 'policy_end', 'effective_end']
+
+
+def enrichment_schema(categories: List[str]) -> Dict[str, Any]:
+    """JSON schema for the enrichment response."""
+    return {
+        "type": "object",
+        "required": ["category", "tags", "summary", "document_type", "items", "expiry_dates", "events"],
+        "properties": {
+            "category": {"type": "string", "enum": categories},
+            "tags": {"type": "array", "items": {"type": "string"}},
+            "summary": {"type": "string"},
+            "document_type": {"type": "string"},
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["label", "value", "type", "importance"],
+                    "properties": {
+                        "label": {"type": "string"},
+                        "value": {"type": "string"},
+                        "type": {"type": "string", "enum": DATA_TYPES},
+                        "importance": {"type": "string", "enum": ["high", "medium", "low"]}
+                    }
+                }
+            },
+            "expiry_dates": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["date", "type"],
+                    "properties": {
+                        "date": {"type": "string"},
+                        "type": {"type": "string", "enum": DATE_TYPES}
+                    }
+                }
+            },
+            "events": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["event_date", "event_type", "title"],
+                    "properties": {
+                        "event_date": {"type": "string"},
+                        "event_end_date": {"type": "string"},
+                        "event_type": {"type": "string", "enum": EVENT_TYPES},
+                        "title": {"type": "string"},
+                        "description": {"type": "string"},
+                        "family_member_name": {"type": "string"},
+                        "confidence": {"type": "number"}
+                    }
+                }
+            }
+        }
+    }
+
+
+def build_enrichment_prompt(content: str, title: str, category_hint: Optional[str]) -> str:
+    """One prompt covering tags, category, dates, extracted data and timeline events."""
+    hint = CATEGORY_HINTS.get(category_hint or 'general', CATEGORY_HINTS['general'])
+
+    return f"""Analyze this family document once and return everything below as JSON.
+
+DOCUMENT TITLE: {title}
+LIKELY CATEGORY: {category_hint or 'unknown'} ({hint})
+
+1. category: the best category from the allowed list (keep the likely category unless the content clearly says otherwise)
+2. tags: 3-5 relevant lowercase single-word tags
+3. summary: a 1-2 sentence summary; document_type: the specific type (e.g. "Auto Insurance Policy", "Lab Results")
+4. items: ALL key data actually in the document, each with
+   - label: specific name (not "Date" but "Policy Effective Date")
+   - value: the value from the document (dates as YYYY-MM-DD, amounts with units)
+   - type: date, amount, person, organization, reference, contact, location, duration, percentage or text
+   - importance: high (expiry dates, totals, primary people, policy/account numbers), medium or low
+5. expiry_dates: expiry, validity, renewal, due and policy end dates as YYYY-MM-DD
+6. events: significant dated events for a family timeline (births, weddings, appointments, purchases,
+   coverage periods...). event_date as YYYY-MM-DD (YYYY-01-01 if only the year is known), optional
+   event_end_date, title (max 100 chars), description, family_member_name if mentioned, confidence 0-1.
+   Not every date is an event.
+
+Only include what is in the document; use empty arrays when nothing applies.
+
+DOCUMENT CONTENT:
+{content[:CONTENT_MAX_CHARS]}"""
+
+
+def clean_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalize extracted items the way extract_document_data does."""
+    valid_items = []
+    for item in items:
+        if not all(k in item for k in ['label', 'value', 'type', 'importance']):
+            continue
+        item['type'] = str(item['type']).lower()
+        if item['type'] not in DATA_TYPES:
+            item['type'] = 'text'
+        item['importance'] = str(item['importance']).lower()
+        if item['importance'] not in ['high', 'medium', 'low']:
+            item['importance'] = 'medium'
+        if item['value'] and str(item['value']).strip():
+            valid_items.append(item)
+    return valid_items
+
+
+def parse_date(date_str: Optional[str]) -> Optional[str]:
+    """Parse various date formats into YYYY-MM-DD."""
+    if not date_str:
+        return None
+
+    formats = [
+        '%Y-%m-%d',
+        '%Y/%m/%d',
+        '%m/%d/%Y',
+        '%d/%m/%Y',
+        '%B %d, %Y',
+        '%b %d, %Y',
+        '%Y-%m',
+        '%Y',
+    ]
+
+    for fmt in formats:
+        try:
+            return datetime.strptime(str(date_str).strip(), fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+
+    return None
+
+
+def enrich_document(
+    co: cohere.ClientV2,
+    content: str,
+    title: str,
+    categories: List[str],
+    category_hint: Optional[str] = None,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Tags, category, dates, extracted data and timeline events in one chat call.
+
+    Args:
+        co: Cohere client
+        content: Document text
+        title: Document title
+        categories: Allowed categories
+        category_hint: Keyword/centroid guess, used as context
+        tenant_id: For usage tracking
+
+    Returns:
+        dict: {category, tags, expiry_dates, extracted_data, events, tokens, model}
+        (empty values and an "error" key if the call failed)
+    """
+    model = SMALL_MODEL if len(content) < SHORT_CONTENT_CHARS else LARGE_MODEL
+    result = {
+        'category': None,
+        'tags': [],
+        'expiry_dates': [],
+        'extracted_data': None,
+        'events': [],
+        'tokens': 0,
+        'model': model
+    }
+
+    start = time.time()
+    try:
+        response = co.chat(
+            model=model,
+            messages=[{"role": "user", "content": build_enrichment_prompt(content, title, category_hint)}],
+            response_format={"type": "json_object", "json_schema": enrichment_schema(categories)},
+            temperature=0.1
+        )
+        enrichment = json.loads(response.message.content[0].text)
+    except Exception as e:
+        print(f"[Enrichment] Failed: {type(e).__name__}: {e}")
+        record_usage(
+            tenant_id=tenant_id, provider="cohere", endpoint="chat", model=model,
+            latency_ms=int((time.time() - start) * 1000), success=False,
+            operation="document_enrichment", error_message=str(e)[:500]
+        )
+        result['error'] = str(e)
+        return result
+
+    billed = response.usage.billed_units if response.usage and response.usage.billed_units else None
+    input_tokens = int(billed.input_tokens or 0) if billed else 0
+    output_tokens = int(billed.output_tokens or 0) if billed else 0
+    record_usage(
+        tenant_id=tenant_id, provider="cohere", endpoint="chat", model=model,
+        input_tokens=input_tokens, output_tokens=output_tokens,
+        latency_ms=int((time.time() - start) * 1000),
+        operation="document_enrichment"
+    )
+    result['tokens'] = input_tokens + output_tokens
+
+    if enrichment.get('category') in categories:
+        result['category'] = enrichment['category']
+
+    result['tags'] = [
+        t.lower().strip() for t in enrichment.get('tags') or []
+        if isinstance(t, str) and t.strip() and len(t) < 30
+    ][:5]
+
+    for d in enrichment.get('expiry_dates') or []:
+        date = parse_date(d.get('date'))
+        if date and d.get('type') in DATE_TYPES:
+            result['expiry_dates'].append({'date': date, 'type': d['type'], 'confidence': 0.8})
+
+    # Same merge as extract_document_data: AI items first, then regex items it missed
+    items = clean_items(enrichment.get('items') or [])
+    ai_values = set(str(item['value']).lower() for item in items)
+    items += [p for p in extract_patterns(content) if str(p['value']).lower() not in ai_values]
+    result['extracted_data'] = organize_extracted_data(
+        items, enrichment.get('summary', ''), enrichment.get('document_type', '')
+    )
+
+    result['events'] = enrichment.get('events') or []
+    return result
+
+
+def store_timeline_events(
+    cursor,
+    tenant_id: str,
+    document_id: int,
+    events: List[Dict[str, Any]],
+    user_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Insert extracted events into timeline_events inside the caller's
+    transaction. Events without a parseable date are skipped.
+
+    Returns:
+        the events created ({id, event_date, event_type, title, confidence})
+    """
+    events_created = []
+    for event in events:
+        event_date = parse_date(event.get('event_date', ''))
+        if not event_date:
+            continue
+
+        event_type = event.get('event_type', 'other')
+        if event_type not in EVENT_TYPES:
+            event_type = 'other'
+        event_title = (event.get('title') or '')[:255]
+        confidence = event.get('confidence', 0.7)
+
+        cursor.execute("""
+            INSERT INTO timeline_events (
+                tenant_id, event_date, event_end_date, event_type,
+                title, description, document_id, family_member_name,
+                source, confidence, extracted_data, created_by
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (
+            tenant_id, event_date, parse_date(event.get('event_end_date')), event_type,
+            event_title, event.get('description', ''), document_id, event.get('family_member_name'),
+            'extracted', confidence, json.dumps(event), user_id
+        ))
+
+        events_created.append({
+            'id': cursor.fetchone()[0],
+            'event_date': event_date,
+            'event_type': event_type,
+            'title': event_title,
+            'confidence': confidence,
+        })
+    return events_created
+
+
+def store_enrichment(cursor, tenant_id: str, document_id: int, enrichment: Dict[str, Any]) -> int:
+    """
+    Write extracted_data and timeline events for a new document (no commit).
+    A timeline failure is rolled back to a savepoint so the document is
+    still stored. Returns the number of events created.
+    """
+    if enrichment.get('extracted_data'):
+        cursor.execute(
+            "UPDATE family_documents SET extracted_data = %s WHERE id = %s",
+            (json.dumps(enrichment['extracted_data']), document_id)
+        )
+
+    if not enrichment.get('events'):
+        return 0
+    cursor.execute("SAVEPOINT enrichment_events")
+    try:
+        created = store_timeline_events(cursor, tenant_id, document_id, enrichment['events'])
+    except psycopg2.Error as e:
+        print(f"[Enrichment] Timeline events not stored: {e}")
+        cursor.execute("ROLLBACK TO SAVEPOINT enrichment_events")
+        return 0
+    cursor.execute("RELEASE SAVEPOINT enrichment_events")
+    return len(created)
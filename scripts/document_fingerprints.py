@@ -0,0 +1,259 @@
+# document_fingerprints.py
+# Windmill Python library - Exact and near-duplicate document detection
+# Path: f/chatbot/document_fingerprints
+#
+# requirements:
+#   - numpy
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Document Fingerprints for Archevi
+=================================
+
+Duplicate checks for the ingest scripts, answered from indexes:
+
+- Exact: SHA-256 of the normalized title + content in
+  family_documents.content_hash, indexed per tenant (migration 025).
+- Near: a 64-bit SimHash of the content's word 3-shingles in
+  document_fingerprints. Two documents whose fingerprints differ in at most
+  NEAR_DUPLICATE_MAX_DISTANCE bits (default 3) are near-duplicates, e.g. a
+  second scan or export of the same paper. The fingerprint is stored as
+  four 16-bit bands, each indexed; by pigeonhole any fingerprint within 3
+  bits matches at least one band exactly, so candidates come from four
+  index lookups and only those few are compared.
+
+Documents shorter than MIN_SHINGLES shingles get no fingerprint (too little
+text to tell a re-scan from a different short note) and are only checked
+for exact duplicates.
+
+Usage:
+    from document_fingerprints import compute_content_hash, simhash, find_duplicate, store_fingerprint
+
+    content_hash = compute_content_hash(content, title)
+    fingerprint = simhash(content)
+    existing = find_duplicate(conn, tenant_id, content_hash, fingerprint)
+    ...
+    store_fingerprint(conn, document_id, tenant_id, content_hash, fingerprint)
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_fingerprints
+- This is a library module; main() fingerprints documents that lack one
+"""
+
+from typing import Any, Dict, Optional
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from db_pool import get_connection
+
+
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 20
+BANDS = 4
+BAND_BITS = 16
+MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3"))
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def compute_content_hash(content: str, title: str) -> str:
+    """
+    Compute a SHA-256 hash of the document content for duplicate detection.
+    Uses normalized content (lowercase, whitespace-trimmed) for consistency.
+    """
+    normalized = ' '.join(content.lower().split())
+    normalized_title = ' '.join((title or '').lower().split())
+    combined = f"{normalized_title}||{normalized}"
+    return hashlib.sha256(combined.encode('utf-8')).hexdigest()
+
+
+def simhash(content: str) -> Optional[int]:
+    """
+    64-bit SimHash of the content's word shingles, as a signed BIGINT.
+    None when the content is too short to fingerprint.
+    """
+    words = WORD_PATTERN.findall(content.lower())
+    count = len(words) - SHINGLE_SIZE + 1
+    if count < MIN_SHINGLES:
+        return None
+
+    hashes = np.fromiter(
+        (
+            int.from_bytes(
+                hashlib.blake2b(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'), digest_size=8).digest(),
+                'little'
+            )
+            for i in range(count)
+        ),
+        dtype=np.uint64,
+        count=count
+    )
+    # Bit j of every shingle hash, then a majority vote per bit
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > count
+    value = int(np.packbits(majority, bitorder='little').view('<u8')[0])
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def band_keys(fingerprint: int) -> list[int]:
+    """Split a fingerprint into BANDS indexed 16-bit values."""
+    unsigned = fingerprint & ((1 << 64) - 1)
+    mask = (1 << BAND_BITS) - 1
+    return [(unsigned >> (BAND_BITS * band)) & mask for band in range(BANDS)]
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count('1')
+
+
+def find_duplicate(
+    conn,
+    tenant_id: str,
+    content_hash: str,
+    fingerprint: Optional[int]
+) -> Optional[Dict[str, Any]]:
+    """
+    Existing document of this tenant with the same content, or nearly the same.
+
+    Returns:
+        {id, title, category, created_at, match: "exact"|"near", similarity}
+        or None
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, title, category, created_at
+            FROM family_documents
+            WHERE tenant_id = %s::uuid AND content_hash = %s
+            LIMIT 1
+        """, (tenant_id, content_hash))
+        row = cursor.fetchone()
+        if row:
+            return {
+                'id': row[0],
+                'title': row[1],
+                'category': row[2],
+                'created_at': row[3].isoformat() if row[3] else None,
+                'match': 'exact',
+                'similarity': 1.0
+            }
+
+        if fingerprint is None:
+            return None
+
+        bands = band_keys(fingerprint)
+        cursor.execute("""
+            SELECT f.simhash, d.id, d.title, d.category, d.created_at
+            FROM document_fingerprints f
+            JOIN family_documents d ON d.id = f.document_id
+            WHERE f.tenant_id = %s::uuid
+              AND (f.band0 = %s OR f.band1 = %s OR f.band2 = %s OR f.band3 = %s)
+        """, (tenant_id, *bands))
+
+        best = None
+        for candidate, doc_id, title, category, created_at in cursor.fetchall():
+            distance = hamming_distance(fingerprint, candidate)
+            if distance <= MAX_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, doc_id, title, category, created_at)
+
+        if best is None:
+            return None
+        distance, doc_id, title, category, created_at = best
+        return {
+            'id': doc_id,
+            'title': title,
+            'category': category,
+            'created_at': created_at.isoformat() if created_at else None,
+            'match': 'near',
+            'similarity': round(1 - distance / 64, 4)
+        }
+    finally:
+        cursor.close()
+
+
+def store_fingerprint(
+    conn,
+    document_id: int,
+    tenant_id: str,
+    content_hash: str,
+    fingerprint: Optional[int]
+) -> None:
+    """
+    Record a document's fingerprint inside the caller's transaction (no commit).
+    Short documents get a row without a fingerprint, so backfill skips them.
+    """
+    bands = band_keys(fingerprint) if fingerprint is not None else [None] * BANDS
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO document_fingerprints
+            (document_id, tenant_id, content_hash, simhash, band0, band1, band2, band3)
+        VALUES (%s, %s::uuid, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (document_id) DO UPDATE
+        SET tenant_id = EXCLUDED.tenant_id, content_hash = EXCLUDED.content_hash,
+            simhash = EXCLUDED.simhash, band0 = EXCLUDED.band0, band1 = EXCLUDED.band1,
+            band2 = EXCLUDED.band2, band3 = EXCLUDED.band3, updated_at = NOW()
+    """, (document_id, tenant_id, content_hash, fingerprint, *bands))
+    cursor.close()
+
+
+def backfill_fingerprints(batch_size: int = 500) -> int:
+    """
+    Fingerprint documents that have none, or whose content_hash changed since
+    (edits and version rollbacks). Returns documents processed.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT d.id, d.tenant_id::text, d.title, d.content, d.content_hash
+                FROM family_documents d
+                LEFT JOIN document_fingerprints f ON f.document_id = d.id
+                WHERE d.id > %s
+                  AND d.tenant_id IS NOT NULL AND d.content IS NOT NULL
+                  AND (f.document_id IS NULL OR f.content_hash IS DISTINCT FROM d.content_hash)
+                ORDER BY d.id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.close()
+                break
+            for doc_id, tenant_id, title, content, content_hash in rows:
+                if not content_hash:
+                    content_hash = compute_content_hash(content, title)
+                    cursor.execute(
+                        "UPDATE family_documents SET content_hash = %s WHERE id = %s",
+                        (content_hash, doc_id)
+                    )
+                store_fingerprint(conn, doc_id, tenant_id, content_hash, simhash(content))
+            conn.commit()
+            cursor.close()
+        last_id = rows[-1][0]
+        processed += len(rows)
+    return processed
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "backfill", batch_size: int = 500) -> dict:
+    """
+    Maintain document fingerprints.
+
+    Args:
+        action: "backfill" (fingerprint new, legacy and edited documents)
+        batch_size: Documents per transaction
+
+    Returns:
+        dict with the number of documents processed
+    """
+    if action == "backfill":
+        return {"success": True, "processed": backfill_fingerprints(batch_size)}
+    raise ValueError("action must be 'backfill'")
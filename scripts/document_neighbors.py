@@ -0,0 +1,402 @@
+# document_neighbors.py
+# Windmill Python library - Precomputed related-documents graph
+# Path: f/chatbot/document_neighbors
+#
+# requirements:
+#   - numpy
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Document Neighbors for Archevi
+==============================
+
+The NEIGHBOR_K most similar documents of every document (cosine similarity
+of family_documents.embedding, within its tenant) are stored in
+document_neighbors (migration 033):
+
+- rebuild_neighbors() recomputes a tenant in bulk: its embeddings are
+  loaded once, normalized, and multiplied block by block with numpy; each
+  row keeps its top K by argpartition.
+- update_document_neighbors() keeps the graph current after a document is
+  inserted or re-embedded: the document's own list comes from one nearest-
+  neighbour query (bucket index or exact scan, see vector_partitions.py);
+  of its REVERSE_CANDIDATES nearest documents, those whose list it now
+  beats take it in and drop their K+1th entry; documents that listed it
+  under its old embedding are refreshed.
+- Deletes cascade; delete_document.py refreshes the documents that listed
+  the deleted one (referrers() before, refresh_documents() after).
+
+Lists are stored regardless of visibility and filtered when read, which is
+why K is larger than the related panel shows. The same graph answers
+duplicate_candidates() (near-identical embeddings) and similar_clusters().
+
+Usage:
+    from document_neighbors import update_document_neighbors
+
+    # after the INSERT/UPDATE that wrote the document's embedding
+    update_document_neighbors(conn, document_id)
+    conn.commit()
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_neighbors
+- main(action="rebuild") recomputes one or all tenants, "refresh" one
+  document, "clusters" and "duplicates" read the graph
+"""
+
+from typing import Optional
+import os
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection
+from vector_partitions import plan_vector_search
+from vector_quantization import nearest_sql
+
+
+NEIGHBOR_K = int(os.getenv("DOCUMENT_NEIGHBORS_K", "20"))
+REVERSE_CANDIDATES = 4 * NEIGHBOR_K    # Nearest documents checked for the reverse edge
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_EMBEDDING_SIMILARITY", "0.97"))
+CLUSTER_SIMILARITY = float(os.getenv("CLUSTER_SIMILARITY", "0.85"))
+BLOCK_ROWS = 1024                      # Rows per similarity block in bulk rebuilds
+
+
+# =========================================================================
+# Bulk rebuild
+# =========================================================================
+
+def top_k_neighbors(embeddings: np.ndarray, k: int = NEIGHBOR_K) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k cosine neighbours of every row of `embeddings`, self excluded.
+
+    Returns:
+        (indices, similarities), both (rows, k) and sorted by similarity
+    """
+    rows = embeddings.shape[0]
+    k = min(k, rows - 1)
+    if k <= 0:
+        return np.empty((rows, 0), dtype=np.int64), np.empty((rows, 0), dtype=np.float32)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms == 0, 1, norms)
+
+    indices = np.empty((rows, k), dtype=np.int64)
+    similarities = np.empty((rows, k), dtype=np.float32)
+    for start in range(0, rows, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, rows)
+        block = unit[start:stop] @ unit.T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        similarities[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return indices, similarities
+
+
+def rebuild_tenant(conn, tenant_id: str) -> int:
+    """Replace a tenant's neighbour lists (caller commits). Returns rows written."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, embedding::real[]
+        FROM family_documents
+        WHERE tenant_id = %s::uuid AND embedding IS NOT NULL
+        ORDER BY id
+    """, (tenant_id,))
+    rows = cursor.fetchall()
+    cursor.execute("DELETE FROM document_neighbors WHERE tenant_id = %s::uuid", (tenant_id,))
+    if len(rows) < 2:
+        cursor.close()
+        return 0
+
+    ids = [row[0] for row in rows]
+    indices, similarities = top_k_neighbors(np.asarray([row[1] for row in rows], dtype=np.float32))
+    values = [
+        (ids[i], ids[j], tenant_id, float(similarity))
+        for i in range(len(ids))
+        for j, similarity in zip(indices[i], similarities[i])
+    ]
+    execute_values(cursor, """
+        INSERT INTO document_neighbors (document_id, neighbor_id, tenant_id, similarity)
+        VALUES %s
+    """, values, template="(%s, %s, %s::uuid, %s)", page_size=1000)
+    cursor.close()
+    return len(values)
+
+
+def rebuild_neighbors(tenant_id: Optional[str] = None) -> int:
+    """Rebuild one tenant, or every tenant (one transaction each). Returns rows."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        if tenant_id:
+            tenant_ids = [tenant_id]
+        else:
+            cursor.execute("""
+                SELECT DISTINCT tenant_id::text FROM family_documents
+                WHERE tenant_id IS NOT NULL AND embedding IS NOT NULL
+            """)
+            tenant_ids = [row[0] for row in cursor.fetchall()]
+            # Tenants whose documents all lost their embeddings
+            cursor.execute("""
+                DELETE FROM document_neighbors n
+                WHERE NOT (n.tenant_id::text = ANY(%s))
+            """, (tenant_ids,))
+        cursor.close()
+        conn.commit()
+
+        rows = 0
+        for tenant in tenant_ids:
+            rows += rebuild_tenant(conn, tenant)
+            conn.commit()
+    return rows
+
+
+# =========================================================================
+# Incremental maintenance
+# =========================================================================
+
+def _nearest(cursor, document_id: int, limit: int) -> tuple[Optional[str], list]:
+    """
+    The document's tenant and its `limit` nearest documents as
+    [(id, similarity)], best first. (None, []) without an embedding.
+    """
+    cursor.execute("""
+        SELECT tenant_id::text FROM family_documents
+        WHERE id = %s AND embedding IS NOT NULL AND tenant_id IS NOT NULL
+    """, (document_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None, []
+    tenant_id = row[0]
+
+    precision, bucket_filter = plan_vector_search(cursor, tenant_id, "family_documents", "full", "d")
+    if precision == "full":
+        # One HNSW scan returns at most ef_search rows
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(max(40, limit)),))
+        cursor.execute("SELECT set_config('hnsw.iterative_scan', 'strict_order', true)")
+    sql, params = nearest_sql(f"""
+        SELECT d.id, d.embedding <=> (SELECT embedding FROM family_documents WHERE id = %s) AS distance
+        FROM family_documents d
+        WHERE d.tenant_id = %s::uuid AND d.id <> %s AND d.embedding IS NOT NULL {bucket_filter}
+    """, "d.embedding", None, limit, precision)
+    cursor.execute(sql, [document_id, tenant_id, document_id] + params)
+    return tenant_id, [(row[0], 1 - float(row[1])) for row in cursor.fetchall()]
+
+
+def _store_list(cursor, document_id: int, tenant_id: str, neighbors: list) -> None:
+    """Replace one document's list with `neighbors` [(id, similarity)]."""
+    cursor.execute("DELETE FROM document_neighbors WHERE document_id = %s", (document_id,))
+    if neighbors:
+        execute_values(cursor, """
+            INSERT INTO document_neighbors (document_id, neighbor_id, tenant_id, similarity)
+            VALUES %s
+        """, [(document_id, n, tenant_id, s) for n, s in neighbors], template="(%s, %s, %s::uuid, %s)")
+
+
+def _trim(cursor, document_ids: list) -> None:
+    """Drop entries beyond NEIGHBOR_K from the given lists."""
+    cursor.execute("""
+        DELETE FROM document_neighbors n
+        USING (
+            SELECT document_id, neighbor_id,
+                   ROW_NUMBER() OVER (PARTITION BY document_id ORDER BY similarity DESC) AS rank
+            FROM document_neighbors
+            WHERE document_id = ANY(%s)
+        ) r
+        WHERE n.document_id = r.document_id AND n.neighbor_id = r.neighbor_id
+          AND r.rank > %s
+    """, (list(document_ids), NEIGHBOR_K))
+
+
+def referrers(conn, document_id: int) -> list[int]:
+    """Documents whose lists contain `document_id`."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT document_id FROM document_neighbors WHERE neighbor_id = %s", (document_id,))
+    ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return ids
+
+
+def refresh_documents(conn, document_ids: list) -> int:
+    """Recompute the lists of documents whose own embedding is unchanged (caller commits)."""
+    cursor = conn.cursor()
+    refreshed = 0
+    for document_id in document_ids:
+        tenant_id, neighbors = _nearest(cursor, document_id, NEIGHBOR_K)
+        if tenant_id:
+            _store_list(cursor, document_id, tenant_id, neighbors)
+            refreshed += 1
+    cursor.close()
+    return refreshed
+
+
+def update_document_neighbors(conn, document_id: int) -> dict:
+    """
+    Bring the graph up to date after a document's embedding was written
+    (new document or re-embed). Runs in the caller's transaction.
+
+    Returns:
+        dict with neighbors (the document's list size), linked (lists it
+        joined) and refreshed (lists recomputed because it moved)
+    """
+    cursor = conn.cursor()
+    # Lists built against the old embedding; refreshed once it is linked anew
+    stale = referrers(conn, document_id)
+    cursor.execute("DELETE FROM document_neighbors WHERE neighbor_id = %s", (document_id,))
+
+    tenant_id, candidates = _nearest(cursor, document_id, max(NEIGHBOR_K, REVERSE_CANDIDATES))
+    if not tenant_id:
+        cursor.execute("DELETE FROM document_neighbors WHERE document_id = %s", (document_id,))
+        cursor.close()
+        return {"neighbors": 0, "linked": 0, "refreshed": refresh_documents(conn, stale)}
+
+    _store_list(cursor, document_id, tenant_id, candidates[:NEIGHBOR_K])
+
+    # Reverse edges: join a candidate's list when it is short or we beat its worst entry
+    linked = []
+    if candidates:
+        cursor.execute("""
+            INSERT INTO document_neighbors (document_id, neighbor_id, tenant_id, similarity)
+            SELECT c.id, %s, %s::uuid, c.similarity
+            FROM unnest(%s::int[], %s::real[]) AS c(id, similarity)
+            WHERE NOT (c.id = ANY(%s))
+              AND c.similarity > COALESCE((
+                  SELECT MIN(n.similarity) FROM document_neighbors n
+                  WHERE n.document_id = c.id
+                  HAVING COUNT(*) >= %s
+              ), -2)
+            ON CONFLICT (document_id, neighbor_id) DO UPDATE
+            SET similarity = EXCLUDED.similarity, computed_at = NOW()
+            RETURNING document_id
+        """, (
+            document_id, tenant_id,
+            [c[0] for c in candidates], [c[1] for c in candidates],
+            stale, NEIGHBOR_K
+        ))
+        linked = [row[0] for row in cursor.fetchall()]
+        if linked:
+            _trim(cursor, linked)
+    cursor.close()
+
+    return {
+        "neighbors": min(len(candidates), NEIGHBOR_K),
+        "linked": len(linked),
+        "refreshed": refresh_documents(conn, stale)
+    }
+
+
+# =========================================================================
+# Reading the graph
+# =========================================================================
+
+def duplicate_candidates(
+    conn,
+    document_id: int,
+    threshold: float = DUPLICATE_SIMILARITY
+) -> list[dict]:
+    """Stored neighbours at or above `threshold` (likely the same document)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT n.neighbor_id, d.title, n.similarity
+        FROM document_neighbors n
+        JOIN family_documents d ON d.id = n.neighbor_id
+        WHERE n.document_id = %s AND n.similarity >= %s
+        ORDER BY n.similarity DESC
+    """, (document_id, threshold))
+    duplicates = [
+        {"id": row[0], "title": row[1], "similarity": round(float(row[2]), 4)}
+        for row in cursor.fetchall()
+    ]
+    cursor.close()
+    return duplicates
+
+
+def similar_clusters(
+    conn,
+    tenant_id: str,
+    threshold: float = CLUSTER_SIMILARITY,
+    min_size: int = 2
+) -> list[list[int]]:
+    """
+    Connected components of the tenant's graph over edges at or above
+    `threshold`, largest first.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT document_id, neighbor_id FROM document_neighbors
+        WHERE tenant_id = %s::uuid AND similarity >= %s
+    """, (tenant_id, threshold))
+    edges = cursor.fetchall()
+    cursor.close()
+
+    parent: dict = {}
+
+    def find(node: int) -> int:
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for a, b in edges:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    clusters: dict = {}
+    for node in parent:
+        clusters.setdefault(find(node), []).append(node)
+    return sorted(
+        (sorted(members) for members in clusters.values() if len(members) >= min_size),
+        key=len, reverse=True
+    )
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(
+    action: str = "rebuild",
+    tenant_id: Optional[str] = None,
+    document_id: Optional[int] = None,
+    threshold: Optional[float] = None
+) -> dict:
+    """
+    Maintain and query the related-documents graph.
+
+    Args:
+        action: "rebuild" (tenant_id, or every tenant when omitted),
+            "refresh" (document_id), "clusters" (tenant_id),
+            "duplicates" (document_id)
+        threshold: Similarity cut-off for clusters/duplicates
+
+    Returns:
+        dict with the action's results
+    """
+    if action == "rebuild":
+        return {"success": True, "rows": rebuild_neighbors(tenant_id)}
+
+    if action in ("refresh", "duplicates") and document_id is None:
+        raise ValueError("document_id is required")
+    if action == "clusters" and not tenant_id:
+        raise ValueError("tenant_id is required for clusters")
+
+    with get_connection(register_vector=False) as conn:
+        if action == "refresh":
+            result = update_document_neighbors(conn, document_id)
+            conn.commit()
+            return {"success": True, **result}
+        if action == "duplicates":
+            return {
+                "success": True,
+                "duplicates": duplicate_candidates(conn, document_id, threshold or DUPLICATE_SIMILARITY)
+            }
+        if action == "clusters":
+            return {
+                "success": True,
+                "clusters": similar_clusters(conn, tenant_id, threshold or CLUSTER_SIMILARITY)
+            }
+
+    raise ValueError(f"Unknown action: {action}")
@@ -0,0 +1,394 @@
+# document_ocr.py
+# Windmill Python library - Local-first OCR for PDFs and images
+# Path: f/chatbot/document_ocr
+#
+# requirements:
+#   - pymupdf
+#   - pytesseract
+#   - pillow
+#   - cohere
+#   - wmill
+
+"""
+Local-First OCR for Archevi
+===========================
+
+Every image used to go to a Cohere vision chat for OCR, scanned PDFs were
+stored without text, and ZIP and email ingest skipped images entirely.
+All ingest paths now extract text through this module:
+
+- PDFs are read page by page with PyMuPDF. Pages with a text layer
+  (TEXT_LAYER_MIN_CHARS or more) use it directly; the others are rendered
+  at OCR_DPI and OCR'd locally with Tesseract, OCR_WORKERS pages at once.
+- Images are OCR'd locally the same way.
+- Only results whose mean word confidence is below OCR_MIN_CONFIDENCE are
+  sent to the vision model (OCR_VISION_MODEL), worst pages first and at
+  most OCR_MAX_VISION_PAGES per PDF. If Tesseract is not installed on the
+  worker every OCR page goes to the vision model, as before.
+
+Language hints accept Tesseract codes ("eng", "eng+fra") or ISO 639-1
+codes ("en", "fr"). The worker needs the tesseract-ocr binary and the
+language packs in use (apt-get install tesseract-ocr tesseract-ocr-fra),
+e.g. in the Windmill worker group's init script.
+
+Usage:
+    from document_ocr import extract_pdf_text, ocr_image
+
+    pdf = extract_pdf_text(pdf_bytes, language="eng", co=co, tenant_id=tenant_id)
+    pdf["text"], pdf["ocr_pages"], pdf["vision_pages"]
+
+    image = ocr_image(image_bytes, "image/png", language="fra", co=co)
+    image["text"], image["confidence"], image["method"]  # "local" | "vision"
+
+    # In worker processes: local OCR only, escalate in the parent
+    pdf = extract_pdf_text(pdf_bytes, allow_vision=False)
+    pdf = escalate_pdf_pages(pdf, pdf_bytes, language="eng", co=co, tenant_id=tenant_id)
+
+Windmill Script Configuration:
+- Path: f/chatbot/document_ocr
+- This is a library module (no main)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import base64
+import io
+import os
+import time
+
+import fitz  # PyMuPDF
+
+from usage_sink import record_usage
+
+
+TEXT_LAYER_MIN_CHARS = 50          # Same threshold as process_pdf_pages' has_text
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WORKERS = max(1, min(4, os.cpu_count() or 1))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "70"))  # Tesseract word confidence, 0-100
+OCR_MAX_VISION_PAGES = int(os.getenv("OCR_MAX_VISION_PAGES", "10"))
+OCR_VISION_MODEL = os.getenv("OCR_VISION_MODEL", "command-a-vision-07-2025")
+
+# ISO 639-1 hints to Tesseract language packs
+TESSERACT_LANGUAGES = {
+    'en': 'eng', 'fr': 'fra', 'es': 'spa', 'de': 'deu', 'it': 'ita',
+    'pt': 'por', 'nl': 'nld', 'pl': 'pol', 'zh': 'chi_sim', 'ja': 'jpn',
+}
+
+
+class OCRUnavailable(Exception):
+    """Raised when Tesseract (pytesseract or the binary) is not installed."""
+    pass
+
+
+def tesseract_language(language: Optional[str]) -> str:
+    """Normalize a language hint to Tesseract codes ("en+fr" -> "eng+fra")."""
+    if not language:
+        return 'eng'
+    parts = [p.strip().lower() for p in language.replace(',', '+').split('+') if p.strip()]
+    return '+'.join(TESSERACT_LANGUAGES.get(p, p) for p in parts) or 'eng'
+
+
+def media_type_for(content_type: str) -> Optional[str]:
+    """Vision model media type, None for formats it doesn't accept (BMP, TIFF)."""
+    for kind in ("png", "webp", "gif"):
+        if kind in content_type:
+            return f"image/{kind}"
+    if "jpeg" in content_type or "jpg" in content_type:
+        return "image/jpeg"
+    return None
+
+
+def local_ocr(image_bytes: bytes, language: str = 'eng') -> tuple[str, float]:
+    """
+    OCR an image with Tesseract.
+
+    Returns:
+        (text with line and block breaks, mean word confidence 0-100 weighted by word length)
+    """
+    try:
+        import pytesseract
+        from PIL import Image, ImageOps
+    except ImportError as e:
+        raise OCRUnavailable(str(e))
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("L")
+    try:
+        data = pytesseract.image_to_data(
+            image, lang=tesseract_language(language), output_type=pytesseract.Output.DICT
+        )
+    except pytesseract.TesseractNotFoundError as e:
+        raise OCRUnavailable(str(e))
+
+    lines: dict = {}
+    weighted = chars = 0.0
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        weighted += confidence * len(word)
+        chars += len(word)
+
+    parts = []
+    previous_block = None
+    for key in sorted(lines):
+        if previous_block is not None and key[0] != previous_block:
+            parts.append("")
+        parts.append(" ".join(lines[key]))
+        previous_block = key[0]
+
+    return "\n".join(parts), (weighted / chars if chars else 0.0)
+
+
+_vision_client = None
+
+
+def _get_vision_client():
+    """Cohere client for escalations when the caller didn't pass one (e.g. in worker processes)."""
+    global _vision_client
+    if _vision_client is None:
+        import cohere
+        import wmill
+        _vision_client = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+    return _vision_client
+
+
+def vision_ocr(
+    image_bytes: bytes,
+    content_type: str = "image/jpeg",
+    language: str = 'eng',
+    co=None,
+    tenant_id: Optional[str] = None
+) -> str:
+    """Transcribe an image with the Cohere vision model."""
+    co = co or _get_vision_client()
+    media_type = media_type_for(content_type)
+    if media_type is None:
+        from PIL import Image
+        png = io.BytesIO()
+        Image.open(io.BytesIO(image_bytes)).save(png, format="PNG")
+        image_bytes, media_type = png.getvalue(), "image/png"
+    data_uri = f"data:{media_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+    prompt = f"""Extract ALL text from this image. This is a scanned document.
+
+Language hint: {language}
+
+Instructions:
+1. Extract every word visible in the image
+2. Preserve the original structure/layout as much as possible
+3. Include headers, body text, and any small print
+4. If you see dates, amounts, or numbers, include them exactly as shown
+
+Return ONLY the extracted text, no commentary."""
+
+    start = time.time()
+    try:
+        response = co.chat(
+            model=OCR_VISION_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": data_uri}},
+                    {"type": "text", "text": prompt}
+                ]
+            }]
+        )
+    except Exception as e:
+        record_usage(
+            tenant_id=tenant_id, provider="cohere", endpoint="chat", model=OCR_VISION_MODEL,
+            latency_ms=int((time.time() - start) * 1000), success=False,
+            operation="ocr_vision", error_message=str(e)[:500]
+        )
+        raise
+
+    billed = response.usage.billed_units if response.usage and response.usage.billed_units else None
+    record_usage(
+        tenant_id=tenant_id, provider="cohere", endpoint="chat", model=OCR_VISION_MODEL,
+        input_tokens=int(billed.input_tokens or 0) if billed else 0,
+        output_tokens=int(billed.output_tokens or 0) if billed else 0,
+        latency_ms=int((time.time() - start) * 1000),
+        operation="ocr_vision"
+    )
+    return response.message.content[0].text.strip()
+
+
+def ocr_image(
+    image_bytes: bytes,
+    content_type: str = "image/jpeg",
+    language: str = 'eng',
+    co=None,
+    tenant_id: Optional[str] = None,
+    allow_vision: bool = True
+) -> dict:
+    """
+    OCR an image locally and escalate to the vision model when confidence is low.
+
+    With allow_vision=False the local result is returned with escalate=True
+    instead; pass it to escalate_image() later (e.g. in the parent of a
+    worker process, where usage can be recorded safely).
+
+    Returns:
+        dict: {text, confidence (local, 0-100, None if Tesseract is unavailable), method, escalate}
+    """
+    try:
+        text, confidence = local_ocr(image_bytes, language)
+    except OCRUnavailable as e:
+        print(f"[document_ocr] Local OCR unavailable: {e}")
+        text, confidence = "", None
+
+    result = {"text": text, "confidence": confidence, "method": "local", "escalate": False}
+    if text.strip() and confidence is not None and confidence >= OCR_MIN_CONFIDENCE:
+        return result
+    result["escalate"] = True
+    if not allow_vision:
+        return result
+    return escalate_image(image_bytes, result, content_type, language, co, tenant_id)
+
+
+def escalate_image(
+    image_bytes: bytes,
+    result: dict,
+    content_type: str = "image/jpeg",
+    language: str = 'eng',
+    co=None,
+    tenant_id: Optional[str] = None
+) -> dict:
+    """Vision OCR for an ocr_image() result marked escalate; keeps the local text if it fails."""
+    if not result.get("escalate"):
+        return result
+    try:
+        vision_text = vision_ocr(image_bytes, content_type, language, co, tenant_id)
+    except Exception as e:
+        if not result["text"].strip():
+            raise
+        print(f"[document_ocr] Vision OCR failed, keeping local text: {e}")
+        return {**result, "escalate": False}
+    return {**result, "text": vision_text, "method": "vision", "escalate": False}
+
+
+def _render_page(page: fitz.Page) -> bytes:
+    """Render a PDF page to PNG at OCR_DPI."""
+    return page.get_pixmap(dpi=OCR_DPI, alpha=False).tobytes("png")
+
+
+def _local_page(item: tuple[int, bytes], language: str) -> tuple[int, str, Optional[float], bool]:
+    """OCR one rendered page: (page_number, text, confidence, needs vision OCR)."""
+    page_number, image = item
+    try:
+        text, confidence = local_ocr(image, language)
+    except OCRUnavailable:
+        return page_number, "", None, True
+    return page_number, text, confidence, not (text.strip() and confidence >= OCR_MIN_CONFIDENCE)
+
+
+def extract_pdf_text(
+    pdf_bytes: bytes,
+    language: str = 'eng',
+    co=None,
+    tenant_id: Optional[str] = None,
+    allow_vision: bool = True,
+    workers: int = OCR_WORKERS,
+    max_vision_pages: int = OCR_MAX_VISION_PAGES
+) -> dict:
+    """
+    Extract a PDF's text: text layer where present, local OCR for the other
+    pages, vision OCR for the lowest-confidence OCR pages.
+
+    With allow_vision=False the numbers of those pages are returned in
+    `escalate` (worst first, at most max_vision_pages) for
+    escalate_pdf_pages() to finish; rendered pages are not kept.
+
+    Returns:
+        dict: {
+            text: str ("--- Page N ---" sections),
+            pages: int,
+            text_layer_pages: int,
+            ocr_pages: int,
+            vision_pages: int,
+            confidence: float | None (mean local OCR confidence of OCR'd pages),
+            page_texts: {page_number: text},
+            escalate: [page_number] still to send to the vision model
+        }
+    """
+    page_texts: dict = {}
+    ocr_results = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        total_pages = doc.page_count
+        batch = []
+        for page in doc:
+            text = page.get_text().strip()
+            if len(text) >= TEXT_LAYER_MIN_CHARS:
+                page_texts[page.number + 1] = text
+                continue
+            # Render a few pages ahead of the OCR threads, not the whole PDF
+            batch.append((page.number + 1, _render_page(page)))
+            if len(batch) >= 2 * max(1, workers):
+                ocr_results.extend(pool.map(lambda item: _local_page(item, language), batch))
+                batch = []
+        if batch:
+            ocr_results.extend(pool.map(lambda item: _local_page(item, language), batch))
+
+    confidences = []
+    escalate = []
+    for page_number, text, confidence, needs_vision in ocr_results:
+        page_texts[page_number] = text
+        if confidence is not None:
+            confidences.append(confidence)
+        if needs_vision:
+            escalate.append((confidence if confidence is not None else -1.0, page_number))
+
+    result = {
+        "text": _join_pages(page_texts),
+        "pages": total_pages,
+        "text_layer_pages": total_pages - len(ocr_results),
+        "ocr_pages": len(ocr_results),
+        "vision_pages": 0,
+        "confidence": sum(confidences) / len(confidences) if confidences else None,
+        "page_texts": page_texts,
+        "escalate": [page_number for _, page_number in sorted(escalate)[:max_vision_pages]]
+    }
+    if allow_vision:
+        return escalate_pdf_pages(result, pdf_bytes, language, co, tenant_id)
+    return result
+
+
+def escalate_pdf_pages(
+    result: dict,
+    pdf_bytes: bytes,
+    language: str = 'eng',
+    co=None,
+    tenant_id: Optional[str] = None
+) -> dict:
+    """
+    Send an extract_pdf_text() result's `escalate` pages to the vision
+    model, rendering them again from the PDF one at a time.
+    """
+    if not result.get("escalate"):
+        return result
+    page_texts = dict(result["page_texts"])
+    vision_pages = result["vision_pages"]
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page_number in result["escalate"]:
+            try:
+                image = _render_page(doc[page_number - 1])
+                page_texts[page_number] = vision_ocr(image, "image/png", language, co, tenant_id)
+                vision_pages += 1
+            except Exception as e:
+                print(f"[document_ocr] Vision OCR failed for page {page_number}: {e}")
+    return {
+        **result,
+        "text": _join_pages(page_texts),
+        "vision_pages": vision_pages,
+        "page_texts": page_texts,
+        "escalate": []
+    }
+
+
+def _join_pages(page_texts: dict) -> str:
+    return "\n\n".join(
+        f"--- Page {number} ---\n{page_texts[number]}"
+        for number in sorted(page_texts) if page_texts[number].strip()
+    )
@@ -45,7 +45,10 @@ Enhanced document embedding with AI-powered features:
 - Auto-categorization using embedding similarity
 - Smart tag extraction
 - Expiry date detection
+- Extracted data and timeline events (tags, category, dates, data and
+  events come from one enrichment call, document_enrichment.py)
 - Confidence scoring
+- Overlapping chunk embeddings for passage-level retrieval
 
 Args:
     title (str): Document title
@@ -57,6 +60,7 @@ Args:
     auto_categorize (bool): Whether to auto-detect category (default: True if no category)
     extract_tags (bool): Whether to extract smart tags (default: True)
     extract_dates (bool): Whether to extract expiry dates (default: True)
+    extract_data_enabled (bool): Whether to store extracted data and timeline events (default: True)
 
 Returns:
     dict: {
@@ -68,7 +72,10 @@ Returns:
         category_confidence: float,
         tags: list[str],
         expiry_dates: list[dict],  # [{date: str, type: str, confidence: float}]
-        ai_features_used: list[str]
+        ai_features_used: list[str],
+        extracted_item_count: int,  # items stored in extracted_data
+        timeline_events_created: int,
+        chunk_count: int  # rows written to document_chunks
     }
 """
 
@@ -80,7 +87,12 @@ import wmill
 import re
 from datetime import datetime
 import json
-import hashlib
+from document_chunks import build_chunks, embed_chunks, store_chunks
+from category_centroids import classify_embedding
+from embedding_registry import active_model
+from document_fingerprints import compute_content_hash, simhash, find_duplicate, store_fingerprint
+from document_neighbors import update_document_neighbors
+from document_enrichment import enrich_document, store_enrichment
 
 
 # Category definitions with example keywords for similarity matching
@@ -155,70 +167,32 @@ EXPIRY_PATTERNS = [
 ]
 
 
-def extract_tags_from_content(content: str, co: cohere.ClientV2, existing_tags: List[str] = None) -> List[str]:
+def extract_tags_from_content(content: str, llm_tags: Optional[List[str]] = None) -> List[str]:
     """
-    Extract meaningful tags from document content using Cohere.
-    Uses a lightweight prompt to extract key topics.
+    Merge pattern-based tags for common document types with the tags from
+    the enrichment call (document_enrichment.py). Pattern tags come first.
     """
-    # First try pattern-based extraction for common document types
-    pattern_tags = set()
-
+    pattern_tags = []
     content_lower = content.lower()
 
     # Check for document type indicators
     if any(word in content_lower for word in ['passport', 'visa']):
-        pattern_tags.add('identity')
+        pattern_tags.append('identity')
     if any(word in content_lower for word in ['prescription', 'medication', 'doctor']):
-        pattern_tags.add('health')
+        pattern_tags.append('health')
     if any(word in content_lower for word in ['invoice', 'receipt', 'payment']):
-        pattern_tags.add('payment')
+        pattern_tags.append('payment')
     if any(word in content_lower for word in ['contract', 'agreement', 'signature']):
-        pattern_tags.add('legal')
+        pattern_tags.append('legal')
     if any(word in content_lower for word in ['warranty', 'guarantee']):
-        pattern_tags.add('warranty')
+        pattern_tags.append('warranty')
     if any(word in content_lower for word in ['insurance', 'policy', 'coverage']):
-        pattern_tags.add('insurance')
+        pattern_tags.append('insurance')
     if any(word in content_lower for word in ['tax', 'irs', 'cra', 'return']):
-        pattern_tags.add('tax')
-
-    # If we found pattern tags, return them (saves API call)
-    if len(pattern_tags) >= 2:
-        return list(pattern_tags)[:5]
-
-    # Use Cohere for more sophisticated extraction
-    try:
-        # Truncate content for efficiency
-        truncated = content[:2000] if len(content) > 2000 else content
-
-        response = co.chat(
-            model="command-r7b-12-2024",
-            messages=[{
-                "role": "user",
-                "content": f"""Extract 3-5 relevant tags for this document. Return ONLY a JSON array of lowercase single-word tags.
-
-Document:
-{truncated}
-
-Return format: ["tag1", "tag2", "tag3"]"""
-            }]
-        )
+        pattern_tags.append('tax')
 
-        # Parse the response
-        response_text = response.message.content[0].text.strip()
-
-        # Try to extract JSON array
-        match = re.search(r'\[.*?\]', response_text, re.DOTALL)
-        if match:
-            tags = json.loads(match.group())
-            # Clean and validate tags
-            clean_tags = [t.lower().strip() for t in tags if isinstance(t, str) and len(t) < 30]
-            # Combine with pattern tags
-            all_tags = list(set(clean_tags) | pattern_tags)
-            return all_tags[:5]
-    except Exception:
-        pass
-
-    return list(pattern_tags)[:5] if pattern_tags else []
+    tags = list(dict.fromkeys(pattern_tags + (llm_tags or [])))
+    return tags[:5]
 
 
 def extract_expiry_dates(content: str) -> List[Dict[str, Any]]:
@@ -391,51 +365,14 @@ def clean_ocr_text(content: str) -> str:
     return result.strip()
 
 
-def compute_content_hash(content: str, title: str) -> str:
-    """
-    Compute a SHA-256 hash of the document content for duplicate detection.
-    Uses normalized content (lowercase, whitespace-trimmed) for consistency.
-    """
-    # Normalize content: lowercase, strip whitespace, remove extra spaces
-    normalized = ' '.join(content.lower().split())
-    normalized_title = ' '.join(title.lower().split())
-    # Combine title and content for the hash
-    combined = f"{normalized_title}||{normalized}"
-    return hashlib.sha256(combined.encode('utf-8')).hexdigest()
-
-
-def check_for_duplicate(conn, tenant_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
-    """
-    Check if a document with the same content hash already exists for this tenant.
-    Returns the existing document info if found, None otherwise.
-    """
-    cursor = conn.cursor()
-    try:
-        # Check metadata->content_hash for exact matches
-        cursor.execute("""
-            SELECT id, title, category, created_at
-            FROM family_documents
-            WHERE tenant_id = %s
-              AND metadata->>'content_hash' = %s
-            LIMIT 1
-        """, (tenant_id, content_hash))
-
-        row = cursor.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'title': row[1],
-                'category': row[2],
-                'created_at': row[3].isoformat() if row[3] else None
-            }
-        return None
-    finally:
-        cursor.close()
-
-
-def auto_categorize(content: str, co: cohere.ClientV2, conn) -> Dict[str, Any]:
+def auto_categorize(
+    content: str,
+    embedding: List[float],
+    conn,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
-    Auto-detect document category using embedding similarity with category exemplars.
+    Auto-detect document category using keywords, then similarity to category centroids.
     """
     # First, try keyword-based detection (fast, free)
     content_lower = content.lower()
@@ -460,60 +397,20 @@ def auto_categorize(content: str, co: cohere.ClientV2, conn) -> Dict[str, Any]:
                 'method': 'keyword'
             }
 
-    # If keywords are ambiguous, use embedding similarity
+    # If keywords are ambiguous, use the document embedding's closest category
+    # centroid (this tenant's, or global for sparse categories)
     try:
-        # Get embedding for the content
-        response = co.embed(
-            texts=[content[:5000]],  # First 5000 chars
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        query_embedding = response.embeddings.float_[0]
-
-        # Get category exemplar embeddings from database
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT category, embedding
-            FROM family_documents
-            WHERE embedding IS NOT NULL
-            GROUP BY category, embedding
-            LIMIT 50
-        """)
-
-        category_similarities = {}
-        for row in cursor.fetchall():
-            cat = row[0]
-            emb = row[1]
-            # Calculate cosine similarity
-            dot_product = sum(a * b for a, b in zip(query_embedding, emb))
-            norm_q = sum(a * a for a in query_embedding) ** 0.5
-            norm_e = sum(a * a for a in emb) ** 0.5
-            similarity = dot_product / (norm_q * norm_e) if norm_q * norm_e > 0 else 0
-
-            if cat not in category_similarities:
-                category_similarities[cat] = []
-            category_similarities[cat].append(similarity)
-
-        cursor.close()
-
-        # Average similarities per category
-        avg_similarities = {
-            cat: sum(sims) / len(sims)
-            for cat, sims in category_similarities.items()
-        }
-
-        if avg_similarities:
-            best_category = max(avg_similarities, key=avg_similarities.get)
-            confidence = avg_similarities[best_category]
+        match = classify_embedding(conn, tenant_id, embedding)
+        if match:
+            best_category, confidence = match
             return {
                 'category': best_category,
                 'confidence': confidence,
                 'method': 'embedding'
             }
     except Exception:
-        pass
+        # Keep the connection usable for the INSERT that follows
+        conn.rollback()
 
     # Fallback to keyword scores if we have any
     if keyword_scores:
@@ -543,6 +440,7 @@ def main(
     auto_categorize_enabled: bool = True,
     extract_tags_enabled: bool = True,
     extract_dates_enabled: bool = True,
+    extract_data_enabled: bool = True,
 ) -> dict:
     """
     Enhanced document embedding with AI-powered features.
@@ -582,13 +480,17 @@ def main(
 
     # Check for duplicate content BEFORE doing any expensive AI operations
     content_hash = compute_content_hash(content.strip(), title.strip())
-    existing_doc = check_for_duplicate(conn, tenant_id.strip(), content_hash)
+    fingerprint = simhash(content)
+    existing_doc = find_duplicate(conn, tenant_id.strip(), content_hash, fingerprint)
 
     if existing_doc:
         conn.close()
         return {
             "document_id": None,
-            "message": f"Duplicate document detected. This content already exists as '{existing_doc['title']}' (ID: {existing_doc['id']})",
+            "message": (
+                f"{'Near-duplicate' if existing_doc['match'] == 'near' else 'Duplicate'} document detected. "
+                f"This content already exists as '{existing_doc['title']}' (ID: {existing_doc['id']})"
+            ),
             "is_duplicate": True,
             "existing_document": existing_doc,
             "tokens_used": 0,
@@ -609,10 +511,27 @@ def main(
         'content_hash': content_hash  # Store for future duplicate detection
     }
 
-    # Auto-categorize if no category provided or if enabled
+    # Generate embedding (also used for categorization below)
+    embed_model, embed_dimension = active_model("text")
+    try:
+        response = co.embed(
+            texts=[content],
+            model=embed_model,
+            input_type="search_document",
+            embedding_types=["float"],
+            output_dimension=embed_dimension
+        )
+        embedding = response.embeddings.float_[0]
+        tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(content.split())
+    except Exception as e:
+        conn.close()
+        raise RuntimeError(f"Cohere API error: {str(e)}")
+
+    # Auto-categorize: keywords, then the embedding's closest category centroid
     final_category = category
+    cat_result = None
     if not category or (auto_categorize_enabled and category == 'general'):
-        cat_result = auto_categorize(content, co, conn)
+        cat_result = auto_categorize(content, embedding, conn, tenant_id.strip())
         if not category:
             final_category = cat_result['category']
         result['suggested_category'] = cat_result['category']
@@ -622,34 +541,57 @@ def main(
     if final_category not in valid_categories:
         final_category = 'general'
 
+    # Single-pass enrichment: tags, category, dates, extracted data and
+    # timeline events from one LLM call (document_enrichment.py)
+    enrichment = None
+    if extract_tags_enabled or extract_data_enabled:
+        enrichment = enrich_document(
+            co, content, title.strip(), valid_categories,
+            result['suggested_category'] or final_category, tenant_id.strip()
+        )
+        tokens_used += enrichment['tokens']
+        if not enrichment.get('error'):
+            ai_features_used.append('single_pass_enrichment')
+
+        # The model read the whole document; prefer it over a weak keyword/centroid guess
+        if cat_result and cat_result['method'] != 'keyword' and enrichment['category']:
+            agrees = enrichment['category'] == cat_result['category']
+            result['suggested_category'] = enrichment['category']
+            result['category_confidence'] = max(cat_result['confidence'], 0.9) if agrees else 0.75
+            if not category:
+                final_category = enrichment['category']
+            ai_features_used.append('auto_categorize:llm')
+
     # Extract tags
     if extract_tags_enabled:
-        tags = extract_tags_from_content(content, co)
+        tags = extract_tags_from_content(content, enrichment['tags'] if enrichment else None)
         result['tags'] = tags
         if tags:
             ai_features_used.append('smart_tags')
 
-    # Extract expiry dates
+    # Extract expiry dates (regex, plus dates the enrichment call found)
     if extract_dates_enabled:
         dates = extract_expiry_dates(content)
-        result['expiry_dates'] = dates
+        if enrichment:
+            seen = {d['date'] for d in dates}
+            dates += [d for d in enrichment['expiry_dates'] if d['date'] not in seen]
+        result['expiry_dates'] = dates[:5]
         if dates:
             ai_features_used.append('expiry_detection')
 
-    # Generate embedding
+    # Chunk-level embeddings for passage retrieval. A failure here only costs
+    # recall: the document is still stored and searched by its whole-document
+    # embedding (chunk_count stays 0).
+    chunks: list = []
+    chunk_embeddings: list = []
     try:
-        response = co.embed(
-            texts=[content],
-            model="embed-v4.0",
-            input_type="search_document",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        embedding = response.embeddings.float_[0]
-        tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(content.split())
+        chunks = build_chunks(content.strip())
+        chunk_embeddings, chunk_tokens = embed_chunks(co, chunks, title.strip(), embed_model, embed_dimension)
+        tokens_used += chunk_tokens
+        ai_features_used.append('chunked')
     except Exception as e:
-        conn.close()
-        raise RuntimeError(f"Cohere API error: {str(e)}")
+        print(f"Chunk embedding failed, storing document-level embedding only: {e}")
+        chunks, chunk_embeddings = [], []
 
     # Store document with enhanced metadata
     try:
@@ -671,14 +613,24 @@ def main(
 
         # Insert document with embedding and metadata
         cursor.execute("""
-            INSERT INTO family_documents (title, content, category, source_file, created_by, embedding, metadata, tenant_id, assigned_to, visibility)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO family_documents (title, content, category, source_file, created_by, embedding, embedding_model, metadata, content_hash, tenant_id, assigned_to, visibility)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """, (title.strip(), content.strip(), final_category, source_file, created_by,
-              embedding, json.dumps(metadata), tenant_id.strip(), assigned_to, final_visibility))
+              embedding, embed_model, json.dumps(metadata), content_hash, tenant_id.strip(), assigned_to, final_visibility))
 
         document_id = cursor.fetchone()[0]
 
+        if chunks:
+            store_chunks(conn, document_id, tenant_id.strip(), chunks, chunk_embeddings, embed_model)
+        store_fingerprint(conn, document_id, tenant_id.strip(), content_hash, fingerprint)
+        update_document_neighbors(conn, document_id)
+
+        # Extracted data and timeline events, committed with the document
+        timeline_events_created = 0
+        if enrichment and extract_data_enabled:
+            timeline_events_created = store_enrichment(cursor, tenant_id.strip(), document_id, enrichment)
+
         # Log API usage
         estimated_cost = tokens_used * 0.0000001
         cursor.execute("""
@@ -706,6 +658,9 @@ def main(
         "tags": result['tags'],
         "expiry_dates": result['expiry_dates'],
         "ai_features_used": ai_features_used,
+        "extracted_item_count": len(enrichment['extracted_data']['items']) if enrichment and extract_data_enabled and enrichment['extracted_data'] else 0,
+        "timeline_events_created": timeline_events_created,
+        "chunk_count": len(chunks),
         "assigned_to": assigned_to,
         "visibility": final_visibility
     }
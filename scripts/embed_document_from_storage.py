@@ -9,7 +9,9 @@
 #   - pgvector
 #   - numpy
 #   - wmill
-#   - pypdf
+#   - pymupdf
+#   - pytesseract
+#   - pillow
 #   - httpx==0.27.2
 #   Cohere SDK dependencies
 #   - fastavro
@@ -46,9 +48,12 @@ Embed documents from Supabase Storage with AI-powered features.
 
 This unified endpoint:
 1. Fetches file from Supabase Storage
-2. Extracts text (PDF, images via OCR, or plain text)
-3. Runs enhanced embedding with auto-categorization, tags, expiry dates
+2. Extracts text (PDF text layer, local OCR for scans and images with
+   vision-model escalation - document_ocr.py, or plain text)
+3. Runs enhanced embedding with auto-categorization, tags, expiry dates,
+   extracted data and timeline events (one enrichment call, document_enrichment.py)
 4. Stores document with storage_path for future reference
+5. Stores page-aware overlapping chunks (document_chunks) for passage retrieval
 
 Args:
     storage_path (str): Path to the file in Supabase Storage
@@ -62,6 +67,7 @@ Args:
     auto_categorize_enabled (bool): Whether to auto-detect category (default: True)
     extract_tags_enabled (bool): Whether to extract smart tags (default: True)
     extract_dates_enabled (bool): Whether to extract expiry dates (default: True)
+    extract_data_enabled (bool): Whether to store extracted data and timeline events (default: True)
 
 Returns:
     dict: {
@@ -77,7 +83,10 @@ Returns:
         category_confidence: float,
         tags: list[str],
         expiry_dates: list[dict],
-        ai_features_used: list[str]
+        ai_features_used: list[str],
+        extracted_item_count: int,  # items stored in extracted_data
+        timeline_events_created: int,
+        chunk_count: int  # rows written to document_chunks
     }
 """
 
@@ -86,13 +95,17 @@ import psycopg2
 from pgvector.psycopg2 import register_vector
 import httpx
 import wmill
-import io
-import base64
 from typing import Optional, List, Dict, Any
 import json
-import hashlib
 import re
 from datetime import datetime
+from document_chunks import build_chunks, embed_chunks, store_chunks
+from category_centroids import classify_embedding
+from embedding_registry import active_model
+from document_fingerprints import compute_content_hash, simhash, find_duplicate, store_fingerprint
+from document_neighbors import update_document_neighbors
+from document_enrichment import enrich_document, store_enrichment
+from document_ocr import extract_pdf_text, ocr_image
 
 
 # Category definitions with example keywords for similarity matching
@@ -169,71 +182,6 @@ def get_supabase_file(storage_path: str, supabase_url: str, supabase_key: str) -
         return response.content, content_type
 
 
-def extract_pdf_text(file_bytes: bytes) -> tuple[str, int]:
-    """Extract text from a PDF file using pypdf."""
-    from pypdf import PdfReader
-
-    pdf_file = io.BytesIO(file_bytes)
-    reader = PdfReader(pdf_file)
-
-    pages = len(reader.pages)
-    text_parts = []
-
-    for i, page in enumerate(reader.pages):
-        page_text = page.extract_text() or ""
-        if page_text.strip():
-            text_parts.append(f"--- Page {i + 1} ---\n{page_text}")
-
-    return "\n\n".join(text_parts), pages
-
-
-def extract_image_text_ocr(file_bytes: bytes, content_type: str, co: cohere.ClientV2, language: str = "eng") -> str:
-    """Extract text from an image using Cohere's vision capabilities."""
-    base64_image = base64.b64encode(file_bytes).decode("utf-8")
-
-    if "png" in content_type:
-        media_type = "image/png"
-    elif "webp" in content_type:
-        media_type = "image/webp"
-    else:
-        media_type = "image/jpeg"
-
-    response = co.chat(
-        model="command-r-plus",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": base64_image
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": f"""Extract ALL text from this image. This is a scanned document.
-
-Language hint: {language}
-
-Instructions:
-1. Extract every word visible in the image
-2. Preserve the original structure/layout as much as possible
-3. Include headers, body text, and any small print
-4. If you see dates, amounts, or numbers, include them exactly as shown
-
-Return ONLY the extracted text, no commentary."""
-                    }
-                ]
-            }
-        ]
-    )
-
-    return response.message.content[0].text.strip()
-
-
 def clean_ocr_text(content: str) -> str:
     """Clean up OCR artifacts from scanned document text."""
     if not content:
@@ -280,41 +228,13 @@ def clean_ocr_text(content: str) -> str:
     return result.strip()
 
 
-def compute_content_hash(content: str, title: str) -> str:
-    """Compute a SHA-256 hash of the document content for duplicate detection."""
-    normalized = ' '.join(content.lower().split())
-    normalized_title = ' '.join(title.lower().split())
-    combined = f"{normalized_title}||{normalized}"
-    return hashlib.sha256(combined.encode('utf-8')).hexdigest()
-
-
-def check_for_duplicate(conn, tenant_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
-    """Check if a document with the same content hash already exists."""
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT id, title, category, created_at
-            FROM family_documents
-            WHERE tenant_id = %s
-              AND metadata->>'content_hash' = %s
-            LIMIT 1
-        """, (tenant_id, content_hash))
-
-        row = cursor.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'title': row[1],
-                'category': row[2],
-                'created_at': row[3].isoformat() if row[3] else None
-            }
-        return None
-    finally:
-        cursor.close()
-
-
-def auto_categorize(content: str, co: cohere.ClientV2, conn) -> Dict[str, Any]:
-    """Auto-detect document category using keyword matching and embedding similarity."""
+def auto_categorize(
+    content: str,
+    embedding: List[float],
+    conn,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Auto-detect document category using keyword matching, then category centroid similarity."""
     content_lower = content.lower()
     keyword_scores = {}
 
@@ -336,56 +256,20 @@ def auto_categorize(content: str, co: cohere.ClientV2, conn) -> Dict[str, Any]:
                 'method': 'keyword'
             }
 
-    # Use embedding similarity if keywords inconclusive
+    # If keywords are ambiguous, use the document embedding's closest category
+    # centroid (this tenant's, or global for sparse categories)
     try:
-        response = co.embed(
-            texts=[content[:5000]],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        query_embedding = response.embeddings.float_[0]
-
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT category, embedding
-            FROM family_documents
-            WHERE embedding IS NOT NULL
-            GROUP BY category, embedding
-            LIMIT 50
-        """)
-
-        category_similarities = {}
-        for row in cursor.fetchall():
-            cat = row[0]
-            emb = row[1]
-            dot_product = sum(a * b for a, b in zip(query_embedding, emb))
-            norm_q = sum(a * a for a in query_embedding) ** 0.5
-            norm_e = sum(a * a for a in emb) ** 0.5
-            similarity = dot_product / (norm_q * norm_e) if norm_q * norm_e > 0 else 0
-
-            if cat not in category_similarities:
-                category_similarities[cat] = []
-            category_similarities[cat].append(similarity)
-
-        cursor.close()
-
-        avg_similarities = {
-            cat: sum(sims) / len(sims)
-            for cat, sims in category_similarities.items()
-        }
-
-        if avg_similarities:
-            best_category = max(avg_similarities, key=avg_similarities.get)
-            confidence = avg_similarities[best_category]
+        match = classify_embedding(conn, tenant_id, embedding)
+        if match:
+            best_category, confidence = match
             return {
                 'category': best_category,
                 'confidence': confidence,
                 'method': 'embedding'
             }
     except Exception:
-        pass
+        # Keep the connection usable for the INSERT that follows
+        conn.rollback()
 
     if keyword_scores:
         max_category = max(keyword_scores, key=keyword_scores.get)
@@ -402,55 +286,32 @@ def auto_categorize(content: str, co: cohere.ClientV2, conn) -> Dict[str, Any]:
     }
 
 
-def extract_tags_from_content(content: str, co: cohere.ClientV2) -> List[str]:
-    """Extract meaningful tags from document content."""
-    pattern_tags = set()
+def extract_tags_from_content(content: str, llm_tags: Optional[List[str]] = None) -> List[str]:
+    """
+    Merge pattern-based tags for common document types with the tags from
+    the enrichment call (document_enrichment.py). Pattern tags come first.
+    """
+    pattern_tags = []
     content_lower = content.lower()
 
+    # Check for document type indicators
     if any(word in content_lower for word in ['passport', 'visa']):
-        pattern_tags.add('identity')
+        pattern_tags.append('identity')
     if any(word in content_lower for word in ['prescription', 'medication', 'doctor']):
-        pattern_tags.add('health')
+        pattern_tags.append('health')
     if any(word in content_lower for word in ['invoice', 'receipt', 'payment']):
-        pattern_tags.add('payment')
+        pattern_tags.append('payment')
     if any(word in content_lower for word in ['contract', 'agreement', 'signature']):
-        pattern_tags.add('legal')
+        pattern_tags.append('legal')
     if any(word in content_lower for word in ['warranty', 'guarantee']):
-        pattern_tags.add('warranty')
+        pattern_tags.append('warranty')
     if any(word in content_lower for word in ['insurance', 'policy', 'coverage']):
-        pattern_tags.add('insurance')
+        pattern_tags.append('insurance')
     if any(word in content_lower for word in ['tax', 'irs', 'cra', 'return']):
-        pattern_tags.add('tax')
-
-    if len(pattern_tags) >= 2:
-        return list(pattern_tags)[:5]
-
-    try:
-        truncated = content[:2000] if len(content) > 2000 else content
-        response = co.chat(
-            model="command-r7b-12-2024",
-            messages=[{
-                "role": "user",
-                "content": f"""Extract 3-5 relevant tags for this document. Return ONLY a JSON array of lowercase single-word tags.
-
-Document:
-{truncated}
-
-Return format: ["tag1", "tag2", "tag3"]"""
-            }]
-        )
-
-        response_text = response.message.content[0].text.strip()
-        match = re.search(r'\[.*?\]', response_text, re.DOTALL)
-        if match:
-            tags = json.loads(match.group())
-            clean_tags = [t.lower().strip() for t in tags if isinstance(t, str) and len(t) < 30]
-            all_tags = list(set(clean_tags) | pattern_tags)
-            return all_tags[:5]
-    except Exception:
-        pass
+        pattern_tags.append('tax')
 
-    return list(pattern_tags)[:5] if pattern_tags else []
+    tags = list(dict.fromkeys(pattern_tags + (llm_tags or [])))
+    return tags[:5]
 
 
 def extract_expiry_dates(content: str) -> List[Dict[str, Any]]:
@@ -512,6 +373,7 @@ def main(
     auto_categorize_enabled: bool = True,
     extract_tags_enabled: bool = True,
     extract_dates_enabled: bool = True,
+    extract_data_enabled: bool = True,
 ) -> dict:
     """
     Embed a document from Supabase Storage with AI-powered features.
@@ -547,21 +409,25 @@ def main(
     extracted_text = ""
     pages = 0
     file_type = "unknown"
+    ocr_info = None
 
     storage_path_lower = storage_path.lower()
 
     if storage_path_lower.endswith(".pdf") or "pdf" in content_type:
         file_type = "pdf"
-        extracted_text, pages = extract_pdf_text(file_bytes)
+        pdf = extract_pdf_text(file_bytes, ocr_language, co, tenant_id.strip())
+        extracted_text, pages = pdf["text"], pdf["pages"]
+        ocr_info = {k: pdf[k] for k in ("ocr_pages", "vision_pages", "confidence")}
 
-        # Check if PDF is scanned (very little text)
-        if len(extracted_text.strip()) < 100 and pages > 0:
-            # Try OCR on the PDF (simplified - in production would render pages to images)
+        # Mostly scanned pages (text came from OCR)
+        if pdf["ocr_pages"] > pdf["text_layer_pages"]:
             file_type = "pdf_scanned"
 
     elif any(storage_path_lower.endswith(ext) for ext in [".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"]) or content_type.startswith("image/"):
         file_type = "image"
-        extracted_text = extract_image_text_ocr(file_bytes, content_type, co, ocr_language)
+        ocr = ocr_image(file_bytes, content_type, ocr_language, co, tenant_id.strip())
+        extracted_text = ocr["text"]
+        ocr_info = {"ocr_method": ocr["method"], "confidence": ocr["confidence"]}
         pages = 1
 
     elif any(storage_path_lower.endswith(ext) for ext in [".txt", ".md"]) or "text" in content_type:
@@ -594,13 +460,17 @@ def main(
 
     # Check for duplicate content
     content_hash = compute_content_hash(extracted_text.strip(), title.strip())
-    existing_doc = check_for_duplicate(conn, tenant_id.strip(), content_hash)
+    fingerprint = simhash(extracted_text)
+    existing_doc = find_duplicate(conn, tenant_id.strip(), content_hash, fingerprint)
 
     if existing_doc:
         conn.close()
         return {
             "document_id": None,
-            "message": f"Duplicate document detected. This content already exists as '{existing_doc['title']}' (ID: {existing_doc['id']})",
+            "message": (
+                f"{'Near-duplicate' if existing_doc['match'] == 'near' else 'Duplicate'} document detected. "
+                f"This content already exists as '{existing_doc['title']}' (ID: {existing_doc['id']})"
+            ),
             "is_duplicate": True,
             "existing_document": existing_doc,
             "storage_path": storage_path,
@@ -623,10 +493,27 @@ def main(
         'category_confidence': 1.0,
     }
 
-    # Auto-categorize
+    # Generate embedding (also used for categorization below)
+    embed_model, embed_dimension = active_model("text")
+    try:
+        response = co.embed(
+            texts=[extracted_text],
+            model=embed_model,
+            input_type="search_document",
+            embedding_types=["float"],
+            output_dimension=embed_dimension
+        )
+        embedding = response.embeddings.float_[0]
+        tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(extracted_text.split())
+    except Exception as e:
+        conn.close()
+        raise RuntimeError(f"Cohere API error: {str(e)}")
+
+    # Auto-categorize: keywords, then the embedding's closest category centroid
     final_category = category
+    cat_result = None
     if not category or (auto_categorize_enabled and category == 'general'):
-        cat_result = auto_categorize(extracted_text, co, conn)
+        cat_result = auto_categorize(extracted_text, embedding, conn, tenant_id.strip())
         if not category:
             final_category = cat_result['category']
         result['suggested_category'] = cat_result['category']
@@ -636,34 +523,57 @@ def main(
     if final_category not in valid_categories:
         final_category = 'general'
 
+    # Single-pass enrichment: tags, category, dates, extracted data and
+    # timeline events from one LLM call (document_enrichment.py)
+    enrichment = None
+    if extract_tags_enabled or extract_data_enabled:
+        enrichment = enrich_document(
+            co, extracted_text, title.strip(), valid_categories,
+            result['suggested_category'] or final_category, tenant_id.strip()
+        )
+        tokens_used += enrichment['tokens']
+        if not enrichment.get('error'):
+            ai_features_used.append('single_pass_enrichment')
+
+        # The model read the whole document; prefer it over a weak keyword/centroid guess
+        if cat_result and cat_result['method'] != 'keyword' and enrichment['category']:
+            agrees = enrichment['category'] == cat_result['category']
+            result['suggested_category'] = enrichment['category']
+            result['category_confidence'] = max(cat_result['confidence'], 0.9) if agrees else 0.75
+            if not category:
+                final_category = enrichment['category']
+            ai_features_used.append('auto_categorize:llm')
+
     # Extract tags
     if extract_tags_enabled:
-        tags = extract_tags_from_content(extracted_text, co)
+        tags = extract_tags_from_content(extracted_text, enrichment['tags'] if enrichment else None)
         result['tags'] = tags
         if tags:
             ai_features_used.append('smart_tags')
 
-    # Extract expiry dates
+    # Extract expiry dates (regex, plus dates the enrichment call found)
     if extract_dates_enabled:
         dates = extract_expiry_dates(extracted_text)
-        result['expiry_dates'] = dates
+        if enrichment:
+            seen = {d['date'] for d in dates}
+            dates += [d for d in enrichment['expiry_dates'] if d['date'] not in seen]
+        result['expiry_dates'] = dates[:5]
         if dates:
             ai_features_used.append('expiry_detection')
 
-    # Generate embedding
+    # Chunk-level embeddings for passage retrieval. A failure here only costs
+    # recall: the document is still stored and searched by its whole-document
+    # embedding (chunk_count stays 0).
+    chunks: list = []
+    chunk_embeddings: list = []
     try:
-        response = co.embed(
-            texts=[extracted_text],
-            model="embed-v4.0",
-            input_type="search_document",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        embedding = response.embeddings.float_[0]
-        tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(extracted_text.split())
+        chunks = build_chunks(extracted_text.strip())
+        chunk_embeddings, chunk_tokens = embed_chunks(co, chunks, title.strip(), embed_model, embed_dimension)
+        tokens_used += chunk_tokens
+        ai_features_used.append('chunked')
     except Exception as e:
-        conn.close()
-        raise RuntimeError(f"Cohere API error: {str(e)}")
+        print(f"Chunk embedding failed, storing document-level embedding only: {e}")
+        chunks, chunk_embeddings = [], []
 
     # Store document
     try:
@@ -680,18 +590,30 @@ def main(
             'pages': pages,
             'source': 'supabase_storage'
         }
+        if ocr_info:
+            metadata['ocr'] = ocr_info
 
         final_visibility = visibility if visibility in valid_visibility else 'everyone'
 
         cursor.execute("""
-            INSERT INTO family_documents (title, content, category, source_file, created_by, embedding, metadata, tenant_id, assigned_to, visibility)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO family_documents (title, content, category, source_file, created_by, embedding, embedding_model, metadata, content_hash, tenant_id, assigned_to, visibility)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """, (title.strip(), extracted_text.strip(), final_category, storage_path, created_by,
-              embedding, json.dumps(metadata), tenant_id.strip(), assigned_to, final_visibility))
+              embedding, embed_model, json.dumps(metadata), content_hash, tenant_id.strip(), assigned_to, final_visibility))
 
         document_id = cursor.fetchone()[0]
 
+        if chunks:
+            store_chunks(conn, document_id, tenant_id.strip(), chunks, chunk_embeddings, embed_model)
+        store_fingerprint(conn, document_id, tenant_id.strip(), content_hash, fingerprint)
+        update_document_neighbors(conn, document_id)
+
+        # Extracted data and timeline events, committed with the document
+        timeline_events_created = 0
+        if enrichment and extract_data_enabled:
+            timeline_events_created = store_enrichment(cursor, tenant_id.strip(), document_id, enrichment)
+
         # Log API usage
         estimated_cost = tokens_used * 0.0000001
         cursor.execute("""
@@ -724,6 +646,9 @@ def main(
         "tags": result['tags'],
         "expiry_dates": result['expiry_dates'],
         "ai_features_used": ai_features_used,
+        "extracted_item_count": len(enrichment['extracted_data']['items']) if enrichment and extract_data_enabled and enrichment['extracted_data'] else 0,
+        "timeline_events_created": timeline_events_created,
+        "chunk_count": len(chunks),
         "assigned_to": assigned_to,
         "visibility": final_visibility
     }
@@ -43,6 +43,8 @@ import psycopg2
 from pgvector.psycopg2 import register_vector
 from typing import Optional
 import wmill
+from blob_store import put_blob
+from embedding_registry import active_model
 
 # Try to import PIL for image resizing
 try:
@@ -118,16 +120,18 @@ def main(
         return {"success": False, "error": f"Image processing failed: {str(e)}"}
 
     # Generate image embedding using Cohere Embed v4
+    # Searched with text query embeddings, so it uses the active text model
+    embed_model, embed_dimension = active_model("text")
     try:
         co = cohere.ClientV2(api_key=cohere_api_key)
 
         # Embed the image
         response = co.embed(
-            model="embed-v4.0",
+            model=embed_model,
             input_type="image",
             embedding_types=["float"],
             images=[f"data:image/jpeg;base64,{resized_b64}"],
-            output_dimension=1024  # Match text embedding dimension
+            output_dimension=embed_dimension
         )
 
         image_embedding = response.embeddings.float_[0]
@@ -142,6 +146,12 @@ def main(
     except Exception as e:
         return {"success": False, "error": f"Embedding failed: {str(e)}"}
 
+    # Image bytes go to the blob store; the row keeps only the hash (readers sign a URL)
+    try:
+        image_hash = put_blob(resized_bytes, prefix="images")
+    except Exception as e:
+        return {"success": False, "error": f"Image storage failed: {str(e)}"}
+
     # Update document in database
     try:
         conn = psycopg2.connect(
@@ -170,8 +180,10 @@ def main(
         cursor.execute("""
             UPDATE family_documents
             SET image_embedding = %s,
+                image_embedding_model = %s,
                 has_image_embedding = TRUE,
-                image_url = %s,
+                image_hash = %s,
+                image_url = NULL,
                 content_type = CASE
                     WHEN content IS NOT NULL AND content != '' THEN 'mixed'
                     ELSE 'image'
@@ -180,7 +192,8 @@ def main(
             WHERE id = %s AND tenant_id = %s::uuid
         """, (
             image_embedding,
-            f"data:image/jpeg;base64,{resized_b64}",
+            embed_model,
+            image_hash,
             document_id,
             tenant_id
         ))
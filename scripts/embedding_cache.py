@@ -0,0 +1,323 @@
+# embedding_cache.py
+# Windmill Python library - Query embedding cache
+# Path: f/chatbot/embedding_cache
+#
+# requirements:
+#   - cohere
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Query Embedding Cache for Archevi
+=================================
+
+Search queries repeat constantly (suggestion chips, follow-up questions,
+stress tests), and every repeat used to cost a 150-400 ms Cohere embed
+round trip. `embed_query()` looks the query up in two tiers first:
+
+1. an in-process LRU (per Windmill worker, no I/O)
+2. the `query_embedding_cache` table (migration 019), shared by all workers
+
+Keys are a sha256 of the normalized query text (NFKC, case-folded,
+whitespace collapsed, trailing punctuation dropped) together with model,
+input_type and output_dimension, so different embedding settings never
+share an entry. The raw query text is not stored.
+
+Entries expire after QUERY_EMBED_CACHE_TTL_DAYS. The table is trimmed to
+QUERY_EMBED_CACHE_MAX_ROWS by last use when `evict()` runs (main(action="evict")
+is meant for a Windmill schedule).
+
+Usage:
+    from embedding_cache import embed_query, embed_queries
+
+    embedding, tokens, cache_hit = embed_query(co, query, output_dimension=1024)
+    if not cache_hit:
+        log_api_usage(..., input_tokens=tokens, ...)
+
+    # Several queries, one Cohere call for all misses
+    embeddings, tokens, misses = embed_queries(co, [q1, q2], output_dimension=1024)
+
+Windmill Script Configuration:
+- Path: f/chatbot/embedding_cache
+- This is a library module; main() reports stats or runs eviction
+"""
+
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from db_pool import get_connection
+
+
+MEMORY_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_MEMORY_SIZE", "512"))
+CACHE_TTL_DAYS = int(os.getenv("QUERY_EMBED_CACHE_TTL_DAYS", "30"))
+CACHE_MAX_ROWS = int(os.getenv("QUERY_EMBED_CACHE_MAX_ROWS", "100000"))
+
+_memory: "OrderedDict[str, tuple[list, float]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0}
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('?!. ')
+
+
+def cache_key(
+    text: str,
+    model: str,
+    input_type: str,
+    output_dimension: Optional[int]
+) -> str:
+    """Cache key for a query under specific embedding settings."""
+    raw = f"{model}\x1f{input_type}\x1f{output_dimension or ''}\x1f{normalize_query(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _memory_get(key: str) -> Optional[list]:
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        embedding, stored_at = entry
+        if time.time() - stored_at > CACHE_TTL_DAYS * 86400:
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return embedding
+
+
+def _memory_put(key: str, embedding: list) -> None:
+    with _memory_lock:
+        _memory[key] = (embedding, time.time())
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _db_get_many(keys: list[str]) -> dict:
+    """Fetch and touch persistent entries in one round trip. Returns key -> embedding."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE query_embedding_cache
+            SET hit_count = hit_count + 1, last_used_at = NOW()
+            WHERE cache_key = ANY(%s)
+              AND created_at > NOW() - make_interval(days => %s)
+            RETURNING cache_key, embedding
+        """, (keys, CACHE_TTL_DAYS))
+        rows = cursor.fetchall()
+        conn.commit()
+        cursor.close()
+    return {
+        key: embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+        for key, embedding in rows
+    }
+
+
+def _db_put_many(
+    entries: list[tuple[str, list]],
+    model: str,
+    input_type: str,
+    output_dimension: Optional[int]
+) -> None:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO query_embedding_cache
+                (cache_key, model, input_type, output_dimension, embedding)
+            VALUES (%s, %s, %s, %s, %s::vector)
+            ON CONFLICT (cache_key) DO UPDATE
+            SET embedding = EXCLUDED.embedding,
+                created_at = NOW(),
+                last_used_at = NOW()
+        """, [(key, model, input_type, output_dimension, embedding) for key, embedding in entries])
+        conn.commit()
+        cursor.close()
+
+
+def embed_queries(
+    co,
+    texts: list[str],
+    model: str = "embed-v4.0",
+    input_type: str = "search_query",
+    output_dimension: Optional[int] = 1024
+) -> tuple[list, int, int]:
+    """
+    Embed several queries, serving cached ones and embedding the rest in a
+    single Cohere call.
+
+    Args:
+        co: cohere.ClientV2
+        texts: Query texts (embedded as given on a miss)
+        model: Embedding model
+        input_type: Cohere input_type
+        output_dimension: Requested dimension, or None for the model default
+
+    Returns:
+        (embeddings in input order, billed input tokens, number of texts
+        that were not served from the cache)
+
+    Cohere errors propagate as before; cache-tier errors never do.
+    """
+    keys = [cache_key(text, model, input_type, output_dimension) for text in texts]
+    found: dict = {}
+
+    for key in keys:
+        embedding = _memory_get(key)
+        if embedding is not None:
+            found[key] = embedding
+            _stats["memory_hits"] += 1
+
+    pending = [key for key in dict.fromkeys(keys) if key not in found]
+    if pending:
+        try:
+            from_db = _db_get_many(pending)
+        except Exception as e:
+            _stats["db_errors"] += 1
+            print(f"[embedding_cache] Lookup failed: {e}")
+            from_db = {}
+        for key, embedding in from_db.items():
+            found[key] = embedding
+            _memory_put(key, embedding)
+        _stats["db_hits"] += sum(1 for key in keys if key in from_db)
+
+    # One Cohere call for every distinct text still missing
+    missing = {}
+    for text, key in zip(texts, keys):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    tokens = 0
+    if missing:
+        _stats["misses"] += sum(1 for key in keys if key in missing)
+        kwargs = {}
+        if output_dimension:
+            kwargs["output_dimension"] = output_dimension
+        response = co.embed(
+            texts=list(missing.values()),
+            model=model,
+            input_type=input_type,
+            embedding_types=["float"],
+            **kwargs
+        )
+        if response.meta and response.meta.billed_units and response.meta.billed_units.input_tokens:
+            tokens = int(response.meta.billed_units.input_tokens)
+        else:
+            tokens = sum(len(text.split()) for text in missing.values())
+
+        new_entries = []
+        for key, embedding in zip(missing.keys(), response.embeddings.float_):
+            embedding = list(embedding)
+            found[key] = embedding
+            _memory_put(key, embedding)
+            new_entries.append((key, embedding))
+        try:
+            _db_put_many(new_entries, model, input_type, output_dimension)
+        except Exception as e:
+            _stats["db_errors"] += 1
+            print(f"[embedding_cache] Store failed: {e}")
+
+    missed = sum(1 for key in keys if key in missing)
+    return [found[key] for key in keys], tokens, missed
+
+
+def embed_query(
+    co,
+    text: str,
+    model: str = "embed-v4.0",
+    input_type: str = "search_query",
+    output_dimension: Optional[int] = 1024
+) -> tuple[list, int, bool]:
+    """
+    Embed one query, serving repeats from the cache.
+
+    Returns:
+        (embedding, billed input tokens - 0 on a hit, cache_hit)
+    """
+    embeddings, tokens, missed = embed_queries(co, [text], model, input_type, output_dimension)
+    return embeddings[0], tokens, missed == 0
+
+
+def cache_stats() -> dict:
+    """Hit rate for this process plus size/hit totals of the persistent tier."""
+    lookups = _stats["memory_hits"] + _stats["db_hits"] + _stats["misses"]
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    stats = {
+        **_stats,
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "memory_entries": len(_memory),
+    }
+    try:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*), COALESCE(SUM(hit_count), 0),
+                       COUNT(*) FILTER (WHERE hit_count > 0)
+                FROM query_embedding_cache
+            """)
+            rows, total_hits, reused = cursor.fetchone()
+            cursor.close()
+        stats["db_rows"] = rows
+        stats["db_total_hits"] = int(total_hits)
+        stats["db_reused_rows"] = reused
+    except Exception as e:
+        stats["db_error"] = str(e)
+    return stats
+
+
+def evict(
+    ttl_days: int = CACHE_TTL_DAYS,
+    max_rows: int = CACHE_MAX_ROWS
+) -> dict:
+    """Delete expired entries, then the least recently used beyond max_rows."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM query_embedding_cache WHERE created_at <= NOW() - make_interval(days => %s)",
+            (ttl_days,)
+        )
+        expired = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM query_embedding_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM query_embedding_cache
+                ORDER BY last_used_at DESC
+                OFFSET %s
+            )
+        """, (max_rows,))
+        trimmed = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    return {"expired": expired, "trimmed": trimmed}
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "stats") -> dict:
+    """
+    Inspect or maintain the query embedding cache.
+
+    Args:
+        action: "stats" (hit rates and table size) or "evict" (TTL + LRU trim)
+
+    Returns:
+        dict with the stats or eviction counts
+    """
+    if action == "evict":
+        return {"success": True, **evict()}
+    if action == "stats":
+        return {"success": True, **cache_stats()}
+    raise ValueError("action must be 'stats' or 'evict'")
@@ -0,0 +1,152 @@
+# embedding_registry.py
+# Windmill Python library - Active embedding model per vector space
+# Path: f/chatbot/embedding_registry
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Embedding Model Registry for Archevi
+====================================
+
+Every script that writes or searches vectors asks this module which model
+and output dimension to use, instead of hard-coding "embed-v4.0" / 1024.
+The registry lives in `embedding_models` (migration 023):
+
+- "text"  - family_documents and document_chunks (searched together), plus
+            image embeddings and voice notes, compared with the same queries
+- "pages" - document_pages (page images, searched with text queries)
+
+Each target has one active model and, while a migration runs, one pending
+model being backfilled by reembed_embeddings.py. Lookups are cached per
+process for EMBEDDING_REGISTRY_TTL_SECS, so after a cutover a worker may
+keep the previous model for up to that long.
+
+If the table cannot be read, the built-in defaults are used so ingestion
+and search keep working.
+
+Usage:
+    from embedding_registry import active_model
+
+    model, output_dimension = active_model("text")
+    co.embed(texts=[...], model=model, output_dimension=output_dimension, ...)
+    # ...and store `model` in the row's embedding_model column
+
+Windmill Script Configuration:
+- Path: f/chatbot/embedding_registry
+- This is a library module; main() lists the registry
+"""
+
+from typing import Optional
+import os
+import threading
+import time
+
+from db_pool import get_connection
+
+
+TARGETS = ("text", "pages")
+
+# Used when the registry table is missing or unreachable
+DEFAULT_MODELS = {
+    "text": ("embed-v4.0", 1024),
+    "pages": ("embed-v4.0", 1024),
+}
+
+CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_REGISTRY_TTL_SECS", "30"))
+
+_cache: dict = {}
+_cache_loaded_at: float = 0.0
+_cache_lock = threading.Lock()
+
+
+def _load() -> dict:
+    """(target, status) -> {model, output_dimension} for active and pending rows."""
+    global _cache, _cache_loaded_at
+
+    with _cache_lock:
+        if _cache and time.time() - _cache_loaded_at < CACHE_TTL_SECONDS:
+            return _cache
+
+        try:
+            with get_connection(register_vector=False) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT target, status, model, output_dimension
+                    FROM embedding_models
+                    WHERE status IN ('active', 'pending')
+                """)
+                rows = cursor.fetchall()
+                cursor.close()
+            _cache = {
+                (target, status): {"model": model, "output_dimension": output_dimension}
+                for target, status, model, output_dimension in rows
+            }
+        except Exception as e:
+            print(f"[embedding_registry] Lookup failed, using defaults: {e}")
+            _cache = {}
+        _cache_loaded_at = time.time()
+        return _cache
+
+
+def active_model(target: str = "text") -> tuple[str, Optional[int]]:
+    """(model, output_dimension) that ingestion and search use for a target."""
+    entry = _load().get((target, "active"))
+    if entry is None:
+        return DEFAULT_MODELS[target]
+    return entry["model"], entry["output_dimension"]
+
+
+def pending_model(target: str = "text") -> Optional[tuple[str, Optional[int]]]:
+    """(model, output_dimension) being migrated to, or None."""
+    entry = _load().get((target, "pending"))
+    if entry is None:
+        return None
+    return entry["model"], entry["output_dimension"]
+
+
+def clear_cache() -> None:
+    """Forget cached lookups (after changing the registry in this process)."""
+    global _cache, _cache_loaded_at
+    with _cache_lock:
+        _cache = {}
+        _cache_loaded_at = 0.0
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main() -> dict:
+    """
+    List the embedding model registry.
+
+    Returns:
+        dict with one entry per registered model
+    """
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT target, model, output_dimension, status, created_at, activated_at, retired_at
+            FROM embedding_models
+            ORDER BY target, created_at
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    return {
+        "success": True,
+        "models": [
+            {
+                "target": r[0],
+                "model": r[1],
+                "output_dimension": r[2],
+                "status": r[3],
+                "created_at": r[4].isoformat() if r[4] else None,
+                "activated_at": r[5].isoformat() if r[5] else None,
+                "retired_at": r[6].isoformat() if r[6] else None,
+            }
+            for r in rows
+        ]
+    }
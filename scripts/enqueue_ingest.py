@@ -0,0 +1,100 @@
+# enqueue_ingest.py
+# Windmill Python script for queueing an upload for background ingest
+# Path: f/chatbot/enqueue_ingest
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+#   - httpx
+
+"""
+Queue an upload (or a follow-up stage for a document) for ingest_worker.py
+and return immediately. Poll get_ingest_job for the outcome.
+
+Args:
+    stage (str): "storage_upload", "zip_upload", "voice_note",
+        "extract_data" or "timeline_events"
+    tenant_id (str): UUID of the tenant
+    args (dict): Arguments of the stage's script (e.g. embed_document_from_storage);
+        tenant_id is filled in from the tenant_id argument. Files go through
+        Storage (storage_path); inline base64 files above MAX_INLINE_FILE_BYTES
+        are rejected, since args are stored in ingest_jobs.payload
+    then (list[str], optional): Follow-up stages to queue for the new document
+        once the upload is stored ("extract_data", "timeline_events")
+    user_id (int, optional): Member who uploaded (passed to timeline_events)
+
+Returns:
+    dict: {
+        success: bool,
+        job_id: int,
+        status: "pending",
+        queue_position: int,
+        error: str (if failed),
+        retry_after: int (seconds, when the queue is full)
+    }
+"""
+
+from typing import Optional
+import os
+import psycopg2
+from db_pool import get_connection
+from ingest_queue import FOLLOW_UP_STAGES, QueueFull, enqueue, queue_position
+
+
+# Stages the app may queue (email_forward is queued by the email trigger)
+CLIENT_STAGES = ("storage_upload", "zip_upload", "voice_note") + FOLLOW_UP_STAGES
+
+# Largest inline (base64) file argument per name; the payload is read on
+# every claim and kept until the job finishes
+MAX_INLINE_FILE_BYTES = {
+    "zip_content_base64": int(os.getenv("INGEST_MAX_INLINE_ZIP_BYTES", str(1024 * 1024))),
+    "audio_content": int(os.getenv("INGEST_MAX_INLINE_AUDIO_BYTES", str(8 * 1024 * 1024))),
+}
+
+
+def main(
+    stage: str,
+    tenant_id: str,
+    args: dict,
+    then: Optional[list] = None,
+    user_id: Optional[int] = None,
+) -> dict:
+    """Queue an ingest job."""
+    if not tenant_id:
+        return {"success": False, "error": "tenant_id is required"}
+    if stage not in CLIENT_STAGES:
+        return {"success": False, "error": f"stage must be one of: {', '.join(CLIENT_STAGES)}"}
+
+    for name, limit in MAX_INLINE_FILE_BYTES.items():
+        if len((args or {}).get(name) or "") > limit:
+            return {
+                "success": False,
+                "error": f"{name} is larger than {limit} bytes; upload the file to storage and pass storage_path"
+                if name == "zip_content_base64" else f"{name} is larger than {limit} bytes"
+            }
+
+    then = [s for s in (then or []) if s in FOLLOW_UP_STAGES]
+    payload = {"args": {**(args or {}), "tenant_id": tenant_id}, "then": then, "user_id": user_id}
+
+    try:
+        with get_connection(register_vector=False) as conn:
+            job_id = enqueue(
+                conn, stage, payload,
+                tenant_id=tenant_id,
+                document_id=payload["args"].get("document_id")
+            )
+            conn.commit()
+            position = queue_position(conn, job_id)
+            conn.rollback()
+
+        return {
+            "success": True,
+            "job_id": job_id,
+            "status": "pending",
+            "queue_position": position
+        }
+
+    except QueueFull as e:
+        return {"success": False, "error": str(e), "retry_after": e.retry_after}
+    except psycopg2.Error as e:
+        return {"success": False, "error": f"Database error: {str(e)}"}
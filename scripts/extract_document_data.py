@@ -17,6 +17,11 @@ Instead of rigid category schemas, this approach:
 3. Assigns importance levels to each item
 4. Works well regardless of document category
 
+extract_batch() extracts many documents concurrently (shared connection
+pool, Cohere client and Cohere throttle) and checkpoints its progress in
+extraction_backfills so interrupted runs resume. Operators run it for one
+tenant or all tenants through backfill_extracted_data.
+
 Args:
     document_id (int): Document ID to extract data from
     tenant_id (str): Tenant UUID for authorization
@@ -41,12 +46,17 @@ Returns:
     }
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import cohere
-import psycopg2
 from typing import Optional, Dict, Any, List
 import wmill
+import os
 import re
 import json
+import time
+
+from db_pool import get_connection
+from rate_limiter import is_rate_limit_error, provider_throttle
 
 
 # Data types for extracted items
@@ -76,6 +86,20 @@ CATEGORY_HINTS = {
     'general': "Analyze this document and extract all key information you can find.",
 }
 
+# Batch extraction (extract_batch / backfill_extracted_data)
+BATCH_CONCURRENCY = int(os.getenv("EXTRACT_BATCH_CONCURRENCY", "4"))
+BATCH_PAGE_SIZE = 4                # Documents per worker between checkpoints
+MAX_FAILED_IDS = 100               # Failed document ids kept on a checkpoint
+
+# Which documents each batch mode selects
+BATCH_MODE_FILTERS = {
+    'missing': "(d.extracted_data IS NULL OR d.extracted_data = '{}'::jsonb)",
+    'reextract_v1': (
+        "d.extracted_data IS NOT NULL AND d.extracted_data != '{}'::jsonb"
+        " AND NOT (d.extracted_data ? 'items')"
+    ),
+}
+
 
 def build_dynamic_extraction_prompt(content: str, category: str, title: str) -> str:
     """Build extraction prompt that discovers data dynamically."""
@@ -136,7 +160,8 @@ def extract_with_ai(content: str, category: str, title: str, co: cohere.ClientV2
         model = "command-r7b-12-2024" if len(content) < 4000 else "command-a-03-2025"
         print(f"[Dynamic Extraction] Using model: {model}")
 
-        response = co.chat(
+        response = provider_throttle("cohere").call(
+            co.chat,
             model=model,
             messages=[{
                 "role": "user",
@@ -197,13 +222,10 @@ def extract_with_ai(content: str, category: str, title: str, co: cohere.ClientV2
         print(f"[Dynamic Extraction] JSON parse error: {e}")
         print(f"[Dynamic Extraction] Response was: {response_text[:300]}")
     except Exception as e:
+        # Rate limits and outages: don't store a pattern-only result as if
+        # extracted; the caller (ingest job or batch) retries later
         print(f"[Dynamic Extraction] Error: {type(e).__name__}: {e}")
-        return {
-            'items': [],
-            'error': str(e),
-            'raw_response': response_text[:500] if response_text else '',
-            'tokens': 0
-        }
+        raise
 
     return {'items': [], 'tokens': 0}
 
@@ -303,6 +325,17 @@ def organize_extracted_data(items: List[Dict], summary: str, document_type: str)
     return result
 
 
+_cohere: Optional[cohere.ClientV2] = None
+
+
+def get_cohere_client() -> cohere.ClientV2:
+    """Process-wide Cohere client, shared by batch worker threads."""
+    global _cohere
+    if _cohere is None:
+        _cohere = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+    return _cohere
+
+
 def main(
     document_id: int,
     tenant_id: str,
@@ -310,6 +343,9 @@ def main(
 ) -> dict:
     """
     Extract structured data from a document using dynamic discovery.
+
+    Missing or unknown documents return success False; Cohere and database
+    errors are raised so ingest_worker retries the extract_data job.
     """
     if not document_id or not tenant_id:
         return {
@@ -317,190 +353,276 @@ def main(
             "error": "document_id and tenant_id are required"
         }
 
-    # Get resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-    cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
-
-    conn = psycopg2.connect(
-        host=postgres_db['host'],
-        port=postgres_db['port'],
-        dbname=postgres_db['dbname'],
-        user=postgres_db['user'],
-        password=postgres_db['password'],
-        sslmode=postgres_db.get('sslmode', 'disable')
-    )
-
-    cursor = conn.cursor()
-
-    try:
-        # Get document
+    # Pooled connections are only held for the read and the write, not the LLM call
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT id, title, content, category, extracted_data
             FROM family_documents
             WHERE id = %s AND tenant_id = %s::uuid
         """, (document_id, tenant_id))
-
         row = cursor.fetchone()
-        if not row:
-            cursor.close()
-            conn.close()
+        cursor.close()
+
+    if not row:
+        return {
+            "success": False,
+            "error": f"Document {document_id} not found or access denied"
+        }
+
+    doc_id, title, content, category, existing_data = row
+
+    # Check if already extracted (and has items array = v2 format)
+    if existing_data and isinstance(existing_data, dict):
+        if existing_data.get('items') and not force_reextract:
             return {
-                "success": False,
-                "error": f"Document {document_id} not found or access denied"
+                "success": True,
+                "document_id": doc_id,
+                "category": category,
+                "extracted_data": existing_data,
+                "item_count": len(existing_data.get('items', [])),
+                "tokens_used": 0,
+                "already_extracted": True
             }
 
-        doc_id, title, content, category, existing_data = row
-
-        # Check if already extracted (and has items array = v2 format)
-        if existing_data and isinstance(existing_data, dict):
-            if existing_data.get('items') and not force_reextract:
-                cursor.close()
-                conn.close()
-                return {
-                    "success": True,
-                    "document_id": doc_id,
-                    "category": category,
-                    "extracted_data": existing_data,
-                    "item_count": len(existing_data.get('items', [])),
-                    "tokens_used": 0,
-                    "already_extracted": True
-                }
-
-        # Initialize Cohere
-        co = cohere.ClientV2(api_key=cohere_api_key)
-
-        # First, extract patterns (fast, no API call)
-        pattern_items = extract_patterns(content)
-
-        # Then, use AI for dynamic extraction
-        ai_result = extract_with_ai(content, category, title, co)
-        ai_items = ai_result.get('items', [])
-        summary = ai_result.get('summary', '')
-        document_type = ai_result.get('document_type', '')
-
-        # Merge: AI items take precedence, add pattern items that AI missed
-        all_items = ai_items.copy()
-        ai_values = set(str(item['value']).lower() for item in ai_items)
-
-        for pattern_item in pattern_items:
-            if str(pattern_item['value']).lower() not in ai_values:
-                all_items.append(pattern_item)
-
-        # Organize into structured format
-        extracted_data = organize_extracted_data(all_items, summary, document_type)
-
-        # Save to database
+    # First, extract patterns (fast, no API call)
+    pattern_items = extract_patterns(content or '')
+
+    # Then, use AI for dynamic extraction
+    ai_result = extract_with_ai(content or '', category, title, get_cohere_client())
+
+    ai_items = ai_result.get('items', [])
+    summary = ai_result.get('summary', '')
+    document_type = ai_result.get('document_type', '')
+
+    # Merge: AI items take precedence, add pattern items that AI missed
+    all_items = ai_items.copy()
+    ai_values = set(str(item['value']).lower() for item in ai_items)
+
+    for pattern_item in pattern_items:
+        if str(pattern_item['value']).lower() not in ai_values:
+            all_items.append(pattern_item)
+
+    # Organize into structured format
+    extracted_data = organize_extracted_data(all_items, summary, document_type)
+
+    # Save to database
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
         cursor.execute("""
             UPDATE family_documents
             SET extracted_data = %s,
                 updated_at = NOW()
             WHERE id = %s
         """, (json.dumps(extracted_data), doc_id))
+        conn.commit()
+        cursor.close()
+
+    return {
+        "success": True,
+        "document_id": doc_id,
+        "category": category,
+        "extracted_data": extracted_data,
+        "item_count": len(all_items),
+        "high_importance_count": len(extracted_data.get('high_importance', [])),
+        "tokens_used": ai_result.get('tokens', 0),
+        "document_type": document_type
+    }
+
+
+def _checkpoint_scope(tenant_id: Optional[str], mode: str, category: Optional[str]) -> str:
+    return f"{tenant_id or 'all'}:{mode}:{category or '*'}"
 
+
+def _load_checkpoint(
+    scope: str,
+    tenant_id: Optional[str],
+    mode: str,
+    category: Optional[str],
+    restart: bool
+) -> int:
+    """Create or reset the scope's checkpoint row. Returns the last finished document id."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO extraction_backfills (scope, tenant_id, mode, category)
+            VALUES (%s, %s::uuid, %s, %s)
+            ON CONFLICT (scope) DO UPDATE SET
+                status = 'running',
+                last_error = NULL,
+                updated_at = NOW(),
+                last_document_id = CASE WHEN %s THEN 0 ELSE extraction_backfills.last_document_id END,
+                processed = CASE WHEN %s THEN 0 ELSE extraction_backfills.processed END,
+                succeeded = CASE WHEN %s THEN 0 ELSE extraction_backfills.succeeded END,
+                failed = CASE WHEN %s THEN 0 ELSE extraction_backfills.failed END,
+                failed_document_ids = CASE WHEN %s THEN '{}' ELSE extraction_backfills.failed_document_ids END,
+                tokens_used = CASE WHEN %s THEN 0 ELSE extraction_backfills.tokens_used END,
+                started_at = CASE WHEN %s THEN NOW() ELSE extraction_backfills.started_at END,
+                completed_at = NULL
+            RETURNING last_document_id
+        """, (scope, tenant_id, mode, category) + (restart,) * 7)
+        last_id = cursor.fetchone()[0]
         conn.commit()
         cursor.close()
-        conn.close()
+    return last_id
 
-        return {
-            "success": True,
-            "document_id": doc_id,
-            "category": category,
-            "extracted_data": extracted_data,
-            "item_count": len(all_items),
-            "high_importance_count": len(extracted_data.get('high_importance', [])),
-            "tokens_used": ai_result.get('tokens', 0),
-            "document_type": document_type
-        }
 
-    except Exception as e:
-        conn.rollback()
+def _save_checkpoint(scope: str, last_id: int, results: List[Dict], status: str, error: Optional[str] = None) -> None:
+    """Advance the checkpoint after a page of documents (one commit per page)."""
+    failed_ids = [r['document_id'] for r in results if not r['success']]
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE extraction_backfills SET
+                last_document_id = GREATEST(last_document_id, %s),
+                processed = processed + %s,
+                succeeded = succeeded + %s,
+                failed = failed + %s,
+                failed_document_ids = (failed_document_ids || %s::integer[])[GREATEST(1, cardinality(failed_document_ids) + %s - %s + 1):],
+                tokens_used = tokens_used + %s,
+                status = %s,
+                last_error = COALESCE(%s, last_error),
+                updated_at = NOW(),
+                completed_at = CASE WHEN %s = 'completed' THEN NOW() ELSE NULL END
+            WHERE scope = %s
+        """, (
+            last_id, len(results), len(results) - len(failed_ids), len(failed_ids),
+            failed_ids, len(failed_ids), MAX_FAILED_IDS,
+            sum(r.get('tokens_used', 0) for r in results),
+            status, error, status, scope
+        ))
+        conn.commit()
         cursor.close()
-        conn.close()
-        return {
-            "success": False,
-            "document_id": document_id,
-            "error": str(e)
-        }
+
+
+def _next_documents(
+    tenant_id: Optional[str],
+    mode: str,
+    category: Optional[str],
+    after_id: int,
+    limit: int
+) -> List[tuple]:
+    """Next documents to extract in id order: [(id, tenant_id)]."""
+    query = f"""
+        SELECT d.id, d.tenant_id::text FROM family_documents d
+        WHERE d.id > %s AND {BATCH_MODE_FILTERS[mode]}
+    """
+    params: List[Any] = [after_id]
+    if tenant_id:
+        query += " AND d.tenant_id = %s::uuid"
+        params.append(tenant_id)
+    if category:
+        query += " AND d.category = %s"
+        params.append(category)
+    query += " ORDER BY d.id LIMIT %s"
+    params.append(limit)
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def _extract_one(doc: tuple) -> Dict[str, Any]:
+    doc_id, doc_tenant_id = doc
+    try:
+        result = main(doc_id, doc_tenant_id, force_reextract=True)
+    except Exception as e:
+        result = {"success": False, "error": str(e), "rate_limited": is_rate_limit_error(e)}
+    return {
+        'document_id': doc_id,
+        'tenant_id': doc_tenant_id,
+        'success': result.get('success', False),
+        'rate_limited': result.get('rate_limited', False),
+        'item_count': result.get('item_count', 0),
+        'tokens_used': result.get('tokens_used', 0),
+        'document_type': result.get('document_type', ''),
+        'error': result.get('error')
+    }
 
 
 def extract_batch(
-    tenant_id: str,
+    tenant_id: Optional[str],
     limit: int = 50,
     category: Optional[str] = None,
     reextract_v1: bool = False,
+    concurrency: int = BATCH_CONCURRENCY,
+    max_seconds: int = 240,
+    restart: bool = False,
 ) -> dict:
     """
     Batch extract data from documents.
 
+    Documents are extracted `concurrency` at a time in id order, sharing the
+    connection pool, the Cohere client and the Cohere throttle. Progress is
+    checkpointed in `extraction_backfills` after every page, so a run that is
+    interrupted, hits its time budget or is paused by rate limits resumes
+    after the last finished document on the next call.
+
     Args:
-        tenant_id: Tenant UUID
-        limit: Maximum documents to process
+        tenant_id: Tenant UUID, or None for all tenants (operator backfill)
+        limit: Maximum documents to process in this run
         category: Optional category filter
         reextract_v1: Re-extract docs with old v1 format (no 'items' array)
+        concurrency: Documents extracted at once
+        max_seconds: Stop starting new pages after this long
+        restart: Discard the checkpoint and start from the first document
 
     Returns:
-        dict with processed count and results
+        dict with processed count, results and checkpoint state
     """
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-
-    conn = psycopg2.connect(
-        host=postgres_db['host'],
-        port=postgres_db['port'],
-        dbname=postgres_db['dbname'],
-        user=postgres_db['user'],
-        password=postgres_db['password'],
-        sslmode=postgres_db.get('sslmode', 'disable')
-    )
-
-    cursor = conn.cursor()
-
-    # Find documents to process
-    if reextract_v1:
-        # Re-extract docs that have old format (no 'items' key)
-        query = """
-            SELECT id FROM family_documents
-            WHERE tenant_id = %s::uuid
-              AND extracted_data IS NOT NULL
-              AND extracted_data != '{}'::jsonb
-              AND NOT (extracted_data ? 'items')
-        """
-    else:
-        # Extract docs without any extracted data
-        query = """
-            SELECT id FROM family_documents
-            WHERE tenant_id = %s::uuid
-              AND (extracted_data IS NULL OR extracted_data = '{}'::jsonb)
-        """
-
-    params = [tenant_id]
-
-    if category:
-        query += " AND category = %s"
-        params.append(category)
-
-    query += " ORDER BY created_at DESC LIMIT %s"
-    params.append(limit)
-
-    cursor.execute(query, params)
-    doc_ids = [row[0] for row in cursor.fetchall()]
-
-    cursor.close()
-    conn.close()
-
-    # Process each document
+    mode = 'reextract_v1' if reextract_v1 else 'missing'
+    scope = _checkpoint_scope(tenant_id, mode, category)
+    concurrency = max(1, concurrency)
+    deadline = time.time() + max_seconds
+
+    last_id = _load_checkpoint(scope, tenant_id, mode, category, restart)
+    start_id = last_id
+    status = 'running'
     results = []
-    for doc_id in doc_ids:
-        result = main(doc_id, tenant_id, force_reextract=True)
-        results.append({
-            'document_id': doc_id,
-            'success': result.get('success', False),
-            'item_count': result.get('item_count', 0),
-            'document_type': result.get('document_type', '')
-        })
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while len(results) < limit and time.time() < deadline:
+            docs = _next_documents(
+                tenant_id, mode, category, last_id,
+                min(concurrency * BATCH_PAGE_SIZE, limit - len(results))
+            )
+            if not docs:
+                status = 'completed'
+                _save_checkpoint(scope, last_id, [], status)
+                break
+
+            page = list(pool.map(_extract_one, docs))
+
+            # Stop at the first document the provider kept rejecting; the next
+            # run starts from it. Later documents that did finish no longer
+            # match the mode filter, so they are not extracted twice.
+            limited = [i for i, r in enumerate(page) if r['rate_limited']]
+            if limited:
+                page = page[:limited[0]]
+                status = 'paused'
+            if page:
+                last_id = page[-1]['document_id']
+            results.extend(page)
+            _save_checkpoint(
+                scope, last_id, page, status,
+                'Provider rate limit; resume with the next run' if limited else None
+            )
+            if limited:
+                break
 
     return {
+        "scope": scope,
         "processed": len(results),
         "successful": sum(1 for r in results if r['success']),
+        "failed": sum(1 for r in results if not r['success']),
         "total_items_extracted": sum(r.get('item_count', 0) for r in results),
+        "tokens_used": sum(r.get('tokens_used', 0) for r in results),
+        "resumed_after_document_id": start_id,
+        "last_document_id": last_id,
+        "status": status,
+        "completed": status == 'completed',
         "results": results
     }
@@ -9,7 +9,9 @@
 #   - pgvector
 #   - numpy
 #   - wmill
-#   - pypdf
+#   - pymupdf
+#   - pytesseract
+#   - pillow
 #   - httpx==0.27.2
 #   Cohere SDK dependencies
 #   - fastavro
@@ -44,8 +46,8 @@
 """
 Extract text from files stored in Supabase Storage.
 Supports:
-- PDF files (via pypdf)
-- Images (via Cohere vision/OCR)
+- PDF files (text layer, local OCR for scanned pages - document_ocr.py)
+- Images (local Tesseract OCR, Cohere vision when confidence is low)
 - Text files (direct read)
 
 This script fetches a file from Supabase Storage using the storage path,
@@ -63,6 +65,8 @@ Returns:
         extracted_text: str,
         file_type: str,
         pages: int (for PDFs),
+        ocr_pages: int (pages OCR'd instead of read from the text layer),
+        vision_pages: int (pages or images escalated to the vision model),
         tokens_used: int,
         document_updated: bool,
         message: str
@@ -74,11 +78,11 @@ import psycopg2
 from pgvector.psycopg2 import register_vector
 import httpx
 import wmill
-import io
-import base64
 from typing import Optional
 import json
-import hashlib
+from document_fingerprints import compute_content_hash, simhash, store_fingerprint
+from document_chunks import reembed_changed_content
+from document_ocr import extract_pdf_text, ocr_image
 
 
 def get_supabase_file(storage_path: str, supabase_url: str, supabase_key: str) -> tuple[bytes, str]:
@@ -102,90 +106,6 @@ def get_supabase_file(storage_path: str, supabase_url: str, supabase_key: str) -
         return response.content, content_type
 
 
-def extract_pdf_text(file_bytes: bytes) -> tuple[str, int]:
-    """
-    Extract text from a PDF file using pypdf.
-    Returns the extracted text and page count.
-    """
-    from pypdf import PdfReader
-
-    pdf_file = io.BytesIO(file_bytes)
-    reader = PdfReader(pdf_file)
-
-    pages = len(reader.pages)
-    text_parts = []
-
-    for i, page in enumerate(reader.pages):
-        page_text = page.extract_text() or ""
-        if page_text.strip():
-            text_parts.append(f"--- Page {i + 1} ---\n{page_text}")
-
-    return "\n\n".join(text_parts), pages
-
-
-def extract_image_text_ocr(file_bytes: bytes, content_type: str, co: cohere.ClientV2, language: str = "eng") -> str:
-    """
-    Extract text from an image using Cohere's vision capabilities.
-    """
-    # Convert to base64 for Cohere
-    base64_image = base64.b64encode(file_bytes).decode("utf-8")
-
-    # Determine media type
-    if "png" in content_type:
-        media_type = "image/png"
-    elif "webp" in content_type:
-        media_type = "image/webp"
-    else:
-        media_type = "image/jpeg"
-
-    # Use Cohere chat with vision
-    response = co.chat(
-        model="command-r-plus",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": base64_image
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": f"""Extract ALL text from this image. This is a scanned document.
-
-Language hint: {language}
-
-Instructions:
-1. Extract every word visible in the image
-2. Preserve the original structure/layout as much as possible
-3. Include headers, body text, and any small print
-4. If you see dates, amounts, or numbers, include them exactly as shown
-5. If the text is in {language}, transcribe it in that language
-
-Return ONLY the extracted text, no commentary."""
-                    }
-                ]
-            }
-        ]
-    )
-
-    return response.message.content[0].text.strip()
-
-
-def compute_content_hash(content: str, title: str) -> str:
-    """
-    Compute a SHA-256 hash of the document content for duplicate detection.
-    """
-    normalized = ' '.join(content.lower().split())
-    normalized_title = ' '.join((title or '').lower().split())
-    combined = f"{normalized_title}||{normalized}"
-    return hashlib.sha256(combined.encode('utf-8')).hexdigest()
-
-
 def update_document_content(
     conn,
     document_id: int,
@@ -195,13 +115,15 @@ def update_document_content(
     new_title: str = None
 ) -> dict:
     """
-    Update a document with extracted text and optionally regenerate embedding.
+    Update a document with extracted text and optionally refresh its embeddings.
+    Only chunks whose text changed are embedded (reembed_changed_content);
+    unchanged text embeds nothing.
     """
     cursor = conn.cursor()
 
     # Get current document info
     cursor.execute("""
-        SELECT title, content, metadata
+        SELECT title, content, metadata, tenant_id::text
         FROM family_documents
         WHERE id = %s
     """, (document_id,))
@@ -211,7 +133,7 @@ def update_document_content(
         cursor.close()
         return {"updated": False, "error": "Document not found"}
 
-    title, old_content, metadata = row
+    title, old_content, metadata, tenant_id = row
     metadata = metadata or {}
 
     # Use new_title if provided, otherwise keep existing (or use empty string)
@@ -223,38 +145,27 @@ def update_document_content(
     metadata['text_extracted'] = True
     metadata['extraction_source'] = 'storage'
 
-    tokens_used = 0
+    embedding_stats = {"tokens_used": 0}
+
+    cursor.execute("""
+        UPDATE family_documents
+        SET title = COALESCE(NULLIF(%s, ''), title),
+            content = %s, metadata = %s, content_hash = %s, updated_at = NOW()
+        WHERE id = %s
+    """, (new_title, extracted_text, json.dumps(metadata), content_hash, document_id))
 
-    if update_embedding:
-        # Generate new embedding
-        response = co.embed(
-            texts=[extracted_text],
-            model="embed-v4.0",
-            input_type="search_document",
-            embedding_types=["float"],
-            output_dimension=1024
+    if update_embedding and tenant_id and extracted_text != (old_content or ''):
+        embedding_stats = reembed_changed_content(
+            conn, co, document_id, tenant_id, final_title, extracted_text
         )
-        embedding = response.embeddings.float_[0]
-        tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(extracted_text.split())
-
-        cursor.execute("""
-            UPDATE family_documents
-            SET title = COALESCE(NULLIF(%s, ''), title),
-                content = %s, embedding = %s, metadata = %s, updated_at = NOW()
-            WHERE id = %s
-        """, (new_title, extracted_text, embedding, json.dumps(metadata), document_id))
-    else:
-        cursor.execute("""
-            UPDATE family_documents
-            SET title = COALESCE(NULLIF(%s, ''), title),
-                content = %s, metadata = %s, updated_at = NOW()
-            WHERE id = %s
-        """, (new_title, extracted_text, json.dumps(metadata), document_id))
+
+    if tenant_id:
+        store_fingerprint(conn, document_id, tenant_id, content_hash, simhash(extracted_text))
 
     conn.commit()
     cursor.close()
 
-    return {"updated": True, "tokens_used": tokens_used}
+    return {"updated": True, **embedding_stats}
 
 
 def main(
@@ -303,6 +214,7 @@ def main(
     pages = 0
     file_type = "unknown"
     tokens_used = 0
+    ocr_pages = vision_pages = 0
 
     storage_path_lower = storage_path.lower()
 
@@ -310,7 +222,9 @@ def main(
         # PDF extraction
         file_type = "pdf"
         try:
-            extracted_text, pages = extract_pdf_text(file_bytes)
+            pdf = extract_pdf_text(file_bytes, language, co, tenant_id.strip())
+            extracted_text, pages = pdf["text"], pdf["pages"]
+            ocr_pages, vision_pages = pdf["ocr_pages"], pdf["vision_pages"]
         except Exception as e:
             return {
                 "extracted_text": None,
@@ -325,7 +239,9 @@ def main(
         # Image OCR
         file_type = "image"
         try:
-            extracted_text = extract_image_text_ocr(file_bytes, content_type, co, language)
+            ocr = ocr_image(file_bytes, content_type, language, co, tenant_id.strip())
+            extracted_text = ocr["text"]
+            ocr_pages, vision_pages = 1, int(ocr["method"] == "vision")
             pages = 1
         except Exception as e:
             return {
@@ -382,6 +298,8 @@ def main(
         "full_text_length": len(extracted_text),
         "file_type": file_type,
         "pages": pages,
+        "ocr_pages": ocr_pages,
+        "vision_pages": vision_pages,
         "tokens_used": tokens_used,
         "document_updated": document_updated,
         "message": f"Successfully extracted {len(extracted_text)} characters from {file_type} file"
@@ -40,8 +40,12 @@ from typing import Optional
 import wmill
 from groq import Groq
 import cohere
-import psycopg2
-from pgvector.psycopg2 import register_vector
+from db_pool import get_connection
+from embedding_cache import embed_query
+from embedding_registry import active_model
+from hybrid_search import hybrid_cte, rrf_relevance
+from vector_partitions import plan_vector_search
+from usage_sink import record_usage
 
 
 def log_api_usage(
@@ -55,60 +59,19 @@ def log_api_usage(
     success: bool = True,
     operation: str = None
 ):
-    """Log API usage to PostgreSQL. Fire-and-forget."""
+    """Queue API usage on the buffered sink. Fire-and-forget."""
     try:
-        postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
+        record_usage(
+            tenant_id=tenant_id,
+            provider=provider,
+            endpoint=endpoint,
+            model=model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            latency_ms=latency_ms,
+            success=success,
+            operation=operation
         )
-        cursor = conn.cursor()
-
-        # Pricing (cents per million tokens)
-        PRICING = {
-            'groq': {
-                'llama-3.3-70b-versatile': {'input': 59, 'output': 79},
-            },
-            'cohere': {
-                'embed-v4.0': {'input': 10, 'output': 0},
-                'rerank-v3.5': {'per_request': 2},
-            }
-        }
-
-        cost_cents = 0
-        if provider in PRICING and model in PRICING[provider]:
-            pricing = PRICING[provider][model]
-            if 'per_request' in pricing:
-                cost_cents = pricing['per_request']
-            else:
-                cost_cents = int(
-                    (input_tokens / 1_000_000) * pricing.get('input', 0) * 100 +
-                    (output_tokens / 1_000_000) * pricing.get('output', 0) * 100
-                )
-
-        cursor.execute("""
-            INSERT INTO api_usage (
-                tenant_id, provider, endpoint, model,
-                input_tokens, output_tokens, cost_cents,
-                latency_ms, success, operation
-            ) VALUES (
-                %s::uuid, %s, %s, %s,
-                %s, %s, %s,
-                %s, %s, %s
-            )
-        """, (
-            tenant_id, provider, endpoint, model,
-            input_tokens, output_tokens, cost_cents,
-            latency_ms, success, operation
-        ))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
     except Exception:
         pass
 
@@ -119,86 +82,75 @@ def search_documents_for_person(
     co: cohere.ClientV2,
     top_k: int = 10
 ) -> list:
-    """Search for documents mentioning a person using semantic search."""
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
+    """Search for documents mentioning a person using hybrid name + semantic search."""
 
     # Create search query focused on the person
     search_query = f"documents about {person_name}, mentions of {person_name}, {person_name}'s life events"
 
     # Embed the query
     try:
+        embed_model, embed_dimension = active_model("text")
         embed_start = time.time()
-        embed_response = co.embed(
-            texts=[search_query],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024
+        query_embedding, embed_tokens, cache_hit = embed_query(
+            co, search_query, model=embed_model, output_dimension=embed_dimension
         )
         embed_latency = int((time.time() - embed_start) * 1000)
-        query_embedding = embed_response.embeddings.float_[0]
 
-        log_api_usage(
-            tenant_id=tenant_id,
-            provider="cohere",
-            endpoint="embed",
-            model="embed-v4.0",
-            input_tokens=len(search_query.split()),
-            latency_ms=embed_latency,
-            success=True,
-            operation="biography_search_embed"
-        )
+        if not cache_hit:
+            log_api_usage(
+                tenant_id=tenant_id,
+                provider="cohere",
+                endpoint="embed",
+                model=embed_model,
+                input_tokens=embed_tokens,
+                latency_ms=embed_latency,
+                success=True,
+                operation="biography_search_embed"
+            )
     except Exception as e:
         print(f"[Biography] Embed error: {e}")
         return []
 
-    # Vector search
+    # Hybrid search
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Enable iterative scans for filtered queries
-        cursor.execute("SET hnsw.iterative_scan = strict_order;")
-
-        # Search with person name filter in content
-        cursor.execute("""
-            SELECT id, title, content, category, extracted_data,
-                   embedding <=> %s::vector AS distance
-            FROM family_documents
-            WHERE tenant_id = %s::uuid
-              AND embedding IS NOT NULL
-              AND (
-                  LOWER(content) LIKE LOWER(%s)
-                  OR LOWER(title) LIKE LOWER(%s)
-              )
-            ORDER BY distance
-            LIMIT %s
-        """, (query_embedding, tenant_id, f'%{person_name}%', f'%{person_name}%', top_k * 2))
-
-        results = cursor.fetchall()
-
-        # If no results with name filter, try pure semantic search
-        if not results:
-            cursor.execute("""
-                SELECT id, title, content, category, extracted_data,
-                       embedding <=> %s::vector AS distance
-                FROM family_documents
-                WHERE tenant_id = %s::uuid AND embedding IS NOT NULL
-                ORDER BY distance
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Enable iterative scans for filtered queries
+            cursor.execute("SET hnsw.iterative_scan = strict_order;")
+            precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "family_documents", "full", "d"
+            )
+
+            # Hybrid search: the name must match lexically (search_tsv GIN index)
+            # or the person-focused query must match semantically; RRF ranks
+            # documents that do both first
+            cte_sql, cte_params = hybrid_cte(
+                from_sql="family_documents d",
+                id_expr="d.id",
+                tsv_expr="d.search_tsv",
+                where_sql="d.tenant_id = %s::uuid",
+                where_params=[tenant_id],
+                query_text='"' + person_name.replace('"', '') + '"',  # phrase match
+                distance_sql="d.embedding <=> %s::vector",
+                distance_params=[query_embedding],
+                vector_where=f"d.embedding IS NOT NULL {bucket_filter}",
+                candidates=top_k * 2,
+                match_all=True,
+                precision=precision
+            )
+            cursor.execute(cte_sql + """
+                SELECT d.id, d.title, d.content, d.category, d.extracted_data,
+                       fused.rrf_score
+                FROM fused
+                JOIN family_documents d ON d.id = fused.id
+                ORDER BY fused.rrf_score DESC
                 LIMIT %s
-            """, (query_embedding, tenant_id, top_k))
+            """, cte_params + [top_k * 2])
+
             results = cursor.fetchall()
 
-        cursor.close()
-        conn.close()
+            cursor.close()
 
     except Exception as e:
         print(f"[Biography] DB error: {e}")
@@ -266,7 +218,7 @@ def search_documents_for_person(
                 "content": r[2][:6000],
                 "category": r[3],
                 "extracted_data": r[4] if r[4] else {},
-                "relevance": 0.5
+                "relevance": rrf_relevance(r[5])
             }
             for r in results[:top_k]
         ]
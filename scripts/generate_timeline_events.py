@@ -5,6 +5,7 @@
 # requirements:
 #   - psycopg2-binary
 #   - groq
+#   - cohere
 #   - wmill
 
 """
@@ -13,10 +14,15 @@ Extract timeline events from a document using AI and store them in the database.
 This script analyzes document content and extracts significant dates and events,
 storing them in the timeline_events table for visualization.
 
+Documents enriched at ingest (document_enrichment.py) already have their
+extracted events; those are returned without another LLM call unless
+replace is set, which regenerates them.
+
 Args:
-    document_id (str): The document UUID to extract events from
+    document_id (int): The family_documents id to extract events from
     tenant_id (str): Tenant UUID for multi-tenant isolation
     user_id (int): User performing the extraction (for audit)
+    replace (bool): Delete the document's extracted events and extract again
 
 Returns:
     dict: {
@@ -29,10 +35,10 @@ Returns:
 
 import psycopg2
 import json
-from datetime import datetime
 from typing import Optional
 import wmill
 from groq import Groq
+from document_enrichment import parse_date, store_timeline_events
 
 
 # Event type mapping for categorization
@@ -108,37 +114,31 @@ Extract all timeline events from this document."""
         return []
 
 
-def parse_date(date_str: str) -> Optional[str]:
-    """Parse various date formats into YYYY-MM-DD."""
-    if not date_str:
-        return None
-
-    # Common date formats to try
-    formats = [
-        '%Y-%m-%d',
-        '%Y/%m/%d',
-        '%m/%d/%Y',
-        '%d/%m/%Y',
-        '%B %d, %Y',
-        '%b %d, %Y',
-        '%Y-%m',
-        '%Y',
+def extracted_events(cursor, tenant_id: str, document_id: int) -> list[dict]:
+    """The document's AI-extracted events, in store_timeline_events' format."""
+    cursor.execute("""
+        SELECT id, event_date, event_type, title, confidence
+        FROM timeline_events
+        WHERE document_id = %s AND tenant_id = %s::uuid AND source = 'extracted'
+        ORDER BY event_date, id
+    """, (document_id, tenant_id))
+    return [
+        {
+            'id': row[0],
+            'event_date': row[1].isoformat() if row[1] else None,
+            'event_type': row[2],
+            'title': row[3],
+            'confidence': float(row[4]) if row[4] is not None else None,
+        }
+        for row in cursor.fetchall()
     ]
 
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(date_str.strip(), fmt)
-            return dt.strftime('%Y-%m-%d')
-        except ValueError:
-            continue
-
-    return None
-
 
 def main(
-    document_id: str,
+    document_id: int,
     tenant_id: str,
     user_id: Optional[int] = None,
+    replace: bool = False,
 ) -> dict:
     """Extract timeline events from a document."""
 
@@ -161,17 +161,34 @@ def main(
         # Get document content
         cursor.execute("""
             SELECT title, content, category, extracted_data
-            FROM documents
-            WHERE id = %s AND tenant_id = %s
+            FROM family_documents
+            WHERE id = %s AND tenant_id = %s::uuid
         """, (document_id, tenant_id))
 
         doc = cursor.fetchone()
         if not doc:
+            cursor.close()
+            conn.close()
             return {"success": False, "error": "Document not found"}
 
         title, content, category, extracted_data = doc
 
+        # Enriched at ingest: no second LLM call, no duplicate events
+        existing = extracted_events(cursor, tenant_id, document_id)
+        if existing and not replace:
+            cursor.close()
+            conn.close()
+            return {
+                "success": True,
+                "events_created": 0,
+                "events": existing,
+                "message": f"Document already has {len(existing)} extracted events"
+            }
+        conn.rollback()
+
         if not content:
+            cursor.close()
+            conn.close()
             return {"success": False, "error": "Document has no content to analyze"}
 
         # Extract events using AI
@@ -187,7 +204,7 @@ def main(
                         'event_date': expiry_date,
                         'event_type': 'insurance' if category == 'insurance' else 'legal',
                         'title': f'{title} - Expiration',
-                        'description': f'Document expires on this date',
+                        'description': 'Document expires on this date',
                         'confidence': 0.95,
                     })
 
@@ -199,53 +216,31 @@ def main(
                         'event_date': eff_date,
                         'event_type': category or 'other',
                         'title': f'{title} - Effective Date',
-                        'description': f'Document becomes effective',
+                        'description': 'Document becomes effective',
                         'confidence': 0.95,
                     })
 
-        # Insert events into database
-        events_created = []
-        for event in ai_events:
-            event_date = parse_date(event.get('event_date', ''))
-            if not event_date:
-                continue  # Skip events without valid dates
-
-            event_end_date = parse_date(event.get('event_end_date'))
-            event_type = event.get('event_type', 'other')
-            event_title = event.get('title', '')[:255]
-            description = event.get('description', '')
-            family_member_name = event.get('family_member_name')
-            confidence = event.get('confidence', 0.7)
-
-            # Validate event_type
-            valid_types = ['birth', 'death', 'wedding', 'anniversary', 'graduation',
-                          'medical', 'legal', 'financial', 'insurance', 'purchase',
-                          'travel', 'milestone', 'photo', 'other']
-            if event_type not in valid_types:
-                event_type = 'other'
-
+        # The document row lock serializes concurrent runs for the same document
+        cursor.execute("SELECT id FROM family_documents WHERE id = %s FOR UPDATE", (document_id,))
+        if replace:
             cursor.execute("""
-                INSERT INTO timeline_events (
-                    tenant_id, event_date, event_end_date, event_type,
-                    title, description, document_id, family_member_name,
-                    source, confidence, extracted_data, created_by
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (
-                tenant_id, event_date, event_end_date, event_type,
-                event_title, description, document_id, family_member_name,
-                'extracted', confidence, json.dumps(event), user_id
-            ))
-
-            event_id = cursor.fetchone()[0]
-            events_created.append({
-                'id': event_id,
-                'event_date': event_date,
-                'event_type': event_type,
-                'title': event_title,
-                'confidence': confidence,
-            })
+                DELETE FROM timeline_events
+                WHERE document_id = %s AND tenant_id = %s::uuid AND source = 'extracted'
+            """, (document_id, tenant_id))
+        else:
+            existing = extracted_events(cursor, tenant_id, document_id)
+            if existing:
+                conn.rollback()
+                cursor.close()
+                conn.close()
+                return {
+                    "success": True,
+                    "events_created": 0,
+                    "events": existing,
+                    "message": f"Document already has {len(existing)} extracted events"
+                }
+
+        events_created = store_timeline_events(cursor, tenant_id, document_id, ai_events, user_id)
 
         conn.commit()
         cursor.close()
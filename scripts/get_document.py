@@ -31,7 +31,8 @@ Returns:
 """
 
 import psycopg2
-import wmill
+from db_pool import get_connection
+from blob_store import blob_url
 
 
 def main(document_id: int) -> dict:
@@ -41,59 +42,49 @@ def main(document_id: int) -> dict:
     if not document_id:
         return {"success": False, "error": "Document ID is required", "document": None}
 
-    # Fetch database resource
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        cursor = conn.cursor()
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT d.id, d.title, d.content, d.category, d.source_file, d.created_by,
-                   d.created_at, d.updated_at, d.assigned_to, fm.name as assigned_to_name,
-                   d.visibility, d.extracted_data,
-                   d.has_image_embedding, d.image_url, d.content_type
-            FROM family_documents d
-            LEFT JOIN family_members fm ON d.assigned_to = fm.id
-            WHERE d.id = %s
-        """, (document_id,))
+            cursor.execute("""
+                SELECT d.id, d.title, d.content, d.category, d.source_file, d.created_by,
+                       d.created_at, d.updated_at, d.assigned_to, fm.name as assigned_to_name,
+                       d.visibility, d.extracted_data,
+                       d.has_image_embedding, d.image_url, d.content_type, d.image_hash
+                FROM family_documents d
+                LEFT JOIN family_members fm ON d.assigned_to = fm.id
+                WHERE d.id = %s
+            """, (document_id,))
 
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            row = cursor.fetchone()
+            cursor.close()
 
-        if not row:
-            return {"success": False, "error": "Document not found", "document": None}
+            if not row:
+                return {"success": False, "error": "Document not found", "document": None}
 
-        document = {
-            "id": row[0],
-            "title": row[1],
-            "content": row[2],
-            "category": row[3],
-            "source_file": row[4],
-            "created_by": row[5],
-            "created_at": row[6].isoformat() if row[6] else None,
-            "updated_at": row[7].isoformat() if row[7] else None,
-            "assigned_to": row[8],
-            "assigned_to_name": row[9],
-            "visibility": row[10] or "everyone",
-            "extracted_data": row[11] if row[11] else None,
-            "has_image_embedding": row[12] or False,
-            "image_url": row[13],
-            "content_type": row[14] or "text",
-        }
+            document = {
+                "id": row[0],
+                "title": row[1],
+                "content": row[2],
+                "category": row[3],
+                "source_file": row[4],
+                "created_by": row[5],
+                "created_at": row[6].isoformat() if row[6] else None,
+                "updated_at": row[7].isoformat() if row[7] else None,
+                "assigned_to": row[8],
+                "assigned_to_name": row[9],
+                "visibility": row[10] or "everyone",
+                "extracted_data": row[11] if row[11] else None,
+                "has_image_embedding": row[12] or False,
+                # Signed blob URL; image_url only holds legacy values
+                "image_url": blob_url(row[15], "images") if row[15] else row[13],
+                "content_type": row[14] or "text",
+            }
 
-        return {
-            "success": True,
-            "document": document
-        }
+            return {
+                "success": True,
+                "document": document
+            }
 
     except psycopg2.Error as e:
         return {"success": False, "error": f"Database error: {str(e)}", "document": None}
@@ -6,6 +6,7 @@ Returns all versions of a document with metadata, sorted by version number desce
 
 from typing import TypedDict, Optional
 import wmill
+from version_store import version_contents
 
 
 class VersionInfo(TypedDict):
@@ -80,7 +81,6 @@ def main(
             SELECT
                 dv.version_number,
                 dv.title,
-                LEFT(dv.content, 200) as content_preview,
                 dv.content_hash,
                 dv.file_size_bytes,
                 dv.change_summary,
@@ -94,13 +94,16 @@ def main(
 
         versions = cursor.fetchall()
 
+        # Delta-encoded versions have no content column; rebuild them for previews
+        contents = version_contents(conn, document_id)
+
         # Mark current version
         result_versions = []
         for v in versions:
             version_info: VersionInfo = {
                 'version_number': v['version_number'],
                 'title': v['title'],
-                'content_preview': v['content_preview'] or '',
+                'content_preview': (contents.get(v['version_number']) or '')[:200],
                 'content_hash': v['content_hash'],
                 'file_size_bytes': v['file_size_bytes'],
                 'change_summary': v['change_summary'],
@@ -0,0 +1,57 @@
+# get_ingest_job.py
+# Windmill Python script for polling a queued ingest job
+# Path: f/chatbot/get_ingest_job
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+#   - httpx
+
+"""
+Get the status (and, once finished, the result) of an ingest job queued by
+enqueue_ingest or the email trigger.
+
+Args:
+    job_id (int): ID returned by enqueue_ingest
+    tenant_id (str): UUID of the tenant that queued the job
+
+Returns:
+    dict: {
+        success: bool,
+        job: {
+            id: int,
+            stage: str,
+            status: "pending" | "processing" | "completed" | "failed" | "dead",
+            queue_position: int (while pending),
+            attempts: int,
+            max_attempts: int,
+            document_id: int | null,
+            result: dict | null (the stage script's return value),
+            last_error: str | null,
+            follow_ups: [{id, stage, status}],
+            created_at, started_at, completed_at: str (ISO format)
+        } | null,
+        error: str (if failed)
+    }
+"""
+
+import psycopg2
+from ingest_queue import get_job
+
+
+def main(job_id: int, tenant_id: str) -> dict:
+    """Get an ingest job's status."""
+    if not job_id or not tenant_id:
+        return {"success": False, "error": "job_id and tenant_id are required", "job": None}
+
+    try:
+        job = get_job(job_id, tenant_id)
+    except psycopg2.Error as e:
+        return {"success": False, "error": f"Database error: {str(e)}", "job": None}
+
+    if not job:
+        return {"success": False, "error": "Job not found", "job": None}
+
+    # Arguments can hold whole files (base64); the caller already has them
+    job.pop("payload", None)
+    return {"success": True, "job": job}
@@ -3,6 +3,7 @@
 # Path: f/chatbot/get_related_documents
 #
 # requirements:
+#   - numpy
 #   - psycopg2-binary
 #   - wmill
 
@@ -12,6 +13,11 @@ Find documents similar to a given document using vector similarity.
 This endpoint finds semantically related documents by comparing embeddings.
 Useful for "You might also want to see..." suggestions.
 
+Related documents are read from the precomputed document_neighbors graph
+(document_neighbors.py), filtered by visibility. Documents without a stored
+list, or whose list the visibility filter leaves short, fall back to a live
+vector query.
+
 Args:
     document_id: ID of the source document
     tenant_id: UUID for data isolation
@@ -23,9 +29,10 @@ Returns:
     dict: {related_documents: [...], source_document: {...}}
 """
 
-import psycopg2
 from typing import TypedDict, List
-import wmill
+from db_pool import get_connection
+from document_access import shared_document_ids, visibility_filter
+from document_neighbors import NEIGHBOR_K
 
 
 class RelatedDocument(TypedDict):
@@ -49,28 +56,6 @@ class RelatedDocumentsResult(TypedDict):
     error: str | None
 
 
-def build_visibility_filter(user_member_type: str | None, user_member_id: int | None) -> tuple[str, list]:
-    """Build SQL WHERE clause for visibility filtering."""
-    if not user_member_type or user_member_type == 'admin':
-        return "", []
-
-    elif user_member_type == 'adult':
-        return """
-            AND (
-                d2.visibility IN ('everyone', 'adults_only')
-                OR (d2.visibility = 'private' AND d2.assigned_to = %s)
-            )
-        """, [user_member_id] if user_member_id else []
-
-    else:  # teen, child
-        return """
-            AND (
-                d2.visibility = 'everyone'
-                OR (d2.visibility = 'private' AND d2.assigned_to = %s)
-            )
-        """, [user_member_id] if user_member_id else []
-
-
 def main(
     document_id: int,
     tenant_id: str,
@@ -89,84 +74,101 @@ def main(
             "error": "document_id and tenant_id are required"
         }
 
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-
-    conn = psycopg2.connect(
-        host=postgres_db['host'],
-        port=postgres_db['port'],
-        dbname=postgres_db['dbname'],
-        user=postgres_db['user'],
-        password=postgres_db['password'],
-        sslmode=postgres_db.get('sslmode', 'disable')
-    )
-    cursor = conn.cursor()
-
     try:
-        # First, get the source document to verify it exists and get its title
-        # Note: Uses family_documents table (legacy) which has tenant_id column added
-        cursor.execute("""
-            SELECT id, title, category, embedding IS NOT NULL as has_embedding
-            FROM family_documents
-            WHERE id = %s AND tenant_id = %s::uuid
-        """, (document_id, tenant_id))
-
-        source_row = cursor.fetchone()
-        if not source_row:
-            conn.close()
-            return {
-                "success": False,
-                "related": [],
-                "related_documents": [],
-                "source_document": None,
-                "error": f"Document {document_id} not found"
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+
+            # First, get the source document to verify it exists and get its title
+            # Note: Uses family_documents table (legacy) which has tenant_id column added
+            cursor.execute("""
+                SELECT id, title, category, embedding IS NOT NULL as has_embedding
+                FROM family_documents
+                WHERE id = %s AND tenant_id = %s::uuid
+            """, (document_id, tenant_id))
+
+            source_row = cursor.fetchone()
+            if not source_row:
+                cursor.close()
+                return {
+                    "success": False,
+                    "related": [],
+                    "related_documents": [],
+                    "source_document": None,
+                    "error": f"Document {document_id} not found"
+                }
+
+            source_document = {
+                "id": source_row[0],
+                "title": source_row[1],
+                "category": source_row[2]
             }
 
-        source_document = {
-            "id": source_row[0],
-            "title": source_row[1],
-            "category": source_row[2]
-        }
-
-        if not source_row[3]:  # No embedding
-            conn.close()
-            return {
-                "success": False,
-                "related": [],
-                "related_documents": [],
-                "source_document": source_document,
-                "error": "Source document has no embedding for similarity search"
-            }
+            if not source_row[3]:  # No embedding
+                cursor.close()
+                return {
+                    "success": False,
+                    "related": [],
+                    "related_documents": [],
+                    "source_document": source_document,
+                    "error": "Source document has no embedding for similarity search"
+                }
+
+            # Build visibility filter (document_access.py)
+            visibility_clause, visibility_params = visibility_filter(
+                "d2", user_member_type, user_member_id,
+                shared_document_ids(cursor, tenant_id, user_member_id)
+            )
 
-        # Build visibility filter
-        visibility_clause, visibility_params = build_visibility_filter(
-            user_member_type, user_member_id
-        )
-
-        # Find similar documents using vector similarity
-        # Uses pgvector's <=> operator for cosine distance
-        # Note: Uses family_documents table (legacy) which has tenant_id column added
-        query = f"""
-            SELECT
-                d2.id,
-                d2.title,
-                d2.category,
-                1 - (d2.embedding <=> d1.embedding) as similarity,
-                d2.created_at,
-                COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d2.metadata->'tags') t), ARRAY[]::text[]) as tags
-            FROM family_documents d1
-            JOIN family_documents d2 ON d1.tenant_id = d2.tenant_id AND d1.id != d2.id
-            WHERE d1.id = %s
-              AND d1.tenant_id = %s::uuid
-              AND d2.embedding IS NOT NULL
-              {visibility_clause}
-            ORDER BY d2.embedding <=> d1.embedding
-            LIMIT %s
-        """
-
-        params = [document_id, tenant_id] + visibility_params + [limit]
-        cursor.execute(query, params)
-
-        results = cursor.fetchall()
+            # Stored neighbour list: a primary-key lookup
+            cursor.execute(f"""
+                SELECT
+                    d2.id,
+                    d2.title,
+                    d2.category,
+                    n.similarity,
+                    d2.created_at,
+                    COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d2.metadata->'tags') t), ARRAY[]::text[]) as tags
+                FROM document_neighbors n
+                JOIN family_documents d2 ON d2.id = n.neighbor_id
+                WHERE n.document_id = %s
+                  {visibility_clause}
+                ORDER BY n.similarity DESC
+                LIMIT %s
+            """, [document_id] + visibility_params + [limit])
+            results = cursor.fetchall()
+
+            if len(results) < limit:
+                cursor.execute("SELECT COUNT(*) FROM document_neighbors WHERE document_id = %s", (document_id,))
+                stored = cursor.fetchone()[0]
+            else:
+                stored = len(results)
+
+            # Not computed yet, or a full list the filter thinned out
+            if stored == 0 or (len(results) < limit and stored >= NEIGHBOR_K):
+                # Find similar documents using vector similarity
+                # Uses pgvector's <=> operator for cosine distance
+                query = f"""
+                    SELECT
+                        d2.id,
+                        d2.title,
+                        d2.category,
+                        1 - (d2.embedding <=> d1.embedding) as similarity,
+                        d2.created_at,
+                        COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d2.metadata->'tags') t), ARRAY[]::text[]) as tags
+                    FROM family_documents d1
+                    JOIN family_documents d2 ON d1.tenant_id = d2.tenant_id AND d1.id != d2.id
+                    WHERE d1.id = %s
+                      AND d1.tenant_id = %s::uuid
+                      AND d2.embedding IS NOT NULL
+                      {visibility_clause}
+                    ORDER BY d2.embedding <=> d1.embedding
+                    LIMIT %s
+                """
+
+                params = [document_id, tenant_id] + visibility_params + [limit]
+                cursor.execute(query, params)
+                results = cursor.fetchall()
+            cursor.close()
 
         related_documents = []
         for row in results:
@@ -179,9 +181,6 @@ def main(
                 "tags": row[5] if row[5] else []
             })
 
-        cursor.close()
-        conn.close()
-
         return {
             "success": True,
             "related": related_documents,  # Alias for path_test.py compatibility
@@ -191,8 +190,6 @@ def main(
         }
 
     except Exception as e:
-        cursor.close()
-        conn.close()
         return {
             "success": False,
             "related": [],
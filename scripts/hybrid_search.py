@@ -0,0 +1,231 @@
+# hybrid_search.py
+# Windmill Python library - Hybrid lexical + vector retrieval
+# Path: f/chatbot/hybrid_search
+#
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Hybrid Search for Archevi
+=========================
+
+Combines pgvector nearest-neighbour candidates with Postgres full-text
+candidates (search_tsv + GIN, migration 018) and fuses the two rankings
+with Reciprocal Rank Fusion:
+
+    rrf_score = 1 / (k + vector_rank) + 1 / (k + lexical_rank)
+
+Embeddings are good at meaning and bad at exact tokens; full-text search is
+the opposite. Policy numbers, account numbers and names such as
+"BCBS-2024-789456" are found by the lexical leg even when the vector leg
+ranks them nowhere.
+
+Both legs and the fusion run in a single SQL statement. `hybrid_cte()`
+returns the `WITH ... fused AS (...)` prefix; the caller appends its own
+SELECT joining `fused` to whatever columns it needs.
+
+With precision="half", "binary" or "coarse" the vector leg shortlists
+from the quantized or 256-d HNSW indexes (migrations 029 and 030) and
+rescores the shortlist with distance_sql (see vector_quantization.py).
+Call vector_quantization.set_search_precision() on the cursor first.
+With precision="exact" the vector leg ranks every row passing the filters
+without an index (small tenants, see vector_partitions.py).
+
+vector_scopes splits the vector leg into separately searched filters, e.g.
+a member's access level through the tenant's bucket index plus their
+private documents scanned exactly (document_access.py).
+
+Usage:
+    from hybrid_search import hybrid_cte
+
+    cte_sql, cte_params = hybrid_cte(
+        from_sql="family_documents d",
+        id_expr="d.id",
+        tsv_expr="d.search_tsv",
+        where_sql="d.tenant_id = %s::uuid",
+        where_params=[tenant_id],
+        query_text=query,
+        distance_sql="d.embedding <=> %s::vector",
+        distance_params=[query_embedding],
+        vector_where="d.embedding IS NOT NULL",
+    )
+    cursor.execute(cte_sql + '''
+        SELECT d.id, d.title, fused.rrf_score
+        FROM fused JOIN family_documents d ON d.id = fused.id
+        ORDER BY fused.rrf_score DESC
+        LIMIT %s
+    ''', cte_params + [15])
+
+Windmill Script Configuration:
+- Path: f/chatbot/hybrid_search
+- This is a library module, not a standalone script
+"""
+
+from typing import Optional
+
+from vector_quantization import first_stage_distance, shortlist_size
+
+
+RRF_K = 60                 # Standard RRF damping constant
+DEFAULT_CANDIDATES = 40    # Candidates taken from each leg before fusion
+TS_CONFIG = "english"      # Must match the search_tsv generated columns
+
+
+def _vector_legs(
+    from_sql: str,
+    id_expr: str,
+    where_sql: str,
+    where_params: list,
+    distance_sql: str,
+    distance_params: list,
+    candidates: int,
+    precision: str,
+    vector_columns: Optional[list]
+) -> list[tuple[str, list, bool]]:
+    """
+    Subqueries of the vector leg as (sql, params, final). Final subqueries
+    are already ordered by distance and limited to `candidates`; quantized
+    shortlists (one per vector column) still need rescoring.
+    """
+    select = f"SELECT {id_expr} AS id, {distance_sql} AS distance FROM {from_sql} WHERE {where_sql}"
+    params = list(distance_params) + list(where_params)
+    if precision == "full":
+        return [(f"{select} ORDER BY distance LIMIT %s", params + [candidates], True)]
+    if precision == "exact":
+        # OFFSET 0 keeps the ORDER BY out of the subquery, so no index scan
+        return [(
+            f"SELECT id, distance FROM ({select} OFFSET 0) exact_scan ORDER BY distance LIMIT %s",
+            params + [candidates], True
+        )]
+    query_embedding = distance_params[0]
+    return [
+        (
+            f"{select} AND {column} IS NOT NULL "
+            f"ORDER BY {first_stage_distance(column, precision, len(query_embedding))} LIMIT %s",
+            params + [query_embedding, shortlist_size(candidates, precision)], False
+        )
+        for column in vector_columns
+    ]
+
+
+def hybrid_cte(
+    from_sql: str,
+    id_expr: str,
+    tsv_expr: str,
+    where_sql: str,
+    where_params: list,
+    query_text: str,
+    distance_sql: str,
+    distance_params: list,
+    vector_where: str,
+    candidates: int = DEFAULT_CANDIDATES,
+    rrf_k: int = RRF_K,
+    match_all: bool = False,
+    precision: str = "full",
+    vector_columns: Optional[list] = None,
+    vector_scopes: Optional[list] = None
+) -> tuple[str, list]:
+    """
+    Build the CTEs for a hybrid (vector + full-text) search fused with RRF.
+
+    Args:
+        from_sql: FROM clause body, e.g. "family_documents d"
+        id_expr: Expression identifying a result row, e.g. "d.id"
+        tsv_expr: tsvector column for the lexical leg, e.g. "d.search_tsv"
+        where_sql: Filter shared by both legs (tenant, visibility, ...)
+        where_params: Parameters for where_sql
+        query_text: Raw user text for websearch_to_tsquery
+        distance_sql: Vector distance expression using %s placeholders
+        distance_params: Parameters for distance_sql (usually the query embedding)
+        vector_where: Extra filter for the vector leg, e.g. "d.embedding IS NOT NULL"
+        candidates: Rows taken from each leg before fusion
+        rrf_k: RRF damping constant
+        match_all: Require every query term in lexical hits. By default terms
+            are OR-ed and ts_rank_cd rewards documents matching more of them,
+            which suits natural-language questions.
+        precision: "full", or "half"/"binary"/"coarse" for a smaller first stage
+            rescored with distance_sql, or "exact" for a scan without HNSW
+        vector_columns: Columns distance_sql ranks, e.g. ["d.embedding"];
+            required for a quantized precision. With several columns each
+            is shortlisted separately. distance_params[0] must be the query
+            embedding.
+        vector_scopes: Alternative filters for the vector leg as (sql,
+            params, exact), each searched separately and merged, so each can
+            use its own plan (document_access.access_filter).
+            Exact scopes are scanned without an index.
+
+    Returns:
+        (sql, params) - sql defines the CTEs `hybrid_query`, `vector_hits`,
+        `lexical_hits` and `fused(id, rrf_score, distance, vector_rank,
+        lexical_rank)`. distance is NULL for lexical-only hits.
+    """
+    if precision not in ("full", "exact") and not vector_columns:
+        raise ValueError("vector_columns is required for a quantized precision")
+
+    legs = []
+    for scope_sql, scope_params, scope_exact in (vector_scopes or [("", [], False)]):
+        legs += _vector_legs(
+            from_sql, id_expr, f"{where_sql} AND {vector_where} {scope_sql}",
+            list(where_params) + list(scope_params), distance_sql, distance_params,
+            candidates, "exact" if scope_exact else precision, vector_columns
+        )
+    if len(legs) == 1 and legs[0][2]:
+        vector_sql, vector_params, _ = legs[0]
+    else:
+        # UNION drops rows found by more than one leg (same id, same distance)
+        vector_sql = f"""
+                SELECT id, distance FROM ({" UNION ".join(f"({leg})" for leg, _, _ in legs)}) shortlist
+                ORDER BY distance
+                LIMIT %s
+        """
+        vector_params = [param for _, leg_params, _ in legs for param in leg_params] + [candidates]
+
+    sql = f"""
+        WITH hybrid_query AS (
+            SELECT CASE
+                       WHEN %s OR position('!' IN q::text) > 0 THEN q
+                       ELSE replace(q::text, ' & ', ' | ')::tsquery
+                   END AS tsq
+            FROM websearch_to_tsquery('{TS_CONFIG}', %s) q
+        ),
+        vector_hits AS (
+            SELECT id, distance, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+            FROM ({vector_sql}) v
+        ),
+        lexical_hits AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                SELECT {id_expr} AS id, ts_rank_cd({tsv_expr}, hq.tsq) AS score
+                FROM {from_sql}
+                CROSS JOIN hybrid_query hq
+                WHERE {where_sql} AND {tsv_expr} @@ hq.tsq
+                ORDER BY score DESC
+                LIMIT %s
+            ) l
+        ),
+        fused AS (
+            SELECT COALESCE(v.id, l.id) AS id,
+                   COALESCE(1.0 / (%s + v.rank), 0) + COALESCE(1.0 / (%s + l.rank), 0) AS rrf_score,
+                   v.distance,
+                   v.rank AS vector_rank,
+                   l.rank AS lexical_rank
+            FROM vector_hits v
+            FULL OUTER JOIN lexical_hits l ON v.id = l.id
+        )
+    """
+    params = (
+        [match_all, query_text or ""]
+        + vector_params
+        + list(where_params) + [candidates]
+        + [rrf_k, rrf_k]
+    )
+    return sql, params
+
+
+def rrf_relevance(rrf_score: Optional[float], rrf_k: int = RRF_K) -> float:
+    """Scale an RRF score to 0..1 (1.0 = ranked first by both legs)."""
+    if not rrf_score:
+        return 0.0
+    return round(min(1.0, float(rrf_score) * (rrf_k + 1) / 2), 3)
@@ -0,0 +1,478 @@
+# ingest_queue.py
+# Windmill Python library - Durable ingest job queue
+# Path: f/chatbot/ingest_queue
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Ingest Job Queue for Archevi
+============================
+
+Postgres-backed queue (`ingest_jobs`, migration 026) between the upload
+endpoints and the scripts that do the work. Uploads insert a job and return
+at once; ingest_worker.py claims jobs and runs them.
+
+- Claiming uses FOR UPDATE SKIP LOCKED, so any number of workers can poll
+  the same table without handing a job out twice.
+- Fairness: runnable jobs are taken round-robin across tenants (each
+  tenant's oldest job first), and a tenant never has more than
+  INGEST_MAX_RUNNING_PER_TENANT jobs running at once, so one family's
+  thousand-file import does not hold up everyone else's single upload.
+- Backpressure: enqueue() raises QueueFull once a tenant has
+  INGEST_MAX_PENDING_PER_TENANT jobs waiting (or the whole queue has
+  INGEST_MAX_PENDING); endpoints turn that into a retry-later response.
+- Retries: a job whose handler raises goes back to pending with exponential
+  backoff (INGEST_RETRY_BASE_SECS doubling, capped at INGEST_RETRY_MAX_SECS,
+  with jitter). After max_attempts it is marked dead (dead letter) and kept
+  for inspection; `main(action="retry_dead")` re-queues dead jobs.
+- Leases: a claimed job is held for INGEST_JOB_LEASE_SECS and renewed by
+  its worker. Jobs whose worker disappeared are released to pending (or
+  dead) by the next worker run.
+- Follow-up stages: an ingest job whose payload has "then" (e.g.
+  ["extract_data", "timeline_events"]) queues those stages for the new
+  document in the same transaction that completes it.
+
+A job's payload is {"args": {...}, "then": [...], "user_id": ...}; "args"
+are the keyword arguments of the stage's script (see ingest_worker.py).
+They are removed once the job completes or fails, and get_job never
+returns them.
+
+Usage:
+    from ingest_queue import enqueue, QueueFull
+
+    with get_connection() as conn:
+        job_id = enqueue(conn, "storage_upload", {"args": args}, tenant_id=tenant_id)
+        conn.commit()
+
+Windmill Script Configuration:
+- Path: f/chatbot/ingest_queue
+- This is a library module; main() reports stats and maintains the queue
+"""
+
+from typing import Any, Dict, Optional
+import json
+import os
+import random
+
+from db_pool import get_connection
+
+
+UPLOAD_STAGES = ("storage_upload", "email_forward", "zip_upload", "voice_note")
+FOLLOW_UP_STAGES = ("extract_data", "timeline_events")
+STAGES = UPLOAD_STAGES + FOLLOW_UP_STAGES
+
+MAX_PENDING_PER_TENANT = int(os.getenv("INGEST_MAX_PENDING_PER_TENANT", "200"))
+MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "5000"))
+MAX_RUNNING_PER_TENANT = int(os.getenv("INGEST_MAX_RUNNING_PER_TENANT", "2"))
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+LEASE_SECONDS = int(os.getenv("INGEST_JOB_LEASE_SECS", "900"))
+RETRY_BASE_SECONDS = float(os.getenv("INGEST_RETRY_BASE_SECS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("INGEST_RETRY_MAX_SECS", "3600"))
+RETENTION_DAYS = int(os.getenv("INGEST_RETENTION_DAYS", "14"))
+
+JOB_COLUMNS = """
+    id, tenant_id::text, document_id, stage, status, priority, payload, result,
+    attempts, max_attempts, run_after, last_error, parent_job_id,
+    created_at, started_at, completed_at
+"""
+
+# JOB_COLUMNS without the stage arguments, for status reads
+STATUS_COLUMNS = """
+    id, tenant_id::text, document_id, stage, status, priority, payload - 'args', result,
+    attempts, max_attempts, run_after, last_error, parent_job_id,
+    created_at, started_at, completed_at
+"""
+
+
+class QueueFull(Exception):
+    """The tenant (or the whole queue) has too many jobs waiting."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _job_dict(row) -> Dict[str, Any]:
+    (job_id, tenant_id, document_id, stage, status, priority, payload, result,
+     attempts, max_attempts, run_after, last_error, parent_job_id,
+     created_at, started_at, completed_at) = row
+    return {
+        "id": job_id,
+        "tenant_id": tenant_id,
+        "document_id": document_id,
+        "stage": stage,
+        "status": status,
+        "priority": priority,
+        "payload": payload or {},
+        "result": result,
+        "attempts": attempts,
+        "max_attempts": max_attempts,
+        "run_after": run_after.isoformat() if run_after else None,
+        "last_error": last_error,
+        "parent_job_id": parent_job_id,
+        "created_at": created_at.isoformat() if created_at else None,
+        "started_at": started_at.isoformat() if started_at else None,
+        "completed_at": completed_at.isoformat() if completed_at else None,
+    }
+
+
+def enqueue(
+    conn,
+    stage: str,
+    payload: Dict[str, Any],
+    tenant_id: Optional[str] = None,
+    document_id: Optional[int] = None,
+    priority: int = 0,
+    parent_job_id: Optional[int] = None,
+    check_backpressure: bool = True
+) -> int:
+    """
+    Insert a job inside the caller's transaction (no commit) and return its id.
+
+    Raises:
+        ValueError: unknown stage
+        QueueFull: too many jobs waiting (only when check_backpressure)
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown ingest stage: {stage}")
+
+    cursor = conn.cursor()
+    try:
+        if check_backpressure:
+            cursor.execute("""
+                SELECT
+                    COUNT(*) FILTER (WHERE tenant_id IS NOT DISTINCT FROM %s::uuid),
+                    COUNT(*)
+                FROM ingest_jobs
+                WHERE status = 'pending'
+            """, (tenant_id,))
+            tenant_pending, total_pending = cursor.fetchone()
+            if tenant_pending >= MAX_PENDING_PER_TENANT:
+                raise QueueFull(
+                    f"{tenant_pending} uploads are already waiting to be processed; try again shortly",
+                    retry_after=60
+                )
+            if total_pending >= MAX_PENDING:
+                raise QueueFull("The ingest queue is full; try again shortly", retry_after=120)
+
+        cursor.execute("""
+            INSERT INTO ingest_jobs (tenant_id, document_id, stage, priority, payload, max_attempts, parent_job_id)
+            VALUES (%s::uuid, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (tenant_id, document_id, stage, priority, json.dumps(payload), MAX_ATTEMPTS, parent_job_id))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def queue_position(conn, job_id: int) -> int:
+    """Pending jobs that were queued before this one (0 = next up)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM ingest_jobs
+        WHERE status = 'pending' AND id < %s AND run_after <= NOW()
+    """, (job_id,))
+    position = cursor.fetchone()[0]
+    cursor.close()
+    return position
+
+
+def claim_jobs(worker_id: str, limit: int) -> list[Dict[str, Any]]:
+    """
+    Claim up to `limit` runnable jobs for this worker.
+
+    Candidates are ranked round-robin across tenants (each tenant's n-th
+    job after the ones it already has running), so the first `limit` slots
+    go to as many different tenants as possible.
+    """
+    if limit <= 0:
+        return []
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            WITH running AS (
+                SELECT tenant_id, COUNT(*) AS n
+                FROM ingest_jobs
+                WHERE status = 'processing'
+                GROUP BY tenant_id
+            ),
+            ranked AS (
+                SELECT j.id,
+                       COALESCE(r.n, 0) + ROW_NUMBER() OVER (
+                           PARTITION BY j.tenant_id ORDER BY j.priority DESC, j.id
+                       ) AS slot
+                FROM ingest_jobs j
+                LEFT JOIN running r ON r.tenant_id IS NOT DISTINCT FROM j.tenant_id
+                WHERE j.status = 'pending' AND j.run_after <= NOW()
+            ),
+            picked AS (
+                SELECT id AS picked_id FROM ingest_jobs
+                WHERE id IN (
+                    SELECT id FROM ranked
+                    WHERE slot <= %s
+                    ORDER BY slot, id
+                    LIMIT %s
+                )
+                AND status = 'pending'
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE ingest_jobs j
+            SET status = 'processing',
+                attempts = j.attempts + 1,
+                locked_by = %s,
+                locked_at = NOW(),
+                started_at = COALESCE(j.started_at, NOW()),
+                updated_at = NOW()
+            FROM picked
+            WHERE j.id = picked.picked_id
+            RETURNING {JOB_COLUMNS}
+        """, (MAX_RUNNING_PER_TENANT, limit, worker_id))
+        jobs = [_job_dict(row) for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+    return jobs
+
+
+def renew_leases(worker_id: str, job_ids: list[int]) -> None:
+    """Extend this worker's lease on jobs it is still running."""
+    if not job_ids:
+        return
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ingest_jobs SET locked_at = NOW()
+            WHERE id = ANY(%s) AND locked_by = %s AND status = 'processing'
+        """, (job_ids, worker_id))
+        conn.commit()
+        cursor.close()
+
+
+def complete_job(job: Dict[str, Any], result: Dict[str, Any], failed: bool = False) -> list[int]:
+    """
+    Record a job's result and queue its follow-up stages.
+
+    Args:
+        job: the claimed job
+        result: the handler's return value
+        failed: the handler reported a failure it would repeat on retry
+
+    Returns:
+        ids of follow-up jobs queued
+    """
+    follow_ups = []
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = %s, result = %s, payload = payload - 'args', document_id = COALESCE(document_id, %s),
+                tenant_id = COALESCE(tenant_id, %s::uuid), last_error = %s, locked_by = NULL, locked_at = NULL,
+                completed_at = NOW(), updated_at = NOW()
+            WHERE id = %s
+        """, (
+            "failed" if failed else "completed",
+            json.dumps(result, default=str),
+            result.get("document_id"),
+            result.get("tenant_id"),
+            (result.get("error") or result.get("message")) if failed else None,
+            job["id"]
+        ))
+
+        document_id = result.get("document_id")
+        tenant_id = job["tenant_id"] or result.get("tenant_id")
+        if not failed and document_id and tenant_id:
+            for stage in job["payload"].get("then") or []:
+                if stage not in FOLLOW_UP_STAGES:
+                    continue
+                args = {"document_id": document_id, "tenant_id": tenant_id}
+                if stage == "timeline_events" and job["payload"].get("user_id"):
+                    args["user_id"] = job["payload"]["user_id"]
+                follow_ups.append(enqueue(
+                    conn, stage, {"args": args},
+                    tenant_id=tenant_id,
+                    document_id=document_id,
+                    priority=job["priority"] - 1,
+                    parent_job_id=job["id"],
+                    check_backpressure=False
+                ))
+
+        conn.commit()
+        cursor.close()
+    return follow_ups
+
+
+def fail_job(job: Dict[str, Any], error: str, retryable: bool = True) -> str:
+    """
+    Record a raised error: back to pending with backoff, or dead once
+    attempts are exhausted (or the error is not retryable).
+
+    Returns:
+        the job's new status
+    """
+    if retryable and job["attempts"] < job["max_attempts"]:
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1))
+        delay *= random.uniform(0.8, 1.2)
+        status = "pending"
+    else:
+        delay = 0
+        status = "dead"
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = %s, last_error = %s,
+                run_after = NOW() + make_interval(secs => %s),
+                locked_by = NULL, locked_at = NULL, updated_at = NOW(),
+                completed_at = CASE WHEN %s = 'dead' THEN NOW() END
+            WHERE id = %s
+        """, (status, error[:4000], delay, status, job["id"]))
+        conn.commit()
+        cursor.close()
+    return status
+
+
+def release_expired_leases() -> Dict[str, int]:
+    """Return jobs whose worker stopped renewing its lease to the queue."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END,
+                last_error = COALESCE(last_error || E'\\n', '') || 'Lease expired (worker lost)',
+                completed_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                locked_by = NULL, locked_at = NULL, updated_at = NOW()
+            WHERE status = 'processing'
+              AND locked_at < NOW() - make_interval(secs => %s)
+            RETURNING status
+        """, (LEASE_SECONDS,))
+        statuses = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+    return {"requeued": statuses.count("pending"), "dead": statuses.count("dead")}
+
+
+def get_job(job_id: int, tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """A job by id (restricted to tenant_id when given), with its queue position."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {STATUS_COLUMNS} FROM ingest_jobs
+            WHERE id = %s AND (%s::uuid IS NULL OR tenant_id = %s::uuid)
+        """, (job_id, tenant_id, tenant_id))
+        row = cursor.fetchone()
+        cursor.close()
+        if not row:
+            return None
+        job = _job_dict(row)
+        if job["status"] == "pending":
+            job["queue_position"] = queue_position(conn, job_id)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, stage, status FROM ingest_jobs
+            WHERE parent_job_id = %s ORDER BY id
+        """, (job_id,))
+        job["follow_ups"] = [
+            {"id": child_id, "stage": stage, "status": status}
+            for child_id, stage, status in cursor.fetchall()
+        ]
+        cursor.close()
+        conn.rollback()
+    return job
+
+
+def queue_stats() -> Dict[str, Any]:
+    """Job counts by stage and status, and the age of the oldest runnable job."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT stage, status, COUNT(*)
+            FROM ingest_jobs
+            WHERE status IN ('pending', 'processing', 'dead')
+               OR completed_at > NOW() - INTERVAL '1 hour'
+            GROUP BY stage, status
+        """)
+        by_stage: Dict[str, Dict[str, int]] = {}
+        for stage, status, count in cursor.fetchall():
+            by_stage.setdefault(stage, {})[status] = count
+        cursor.execute("""
+            SELECT EXTRACT(EPOCH FROM NOW() - MIN(run_after)),
+                   COUNT(DISTINCT tenant_id)
+            FROM ingest_jobs
+            WHERE status = 'pending' AND run_after <= NOW()
+        """)
+        oldest, tenants_waiting = cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+    return {
+        "by_stage": by_stage,
+        "oldest_runnable_seconds": round(float(oldest), 1) if oldest is not None else None,
+        "tenants_waiting": tenants_waiting,
+    }
+
+
+def retry_dead(job_id: Optional[int] = None, tenant_id: Optional[str] = None) -> int:
+    """Re-queue dead jobs (one job, one tenant's, or all) with fresh attempts."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET status = 'pending', attempts = 0, run_after = NOW(),
+                completed_at = NULL, updated_at = NOW()
+            WHERE status = 'dead'
+              AND (%s::bigint IS NULL OR id = %s)
+              AND (%s::uuid IS NULL OR tenant_id = %s::uuid)
+        """, (job_id, job_id, tenant_id, tenant_id))
+        count = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    return count
+
+
+def purge_finished(days: int = RETENTION_DAYS) -> int:
+    """Delete completed and failed jobs older than `days` (dead jobs are kept)."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM ingest_jobs
+            WHERE status IN ('completed', 'failed')
+              AND completed_at < NOW() - make_interval(days => %s)
+        """, (days,))
+        count = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    return count
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(
+    action: str = "stats",
+    job_id: Optional[int] = None,
+    tenant_id: Optional[str] = None
+) -> dict:
+    """
+    Inspect and maintain the ingest queue.
+
+    Args:
+        action: "stats", "retry_dead" (re-queue dead jobs, optionally one
+            job_id or tenant_id), "release" (expired leases) or "purge"
+            (finished jobs older than INGEST_RETENTION_DAYS; schedule daily)
+        job_id: Job for "retry_dead"
+        tenant_id: Tenant for "retry_dead"
+
+    Returns:
+        dict with the action's result
+    """
+    if action == "stats":
+        return {"success": True, **queue_stats()}
+    if action == "retry_dead":
+        return {"success": True, "requeued": retry_dead(job_id, tenant_id)}
+    if action == "release":
+        return {"success": True, **release_expired_leases()}
+    if action == "purge":
+        return {"success": True, "deleted": purge_finished()}
+    raise ValueError("action must be 'stats', 'retry_dead', 'release' or 'purge'")
@@ -0,0 +1,152 @@
+# ingest_worker.py
+# Windmill Python script - Runs queued ingest jobs
+# Path: f/chatbot/ingest_worker
+#
+# requirements:
+#   - cohere
+#   - groq
+#   - psycopg2-binary
+#   - pgvector
+#   - numpy
+#   - wmill
+#   - pypdf
+#   - httpx
+#   - resend
+
+"""
+Ingest Worker
+Claims jobs from ingest_jobs (ingest_queue.py) and runs each with the script
+that used to be called directly by the upload:
+
+    storage_upload   -> embed_document_from_storage.main
+    email_forward    -> process_email_forward.process_email
+    zip_upload       -> process_zip_upload.main
+    voice_note       -> transcribe_voice_note.main
+    extract_data     -> extract_document_data.main
+    timeline_events  -> generate_timeline_events.main
+
+Up to `concurrency` jobs run at once in a thread pool (the work is API calls
+and database writes, so threads are enough). Throughput scales by raising
+INGEST_WORKER_CONCURRENCY or by running more workers: claims use
+FOR UPDATE SKIP LOCKED, so workers never share a job.
+
+Outcomes:
+- The script returns a result -> completed (follow-up stages queued)
+- The result says success: false (e.g. unknown email sender) -> failed; not
+  retried, since a retry would repeat it (and re-send rejection emails)
+- The script raises -> retried with backoff, dead after max_attempts;
+  ValueError/TypeError (bad input or arguments) go straight to dead
+
+Windmill Script Configuration:
+- Path: f/chatbot/ingest_worker
+- Trigger: Scheduled every 1 minute; each run polls for `max_seconds`, so
+  one schedule keeps one worker busy. Set the script timeout above
+  max_seconds plus the longest job (e.g. 15 minutes for large ZIPs).
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional
+import importlib
+import os
+import socket
+import time
+import uuid
+
+from ingest_queue import claim_jobs, complete_job, fail_job, release_expired_leases, renew_leases
+
+
+WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "4"))
+POLL_SECONDS = 2.0
+LEASE_RENEW_SECONDS = 60.0
+
+# stage -> (module, function); modules are imported on first use
+STAGE_HANDLERS = {
+    "storage_upload": ("embed_document_from_storage", "main"),
+    "email_forward": ("process_email_forward", "process_email"),
+    "zip_upload": ("process_zip_upload", "main"),
+    "voice_note": ("transcribe_voice_note", "main"),
+    "extract_data": ("extract_document_data", "main"),
+    "timeline_events": ("generate_timeline_events", "main"),
+}
+
+
+def run_job(job: Dict[str, Any]) -> str:
+    """Run one claimed job and record its outcome. Returns the job's new status."""
+    try:
+        module_name, function_name = STAGE_HANDLERS[job["stage"]]
+        handler = getattr(importlib.import_module(module_name), function_name)
+        result = handler(**job["payload"].get("args", {}))
+    except (ValueError, TypeError, KeyError) as e:
+        return fail_job(job, f"{type(e).__name__}: {e}", retryable=False)
+    except Exception as e:
+        return fail_job(job, f"{type(e).__name__}: {e}")
+
+    if not isinstance(result, dict):
+        result = {"value": result}
+    failed = result.get("success") is False and not result.get("is_duplicate")
+    complete_job(job, result, failed=failed)
+    return "failed" if failed else "completed"
+
+
+def main(
+    concurrency: Optional[int] = None,
+    max_seconds: int = 55,
+    worker_id: Optional[str] = None
+) -> dict:
+    """
+    Run queued ingest jobs until max_seconds have passed, then finish the
+    jobs already started.
+
+    Args:
+        concurrency: Jobs run at once (default INGEST_WORKER_CONCURRENCY)
+        max_seconds: How long to keep claiming new jobs
+        worker_id: Lease owner name (default host:pid:random)
+
+    Returns:
+        dict with counts by outcome
+    """
+    concurrency = max(1, concurrency or WORKER_CONCURRENCY)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    deadline = time.time() + max_seconds
+
+    results = {
+        "worker_id": worker_id,
+        "released": release_expired_leases(),
+        "claimed": 0,
+        "completed": 0,
+        "failed": 0,
+        "retrying": 0,
+        "dead": 0
+    }
+
+    running = {}  # future -> job
+    last_renewal = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            if time.time() < deadline and len(running) < concurrency:
+                for job in claim_jobs(worker_id, concurrency - len(running)):
+                    running[pool.submit(run_job, job)] = job
+                    results["claimed"] += 1
+            elif not running:
+                break
+
+            if not running:
+                time.sleep(POLL_SECONDS)
+                continue
+
+            done, _ = wait(running, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    status = future.result()
+                except Exception as e:
+                    # Recording the outcome failed; the lease expires and the job is retried
+                    print(f"[ingest_worker] Job {job['id']} outcome not recorded: {e}")
+                    continue
+                results["retrying" if status == "pending" else status] += 1
+
+            if running and time.time() - last_renewal >= LEASE_RENEW_SECONDS:
+                renew_leases(worker_id, [job["id"] for job in running.values()])
+                last_renewal = time.time()
+
+    return results
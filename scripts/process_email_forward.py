@@ -43,16 +43,20 @@
 #   - annotated-types
 #   - typing_extensions
 #   - typing_inspection
-#   PDF parsing
-#   - pypdf
+#   PDF parsing and OCR
+#   - pymupdf
+#   - pytesseract
+#   - pillow
 
 """
 Process emails forwarded to save@archevi.ca and save them as documents.
 
-This script receives emails via Windmill's email trigger and:
+This script receives emails via Windmill's email trigger and queues them in
+ingest_jobs (ingest_queue.py); ingest_worker.py then calls process_email(),
+which:
 1. Verifies the sender is a registered family member
 2. Extracts email subject as title, body as content
-3. Processes any PDF/image attachments
+3. Extracts text from PDF/image attachments (OCR for scans and photos, document_ocr.py)
 4. Calls embed_document_enhanced to save with AI features
 5. Sends a confirmation email back to the sender
 
@@ -61,7 +65,10 @@ Windmill Email Trigger provides:
 - parsed_email: Object with headers, text_body, html_body, attachments
 - email_extra_args: Optional query parameters (e.g., category=medical)
 
-Returns:
+Returns (main):
+    dict: {success: bool, queued: bool, job_id: int}
+
+Returns (process_email, stored as the job's result):
     dict: {
         success: bool,
         document_id: int (if successful),
@@ -74,13 +81,19 @@ Returns:
 import psycopg2
 from typing import Optional, Dict, Any, List
 import wmill
+import os
 import re
 from datetime import datetime
 import json
 from email.utils import parseaddr
 import cohere
 from pgvector.psycopg2 import register_vector
-import hashlib
+from embedding_registry import active_model
+from document_fingerprints import compute_content_hash, simhash, find_duplicate, store_fingerprint
+from document_neighbors import update_document_neighbors
+from db_pool import get_connection
+from document_ocr import extract_pdf_text, ocr_image
+from ingest_queue import enqueue
 
 
 def extract_sender_email(parsed_email: Dict) -> Optional[str]:
@@ -219,27 +232,18 @@ def process_attachments(parsed_email: Dict, tenant_id: str, conn, co) -> List[Di
         is_image = content_type.startswith('image/') or filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
 
         if is_pdf:
-            # Read PDF from S3 and extract text
+            # Read PDF from S3; scanned pages are OCR'd
             try:
                 pdf_content = wmill.read_s3_file(s3_path)
                 if pdf_content:
-                    # Use pypdf to extract text
-                    from pypdf import PdfReader
-                    from io import BytesIO
-
-                    reader = PdfReader(BytesIO(pdf_content))
-                    text_parts = []
-                    for page in reader.pages:
-                        text = page.extract_text()
-                        if text:
-                            text_parts.append(text)
-
-                    if text_parts:
+                    pdf = extract_pdf_text(pdf_content, co=co, tenant_id=str(tenant_id))
+                    if pdf['text'].strip():
                         processed.append({
                             'filename': filename,
                             'type': 'pdf',
-                            'content': '\n\n'.join(text_parts),
-                            'page_count': len(reader.pages)
+                            'content': pdf['text'],
+                            'page_count': pdf['pages'],
+                            'ocr_pages': pdf['ocr_pages']
                         })
             except Exception as e:
                 processed.append({
@@ -249,14 +253,28 @@ def process_attachments(parsed_email: Dict, tenant_id: str, conn, co) -> List[Di
                 })
 
         elif is_image:
-            # For images, we note them but OCR would need client-side processing
-            # or a separate OCR service integration
-            processed.append({
-                'filename': filename,
-                'type': 'image',
-                's3_path': s3_path,
-                'note': 'Image attachments require OCR - content not extracted'
-            })
+            # Photographed receipts, scans sent from a phone, etc.
+            try:
+                image_content = wmill.read_s3_file(s3_path)
+                if image_content:
+                    ocr = ocr_image(
+                        image_content, content_type or filename.lower(),
+                        co=co, tenant_id=str(tenant_id)
+                    )
+                    if ocr['text'].strip():
+                        processed.append({
+                            'filename': filename,
+                            'type': 'image',
+                            'content': ocr['text'],
+                            'ocr_method': ocr['method']
+                        })
+            except Exception as e:
+                processed.append({
+                    'filename': filename,
+                    'type': 'image',
+                    's3_path': s3_path,
+                    'error': str(e)
+                })
 
     return processed
 
@@ -418,16 +436,16 @@ def send_rejection_email(recipient_email: str, reason: str) -> bool:
         return False
 
 
-def main(
-    raw_email: str = "",
+def process_email(
     parsed_email: Optional[Dict] = None,
     email_extra_args: Optional[Dict] = None
 ) -> dict:
     """
     Process a forwarded email and save it as a document.
 
-    This is triggered by Windmill's email trigger when someone sends
-    an email to save@archevi.ca (or the configured email address).
+    Run by ingest_worker.py for queued emails (see main()). Rejections
+    (unknown sender, no content, duplicate) return success False; other
+    errors are raised so the job is retried.
     """
     if not parsed_email:
         return {
@@ -541,14 +559,30 @@ def main(
     # This is a simplified version - for production, consider refactoring to share code
 
     try:
-        # Import the enhanced embedding logic
+        # Check for duplicates (exact or near, e.g. the same email forwarded
+        # twice) BEFORE any embedding work
+        content_hash = compute_content_hash(full_content, subject)
+        fingerprint = simhash(full_content)
+        existing = find_duplicate(conn, member['tenant_id'], content_hash, fingerprint)
+        if existing:
+            conn.close()
+            return {
+                "success": False,
+                "error": f"Duplicate document - this email was already saved as '{existing['title']}' (ID: {existing['id']})",
+                "is_duplicate": True,
+                "existing_id": existing['id'],
+                "duplicate_match": existing['match'],
+                "sender": sender_email
+            }
+
         # Generate embedding
+        embed_model, embed_dimension = active_model("text")
         response = co.embed(
             texts=[full_content[:8000]],  # Truncate for embedding
-            model="embed-v4.0",
+            model=embed_model,
             input_type="search_document",
             embedding_types=["float"],
-            output_dimension=1024
+            output_dimension=embed_dimension
         )
         embedding = response.embeddings.float_[0]
         tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(full_content.split())
@@ -559,30 +593,7 @@ def main(
         # Extract tags
         tags = extract_simple_tags(full_content)
 
-        # Compute content hash for duplicate detection
-        content_hash = hashlib.sha256(
-            f"{subject.lower()}||{' '.join(full_content.lower().split())}".encode()
-        ).hexdigest()
-
-        # Check for duplicates
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, title FROM family_documents
-            WHERE tenant_id = %s AND metadata->>'content_hash' = %s
-            LIMIT 1
-        """, (member['tenant_id'], content_hash))
-
-        existing = cursor.fetchone()
-        if existing:
-            cursor.close()
-            conn.close()
-            return {
-                "success": False,
-                "error": f"Duplicate document - this email was already saved as '{existing[1]}' (ID: {existing[0]})",
-                "is_duplicate": True,
-                "existing_id": existing[0],
-                "sender": sender_email
-            }
 
         # Prepare metadata
         metadata = {
@@ -600,9 +611,9 @@ def main(
         cursor.execute("""
             INSERT INTO family_documents (
                 title, content, category, source_file, created_by,
-                embedding, metadata, tenant_id, visibility
+                embedding, embedding_model, metadata, content_hash, tenant_id, visibility
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """, (
             subject,
@@ -611,12 +622,16 @@ def main(
             'email_forward',
             member['name'],
             embedding,
+            embed_model,
             json.dumps(metadata),
+            content_hash,
             member['tenant_id'],
             visibility
         ))
 
         document_id = cursor.fetchone()[0]
+        store_fingerprint(conn, document_id, member['tenant_id'], content_hash, fingerprint)
+        update_document_neighbors(conn, document_id)
 
         # Log API usage
         cursor.execute("""
@@ -648,17 +663,60 @@ def main(
             "tokens_used": tokens_used,
             "attachments_processed": len(attachments_with_content),
             "sender": sender_email,
-            "member_name": member['name']
+            "member_name": member['name'],
+            "tenant_id": str(member['tenant_id'])
         }
 
-    except Exception as e:
+    except Exception:
+        # Outages (Cohere, Postgres) are raised so ingest_worker retries the
+        # job with backoff; only deliberate rejections return success False
         conn.close()
+        raise
+
+
+
+def main(
+    raw_email: str = "",
+    parsed_email: Optional[Dict] = None,
+    email_extra_args: Optional[Dict] = None
+) -> dict:
+    """
+    Queue a forwarded email for the ingest worker.
+
+    This is triggered by Windmill's email trigger when someone sends
+    an email to save@archevi.ca (or the configured email address). The
+    trigger returns once the email is in ingest_jobs; ingest_worker.py
+    runs process_email() and the sender gets the usual confirmation or
+    rejection email. With INGEST_QUEUE_ENABLED=false the email is
+    processed inline as before.
+    """
+    if not parsed_email:
         return {
             "success": False,
-            "error": f"Failed to process email: {str(e)}",
-            "sender": sender_email
+            "error": "No parsed email data received"
         }
 
+    if os.getenv("INGEST_QUEUE_ENABLED", "true").lower() != "true":
+        return process_email(parsed_email, email_extra_args)
+
+    # The tenant is only known once the worker has verified the sender, and
+    # an email turned away here would be lost, so there is no backpressure
+    with get_connection(register_vector=False) as conn:
+        job_id = enqueue(
+            conn,
+            "email_forward",
+            {"args": {"parsed_email": parsed_email, "email_extra_args": email_extra_args}},
+            check_backpressure=False
+        )
+        conn.commit()
+
+    return {
+        "success": True,
+        "queued": True,
+        "job_id": job_id,
+        "sender": extract_sender_email(parsed_email)
+    }
+
 
 def auto_detect_category(content: str) -> str:
     """Simple keyword-based category detection."""
@@ -9,6 +9,7 @@
 #   - pgvector
 #   - wmill
 #   - pillow
+#   - httpx
 
 """
 Process a PDF document: render pages as images and create visual embeddings.
@@ -16,18 +17,33 @@ Process a PDF document: render pages as images and create visual embeddings.
 This enables visual search of scanned documents, charts, diagrams, and handwritten notes
 using Cohere Embed v4's image understanding capabilities.
 
+Pipeline:
+1. The PDF is decoded to a temp file once
+2. A process pool renders pages (PyMuPDF + PIL are CPU-bound), RENDER_BATCH_SIZE
+   pages per task so each worker opens the PDF once per batch
+3. Each rendered batch is embedded in one Cohere call (multi-image inputs)
+4. A writer thread uploads the previous batch's thumbnails to the blob store
+   (blob_store.py) and upserts its rows into document_pages with one
+   multi-row INSERT ... ON CONFLICT while the next batch is embedded
+
+Every batch is committed on its own, and pages that already have an embedding
+from the active "pages" model are skipped, so a timed-out or failed run can
+simply be re-run for the same document (force=True re-processes every page).
+
 Args:
     document_id (int): ID of the PDF document to process
     tenant_id (str): UUID of the tenant
     pdf_content (str): Base64-encoded PDF file content
     max_pages (int): Maximum pages to process (default: 50, for cost control)
     page_size (int): Target page image size in pixels (default: 512)
+    force (bool): Re-embed pages that are already processed (default: False)
 
 Returns:
     dict: {
         success: bool,
         document_id: int,
         pages_processed: int,
+        pages_resumed: int,
         total_pages: int,
         total_tokens: int,
         cost_usd: float,
@@ -37,13 +53,29 @@ Returns:
 
 import base64
 import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
 import fitz  # PyMuPDF
 import cohere
 import psycopg2
-from pgvector.psycopg2 import register_vector
+from psycopg2.extras import execute_values
 from PIL import Image
 import wmill
-from typing import Optional
+
+from blob_store import put_blobs
+from db_pool import get_connection
+from embedding_registry import active_model
+from usage_sink import record_usage
+
+
+RENDER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+RENDER_BATCH_SIZE = 16  # Pages per render task and per Cohere embed call (~1-2 MB of images)
+PAGE_TEXT_MAX_CHARS = 5000
+COST_PER_TOKEN = 0.0000004  # Cohere: ~$0.0004 per image at ~1000 tokens
 
 
 def render_page_to_image(page: fitz.Page, target_size: int = 512) -> bytes:
@@ -55,7 +87,7 @@ def render_page_to_image(page: fitz.Page, target_size: int = 512) -> bytes:
         target_size: Target dimension for the longer side
 
     Returns:
-        JPEG image as bytes
+        JPEG image bytes
     """
     # Calculate zoom factor to achieve target size
     rect = page.rect
@@ -75,39 +107,133 @@ def render_page_to_image(page: fitz.Page, target_size: int = 512) -> bytes:
     return buffer.getvalue()
 
 
-def embed_image(co: cohere.Client, image_bytes: bytes) -> tuple[list[float], int]:
+def render_pages(pdf_path: str, page_numbers: list[int], page_size: int) -> list[dict]:
+    """
+    Render a batch of pages (0-indexed) in a worker process.
+
+    Returns:
+        one dict per page with the JPEG bytes, text and page metadata
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            page = doc[page_num]
+            rect = page.rect
+
+            # Check if page has text or is mostly images
+            text = page.get_text().strip()
+            pages.append({
+                "page_number": page_num + 1,  # 1-indexed
+                "image": render_page_to_image(page, page_size),
+                "text": text[:PAGE_TEXT_MAX_CHARS] if text else None,
+                "width": int(rect.width),
+                "height": int(rect.height),
+                "has_text": len(text) > 50,
+                "has_images": len(page.get_images()) > 0
+            })
+    return pages
+
+
+def to_data_uri(image_bytes: bytes) -> str:
+    """JPEG bytes as a data URI for Cohere."""
+    return f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+
+def embed_images(
+    co: cohere.ClientV2,
+    images: list[bytes],
+    model: str,
+    output_dimension: Optional[int]
+) -> tuple[list[list[float]], int]:
     """
-    Create embedding for an image using Cohere Embed v4.
+    Embed several JPEG page images in one Cohere Embed v4 call.
 
     Args:
         co: Cohere client
-        image_bytes: JPEG image bytes
+        images: JPEG image bytes
+        model, output_dimension: the registry's active "pages" model
 
     Returns:
-        Tuple of (embedding vector, token count)
+        Tuple of (embedding vectors in input order, billed image tokens)
     """
-    # Convert to base64 data URI
-    b64_image = base64.b64encode(image_bytes).decode('utf-8')
-    data_uri = f"data:image/jpeg;base64,{b64_image}"
-
-    # Call Cohere Embed v4
     response = co.embed(
-        model="embed-v4.0",
-        input_type="image",
+        model=model,
+        input_type="search_document",
         embedding_types=["float"],
-        images=[data_uri]
+        inputs=[
+            {"content": [{"type": "image_url", "image_url": {"url": to_data_uri(image)}}]}
+            for image in images
+        ],
+        output_dimension=output_dimension  # document_pages.embedding is vector(1024)
     )
 
-    embedding = response.embeddings.float[0]
-
     # Get token count - handle various response structures
-    tokens = 1  # Default to 1 image
-    if hasattr(response, 'meta') and response.meta:
-        if hasattr(response.meta, 'billed_units') and response.meta.billed_units:
-            if hasattr(response.meta.billed_units, 'images') and response.meta.billed_units.images:
-                tokens = response.meta.billed_units.images
+    tokens = len(images)  # Default to 1 per image
+    billed = getattr(response.meta, 'billed_units', None) if response.meta else None
+    if billed is not None:
+        tokens = int(getattr(billed, 'images', None) or getattr(billed, 'input_tokens', None) or tokens)
+
+    return [list(embedding) for embedding in response.embeddings.float_], tokens
+
+
+def load_processed_pages(document_id: int, embedding_model: str) -> set[int]:
+    """Page numbers that already have an embedding from embedding_model."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT page_number FROM document_pages
+            WHERE document_id = %s AND embedding IS NOT NULL AND embedding_model = %s
+        """, (document_id, embedding_model))
+        pages = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+    return pages
 
-    return embedding, tokens
+
+def write_pages(document_id: int, tenant_id: str, pages: list[dict], embedding_model: str) -> None:
+    """Upload a batch's thumbnails, then upsert its pages with one multi-row INSERT and commit."""
+    image_hashes = put_blobs([page["image"] for page in pages], prefix="pages")
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        execute_values(cursor, """
+            INSERT INTO document_pages (
+                document_id, tenant_id, page_number,
+                page_image, page_image_hash, embedding, embedding_model, ocr_text,
+                width, height, has_text, has_images,
+                embedding_tokens
+            )
+            VALUES %s
+            ON CONFLICT (document_id, page_number)
+            DO UPDATE SET
+                page_image = EXCLUDED.page_image,
+                page_image_hash = EXCLUDED.page_image_hash,
+                embedding = EXCLUDED.embedding,
+                embedding_model = EXCLUDED.embedding_model,
+                ocr_text = EXCLUDED.ocr_text,
+                width = EXCLUDED.width,
+                height = EXCLUDED.height,
+                has_text = EXCLUDED.has_text,
+                has_images = EXCLUDED.has_images,
+                embedding_tokens = EXCLUDED.embedding_tokens,
+                processed_at = NOW()
+        """, [
+            (document_id, tenant_id, page["page_number"],
+             None, image_hash, page["embedding"], embedding_model, page["text"],
+             page["width"], page["height"], page["has_text"], page["has_images"],
+             page["tokens"])
+            for page, image_hash in zip(pages, image_hashes)
+        ], template="(%s, %s::uuid, %s, %s, %s, %s::vector, %s, %s, %s, %s, %s, %s, %s)", page_size=len(pages))
+        conn.commit()
+        cursor.close()
+
+
+def report_progress(done: int, total: int) -> None:
+    """Report job progress to Windmill (best effort, older SDKs lack it)."""
+    if not total:
+        return
+    try:
+        wmill.set_progress(min(99, int(done * 100 / total)))
+    except Exception:
+        pass
 
 
 def main(
@@ -115,122 +241,124 @@ def main(
     tenant_id: str,
     pdf_content: str,
     max_pages: int = 50,
-    page_size: int = 512
+    page_size: int = 512,
+    force: bool = False
 ) -> dict:
     """Process PDF pages and create visual embeddings."""
 
     if not document_id or not tenant_id or not pdf_content:
         return {"success": False, "error": "document_id, tenant_id, and pdf_content are required"}
 
-    # Get resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
     cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
 
     # Initialize Cohere client
-    co = cohere.Client(cohere_api_key)
+    co = cohere.ClientV2(api_key=cohere_api_key)
+    embed_model, embed_dimension = active_model("pages")
 
     total_tokens = 0
     pages_processed = 0
+    pages_resumed = 0
+    total_pages = 0
 
-    try:
-        # Decode PDF
-        pdf_bytes = base64.b64decode(pdf_content)
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        total_pages = len(doc)
-
-        # Limit pages for cost control
-        pages_to_process = min(total_pages, max_pages)
-
-        # Connect to database
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Process each page
-        for page_num in range(pages_to_process):
-            page = doc[page_num]
-
-            # Render page to image
-            image_bytes = render_page_to_image(page, page_size)
-            b64_image = base64.b64encode(image_bytes).decode('utf-8')
-
-            # Get page dimensions
-            rect = page.rect
-
-            # Check if page has text or is mostly images
-            text = page.get_text().strip()
-            has_text = len(text) > 50
-            has_images = len(page.get_images()) > 0
-
-            # Create visual embedding
-            embedding, tokens = embed_image(co, image_bytes)
-            total_tokens += tokens
+    def failure(message: str) -> dict:
+        return {
+            "success": False,
+            "error": message,
+            "document_id": document_id,
+            "pages_processed": pages_processed,
+            "pages_resumed": pages_resumed,
+            "total_pages": total_pages
+        }
 
-            # Insert or update page record
-            cursor.execute("""
-                INSERT INTO document_pages (
-                    document_id, tenant_id, page_number,
-                    page_image, embedding, ocr_text,
-                    width, height, has_text, has_images,
-                    embedding_tokens
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (document_id, page_number)
-                DO UPDATE SET
-                    page_image = EXCLUDED.page_image,
-                    embedding = EXCLUDED.embedding,
-                    ocr_text = EXCLUDED.ocr_text,
-                    width = EXCLUDED.width,
-                    height = EXCLUDED.height,
-                    has_text = EXCLUDED.has_text,
-                    has_images = EXCLUDED.has_images,
-                    embedding_tokens = EXCLUDED.embedding_tokens,
-                    processed_at = NOW()
-            """, (
-                document_id, tenant_id, page_num + 1,  # 1-indexed
-                b64_image, embedding, text[:5000] if text else None,
-                int(rect.width), int(rect.height), has_text, has_images,
-                tokens
-            ))
-
-            pages_processed += 1
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as spool:
+            # Decode PDF once; render workers open it by path
+            spool.write(base64.b64decode(pdf_content))
+            spool.flush()
+            pdf_content = None  # Release our reference to the base64 copy
+
+            with fitz.open(spool.name) as doc:
+                total_pages = len(doc)
+
+            # Limit pages for cost control
+            pages_to_process = min(total_pages, max_pages)
+
+            done_pages = set() if force else load_processed_pages(document_id, embed_model)
+            todo = [n for n in range(pages_to_process) if n + 1 not in done_pages]
+            pages_resumed = pages_to_process - len(todo)
+            report_progress(pages_resumed, pages_to_process)
+
+            # Rendering runs ahead in worker processes while the main thread
+            # embeds one batch and the writer thread stores the previous one
+            pending = None
+            with ProcessPoolExecutor(max_workers=RENDER_WORKERS) as renderers, \
+                    ThreadPoolExecutor(max_workers=1) as writer:
+                renders = [
+                    renderers.submit(render_pages, spool.name, todo[i:i + RENDER_BATCH_SIZE], page_size)
+                    for i in range(0, len(todo), RENDER_BATCH_SIZE)
+                ]
+
+                for render in renders:
+                    pages = render.result()
+
+                    # Create visual embeddings
+                    embed_start = time.time()
+                    embeddings, tokens = embed_images(
+                        co, [page["image"] for page in pages], embed_model, embed_dimension
+                    )
+                    record_usage(
+                        tenant_id=tenant_id,
+                        provider="cohere",
+                        endpoint="embed",
+                        model=embed_model,
+                        input_tokens=tokens,
+                        latency_ms=int((time.time() - embed_start) * 1000),
+                        operation="pdf_page_embed"
+                    )
+                    total_tokens += tokens
+                    for page, embedding in zip(pages, embeddings):
+                        page["embedding"] = embedding
+                        page["tokens"] = max(1, tokens // len(pages))
+
+                    if pending:
+                        pending[0].result()
+                        pages_processed += pending[1]
+                        report_progress(pages_resumed + pages_processed, pages_to_process)
+                    pending = (writer.submit(write_pages, document_id, tenant_id, pages, embed_model), len(pages))
+
+                if pending:
+                    pending[0].result()
+                    pages_processed += pending[1]
 
         # Update document metadata
-        cursor.execute("""
-            UPDATE family_documents
-            SET pdf_page_count = %s,
-                has_page_embeddings = TRUE,
-                updated_at = NOW()
-            WHERE id = %s
-        """, (total_pages, document_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-        doc.close()
-
-        # Calculate cost (Cohere: ~$0.0004 per image at ~1000 tokens)
-        cost_usd = total_tokens * 0.0000004
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE family_documents
+                SET pdf_page_count = %s,
+                    has_page_embeddings = TRUE,
+                    updated_at = NOW()
+                WHERE id = %s
+            """, (total_pages, document_id))
+            conn.commit()
+            cursor.close()
+
+        # Calculate cost
+        cost_usd = total_tokens * COST_PER_TOKEN
 
         return {
             "success": True,
             "document_id": document_id,
             "pages_processed": pages_processed,
+            "pages_resumed": pages_resumed,
             "total_pages": total_pages,
             "total_tokens": total_tokens,
             "cost_usd": round(cost_usd, 6)
         }
 
     except fitz.FileDataError as e:
-        return {"success": False, "error": f"Invalid PDF: {str(e)}"}
+        return failure(f"Invalid PDF: {str(e)}")
     except psycopg2.Error as e:
-        return {"success": False, "error": f"Database error: {str(e)}"}
+        return failure(f"Database error: {str(e)}")
     except Exception as e:
-        return {"success": False, "error": f"Failed to process PDF: {str(e)}"}
+        return failure(f"Failed to process PDF: {str(e)}")
@@ -8,28 +8,53 @@
 #   - psycopg2-binary
 #   - cohere
 #   - pgvector
-#   - numpy
+#   - pymupdf
+#   - pytesseract
+#   - pillow
 
 """
 Process a ZIP file containing multiple documents for batch embedding.
 
 Supported file types:
-- PDF (.pdf) - text extraction
+- PDF (.pdf) - text layer, local OCR for scanned pages (document_ocr.py)
+- Word (.docx) - text from document.xml
 - Text (.txt, .md) - direct content
-- Images (.jpg, .png, .webp) - placeholder for future OCR
+- Images (.jpg, .png, .webp, .gif, .bmp, .tif) - local OCR, vision model
+  only for low-confidence results
+
+Pipeline:
+1. The archive is spooled to a temp file (streamed from Supabase Storage,
+   or base64-decoded in slices) and hashed on the way
+2. A process pool extracts text from the members in parallel (local OCR
+   only), at most EXTRACT_AHEAD members ahead of the embed loop;
+   low-confidence OCR is sent to the vision model from the main process,
+   where usage is recorded
+3. Extracted texts are packed into Cohere embed calls of up to
+   EMBED_BATCH_SIZE texts
+4. Each batch is written with multi-row INSERTs and committed, together
+   with its per-file rows in zip_ingest_files (migration 022)
+5. The tenant's related-documents graph is rebuilt in one pass
+   (document_neighbors.py) rather than updated per document
+
+Re-running the same archive for the same tenant skips files that were
+already imported, so a failed or timed-out upload can simply be retried.
 
 Args:
-    zip_content_base64 (str): Base64-encoded ZIP file content
+    zip_content_base64 (str, optional): Base64-encoded ZIP file content
     tenant_id (str): Tenant UUID for multi-tenant isolation
     default_category (str, optional): Default category if not detectable
     auto_categorize (bool): Enable AI auto-categorization (default: True)
     extract_tags (bool): Enable AI tag extraction (default: True)
     visibility (str): Default visibility for all documents (default: 'everyone')
     assigned_to (int, optional): Default family member assignment
+    storage_path (str, optional): ZIP in Supabase Storage, used instead of
+        zip_content_base64
+    ocr_language (str): Language hint for scanned PDFs and images (default: 'eng')
 
 Returns:
     dict: {
         success: bool,
+        archive_sha256: str,
         total_files: int,
         processed: int,
         failed: int,
@@ -38,62 +63,46 @@ Returns:
     }
 """
 
-import wmill
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
 import base64
-import zipfile
+import hashlib
 import io
+import multiprocessing
 import os
-from typing import Optional, List, Dict, Any
-import cohere
-import psycopg2
-from pgvector.psycopg2 import register_vector
-import numpy as np
 import re
+import tempfile
+import time
+import zipfile
+
+import cohere
+import httpx
+import wmill
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection
+from document_neighbors import rebuild_neighbors
+from document_ocr import escalate_image, escalate_pdf_pages, extract_pdf_text, ocr_image
+from embedding_registry import active_model
+from usage_sink import record_usage
 
 
 # Supported file extensions
 SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.md', '.docx'}
-IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
 SKIP_EXTENSIONS = {'.ds_store', '.gitkeep', '.gitignore'}
 
-
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF bytes using basic method."""
-    try:
-        # Try PyPDF2 if available
-        try:
-            import PyPDF2
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-            text_parts = []
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-            return '\n\n'.join(text_parts)
-        except ImportError:
-            pass
-
-        # Fallback: try pdfplumber
-        try:
-            import pdfplumber
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                text_parts = []
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        text_parts.append(text)
-                return '\n\n'.join(text_parts)
-        except ImportError:
-            pass
-
-        # Last resort: basic text extraction
-        content = pdf_bytes.decode('latin-1', errors='ignore')
-        # Extract text between stream markers (very basic)
-        text_parts = re.findall(r'\((.*?)\)', content)
-        return ' '.join(text_parts[:1000])  # Limit to prevent huge output
-
-    except Exception as e:
-        return f"[PDF extraction error: {str(e)}]"
+MAX_CONTENT_LENGTH = 50000         # Stored content per document (chars)
+EMBED_MAX_CHARS = 8000             # Leading text embedded per document
+EMBED_BATCH_SIZE = 96              # Cohere embed limit per call
+EXTRACT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+EXTRACT_AHEAD = 2 * EXTRACT_WORKERS  # Members submitted but not yet consumed
+# ingest_worker runs jobs on threads; forking a multi-threaded process can
+# copy a lock another thread holds (db_pool, usage_sink, stdout) into the child
+EXTRACT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+SPOOL_CHUNK_SIZE = 1024 * 1024     # Bytes per read/write while spooling
+PROGRESS_TABLE_COLUMNS = "(tenant_id, archive_sha256, filename, status, document_id, detail)"
 
 
 def get_title_from_filename(filename: str) -> str:
@@ -112,29 +121,253 @@ def get_title_from_filename(filename: str) -> str:
     return name or filename
 
 
-def main(
-    zip_content_base64: str,
+def extract_text_from_docx(docx_bytes: bytes) -> str:
+    """Extract text from DOCX bytes (text runs in word/document.xml)."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as docx:
+            xml_content = docx.read('word/document.xml').decode('utf-8')
+        # Extract text between <w:t> tags
+        return ' '.join(re.findall(r'<w:t[^>]*>([^<]+)</w:t>', xml_content))
+    except Exception:
+        return "[DOCX extraction failed]"
+
+
+def extract_member(
+    zip_path: str,
+    filename: str,
+    ext: str,
+    language: str = 'eng'
+) -> tuple[str, Optional[dict]]:
+    """
+    Read one archive member and extract its text. Runs in a worker process,
+    so it reopens the spooled archive rather than receiving the bytes.
+    Members are already OCR'd in parallel, so PDF pages are OCR'd one at a time.
+
+    OCR here is local only: workers have no database pool and exit without
+    flushing usage_sink, so low-confidence
+    results are returned as `pending` and sent to the vision model by the
+    parent (escalate_member). `pending` holds text and page numbers only;
+    the parent re-reads the member from the spooled archive.
+
+    Returns:
+        (content, pending) - pending is the OCR result to escalate, or None
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        file_bytes = zf.read(filename)
+
+    if ext == '.pdf':
+        pdf = extract_pdf_text(file_bytes, language, allow_vision=False, workers=1)
+        return pdf["text"], (pdf if pdf["escalate"] else None)
+    if ext in IMAGE_EXTENSIONS:
+        ocr = ocr_image(file_bytes, f"image/{ext.lstrip('.')}", language, allow_vision=False)
+        return ocr["text"], (ocr if ocr["escalate"] else None)
+    if ext == '.docx':
+        return extract_text_from_docx(file_bytes), None
+    return file_bytes.decode('utf-8', errors='replace'), None
+
+
+def escalate_member(
+    zip_path: str,
+    filename: str,
+    ext: str,
+    pending: dict,
+    co,
+    tenant_id: Optional[str] = None,
+    language: str = 'eng'
+) -> str:
+    """Finish a worker's local OCR with the vision model, in the parent process."""
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        file_bytes = zf.read(filename)
+    if ext == '.pdf':
+        return escalate_pdf_pages(pending, file_bytes, language, co, tenant_id)["text"]
+    return escalate_image(file_bytes, pending, f"image/{ext.lstrip('.')}", language, co, tenant_id)["text"]
+
+
+def detect_category(content: str, default_category: str) -> tuple[str, float]:
+    """Simple keyword-based categorization. Returns (category, confidence)."""
+    content_lower = content.lower()
+    if any(w in content_lower for w in ['insurance', 'policy', 'premium', 'coverage', 'claim']):
+        return 'insurance', 0.7
+    if any(w in content_lower for w in ['medical', 'doctor', 'hospital', 'prescription', 'diagnosis', 'patient']):
+        return 'medical', 0.7
+    if any(w in content_lower for w in ['invoice', 'receipt', 'payment', 'amount due', 'total']):
+        return 'invoices', 0.7
+    if any(w in content_lower for w in ['tax', 'income', 'deduction', 'cra', 'irs', 'w-2', 't4']):
+        return 'taxes', 0.7
+    if any(w in content_lower for w in ['contract', 'agreement', 'hereby', 'whereas', 'party']):
+        return 'legal', 0.6
+    if any(w in content_lower for w in ['recipe', 'ingredient', 'tablespoon', 'teaspoon', 'bake', 'cook']):
+        return 'recipes', 0.8
+    return default_category, 0.0
+
+
+def spool_archive(
+    spool,
+    zip_content_base64: Optional[str],
+    storage_path: Optional[str]
+) -> str:
+    """
+    Write the archive to an open binary file without holding a second full
+    copy in memory. Returns the archive's sha256.
+    """
+    digest = hashlib.sha256()
+
+    if storage_path:
+        supabase_url = wmill.get_variable("f/chatbot/supabase_url")
+        supabase_key = wmill.get_variable("f/chatbot/supabase_service_key")
+        url = f"{supabase_url}/storage/v1/object/documents/{storage_path}"
+        headers = {
+            "Authorization": f"Bearer {supabase_key}",
+            "apikey": supabase_key
+        }
+        with httpx.Client(timeout=120.0) as client:
+            with client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                for chunk in response.iter_bytes(SPOOL_CHUNK_SIZE):
+                    digest.update(chunk)
+                    spool.write(chunk)
+    else:
+        encoded = re.sub(r'\s+', '', zip_content_base64 or '')
+        # Slices are a multiple of 4 characters so each decodes on its own
+        step = (SPOOL_CHUNK_SIZE // 3) * 4
+        for start in range(0, len(encoded), step):
+            chunk = base64.b64decode(encoded[start:start + step], validate=True)
+            digest.update(chunk)
+            spool.write(chunk)
+
+    spool.flush()
+    return digest.hexdigest()
+
+
+def load_completed_files(tenant_id: str, archive_sha256: str) -> Dict[str, int]:
+    """Files of this archive already imported by an earlier run -> document_id."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT filename, document_id
+            FROM zip_ingest_files
+            WHERE tenant_id = %s::uuid AND archive_sha256 = %s AND status = 'success'
+        """, (tenant_id, archive_sha256))
+        rows = cursor.fetchall()
+        cursor.close()
+    return {filename: document_id for filename, document_id in rows}
+
+
+def record_file_outcomes(tenant_id: str, archive_sha256: str, outcomes: List[tuple]) -> None:
+    """Upsert (filename, status, document_id, detail) rows for files that were not imported."""
+    if not outcomes:
+        return
+    try:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            execute_values(cursor, f"""
+                INSERT INTO zip_ingest_files {PROGRESS_TABLE_COLUMNS}
+                VALUES %s
+                ON CONFLICT (tenant_id, archive_sha256, filename) DO UPDATE
+                SET status = EXCLUDED.status, document_id = EXCLUDED.document_id,
+                    detail = EXCLUDED.detail, updated_at = NOW()
+            """, [(tenant_id, archive_sha256) + outcome for outcome in outcomes])
+            conn.commit()
+            cursor.close()
+    except Exception as e:
+        print(f"[process_zip_upload] Failed to record progress: {e}")
+
+
+def embed_batch(co, tenant_id: str, batch: List[dict]) -> None:
+    """Embed a batch of extracted documents in one Cohere call (sets item['embedding'])."""
+    embed_model, embed_dimension = active_model("text")
+    embed_start = time.time()
+    response = co.embed(
+        texts=[item["content"][:EMBED_MAX_CHARS] for item in batch],
+        model=embed_model,
+        input_type="search_document",
+        embedding_types=["float"],
+        output_dimension=embed_dimension
+    )
+    for item, embedding in zip(batch, response.embeddings.float_):
+        item["embedding"] = list(embedding)
+        item["embedding_model"] = embed_model
+
+    if response.meta and response.meta.billed_units and response.meta.billed_units.input_tokens:
+        tokens = int(response.meta.billed_units.input_tokens)
+    else:
+        tokens = sum(len(item["content"][:EMBED_MAX_CHARS].split()) for item in batch)
+    record_usage(
+        tenant_id=tenant_id,
+        provider="cohere",
+        endpoint="embed",
+        model=embed_model,
+        input_tokens=tokens,
+        latency_ms=int((time.time() - embed_start) * 1000),
+        operation="zip_upload_embed"
+    )
+
+
+def write_batch(
     tenant_id: str,
+    archive_sha256: str,
+    batch: List[dict],
+    visibility: str,
+    assigned_to: Optional[int]
+) -> List[int]:
+    """Insert a batch of documents plus their progress rows in one transaction."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        rows = execute_values(cursor, """
+            INSERT INTO family_documents
+            (tenant_id, title, content, category, source_file, embedding, embedding_model,
+             visibility, assigned_to)
+            VALUES %s
+            RETURNING id
+        """, [
+            (tenant_id, item["title"], item["content"], item["category"], item["filename"],
+             item["embedding"], item["embedding_model"], visibility, assigned_to)
+            for item in batch
+        ], template="(%s::uuid, %s, %s, %s, %s, %s::vector, %s, %s, %s)", page_size=len(batch), fetch=True)
+        document_ids = [row[0] for row in rows]
+
+        execute_values(cursor, f"""
+            INSERT INTO zip_ingest_files {PROGRESS_TABLE_COLUMNS}
+            VALUES %s
+            ON CONFLICT (tenant_id, archive_sha256, filename) DO UPDATE
+            SET status = EXCLUDED.status, document_id = EXCLUDED.document_id,
+                detail = NULL, updated_at = NOW()
+        """, [
+            (tenant_id, archive_sha256, item["filename"], "success", document_id, None)
+            for item, document_id in zip(batch, document_ids)
+        ])
+        conn.commit()
+        cursor.close()
+    return document_ids
+
+
+def report_progress(done: int, total: int) -> None:
+    """Report job progress to Windmill (best effort, older SDKs lack it)."""
+    if not total:
+        return
+    try:
+        wmill.set_progress(min(99, int(done * 100 / total)))
+    except Exception:
+        pass
+
+
+def main(
+    zip_content_base64: Optional[str] = None,
+    tenant_id: str = "",
     default_category: str = "general",
     auto_categorize: bool = True,
     extract_tags: bool = True,
     visibility: str = "everyone",
-    assigned_to: Optional[int] = None
+    assigned_to: Optional[int] = None,
+    storage_path: Optional[str] = None,
+    ocr_language: str = "eng"
 ) -> Dict[str, Any]:
     """Process ZIP file and embed all supported documents."""
 
-    results = []
-    processed = 0
-    failed = 0
-    skipped = 0
-
-    # Decode ZIP content
-    try:
-        zip_bytes = base64.b64decode(zip_content_base64)
-    except Exception as e:
+    def error_result(message: str) -> Dict[str, Any]:
         return {
             "success": False,
-            "error": f"Failed to decode ZIP content: {str(e)}",
+            "error": message,
             "total_files": 0,
             "processed": 0,
             "failed": 1,
@@ -142,221 +375,207 @@ def main(
             "results": []
         }
 
-    # Get database connection
-    try:
-        db_resource = wmill.get_resource("u/admin/archevi_postgres")
-        conn = psycopg2.connect(db_resource["connection_string"])
-    except:
-        postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-        conn = psycopg2.connect(
-            host=postgres_db["host"],
-            port=postgres_db["port"],
-            dbname=postgres_db["dbname"],
-            user=postgres_db["user"],
-            password=postgres_db["password"],
-            sslmode=postgres_db.get("sslmode", "disable")
-        )
-
-    register_vector(conn)
-
-    # Get Cohere client
-    cohere_key = wmill.get_variable("f/chatbot/COHERE_API_KEY")
-    co = cohere.ClientV2(api_key=cohere_key)
+    if not tenant_id or not tenant_id.strip():
+        return error_result("tenant_id is required")
+    tenant_id = tenant_id.strip()
+    if not zip_content_base64 and not storage_path:
+        return error_result("Either zip_content_base64 or storage_path is required")
 
-    try:
-        with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zf:
-            file_list = zf.namelist()
-            total_files = len([f for f in file_list if not f.endswith('/')])
+    processed = 0
+    failed = 0
+    skipped = 0
+    failure_outcomes = []  # (filename, status, document_id, detail) for zip_ingest_files
 
-            for filename in file_list:
-                # Skip directories
-                if filename.endswith('/'):
-                    continue
+    with tempfile.NamedTemporaryFile(suffix=".zip") as spool:
+        # Spool the archive to disk
+        try:
+            archive_sha256 = spool_archive(spool, zip_content_base64, storage_path)
+        except Exception as e:
+            return error_result(f"Failed to decode ZIP content: {str(e)}")
+        zip_content_base64 = None  # Release our reference to the base64 copy
 
-                # Skip hidden/system files
-                basename = os.path.basename(filename).lower()
-                if basename.startswith('.') or basename.startswith('__'):
-                    skipped += 1
-                    results.append({
-                        "filename": filename,
-                        "status": "skipped",
-                        "reason": "Hidden or system file"
-                    })
-                    continue
+        try:
+            with zipfile.ZipFile(spool.name, 'r') as zf:
+                file_list = [f for f in zf.namelist() if not f.endswith('/')]
+        except zipfile.BadZipFile:
+            return error_result("Invalid ZIP file")
 
-                # Check extension
-                ext = os.path.splitext(filename)[1].lower()
+        total_files = len(file_list)
+        results: List[Optional[dict]] = [None] * total_files
 
-                if ext in SKIP_EXTENSIONS:
-                    skipped += 1
-                    results.append({
-                        "filename": filename,
-                        "status": "skipped",
-                        "reason": "System file"
-                    })
+        try:
+            completed = load_completed_files(tenant_id, archive_sha256)
+        except Exception as e:
+            print(f"[process_zip_upload] Could not load earlier progress: {e}")
+            completed = {}
+
+        # Triage members without reading them
+        to_extract = []
+        for index, filename in enumerate(file_list):
+            basename = os.path.basename(filename).lower()
+            ext = os.path.splitext(filename)[1].lower()
+
+            reason = None
+            if basename.startswith('.') or basename.startswith('__'):
+                reason = "Hidden or system file"
+            elif ext in SKIP_EXTENSIONS:
+                reason = "System file"
+            elif ext not in SUPPORTED_EXTENSIONS and ext not in IMAGE_EXTENSIONS:
+                reason = f"Unsupported file type: {ext}"
+
+            if reason:
+                skipped += 1
+                results[index] = {"filename": filename, "status": "skipped", "reason": reason}
+            elif filename in completed:
+                # Imported by an earlier run of this archive
+                processed += 1
+                results[index] = {
+                    "filename": filename,
+                    "status": "success",
+                    "document_id": completed[filename],
+                    "title": get_title_from_filename(os.path.basename(filename)),
+                    "resumed": True
+                }
+            else:
+                to_extract.append((index, filename, ext))
+
+        co = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+        done = total_files - len(to_extract)
+        report_progress(done, total_files)
+
+        def collect(pending) -> None:
+            """Wait for a submitted batch write and record its per-file results."""
+            nonlocal processed, failed, done
+            future, batch = pending
+            try:
+                document_ids = future.result()
+            except Exception as e:
+                document_ids = None
+                error = f"Database error: {str(e)}"
+            for position, item in enumerate(batch):
+                if document_ids is not None:
+                    processed += 1
+                    results[item["index"]] = {
+                        "filename": item["filename"],
+                        "status": "success",
+                        "document_id": document_ids[position],
+                        "title": item["title"],
+                        "category": item["category"],
+                        "category_confidence": item["category_confidence"],
+                        "content_length": len(item["content"])
+                    }
+                else:
+                    failed += 1
+                    results[item["index"]] = {"filename": item["filename"], "status": "failed", "error": error}
+                    failure_outcomes.append((item["filename"], "failed", None, error))
+            done += len(batch)
+            report_progress(done, total_files)
+
+        def embed_and_submit(batch: List[dict], writer, pending):
+            """Embed a batch, wait for the previous write, then start this one's write."""
+            nonlocal failed, done
+            try:
+                embed_batch(co, tenant_id, batch)
+            except Exception as e:
+                error = f"Cohere API error: {str(e)}"
+                for item in batch:
+                    failed += 1
+                    results[item["index"]] = {"filename": item["filename"], "status": "failed", "error": error}
+                    failure_outcomes.append((item["filename"], "failed", None, error))
+                done += len(batch)
+                return pending
+            if pending:
+                collect(pending)
+            future = writer.submit(write_batch, tenant_id, archive_sha256, batch, visibility, assigned_to)
+            return (future, batch)
+
+        # Extraction runs ahead in worker processes while the main thread
+        # embeds one batch and the writer thread stores the previous one
+        batch: List[dict] = []
+        pending = None
+        extract_context = multiprocessing.get_context(EXTRACT_START_METHOD)
+        with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=extract_context) as extractors, \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            # A bounded window of submissions: finished extractions wait for
+            # the embed loop, so only EXTRACT_AHEAD results are held at once
+            members = iter(to_extract)
+            extractions = deque()
+
+            def submit_next() -> None:
+                member = next(members, None)
+                if member is not None:
+                    index, filename, ext = member
+                    extractions.append((index, filename, ext, extractors.submit(
+                        extract_member, spool.name, filename, ext, ocr_language
+                    )))
+
+            for _ in range(EXTRACT_AHEAD):
+                submit_next()
+
+            while extractions:
+                index, filename, ext, extraction = extractions.popleft()
+                submit_next()
+                try:
+                    content, ocr_pending = extraction.result()
+                    if ocr_pending:
+                        content = escalate_member(
+                            spool.name, filename, ext, ocr_pending, co, tenant_id, ocr_language
+                        )
+                except Exception as e:
+                    failed += 1
+                    done += 1
+                    results[index] = {"filename": filename, "status": "failed", "error": str(e)}
+                    failure_outcomes.append((filename, "failed", None, str(e)))
                     continue
 
-                if ext in IMAGE_EXTENSIONS:
-                    skipped += 1
-                    results.append({
-                        "filename": filename,
-                        "status": "skipped",
-                        "reason": "Image files require OCR (not yet supported in bulk upload)"
-                    })
-                    continue
+                if len(content) > MAX_CONTENT_LENGTH:
+                    content = content[:MAX_CONTENT_LENGTH] + "\n\n[Content truncated...]"
 
-                if ext not in SUPPORTED_EXTENSIONS:
+                # Skip if no meaningful content
+                if not content or len(content.strip()) < 10:
                     skipped += 1
-                    results.append({
+                    done += 1
+                    results[index] = {
                         "filename": filename,
                         "status": "skipped",
-                        "reason": f"Unsupported file type: {ext}"
-                    })
+                        "reason": "No extractable text content"
+                    }
+                    failure_outcomes.append((filename, "skipped", None, "No extractable text content"))
                     continue
 
-                try:
-                    # Read file content
-                    file_bytes = zf.read(filename)
-
-                    # Extract text based on file type
-                    if ext == '.pdf':
-                        content = extract_text_from_pdf(file_bytes)
-                    elif ext in {'.txt', '.md'}:
-                        content = file_bytes.decode('utf-8', errors='replace')
-                    elif ext == '.docx':
-                        # Basic DOCX support - extract text from XML
-                        try:
-                            import zipfile as zf_inner
-                            with zf_inner.ZipFile(io.BytesIO(file_bytes)) as docx:
-                                xml_content = docx.read('word/document.xml').decode('utf-8')
-                                # Extract text between <w:t> tags
-                                content = ' '.join(re.findall(r'<w:t[^>]*>([^<]+)</w:t>', xml_content))
-                        except:
-                            content = "[DOCX extraction failed]"
-                    else:
-                        content = file_bytes.decode('utf-8', errors='replace')
-
-                    # Skip if no meaningful content
-                    if not content or len(content.strip()) < 10:
-                        skipped += 1
-                        results.append({
-                            "filename": filename,
-                            "status": "skipped",
-                            "reason": "No extractable text content"
-                        })
-                        continue
-
-                    # Generate title
-                    title = get_title_from_filename(os.path.basename(filename))
-
-                    # Truncate content if too long (Cohere has limits)
-                    max_content_length = 50000
-                    if len(content) > max_content_length:
-                        content = content[:max_content_length] + "\n\n[Content truncated...]"
-
-                    # Generate embedding
-                    embed_response = co.embed(
-                        texts=[content[:8000]],  # Cohere embed limit
-                        model="embed-english-v3.0",
-                        input_type="search_document",
-                        embedding_types=["float"]
-                    )
-                    embedding = embed_response.embeddings.float_[0]
-
-                    # Determine category (simple heuristic or use provided)
-                    category = default_category
-                    category_confidence = 0.0
-
-                    if auto_categorize:
-                        # Simple keyword-based categorization
-                        content_lower = content.lower()
-                        if any(w in content_lower for w in ['insurance', 'policy', 'premium', 'coverage', 'claim']):
-                            category = 'insurance'
-                            category_confidence = 0.7
-                        elif any(w in content_lower for w in ['medical', 'doctor', 'hospital', 'prescription', 'diagnosis', 'patient']):
-                            category = 'medical'
-                            category_confidence = 0.7
-                        elif any(w in content_lower for w in ['invoice', 'receipt', 'payment', 'amount due', 'total']):
-                            category = 'invoices'
-                            category_confidence = 0.7
-                        elif any(w in content_lower for w in ['tax', 'income', 'deduction', 'cra', 'irs', 'w-2', 't4']):
-                            category = 'taxes'
-                            category_confidence = 0.7
-                        elif any(w in content_lower for w in ['contract', 'agreement', 'hereby', 'whereas', 'party']):
-                            category = 'legal'
-                            category_confidence = 0.6
-                        elif any(w in content_lower for w in ['recipe', 'ingredient', 'tablespoon', 'teaspoon', 'bake', 'cook']):
-                            category = 'recipes'
-                            category_confidence = 0.8
-
-                    # Insert into database
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            INSERT INTO family_documents
-                            (tenant_id, title, content, category, source_file, embedding, visibility, assigned_to)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            RETURNING id
-                        """, [
-                            tenant_id,
-                            title,
-                            content,
-                            category,
-                            filename,
-                            np.array(embedding),
-                            visibility,
-                            assigned_to
-                        ])
-                        doc_id = cur.fetchone()[0]
-                        conn.commit()
-
-                    processed += 1
-                    results.append({
-                        "filename": filename,
-                        "status": "success",
-                        "document_id": doc_id,
-                        "title": title,
-                        "category": category,
-                        "category_confidence": category_confidence,
-                        "content_length": len(content)
-                    })
-
-                except Exception as e:
-                    failed += 1
-                    results.append({
-                        "filename": filename,
-                        "status": "failed",
-                        "error": str(e)
-                    })
-                    conn.rollback()
-
-        return {
-            "success": True,
-            "total_files": total_files,
-            "processed": processed,
-            "failed": failed,
-            "skipped": skipped,
-            "results": results
-        }
-
-    except zipfile.BadZipFile:
-        return {
-            "success": False,
-            "error": "Invalid ZIP file",
-            "total_files": 0,
-            "processed": 0,
-            "failed": 1,
-            "skipped": 0,
-            "results": []
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "total_files": 0,
-            "processed": processed,
-            "failed": failed + 1,
-            "skipped": skipped,
-            "results": results
-        }
-    finally:
-        conn.close()
+                # Determine category (simple heuristic or use provided)
+                category, category_confidence = (
+                    detect_category(content, default_category) if auto_categorize
+                    else (default_category, 0.0)
+                )
+
+                batch.append({
+                    "index": index,
+                    "filename": filename,
+                    "title": get_title_from_filename(os.path.basename(filename)),
+                    "content": content,
+                    "category": category,
+                    "category_confidence": category_confidence
+                })
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    pending = embed_and_submit(batch, writer, pending)
+                    batch = []
+
+            if batch:
+                pending = embed_and_submit(batch, writer, pending)
+            if pending:
+                collect(pending)
+
+    record_file_outcomes(tenant_id, archive_sha256, failure_outcomes)
+    if processed:
+        rebuild_neighbors(tenant_id)
+
+    return {
+        "success": True,
+        "archive_sha256": archive_sha256,
+        "total_files": total_files,
+        "processed": processed,
+        "failed": failed,
+        "skipped": skipped,
+        "results": [result for result in results if result is not None]
+    }
@@ -8,6 +8,10 @@
 Tenant Provisioning Script
 Handles the complete flow from signup to ready-to-use tenant.
 
+New tenants are assigned a vector bucket by trigger (migration 031); the
+bucket's HNSW indexes are created here if they don't exist yet
+(vector_partitions.py).
+
 Windmill Script Configuration:
 - Path: f/tenant/provision_tenant
 - Trigger: Called by signup flow or admin
@@ -18,6 +22,7 @@ from typing import Optional
 import re
 import secrets
 import json
+from vector_partitions import ensure_bucket_indexes
 
 
 def generate_slug(name: str) -> str:
@@ -121,13 +126,16 @@ def main(
                     created_by, status
                 )
                 VALUES (%s, %s, %s, {trial_end}, %s, %s, %s, %s, 'active')
-                RETURNING id
+                RETURNING id, vector_bucket
             """, [
                 family_name, slug, plan,
                 config["ai_allowance"], config["max_members"], config["max_storage_gb"],
                 user_id
             ])
-            tenant_id = cur.fetchone()[0]
+            tenant_id, vector_bucket = cur.fetchone()
+
+            # Per-tenant vector index partition
+            ensure_bucket_indexes(cur, vector_bucket)
 
             # Create owner membership
             cur.execute("""
@@ -172,6 +180,7 @@ def main(
                 "slug": slug,
                 "subdomain": f"{slug}.archevi.ca",
                 "plan": plan,
+                "vector_bucket": vector_bucket,
                 "trial_days": trial_days if plan == "trial" else None,
                 "message": f"Tenant '{family_name}' created successfully"
             }
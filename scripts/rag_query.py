@@ -66,6 +66,7 @@ import time
 import re
 from typing import Optional
 import wmill
+from document_access import shared_document_ids, visibility_filter as build_visibility_filter
 
 # UUID validation regex
 UUID_REGEX = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
@@ -160,31 +161,12 @@ def main(
         # Filter out documents without embeddings (NULL embedding returns NULL distance)
         # Note: Uses family_documents table (legacy) which has tenant_id column added
 
-        # Build visibility filter based on user's member_type
-        visibility_filter = ""
-        params = [query_embedding, tenant_id]
-
-        if user_member_type:
-            if user_member_type == 'admin':
-                # Admins see everything - no visibility filter
-                pass
-            elif user_member_type == 'adult':
-                # Adults see: everyone, adults_only, and private docs assigned to them
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only') OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only')"
-            else:
-                # teen/child see: everyone, and private docs assigned to them
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') = 'everyone' OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
-        else:
-            # No user_member_type - show only 'everyone' visibility (safest default)
-            visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
+        # Build visibility filter based on user's member_type (document_access.py)
+        visibility_filter, visibility_params = build_visibility_filter(
+            "family_documents", user_member_type, user_member_id,
+            shared_document_ids(cursor, tenant_id, user_member_id)
+        )
+        params = [query_embedding, tenant_id] + visibility_params
 
         cursor.execute(f"""
             SELECT id, title, content, category, embedding <=> %s::vector AS distance
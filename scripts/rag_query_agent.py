@@ -8,6 +8,7 @@
 #   - psycopg2-binary
 #   - pgvector
 #   - wmill
+#   - httpx
 
 """
 AI Agent-style RAG query using Groq with tool calling.
@@ -39,19 +40,36 @@ Returns:
 When stream=True, also emits SSE events:
     - {type: "thinking", data: {status: "started"}}
     - {type: "search", data: {query, status: "started"|"complete", results}}
-    - {type: "answer", data: {chunk}} - streamed answer chunks
+    - {type: "answer", data: {status: "started"}}
+    - {type: "answer", data: {chunk}} - streamed answer chunks (coalesced tokens)
+    - {type: "answer", data: {status: "complete", content}} - full answer
     - {type: "complete", data: {full response}}
+
+Repeated standalone questions are answered from the semantic answer cache
+(answer_cache.py): only the "answer" and "complete" events are sent, with cached=True.
 """
 
 import json
 import uuid
 import time
-from typing import Optional, Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Generator, Callable
 import wmill
 from groq import Groq
 import cohere
 import psycopg2
-from pgvector.psycopg2 import register_vector
+from db_pool import get_connection
+from usage_sink import record_usage
+from document_chunks import search_chunks, chunk_embedding_text, group_chunks_by_document
+from hybrid_search import hybrid_cte, rrf_relevance, DEFAULT_CANDIDATES
+from embedding_cache import embed_query, embed_queries
+from embedding_registry import active_model
+from vector_quantization import nearest_sql, resolve_precision, set_search_precision
+from vector_partitions import plan_vector_search
+from document_access import access_filter, shared_document_ids, visibility_filter
+from blob_store import blob_urls
+from answer_cache import visibility_scope, lookup_answer, store_answer
+from rate_limiter import check_rate_limit
 
 
 def log_api_usage_direct(
@@ -65,66 +83,23 @@ def log_api_usage_direct(
     success: bool = True,
     operation: str = None
 ):
-    """Log API usage directly to PostgreSQL. Fire-and-forget - errors are silently ignored."""
+    """Queue API usage on the buffered sink. Fire-and-forget - errors are silently ignored.
+
+    Rows are priced from api_pricing and written in batches by a background
+    thread (and at script exit), so this never waits on the database.
+    """
     try:
-        postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
+        record_usage(
+            tenant_id=tenant_id,
+            provider=provider,
+            endpoint=endpoint,
+            model=model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            latency_ms=latency_ms,
+            success=success,
+            operation=operation
         )
-        cursor = conn.cursor()
-
-        # Pricing (cents per million tokens)
-        PRICING = {
-            'groq': {
-                'llama-3.3-70b-versatile': {'input': 59, 'output': 79},
-                'llama-4-scout-17b-16e-instruct': {'input': 11, 'output': 34},
-                'llama-4-maverick-17b-128e-instruct': {'input': 50, 'output': 77},
-            },
-            'cohere': {
-                'embed-v4.0': {'input': 10, 'output': 0},
-                'rerank-v3.5': {'per_request': 2},  # 0.2 cents
-                'command-r-08-2024': {'input': 150, 'output': 600},
-                'command-a-03-2025': {'input': 250, 'output': 1000},
-                'command-r-plus-08-2024': {'input': 250, 'output': 1000},
-            }
-        }
-
-        # Calculate cost
-        cost_cents = 0
-        if provider in PRICING and model in PRICING[provider]:
-            pricing = PRICING[provider][model]
-            if 'per_request' in pricing:
-                cost_cents = pricing['per_request']
-            else:
-                cost_cents = int(
-                    (input_tokens / 1_000_000) * pricing.get('input', 0) * 100 +
-                    (output_tokens / 1_000_000) * pricing.get('output', 0) * 100
-                )
-
-        cursor.execute("""
-            INSERT INTO api_usage (
-                tenant_id, provider, endpoint, model,
-                input_tokens, output_tokens, cost_cents,
-                latency_ms, success, operation
-            ) VALUES (
-                %s::uuid, %s, %s, %s,
-                %s, %s, %s,
-                %s, %s, %s
-            )
-        """, (
-            tenant_id, provider, endpoint, model,
-            input_tokens, output_tokens, cost_cents,
-            latency_ms, success, operation
-        ))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
     except Exception:
         pass  # Fire-and-forget - don't let logging failures affect the main flow
 
@@ -168,6 +143,45 @@ def stream_event(event_type: str, data: dict) -> str:
     return json.dumps({"type": event_type, "data": data})
 
 
+# Answer streaming: coalesce LLM deltas so a long answer is a few dozen SSE
+# events rather than one per token
+STREAM_MIN_CHARS = 48
+STREAM_MAX_INTERVAL_SECS = 0.15
+
+
+class AnswerStream:
+    """Buffers streamed answer tokens and emits them as bounded "answer" chunk events."""
+
+    def __init__(
+        self,
+        emit: Callable[[str, dict], None],
+        min_chars: int = STREAM_MIN_CHARS,
+        max_interval: float = STREAM_MAX_INTERVAL_SECS
+    ):
+        self.emit = emit
+        self.min_chars = min_chars
+        self.max_interval = max_interval
+        self._buffer: list = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        self.events = 0
+
+    def __call__(self, token: str) -> None:
+        self._buffer.append(token)
+        self._buffered_chars += len(token)
+        if (self._buffered_chars >= self.min_chars
+                or time.monotonic() - self._last_flush >= self.max_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self.emit("answer", {"chunk": "".join(self._buffer)})
+            self.events += 1
+            self._buffer = []
+            self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+
 def format_extracted_data_for_ai(extracted_data: dict) -> str:
     """Format extracted data into a structured text block for AI context.
 
@@ -247,91 +261,6 @@ class TenantRateLimitExceeded(Exception):
         self.window = window
 
 
-def check_rate_limit(
-    conn,
-    tenant_id: str,
-    endpoint: str = "rag_query",
-    max_requests: int = 30,
-    window_seconds: int = 60
-) -> tuple[bool, int, int]:
-    """
-    Check and update rate limit for a tenant.
-
-    Uses a fixed window rate limiting strategy with PostgreSQL for persistence.
-
-    Args:
-        conn: PostgreSQL connection
-        tenant_id: UUID of the tenant
-        endpoint: Name of the endpoint being rate limited
-        max_requests: Maximum requests allowed per window
-        window_seconds: Window duration in seconds
-
-    Returns:
-        tuple: (allowed: bool, remaining: int, retry_after: int)
-    """
-    from datetime import datetime, timedelta
-
-    cursor = conn.cursor()
-
-    # Calculate current window start (truncate to window boundary)
-    now = datetime.utcnow()
-    window_start = now.replace(
-        second=(now.second // window_seconds) * window_seconds,
-        microsecond=0
-    )
-
-    # Upsert: increment counter or create new record
-    cursor.execute("""
-        INSERT INTO rate_limits (tenant_id, endpoint, window_start, request_count)
-        VALUES (%s, %s, %s, 1)
-        ON CONFLICT (tenant_id, endpoint, window_start)
-        DO UPDATE SET request_count = rate_limits.request_count + 1
-        RETURNING request_count
-    """, (tenant_id, endpoint, window_start))
-
-    result = cursor.fetchone()
-    current_count = result[0] if result else 1
-    conn.commit()
-
-    # Calculate remaining and retry_after
-    remaining = max(0, max_requests - current_count)
-
-    if current_count > max_requests:
-        # Calculate seconds until window resets
-        window_end = window_start + timedelta(seconds=window_seconds)
-        retry_after = int((window_end - now).total_seconds())
-        cursor.close()
-        return False, 0, max(1, retry_after)
-
-    cursor.close()
-    return True, remaining, 0
-
-
-def cleanup_old_rate_limits(conn, hours: int = 24):
-    """Remove rate limit records older than specified hours."""
-    from datetime import datetime, timedelta
-
-    cursor = conn.cursor()
-    cutoff = datetime.utcnow() - timedelta(hours=hours)
-    cursor.execute(
-        "DELETE FROM rate_limits WHERE window_start < %s",
-        (cutoff,)
-    )
-    deleted = cursor.rowcount
-    conn.commit()
-    cursor.close()
-    return deleted
-
-
-# Rate limit tiers per plan (requests per minute)
-PLAN_RATE_LIMITS = {
-    'trial': 15,           # Limited trial: 15 req/min
-    'starter': 30,         # Basic plan: 30 req/min
-    'family': 60,          # Family plan: 60 req/min
-    'family_office': 120,  # Premium plan: 120 req/min
-}
-
-
 # Available models for user selection
 AVAILABLE_MODELS = {
     'groq': {
@@ -386,6 +315,14 @@ AVAILABLE_MODELS = {
 DEFAULT_MODEL = 'llama-3.3-70b-versatile'
 DEFAULT_PROVIDER = 'groq'
 
+# Retrieval settings for search_documents_internal
+DEFAULT_RETRIEVAL_MODE = 'chunks'  # 'chunks' or 'document'
+CHUNK_CANDIDATES = 40              # Nearest chunks fetched before rerank
+MAX_CHUNKS_PER_DOCUMENT = 3        # Chunks kept per document for the LLM
+
+# Tool calls returned in one model turn run concurrently, up to this many at once
+MAX_PARALLEL_TOOLS = 4
+
 
 def get_model_provider(model_id: str) -> tuple[str, str]:
     """Get the provider for a model ID. Returns (provider, model_id) or defaults."""
@@ -396,40 +333,6 @@ def get_model_provider(model_id: str) -> tuple[str, str]:
     return DEFAULT_PROVIDER, DEFAULT_MODEL
 
 
-def get_tenant_rate_limit(conn, tenant_id: str) -> tuple[int, str]:
-    """
-    Get rate limit for a tenant based on their plan.
-
-    Args:
-        conn: PostgreSQL connection
-        tenant_id: UUID of the tenant
-
-    Returns:
-        tuple: (max_requests_per_minute: int, plan_name: str)
-    """
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT plan, status FROM tenants WHERE id = %s
-    """, (tenant_id,))
-
-    result = cursor.fetchone()
-    cursor.close()
-
-    if not result:
-        # Unknown tenant - use trial limits
-        return PLAN_RATE_LIMITS['trial'], 'unknown'
-
-    plan, status = result
-
-    # Suspended tenants get very limited access
-    if status == 'suspended':
-        return 5, 'suspended'
-
-    # Get plan-specific limit (default to trial if plan unknown)
-    limit = PLAN_RATE_LIMITS.get(plan, PLAN_RATE_LIMITS['trial'])
-    return limit, plan
-
-
 def call_groq_with_retry(client, max_retries: int = 3, **kwargs):
     """Call Groq API with automatic retry and exponential backoff for rate limits.
 
@@ -469,7 +372,8 @@ def generate_with_model(
     tenant_id: str = None,
     use_tools: bool = False,
     search_tool: dict = None,
-    tools: list = None
+    tools: list = None,
+    on_token: Optional[Callable[[str], None]] = None
 ) -> tuple[str, str, list]:
     """
     Generate a response using the specified model.
@@ -484,6 +388,8 @@ def generate_with_model(
         use_tools: Whether to enable tool calling
         search_tool: Single tool definition (backward compat) if use_tools is True
         tools: List of tool definitions if use_tools is True (takes precedence)
+        on_token: If given (and tools are off), stream the answer and call
+            on_token with each text delta as it arrives
 
     Returns: (response_content, model_used, tool_calls)
     """
@@ -501,12 +407,32 @@ def generate_with_model(
     if provider == 'cohere':
         return _generate_with_cohere(
             cohere_client, messages, model_id, tenant_id,
-            use_tools=use_tools and supports_tools, search_tool=search_tool, tools=tool_list
+            use_tools=use_tools and supports_tools, search_tool=search_tool, tools=tool_list,
+            on_token=on_token
         )
 
     # Try Groq first
     try:
         start_time = time.time()
+        if on_token and not (use_tools and tool_list and supports_tools):
+            content, usage = _stream_groq(groq_client, model_id, messages, on_token)
+            latency_ms = int((time.time() - start_time) * 1000)
+
+            if tenant_id:
+                log_api_usage(
+                    tenant_id=tenant_id,
+                    provider="groq",
+                    endpoint="chat",
+                    model=model_id,
+                    input_tokens=getattr(usage, 'prompt_tokens', 0) if usage else 0,
+                    output_tokens=getattr(usage, 'completion_tokens', 0) if usage else 0,
+                    latency_ms=latency_ms,
+                    success=True,
+                    operation="rag_query"
+                )
+
+            return content, model_id, []
+
         if use_tools and tool_list and supports_tools:
             response = call_groq_with_retry(
                 groq_client,
@@ -515,7 +441,7 @@ def generate_with_model(
                 messages=messages,
                 tools=tool_list,
                 tool_choice="auto",
-                parallel_tool_calls=False,
+                parallel_tool_calls=True,
                 temperature=0.2,
                 max_tokens=2048
             )
@@ -556,10 +482,43 @@ def generate_with_model(
         # Fall back to Cohere Command-R
         return _generate_with_cohere(
             cohere_client, messages, "command-r-08-2024", tenant_id,
-            use_tools=False, search_tool=None, is_fallback=True
+            use_tools=False, search_tool=None, is_fallback=True,
+            on_token=on_token
         )
 
 
+def _stream_groq(groq_client, model_id: str, messages: list, on_token: Callable[[str], None]):
+    """Stream a Groq chat completion, forwarding text deltas to on_token.
+
+    Returns: (full_content, usage) - usage comes from the final chunk (x_groq.usage).
+    """
+    stream = call_groq_with_retry(
+        groq_client,
+        max_retries=3,
+        model=model_id,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=2048,
+        stream=True
+    )
+
+    parts = []
+    usage = None
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        x_groq = getattr(chunk, 'x_groq', None)
+        if x_groq is not None and getattr(x_groq, 'usage', None):
+            usage = x_groq.usage
+        elif getattr(chunk, 'usage', None):
+            usage = chunk.usage
+
+    return "".join(parts), usage
+
+
 def _generate_with_cohere(
     cohere_client,
     messages: list,
@@ -568,9 +527,10 @@ def _generate_with_cohere(
     use_tools: bool = False,
     search_tool: dict = None,
     tools: list = None,
-    is_fallback: bool = False
+    is_fallback: bool = False,
+    on_token: Optional[Callable[[str], None]] = None
 ) -> tuple[str, str, list]:
-    """Generate response using Cohere API."""
+    """Generate response using Cohere API (chat_stream when on_token is given and tools are off)."""
     # Convert messages to Cohere V2 format (system goes in messages)
     cohere_messages = []
 
@@ -611,6 +571,38 @@ def _generate_with_cohere(
     if cohere_tools:
         chat_kwargs["tools"] = cohere_tools
 
+    if on_token and not cohere_tools:
+        parts = []
+        input_tokens = output_tokens = 0
+        for event in cohere_client.chat_stream(**chat_kwargs):
+            if event.type == "content-delta":
+                text = event.delta.message.content.text
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            elif event.type == "message-end":
+                usage = getattr(event.delta, 'usage', None)
+                if usage and usage.tokens:
+                    input_tokens = int(usage.tokens.input_tokens or 0)
+                    output_tokens = int(usage.tokens.output_tokens or 0)
+        latency_ms = int((time.time() - start_time) * 1000)
+
+        if tenant_id:
+            log_api_usage(
+                tenant_id=tenant_id,
+                provider="cohere",
+                endpoint="chat",
+                model=model_id,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                latency_ms=latency_ms,
+                success=True,
+                operation="rag_query_fallback" if is_fallback else "rag_query"
+            )
+
+        model_label = f"{model_id} (fallback)" if is_fallback else model_id
+        return "".join(parts), model_label, []
+
     response = cohere_client.chat(**chat_kwargs)
     latency_ms = int((time.time() - start_time) * 1000)
 
@@ -735,127 +727,157 @@ def search_documents_internal(
     tenant_id: str,
     top_k: int = 5,
     user_member_type: Optional[str] = None,
-    user_member_id: Optional[int] = None
+    user_member_id: Optional[int] = None,
+    retrieval_mode: str = DEFAULT_RETRIEVAL_MODE,
+    query_embedding: Optional[list] = None,
+    vector_precision: Optional[str] = None
 ) -> dict:
-    """Search documents using Cohere Embed v4 + pgvector + Rerank v3.5."""
+    """Search documents using Cohere Embed v4 + hybrid pgvector/full-text + Rerank v3.5.
+
+    Vector and lexical candidates are fused with RRF (see hybrid_search.py).
+
+    retrieval_mode:
+        "chunks"   - match document_chunks passages, rerank the passages and
+                     return each document with only its best chunks. Documents
+                     that have not been chunked yet are matched by their
+                     whole-document embedding alongside.
+        "document" - match whole-document embeddings only (original behaviour).
+
+    query_embedding: precomputed 1024-d query embedding (see
+    execute_tool_calls); the query is embedded here when omitted.
+
+    vector_precision: "full", "half" or "binary" - quantized first-stage
+    vector search rescored at full precision - or "coarse" - shortlist on
+    the leading 256 Matryoshka dimensions, re-rank on all 1024
+    (vector_quantization.py); defaults to VECTOR_SEARCH_PRECISION. Tenants
+    with few vectors are scanned exactly, others search their bucket's
+    HNSW index (vector_partitions.py).
+    """
     if not query or not query.strip():
         return {"documents": [], "query": query, "count": 0}
 
     query = query.strip()
+    use_chunks = retrieval_mode == "chunks"
+    precision = resolve_precision(vector_precision)
 
     # Fetch resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
     cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
 
     co = cohere.ClientV2(api_key=cohere_api_key)
 
-    # Step 1: Embed query
-    try:
-        embed_start = time.time()
-        embed_response = co.embed(
-            texts=[query],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        embed_latency = int((time.time() - embed_start) * 1000)
-        query_embedding = embed_response.embeddings.float_[0]
+    # Step 1: Embed query (repeated queries are served from the embedding cache)
+    if query_embedding is None:
+        try:
+            embed_model, embed_dimension = active_model("text")
+            embed_start = time.time()
+            query_embedding, embed_tokens, cache_hit = embed_query(
+                co, query, model=embed_model, output_dimension=embed_dimension
+            )
+            embed_latency = int((time.time() - embed_start) * 1000)
 
-        # Log embed usage (estimate tokens from query length)
-        log_api_usage(
-            tenant_id=tenant_id,
-            provider="cohere",
-            endpoint="embed",
-            model="embed-v4.0",
-            input_tokens=len(query.split()),  # Approximate token count
-            output_tokens=0,
-            latency_ms=embed_latency,
-            success=True,
-            operation="search_embed"
-        )
-    except Exception as e:
-        return {"documents": [], "query": query, "count": 0, "error": f"Embed error: {str(e)}"}
+            # Log embed usage - cache hits cost nothing
+            if not cache_hit:
+                log_api_usage(
+                    tenant_id=tenant_id,
+                    provider="cohere",
+                    endpoint="embed",
+                    model=embed_model,
+                    input_tokens=embed_tokens,
+                    output_tokens=0,
+                    latency_ms=embed_latency,
+                    success=True,
+                    operation="search_embed"
+                )
+        except Exception as e:
+            return {"documents": [], "query": query, "count": 0, "error": f"Embed error: {str(e)}"}
 
     # Step 2: Vector search
+    candidates = []
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Enable pgvector iterative scans for filtered queries (pgvector 0.8.0+)
-        # This prevents overfiltering when combining vector search with WHERE clauses
-        cursor.execute("SET hnsw.iterative_scan = strict_order;")
-
-        # Build visibility filter
-        visibility_filter = ""
-        params = [query_embedding, tenant_id]
-
-        if user_member_type:
-            if user_member_type == 'admin':
-                pass
-            elif user_member_type == 'adult':
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only') OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only')"
-            else:
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') = 'everyone' OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
-        else:
-            visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
-
-        cursor.execute(f"""
-            SELECT id, title, content, category, extracted_data, embedding <=> %s::vector AS distance
-            FROM family_documents
-            WHERE tenant_id = %s::uuid AND embedding IS NOT NULL
-            {visibility_filter}
-            ORDER BY distance
-            LIMIT 15
-        """, params)
-
-        search_results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Enable pgvector iterative scans for filtered queries (pgvector 0.8.0+)
+            # This prevents overfiltering when combining vector search with WHERE clauses
+            cursor.execute("SET hnsw.iterative_scan = strict_order;")
+            set_search_precision(cursor, precision, max(CHUNK_CANDIDATES, DEFAULT_CANDIDATES))
+            shared_ids = shared_document_ids(cursor, tenant_id, user_member_id)
+
+            if use_chunks:
+                chunk_visibility, chunk_visibility_params, chunk_scopes = access_filter(
+                    cursor, tenant_id, user_member_type, user_member_id,
+                    alias="dc", id_column="document_id", assigned_alias="fd", shared_ids=shared_ids
+                )
+                for chunk in search_chunks(
+                    cursor, query_embedding, query, tenant_id,
+                    chunk_visibility, chunk_visibility_params, limit=CHUNK_CANDIDATES,
+                    precision=precision, vector_scopes=chunk_scopes
+                ):
+                    chunk["rerank_text"] = chunk_embedding_text(chunk, chunk["title"])
+                    candidates.append(chunk)
+
+            # Whole-document candidates (only documents without chunks in chunk mode)
+            chunk_filter = "AND COALESCE(d.chunk_count, 0) = 0" if use_chunks else ""
+            doc_precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "family_documents", precision, "d"
+            )
+            doc_visibility, doc_visibility_params, vector_scopes = access_filter(
+                cursor, tenant_id, user_member_type, user_member_id, alias="d", shared_ids=shared_ids
+            )
+            cte_sql, cte_params = hybrid_cte(
+                from_sql="family_documents d",
+                id_expr="d.id",
+                tsv_expr="d.search_tsv",
+                where_sql=f"d.tenant_id = %s::uuid {chunk_filter} {doc_visibility}",
+                where_params=[tenant_id] + doc_visibility_params,
+                query_text=query,
+                distance_sql="d.embedding <=> %s::vector",
+                distance_params=[query_embedding],
+                vector_where=f"d.embedding IS NOT NULL {bucket_filter}",
+                precision=doc_precision,
+                vector_columns=["d.embedding"],
+                vector_scopes=vector_scopes,
+            )
+            cursor.execute(cte_sql + """
+                SELECT d.id, d.title, d.content, d.category, d.extracted_data,
+                       fused.distance, fused.rrf_score
+                FROM fused
+                JOIN family_documents d ON d.id = fused.id
+                ORDER BY fused.rrf_score DESC
+                LIMIT 15
+            """, cte_params)
+
+            for r in cursor.fetchall():
+                # r = (id, title, content, category, extracted_data, distance, rrf_score)
+                candidates.append({
+                    "document_id": r[0],
+                    "title": r[1],
+                    "content": r[2][:8000],
+                    "category": r[3],
+                    "extracted_data": r[4] if r[4] else {},
+                    "distance": float(r[5]) if r[5] is not None else None,
+                    "rrf_score": float(r[6]),
+                    "rerank_text": f"title: {r[1]}\ncategory: {r[3]}\ncontent: {r[2][:4000]}"
+                })
+            cursor.close()
 
     except psycopg2.Error as e:
         return {"documents": [], "query": query, "count": 0, "error": f"DB error: {str(e)}"}
 
-    if not search_results:
+    if not candidates:
         return {"documents": [], "query": query, "count": 0}
 
+    # Chunk and document legs are fused with the same RRF constant
+    candidates.sort(key=lambda c: c["rrf_score"], reverse=True)
+    top_n = top_k * MAX_CHUNKS_PER_DOCUMENT if use_chunks else top_k
+
     # Step 3: Rerank
     try:
-        documents_for_rerank = []
-        for r in search_results:
-            # r = (id, title, content, category, extracted_data, distance)
-            extracted_data = r[4] if r[4] else {}
-            doc_text = f"title: {r[1]}\ncategory: {r[3]}\ncontent: {r[2][:4000]}"
-            documents_for_rerank.append({
-                "id": str(r[0]),
-                "title": r[1],
-                "content": r[2][:8000],
-                "category": r[3],
-                "extracted_data": extracted_data,
-                "rerank_text": doc_text
-            })
-
         rerank_start = time.time()
         rerank_response = co.rerank(
             query=query,
-            documents=[d["rerank_text"] for d in documents_for_rerank],
-            top_n=top_k,
+            documents=[c["rerank_text"] for c in candidates],
+            top_n=min(top_n, len(candidates)),
             model="rerank-v3.5",
             return_documents=False
         )
@@ -874,38 +896,31 @@ def search_documents_internal(
             operation="search_rerank"
         )
 
-        documents = []
+        scored = []
         for result in rerank_response.results:
-            doc = documents_for_rerank[result.index]
-            documents.append({
-                "id": doc["id"],
-                "title": doc["title"],
-                "content": doc["content"],
-                "category": doc["category"],
-                "extracted_data": doc.get("extracted_data", {}),
-                "relevance": round(float(result.relevance_score), 3)
-            })
+            candidate = dict(candidates[result.index])
+            candidate["relevance"] = round(float(result.relevance_score), 3)
+            scored.append(candidate)
 
     except Exception:
-        documents = []
-        for r in search_results[:top_k]:
-            # r = (id, title, content, category, extracted_data, distance)
-            distance = float(r[5])
-            extracted_data = r[4] if r[4] else {}
-            similarity = max(0.0, min(1.0, 1.0 / (1.0 + distance)))
-            documents.append({
-                "id": str(r[0]),
-                "title": r[1],
-                "content": r[2][:8000],
-                "category": r[3],
-                "extracted_data": extracted_data,
-                "relevance": round(similarity, 3)
-            })
+        scored = []
+        for candidate in candidates[:top_n]:
+            candidate = dict(candidate)
+            candidate["relevance"] = rrf_relevance(candidate["rrf_score"])
+            scored.append(candidate)
+
+    documents = group_chunks_by_document(
+        scored,
+        max_documents=top_k,
+        max_chunks_per_document=MAX_CHUNKS_PER_DOCUMENT if use_chunks else 1
+    )
 
     return {
         "documents": documents,
         "query": query,
-        "count": len(documents)
+        "count": len(documents),
+        "retrieval_mode": retrieval_mode,
+        "vector_precision": precision
     }
 
 
@@ -914,7 +929,11 @@ def search_pdf_pages_internal(
     tenant_id: str,
     document_id: Optional[int] = None,
     limit: int = 5,
-    min_similarity: float = 0.2
+    min_similarity: float = 0.2,
+    query_embedding: Optional[list] = None,
+    vector_precision: Optional[str] = None,
+    user_member_type: Optional[str] = None,
+    user_member_id: Optional[int] = None
 ) -> dict:
     """Search PDF pages by visual similarity using Cohere Embed v4.
 
@@ -929,6 +948,12 @@ def search_pdf_pages_internal(
         document_id: Optional document ID to limit search
         limit: Max results
         min_similarity: Minimum similarity threshold
+        query_embedding: Precomputed query embedding (default dimension);
+            the query is embedded here when omitted
+        vector_precision: "full", "half", "binary" or "coarse" (vector_quantization.py);
+            "exact" is used automatically for tenants with few pages
+        user_member_type, user_member_id: Pages of documents the member
+            can't see are skipped (document_access.py)
 
     Returns:
         dict with pages list, query, count
@@ -937,100 +962,106 @@ def search_pdf_pages_internal(
         return {"pages": [], "query": query, "count": 0}
 
     query = query.strip()
+    precision = resolve_precision(vector_precision, "pages")
 
     # Fetch resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
     cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
 
     co = cohere.ClientV2(api_key=cohere_api_key)
 
     # Step 1: Embed query as text (Cohere aligns text and image embeddings)
-    try:
-        embed_start = time.time()
-        embed_response = co.embed(
-            texts=[query],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"]
-        )
-        embed_latency = int((time.time() - embed_start) * 1000)
-        query_embedding = embed_response.embeddings.float_[0]
+    if query_embedding is None:
+        try:
+            embed_model, embed_dimension = active_model("pages")
+            embed_start = time.time()
+            query_embedding, embed_tokens, cache_hit = embed_query(
+                co, query, model=embed_model, output_dimension=embed_dimension
+            )
+            embed_latency = int((time.time() - embed_start) * 1000)
 
-        log_api_usage(
-            tenant_id=tenant_id,
-            provider="cohere",
-            endpoint="embed",
-            model="embed-v4.0",
-            input_tokens=len(query.split()),
-            output_tokens=0,
-            latency_ms=embed_latency,
-            success=True,
-            operation="visual_search_embed"
-        )
-    except Exception as e:
-        return {"pages": [], "query": query, "count": 0, "error": f"Embed error: {str(e)}"}
+            if not cache_hit:
+                log_api_usage(
+                    tenant_id=tenant_id,
+                    provider="cohere",
+                    endpoint="embed",
+                    model=embed_model,
+                    input_tokens=embed_tokens,
+                    output_tokens=0,
+                    latency_ms=embed_latency,
+                    success=True,
+                    operation="visual_search_embed"
+                )
+        except Exception as e:
+            return {"pages": [], "query": query, "count": 0, "error": f"Embed error: {str(e)}"}
 
     # Step 2: Vector search in document_pages
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Enable pgvector iterative scans
-        cursor.execute("SET hnsw.iterative_scan = strict_order;")
-
-        # Build query with optional document filter
-        params = [query_embedding, tenant_id, query_embedding, min_similarity, query_embedding, limit]
-        doc_filter = ""
-        if document_id:
-            doc_filter = "AND dp.document_id = %s"
-            params = [query_embedding, tenant_id, document_id, query_embedding, min_similarity, query_embedding, limit]
-
-        cursor.execute(f"""
-            SELECT
-                dp.id as page_id,
-                dp.document_id,
-                fd.title as document_title,
-                dp.page_number,
-                (1 - (dp.embedding <=> %s::vector)) as similarity,
-                dp.page_image,
-                dp.ocr_text,
-                dp.has_images,
-                dp.width,
-                dp.height
-            FROM document_pages dp
-            JOIN family_documents fd ON dp.document_id = fd.id
-            WHERE dp.tenant_id = %s::uuid
-              {doc_filter}
-              AND dp.embedding IS NOT NULL
-              AND (1 - (dp.embedding <=> %s::vector)) >= %s
-            ORDER BY dp.embedding <=> %s::vector
-            LIMIT %s
-        """, params)
-
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Enable pgvector iterative scans
+            cursor.execute("SET hnsw.iterative_scan = strict_order;")
+            precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "document_pages", precision, "dp"
+            )
+            set_search_precision(cursor, precision, limit)
+
+            # Build query with optional document filter
+            params = [query_embedding, tenant_id]
+            doc_filter = ""
+            if document_id:
+                doc_filter = "AND dp.document_id = %s"
+                params.append(document_id)
+            page_visibility, page_visibility_params = visibility_filter(
+                "fd", user_member_type, user_member_id,
+                shared_document_ids(cursor, tenant_id, user_member_id)
+            )
+            params += page_visibility_params + [query_embedding, min_similarity]
+
+            search_sql, search_params = nearest_sql(f"""
+                SELECT
+                    dp.id as page_id,
+                    dp.document_id,
+                    fd.title as document_title,
+                    dp.page_number,
+                    (1 - (dp.embedding <=> %s::vector)) as similarity,
+                    dp.page_image_hash,
+                    dp.page_image,  -- NULL once moved to the blob store
+                    dp.ocr_text,
+                    dp.has_images,
+                    dp.width,
+                    dp.height,
+                    dp.embedding <=> %s::vector AS distance
+                FROM document_pages dp
+                JOIN family_documents fd ON dp.document_id = fd.id
+                WHERE dp.tenant_id = %s::uuid
+                  {doc_filter}
+                  {page_visibility}
+                  AND dp.embedding IS NOT NULL {bucket_filter}
+                  AND (1 - (dp.embedding <=> %s::vector)) >= %s
+            """, "dp.embedding", query_embedding, limit, precision)
+            cursor.execute(search_sql, [query_embedding] + params + search_params)
+
+            rows = cursor.fetchall()
+            cursor.close()
+
+        # Signed after the visibility filter, one signing request per result set
+        image_urls = blob_urls([row[5] for row in rows], "pages")
 
         pages = []
-        for row in rows:
+        for row, image_url in zip(rows, image_urls):
             pages.append({
                 "page_id": row[0],
                 "document_id": row[1],
                 "document_title": row[2],
                 "page_number": row[3],
                 "similarity": round(float(row[4]), 4),
-                "page_image": row[5],  # Base64 thumbnail
-                "ocr_text": row[6][:500] if row[6] else None,
-                "has_images": row[7],
-                "dimensions": {"width": row[8], "height": row[9]}
+                "page_image_url": image_url,
+                "page_image_hash": row[5],  # Cached answers re-sign from the hash
+                "page_image": row[6],  # Legacy base64 thumbnail
+                "ocr_text": row[7][:500] if row[7] else None,
+                "has_images": row[8],
+                "dimensions": {"width": row[9], "height": row[10]}
             })
 
         return {
@@ -1043,6 +1074,101 @@ def search_pdf_pages_internal(
         return {"pages": [], "query": query, "count": 0, "error": f"DB error: {str(e)}"}
 
 
+def execute_tool_calls(
+    planned: list[dict],
+    tenant_id: str,
+    user_member_type: Optional[str] = None,
+    user_member_id: Optional[int] = None,
+    retrieval_mode: str = DEFAULT_RETRIEVAL_MODE,
+    vector_precision: Optional[str] = None
+) -> list[dict]:
+    """Run the search tool calls from one model turn concurrently.
+
+    All query texts are embedded up front with one Cohere call per vector
+    space, each with its registry model and output dimension
+    (active_model("text") for search_documents, active_model("pages") for
+    search_pdf_pages), then the searches run in a thread pool.
+
+    Args:
+        planned: [{"name": "search_documents" | "search_pdf_pages",
+                   "query": str, "document_id": Optional[int]}, ...]
+
+    Returns:
+        Search results in the same order as planned
+    """
+    if not planned:
+        return []
+
+    # Batch the query embeddings; a failed batch leaves each search to embed
+    # (and report the error) on its own
+    embeddings: list = [None] * len(planned)
+    cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
+    co = cohere.ClientV2(api_key=cohere_api_key)
+    for tool_name, target, operation in (
+        ("search_documents", "text", "search_embed"),
+        ("search_pdf_pages", "pages", "visual_search_embed"),
+    ):
+        positions = [i for i, call in enumerate(planned) if call["name"] == tool_name]
+        if not positions:
+            continue
+        texts = [planned[i]["query"].strip() for i in positions]
+        if not all(texts):
+            continue
+        try:
+            embed_model, embed_dimension = active_model(target)
+            embed_start = time.time()
+            batch, embed_tokens, misses = embed_queries(
+                co, texts, model=embed_model, output_dimension=embed_dimension
+            )
+            if misses:
+                log_api_usage(
+                    tenant_id=tenant_id,
+                    provider="cohere",
+                    endpoint="embed",
+                    model=embed_model,
+                    input_tokens=embed_tokens,
+                    output_tokens=0,
+                    latency_ms=int((time.time() - embed_start) * 1000),
+                    success=True,
+                    operation=operation
+                )
+            for i, embedding in zip(positions, batch):
+                embeddings[i] = embedding
+        except Exception:
+            pass
+
+    def run(index: int) -> dict:
+        call = planned[index]
+        if call["name"] == "search_pdf_pages":
+            return search_pdf_pages_internal(
+                query=call["query"],
+                tenant_id=tenant_id,
+                document_id=call.get("document_id"),
+                limit=5,
+                min_similarity=0.2,
+                query_embedding=embeddings[index],
+                vector_precision=vector_precision,
+                user_member_type=user_member_type,
+                user_member_id=user_member_id
+            )
+        return search_documents_internal(
+            query=call["query"],
+            tenant_id=tenant_id,
+            top_k=5,
+            user_member_type=user_member_type,
+            user_member_id=user_member_id,
+            retrieval_mode=retrieval_mode,
+            query_embedding=embeddings[index],
+            vector_precision=vector_precision
+        )
+
+    if len(planned) == 1:
+        return [run(0)]
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_TOOLS, len(planned))) as executor:
+        return list(executor.map(run, range(len(planned))))
+
+
 def main(
     user_message: str,
     tenant_id: str,
@@ -1052,6 +1178,8 @@ def main(
     user_member_id: Optional[int] = None,
     stream: bool = True,
     model: Optional[str] = None,
+    retrieval_mode: str = DEFAULT_RETRIEVAL_MODE,
+    vector_precision: Optional[str] = None,
 ) -> dict:
     """Execute AI Agent RAG pipeline with tool calling.
 
@@ -1064,6 +1192,9 @@ def main(
         user_member_id: For private doc access
         stream: Whether to stream events (default True)
         model: Optional model ID to use (defaults to llama-3.3-70b-versatile)
+        retrieval_mode: 'chunks' (passage retrieval, default) or 'document'
+        vector_precision: 'full', 'half', 'binary' or 'coarse' first-stage vector search
+            (default VECTOR_SEARCH_PRECISION, see vector_quantization.py)
 
     Uses the specified model, or falls back to Cohere Command-R if rate limited.
     When stream=True, emits SSE events via wmill.stream_result() for real-time UI updates.
@@ -1086,58 +1217,33 @@ def main(
     if not session_id:
         session_id = str(uuid.uuid4())
 
-    # Rate limit check - limits based on tenant's plan
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-    rate_limit_conn = psycopg2.connect(
-        host=postgres_db['host'],
-        port=postgres_db['port'],
-        dbname=postgres_db['dbname'],
-        user=postgres_db['user'],
-        password=postgres_db['password'],
-        sslmode=postgres_db.get('sslmode', 'disable')
-    )
-
-    try:
-        # Get plan-based rate limit for this tenant
-        max_requests, tenant_plan = get_tenant_rate_limit(rate_limit_conn, tenant_id)
-
-        allowed, remaining, retry_after = check_rate_limit(
-            rate_limit_conn,
-            tenant_id,
-            endpoint="rag_query",
-            max_requests=max_requests,
-            window_seconds=60
-        )
-
-        if not allowed:
-            rate_limit_conn.close()
-            result = {
-                "error": "rate_limit_exceeded",
-                "answer": "You've reached the query limit. Please wait a moment before asking another question.",
-                "sources": [],
-                "tool_calls": [],
-                "retry_after": retry_after,
-                "limit": max_requests,
-                "window": 60,
-                "plan": tenant_plan,
-                "session_id": session_id,
-                "tenant_id": tenant_id
-            }
-            emit("error", {"message": "rate_limit_exceeded", "retry_after": retry_after, "plan": tenant_plan})
-            return result
-
-        # Store for response
-        rate_limit_remaining = remaining
-        rate_limit_max = max_requests
-        rate_limit_plan = tenant_plan
-
-        # Occasionally cleanup old rate limit records (1% chance)
-        import random
-        if random.random() < 0.01:
-            cleanup_old_rate_limits(rate_limit_conn, hours=24)
+    # Rate limit check - limits based on tenant's plan (in-process token
+    # bucket; counts are written to rate_limits in the background)
+    decision = check_rate_limit(tenant_id, endpoint="rag_query", window_seconds=60)
+    max_requests = decision["limit"]
+    tenant_plan = decision["plan"]
+
+    if not decision["allowed"]:
+        retry_after = decision["retry_after"]
+        result = {
+            "error": "rate_limit_exceeded",
+            "answer": "You've reached the query limit. Please wait a moment before asking another question.",
+            "sources": [],
+            "tool_calls": [],
+            "retry_after": retry_after,
+            "limit": max_requests,
+            "window": 60,
+            "plan": tenant_plan,
+            "session_id": session_id,
+            "tenant_id": tenant_id
+        }
+        emit("error", {"message": "rate_limit_exceeded", "retry_after": retry_after, "plan": tenant_plan})
+        return result
 
-    finally:
-        rate_limit_conn.close()
+    # Store for response
+    rate_limit_remaining = decision["remaining"]
+    rate_limit_max = max_requests
+    rate_limit_plan = tenant_plan
 
     # Initialize both clients
     groq_api_key = wmill.get_variable("f/chatbot/groq_api_key")
@@ -1156,6 +1262,56 @@ def main(
     requested_model = model or DEFAULT_MODEL
     model_used = requested_model
 
+    # Semantic answer cache - standalone questions only, since follow-ups
+    # depend on the conversation history
+    answer_scope = visibility_scope(user_member_type, user_member_id)
+    question_embedding = None
+    if not conversation_history:
+        try:
+            embed_model, embed_dimension = active_model("text")
+            embed_start = time.time()
+            question_embedding, embed_tokens, embed_cached = embed_query(
+                cohere_client, user_message.strip(), model=embed_model, output_dimension=embed_dimension
+            )
+            if not embed_cached:
+                log_api_usage(
+                    tenant_id=tenant_id,
+                    provider="cohere",
+                    endpoint="embed",
+                    model=embed_model,
+                    input_tokens=embed_tokens,
+                    latency_ms=int((time.time() - embed_start) * 1000),
+                    success=True,
+                    operation="answer_cache_embed"
+                )
+        except Exception:
+            question_embedding = None
+
+    if question_embedding is not None:
+        cached = lookup_answer(tenant_id, answer_scope, requested_model, question_embedding)
+        if cached:
+            result = {
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "page_sources": cached["page_sources"],
+                "tool_calls": cached["tool_calls"],
+                "confidence": cached["confidence"],
+                "session_id": session_id,
+                "tenant_id": tenant_id,
+                "model": cached["model"],
+                "cached": True,
+                "cache_similarity": cached["similarity"],
+                "rate_limit": {
+                    "remaining": rate_limit_remaining,
+                    "limit": rate_limit_max,
+                    "window": 60,
+                    "plan": rate_limit_plan
+                }
+            }
+            emit("answer", {"status": "complete", "content": result["answer"]})
+            emit("complete", result)
+            return result
+
     # Emit thinking started event
     emit("thinking", {"status": "started", "model": requested_model})
 
@@ -1182,46 +1338,72 @@ def main(
             assistant_msg = {"role": "assistant", "content": content or "", "tool_calls": tool_calls}
             messages.append(assistant_msg)
 
+            # Parse every call first so the searches can run together
+            planned = []
             for tool_call in tool_calls:
-                if tool_call.function.name == "search_documents":
-                    args = json.loads(tool_call.function.arguments)
-                    search_query = args.get("query", user_message)
+                if tool_call.function.name not in ("search_documents", "search_pdf_pages"):
+                    continue
+                args = json.loads(tool_call.function.arguments)
+                planned.append({
+                    "id": tool_call.id,
+                    "name": tool_call.function.name,
+                    "query": args.get("query", user_message),
+                    "document_id": args.get("document_id")
+                })
 
+            for call in planned:
+                if call["name"] == "search_documents":
                     tool_calls_made.append({
                         "name": "search_documents",
-                        "query": search_query
+                        "query": call["query"]
                     })
-
                     # Emit search started event
-                    emit("search", {"status": "started", "query": search_query})
-
-                    # Execute search
-                    search_result = search_documents_internal(
-                        query=search_query,
-                        tenant_id=tenant_id,
-                        top_k=5,
-                        user_member_type=user_member_type,
-                        user_member_id=user_member_id
-                    )
-
-                    if search_result.get("documents"):
-                        sources = [
-                            {
-                                "id": doc["id"],
-                                "title": doc["title"],
-                                "category": doc["category"],
-                                "relevance": doc["relevance"],
-                                "snippet": doc["content"][:500] if doc.get("content") else None
-                            }
-                            for doc in search_result["documents"]
-                        ]
+                    emit("search", {"status": "started", "query": call["query"]})
+                else:
+                    tool_calls_made.append({
+                        "name": "search_pdf_pages",
+                        "query": call["query"],
+                        "document_id": call["document_id"]
+                    })
+                    # Emit visual search started
+                    emit("visual_search", {"status": "started", "query": call["query"]})
+
+            # Execute all searches concurrently (one batched embed call)
+            tool_results = execute_tool_calls(
+                planned,
+                tenant_id=tenant_id,
+                user_member_type=user_member_type,
+                user_member_id=user_member_id,
+                retrieval_mode=retrieval_mode,
+                vector_precision=vector_precision
+            )
+
+            # Results are applied in call order, so tool messages line up with
+            # the assistant message's tool_calls
+            for call, tool_result in zip(planned, tool_results):
+                if call["name"] == "search_documents":
+                    search_query = call["query"]
+                    search_result = tool_result
+
+                    call_sources = [
+                        {
+                            "id": doc["id"],
+                            "title": doc["title"],
+                            "category": doc["category"],
+                            "relevance": doc["relevance"],
+                            "snippet": doc["content"][:500] if doc.get("content") else None
+                        }
+                        for doc in search_result.get("documents", [])
+                    ]
+                    seen_ids = {source["id"] for source in sources}
+                    sources.extend(source for source in call_sources if source["id"] not in seen_ids)
 
                     # Emit search complete event with results
                     emit("search", {
                         "status": "complete",
                         "query": search_query,
-                        "count": len(sources),
-                        "sources": sources
+                        "count": len(call_sources),
+                        "sources": call_sources
                     })
 
                     # Format documents for AI with extracted key data prominently displayed
@@ -1246,56 +1428,34 @@ def main(
                         "documents": formatted_docs
                     })
 
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": tool_response
-                    })
-
-                elif tool_call.function.name == "search_pdf_pages":
-                    args = json.loads(tool_call.function.arguments)
-                    visual_query = args.get("query", user_message)
-                    doc_id = args.get("document_id")
-
-                    tool_calls_made.append({
-                        "name": "search_pdf_pages",
-                        "query": visual_query,
-                        "document_id": doc_id
-                    })
-
-                    # Emit visual search started
-                    emit("visual_search", {"status": "started", "query": visual_query})
-
-                    # Execute visual search
-                    page_result = search_pdf_pages_internal(
-                        query=visual_query,
-                        tenant_id=tenant_id,
-                        document_id=doc_id,
-                        limit=5,
-                        min_similarity=0.2
-                    )
-
-                    if page_result.get("pages"):
-                        page_sources = [
-                            {
-                                "page_id": p["page_id"],
-                                "document_id": p["document_id"],
-                                "document_title": p["document_title"],
-                                "page_number": p["page_number"],
-                                "similarity": p["similarity"],
-                                "page_image": p["page_image"],
-                                "ocr_text": p["ocr_text"],
-                                "type": "page"
-                            }
-                            for p in page_result["pages"]
-                        ]
+                else:
+                    visual_query = call["query"]
+                    page_result = tool_result
+
+                    call_pages = [
+                        {
+                            "page_id": p["page_id"],
+                            "document_id": p["document_id"],
+                            "document_title": p["document_title"],
+                            "page_number": p["page_number"],
+                            "similarity": p["similarity"],
+                            "page_image_url": p["page_image_url"],
+                            "page_image_hash": p["page_image_hash"],
+                            "page_image": p["page_image"],
+                            "ocr_text": p["ocr_text"],
+                            "type": "page"
+                        }
+                        for p in page_result.get("pages", [])
+                    ]
+                    seen_pages = {page["page_id"] for page in page_sources}
+                    page_sources.extend(p for p in call_pages if p["page_id"] not in seen_pages)
 
                     # Emit visual search complete
                     emit("visual_search", {
                         "status": "complete",
                         "query": visual_query,
-                        "count": len(page_sources),
-                        "page_sources": page_sources
+                        "count": len(call_pages),
+                        "page_sources": call_pages
                     })
 
                     # Build tool response - don't include full page images in LLM context
@@ -1312,24 +1472,29 @@ def main(
                         ]
                     })
 
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": tool_response
-                    })
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "content": tool_response
+                })
 
             # Emit answer generation started
             emit("answer", {"status": "started"})
 
-            # Second call - generate answer with search results
+            # Second call - generate answer with search results, streaming
+            # tokens to the UI as they arrive
+            answer_stream = AnswerStream(emit) if stream else None
             answer, model_used, _ = generate_with_model(
                 groq_client, cohere_client, messages,
                 model_id=requested_model,
                 tenant_id=tenant_id,
-                use_tools=False
+                use_tools=False,
+                on_token=answer_stream
             )
+            if answer_stream:
+                answer_stream.flush()
 
-            # Emit answer complete (full answer - not chunked since Groq doesn't stream here)
+            # Emit answer complete (full answer for clients that ignore chunks)
             emit("answer", {"status": "complete", "content": answer})
 
         elif is_cohere_fallback:
@@ -1348,7 +1513,10 @@ def main(
                 tenant_id=tenant_id,
                 top_k=5,
                 user_member_type=user_member_type,
-                user_member_id=user_member_id
+                user_member_id=user_member_id,
+                retrieval_mode=retrieval_mode,
+                query_embedding=question_embedding,  # already embedded for the answer cache
+                vector_precision=vector_precision
             )
 
             if search_result.get("documents"):
@@ -1392,13 +1560,17 @@ def main(
                 # Emit answer started
                 emit("answer", {"status": "started"})
 
-                # Generate answer with context
+                # Generate answer with context, streaming tokens
+                answer_stream = AnswerStream(emit) if stream else None
                 answer, model_used, _ = generate_with_model(
                     groq_client, cohere_client, messages,
                     model_id=requested_model,
                     tenant_id=tenant_id,
-                    use_tools=False
+                    use_tools=False,
+                    on_token=answer_stream
                 )
+                if answer_stream:
+                    answer_stream.flush()
 
                 # Emit answer complete
                 emit("answer", {"status": "complete", "content": answer})
@@ -1469,6 +1641,7 @@ def main(
         "session_id": session_id,
         "tenant_id": tenant_id,
         "model": model_used,
+        "cached": False,
         "rate_limit": {
             "remaining": rate_limit_remaining,
             "limit": rate_limit_max,
@@ -1480,4 +1653,8 @@ def main(
     # Emit complete event with full result
     emit("complete", result)
 
+    # Cache document-grounded answers after the client already has them
+    if question_embedding is not None:
+        store_answer(tenant_id, answer_scope, requested_model, user_message.strip(), question_embedding, result)
+
     return result
@@ -0,0 +1,434 @@
+# rate_limiter.py
+# Windmill Python library - Per-tenant rate limiting
+# Path: f/chatbot/rate_limiter
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Per-Tenant Rate Limiter for Archevi
+===================================
+
+Token bucket per (tenant, endpoint) held in process memory, so a chat
+request no longer waits on an upsert + commit into `rate_limits` and a
+separate `tenants` plan lookup.
+
+- Each bucket holds `limit` tokens and refills at `limit / window_seconds`
+  tokens per second (plan limits from PLAN_RATE_LIMITS).
+- The tenant's plan and the requests already counted in `rate_limits` for
+  the current window are loaded together in one query when a bucket is
+  first used and again every RATE_LIMIT_PLAN_TTL_SECS. That refresh also
+  reconciles the bucket with requests served by other workers.
+- Allowed requests are counted in memory and written to `rate_limits`
+  (same fixed-window rows as before, kept for audit and analytics) by a
+  background thread every RATE_LIMIT_FLUSH_SECS and at process exit.
+- Old `rate_limits` rows are deleted by `main(action="cleanup")`, which is
+  meant for a Windmill schedule, instead of 1% of chat requests.
+
+If the database is unreachable the limiter keeps working from memory
+(trial limits for a tenant it has never seen) rather than failing queries.
+
+ProviderThrottle paces this process's outbound calls to an LLM provider
+(Cohere, Groq) for batch jobs that fan out across threads: calls are spaced
+to the provider's requests-per-minute budget, and a 429 pauses every
+thread sharing the throttle (Retry-After when the provider sends one,
+otherwise exponential backoff) before the call is retried.
+
+Usage:
+    from rate_limiter import check_rate_limit
+
+    decision = check_rate_limit(tenant_id, endpoint="rag_query")
+    if not decision["allowed"]:
+        return {"error": "rate_limit_exceeded", "retry_after": decision["retry_after"]}
+
+    response = provider_throttle("cohere").call(co.chat, model=..., messages=...)
+
+Windmill Script Configuration:
+- Path: f/chatbot/rate_limiter
+- This is a library module; main() reports stats, flushes or cleans up
+"""
+
+from datetime import datetime
+from typing import Optional
+import atexit
+import math
+import os
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection
+
+
+# Requests per minute for each plan
+PLAN_RATE_LIMITS = {
+    'trial': 15,           # Limited trial: 15 req/min
+    'starter': 30,         # Basic plan: 30 req/min
+    'family': 60,          # Family plan: 60 req/min
+    'family_office': 120,  # Premium plan: 120 req/min
+}
+SUSPENDED_RATE_LIMIT = 5
+
+PLAN_TTL_SECONDS = float(os.getenv("RATE_LIMIT_PLAN_TTL_SECS", "60"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("RATE_LIMIT_FLUSH_SECS", "10"))
+RETENTION_HOURS = int(os.getenv("RATE_LIMIT_RETENTION_HOURS", "24"))
+
+# Outbound LLM calls per minute per process (ProviderThrottle)
+PROVIDER_CALLS_PER_MINUTE = {
+    'cohere': int(os.getenv("COHERE_CALLS_PER_MINUTE", "300")),
+    'groq': int(os.getenv("GROQ_CALLS_PER_MINUTE", "30")),
+}
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "4"))
+PROVIDER_BACKOFF_BASE_SECS = 2.0
+PROVIDER_BACKOFF_MAX_SECS = 60.0
+
+
+def plan_limit(plan: Optional[str], status: Optional[str]) -> tuple[int, str]:
+    """Map a tenant's plan and status to (max_requests_per_window, plan_name)."""
+    if plan is None and status is None:
+        # Unknown tenant - use trial limits
+        return PLAN_RATE_LIMITS['trial'], 'unknown'
+    if status == 'suspended':
+        return SUSPENDED_RATE_LIMIT, 'suspended'
+    return PLAN_RATE_LIMITS.get(plan, PLAN_RATE_LIMITS['trial']), plan
+
+
+def window_start_for(timestamp: float, window_seconds: int) -> datetime:
+    """Fixed window boundary (naive UTC, as stored in rate_limits.window_start)."""
+    return datetime.utcfromtimestamp(int(timestamp // window_seconds) * window_seconds)
+
+
+class _Bucket:
+    __slots__ = ("limit", "plan", "window_seconds", "tokens", "updated_at", "refreshed_at")
+
+    def __init__(self, limit: int, plan: str, window_seconds: int, used: int):
+        self.limit = limit
+        self.plan = plan
+        self.window_seconds = window_seconds
+        self.tokens = float(max(0, limit - used))
+        self.updated_at = time.monotonic()
+        self.refreshed_at = self.updated_at
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.window_seconds
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(float(self.limit), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimiter:
+    """In-process token buckets with write-behind of request counts."""
+
+    def __init__(
+        self,
+        plan_ttl: float = PLAN_TTL_SECONDS,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS
+    ):
+        self.plan_ttl = plan_ttl
+        self.flush_interval = flush_interval
+
+        self._buckets: dict = {}
+        # (tenant_id, endpoint, window_start) -> requests not yet written
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"allowed": 0, "rejected": 0, "refreshes": 0, "flushes": 0, "errors": 0}
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="rate-limit-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            if self._closed:
+                return
+            self.flush()
+
+    def _load(self, tenant_id: str, endpoint: str, window_start: datetime) -> tuple[int, str, int]:
+        """One query for the tenant's plan and requests already counted this window."""
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT t.plan, t.status, COALESCE((
+                    SELECT request_count FROM rate_limits
+                    WHERE tenant_id = %s::uuid AND endpoint = %s AND window_start = %s
+                ), 0)
+                FROM (SELECT 1) AS one
+                LEFT JOIN tenants t ON t.id = %s::uuid
+            """, (tenant_id, endpoint, window_start, tenant_id))
+            plan, status, used = cursor.fetchone()
+            cursor.close()
+        limit, plan_name = plan_limit(plan, status)
+        return limit, plan_name, int(used)
+
+    def check(
+        self,
+        tenant_id: str,
+        endpoint: str = "rag_query",
+        window_seconds: int = 60
+    ) -> dict:
+        """
+        Take one token for a request.
+
+        Returns:
+            dict with allowed, remaining, retry_after (seconds), limit, plan
+        """
+        key = (tenant_id, endpoint)
+        now = time.monotonic()
+        window_start = window_start_for(time.time(), window_seconds)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            needs_refresh = bucket is None or now - bucket.refreshed_at >= self.plan_ttl
+            local_pending = self._pending.get((tenant_id, endpoint, window_start), 0)
+
+        if needs_refresh:
+            try:
+                limit, plan, used = self._load(tenant_id, endpoint, window_start)
+                used += local_pending
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[rate_limiter] Plan refresh failed: {e}")
+                limit, plan, used = (
+                    (bucket.limit, bucket.plan, 0) if bucket else (PLAN_RATE_LIMITS['trial'], 'unknown', 0)
+                )
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if needs_refresh:
+                if bucket is None or bucket.window_seconds != window_seconds:
+                    bucket = _Bucket(limit, plan, window_seconds, used)
+                    self._buckets[key] = bucket
+                else:
+                    bucket.refill(now)
+                    bucket.limit = limit
+                    bucket.plan = plan
+                    # Requests served by other workers this window use up tokens too
+                    bucket.tokens = min(bucket.tokens, float(max(0, limit - used)))
+                    bucket.refreshed_at = now
+            bucket.refill(now)
+
+            if bucket.tokens < 1:
+                self.stats["rejected"] += 1
+                retry_after = max(1, math.ceil((1 - bucket.tokens) / bucket.rate))
+                return {
+                    "allowed": False, "remaining": 0, "retry_after": retry_after,
+                    "limit": bucket.limit, "plan": bucket.plan
+                }
+
+            bucket.tokens -= 1
+            self.stats["allowed"] += 1
+            pending_key = (tenant_id, endpoint, window_start)
+            self._pending[pending_key] = self._pending.get(pending_key, 0) + 1
+            self._ensure_worker()
+            return {
+                "allowed": True, "remaining": int(bucket.tokens), "retry_after": 0,
+                "limit": bucket.limit, "plan": bucket.plan
+            }
+
+    def flush(self) -> int:
+        """Write pending request counts to rate_limits. Returns rows upserted."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+            if not pending:
+                return 0
+
+            try:
+                with get_connection(register_vector=False) as conn:
+                    cursor = conn.cursor()
+                    execute_values(cursor, """
+                        INSERT INTO rate_limits (tenant_id, endpoint, window_start, request_count)
+                        VALUES %s
+                        ON CONFLICT (tenant_id, endpoint, window_start)
+                        DO UPDATE SET request_count = rate_limits.request_count + EXCLUDED.request_count
+                    """, [
+                        (tenant_id, endpoint, window_start, count)
+                        for (tenant_id, endpoint, window_start), count in pending.items()
+                    ], template="(%s::uuid, %s, %s, %s)")
+                    conn.commit()
+                    cursor.close()
+                self.stats["flushes"] += 1
+                return len(pending)
+            except Exception as e:
+                # Put the counts back so the next flush retries them
+                with self._lock:
+                    for key, count in pending.items():
+                        self._pending[key] = self._pending.get(key, 0) + count
+                self.stats["errors"] += 1
+                print(f"[rate_limiter] Failed to write {len(pending)} rate_limits rows: {e}")
+                return 0
+
+    def close(self) -> None:
+        """Flush pending counts and stop the background thread."""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def check_rate_limit(tenant_id: str, endpoint: str = "rag_query", window_seconds: int = 60) -> dict:
+    """Take one request token on the process-wide limiter (see RateLimiter.check)."""
+    return get_limiter().check(tenant_id, endpoint, window_seconds)
+
+
+def cleanup_old_rate_limits(hours: int = RETENTION_HOURS) -> int:
+    """Remove rate limit records older than specified hours."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM rate_limits WHERE window_start < (NOW() AT TIME ZONE 'UTC') - make_interval(hours => %s)",
+            (hours,)
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    return deleted
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for a provider 429 (Cohere TooManyRequestsError, Groq RateLimitError)."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "rate_limit" in message or "429" in message or "too many requests" in message
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Retry-After header of a provider error, if it sent one."""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderThrottle:
+    """Spaces calls to one provider across threads and backs off together on 429s."""
+
+    def __init__(self, provider: str, calls_per_minute: int):
+        self.provider = provider
+        self.interval = 60.0 / max(1, calls_per_minute)
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "rate_limited": 0, "waited_secs": 0.0}
+
+    def acquire(self) -> None:
+        """Block until this thread may make its next call."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+            self.stats["calls"] += 1
+            self.stats["waited_secs"] += slot - now
+        if slot > now:
+            time.sleep(slot - now)
+
+    def rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Pause all callers after a 429. Returns the pause in seconds."""
+        with self._lock:
+            self._backoff = min(PROVIDER_BACKOFF_MAX_SECS, self._backoff * 2 or PROVIDER_BACKOFF_BASE_SECS)
+            delay = retry_after if retry_after is not None else self._backoff
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.stats["rate_limited"] += 1
+        print(f"[rate_limiter] {self.provider} rate limited, pausing {delay:.1f}s")
+        return delay
+
+    def call(self, fn, *args, max_retries: int = PROVIDER_MAX_RETRIES, **kwargs):
+        """
+        Call fn(*args, **kwargs) in turn, retrying 429s up to max_retries times.
+        Other errors, and a 429 after the last retry, are raised.
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                self.rate_limited(_retry_after(e))
+                continue
+            with self._lock:
+                self._backoff = 0.0
+            return result
+
+
+_throttles: dict = {}
+
+
+def provider_throttle(provider: str) -> ProviderThrottle:
+    """Return the process-wide throttle for a provider ("cohere" or "groq")."""
+    throttle = _throttles.get(provider)
+    if throttle is None:
+        with _limiter_lock:
+            throttle = _throttles.get(provider)
+            if throttle is None:
+                throttle = ProviderThrottle(provider, PROVIDER_CALLS_PER_MINUTE.get(provider, 60))
+                _throttles[provider] = throttle
+    return throttle
+
+
+def _close_at_exit() -> None:
+    if _limiter is not None:
+        _limiter.close()
+
+
+atexit.register(_close_at_exit)
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "cleanup", hours: int = RETENTION_HOURS) -> dict:
+    """
+    Maintain rate limit records.
+
+    Args:
+        action: "cleanup" (delete rows older than `hours`; schedule this),
+            "flush" (write this worker's pending counts) or "stats"
+        hours: Retention for "cleanup"
+
+    Returns:
+        dict with the deleted/flushed counts or stats
+    """
+    if action == "cleanup":
+        return {"success": True, "deleted": cleanup_old_rate_limits(hours)}
+    if action == "flush":
+        return {"success": True, "flushed": get_limiter().flush()}
+    if action == "stats":
+        limiter = get_limiter()
+        return {
+            "success": True, **limiter.stats, "buckets": len(limiter._buckets),
+            "providers": {name: throttle.stats for name, throttle in _throttles.items()}
+        }
+    raise ValueError("action must be 'cleanup', 'flush' or 'stats'")
@@ -0,0 +1,586 @@
+# reembed_embeddings.py
+# Windmill Python script - Online re-embedding for embedding model upgrades
+# Path: f/chatbot/reembed_embeddings
+#
+# requirements:
+#   - cohere
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+#   - httpx
+
+"""
+Online Re-Embedding for Archevi
+===============================
+
+Moves a vector space (see embedding_registry.py) to a new embedding model
+without downtime and without mixing models in one index:
+
+1. start   - register the new model as pending and add shadow columns
+             (<column>_next, <column>_next_model) for each of the target's
+             vector columns.
+             A trigger clears a row's shadow vector whenever its live
+             embedding is rewritten, so edits during the migration are
+             picked up again.
+2. run     - stream rows without a shadow vector in id order, embed them in
+             batches and write <column>_next, committing per batch. Once a
+             column is complete its shadow HNSW index is built CONCURRENTLY,
+             along with shadow quantized indexes for each quantized index
+             the live column has (migration 029).
+             Runs for at most max_seconds; schedule it until it reports
+             ready_for_cutover.
+3. cutover - in one transaction per target: lock out writers, embed any
+             rows written since the last run, swap the shadow columns in
+             for the live ones (old vectors and index are dropped), and
+             promote the pending model. Cached answers are dropped and
+             category centroids and document neighbours rebuilt, since
+             they hold old-model vectors or similarities.
+4. abort   - drop the shadow columns and the pending registry row.
+
+Without a pending model, `run` re-embeds stale rows in place: rows whose
+embedding_model is unknown or differs from the active model (for example
+documents from the old bulk ZIP path, which used embed-english-v3.0).
+
+Args:
+    action (str): "status", "start", "run", "cutover" or "abort"
+    target (str): "text" (family_documents + document_chunks, plus
+        family_documents.image_embedding and voice_notes) or "pages"
+    model (str): New model for "start"
+    output_dimension (int): New dimension for "start"
+    batch_size (int): Rows per embed call for "run" (default 96)
+    max_seconds (int): Time budget for "run" (default 240)
+
+Returns:
+    dict: per-column progress for the action
+"""
+
+from typing import Optional
+import base64
+import time
+
+import cohere
+import wmill
+from psycopg2.extras import execute_values
+
+from blob_store import get_blob
+from db_pool import get_connection
+from embedding_registry import TARGETS, active_model, clear_cache
+from document_chunks import chunk_embedding_text
+from category_centroids import rebuild_centroids
+from document_neighbors import rebuild_neighbors
+from vector_quantization import QUANTIZED_INDEXES, quantized_index_sql
+from vector_partitions import bucket_index_name, bucket_index_sql, live_buckets
+
+
+# Vector columns per target: "table" for table.embedding, "table.column"
+# otherwise. Image embeddings and voice notes are compared with text query
+# embeddings, so they move with the text model.
+TARGET_COLUMNS = {
+    "text": ("family_documents", "document_chunks", "family_documents.image_embedding", "voice_notes"),
+    "pages": ("document_pages",),
+}
+
+# Row source per vector column: (SELECT returning id + embedding inputs, extra filter)
+ROW_SOURCES = {
+    "family_documents": (
+        "SELECT t.id, t.content FROM family_documents t",
+        "AND t.content IS NOT NULL"
+    ),
+    "document_chunks": (
+        "SELECT t.id, t.content, t.heading, t.page_number, d.title "
+        "FROM document_chunks t JOIN family_documents d ON d.id = t.document_id",
+        ""
+    ),
+    "document_pages": (
+        "SELECT t.id, t.page_image, t.page_image_hash FROM document_pages t",
+        "AND (t.page_image IS NOT NULL OR t.page_image_hash IS NOT NULL)"
+    ),
+    # Legacy rows may hold an inline data URI in image_url instead of a blob
+    "family_documents.image_embedding": (
+        "SELECT t.id, t.image_url, t.image_hash FROM family_documents t",
+        "AND (t.image_hash IS NOT NULL OR left(t.image_url, 5) = 'data:')"
+    ),
+    "voice_notes": (
+        "SELECT t.id, t.transcript FROM voice_notes t",
+        ""
+    ),
+}
+
+# Embedded from images, prefix of their blobs
+IMAGE_SOURCES = {"document_pages": "pages", "family_documents.image_embedding": "images"}
+
+DEFAULT_BATCH_SIZE = 96           # Cohere embed limit per call
+IMAGE_BATCH_SIZE = 16             # Page thumbnails per embed call
+MAX_BATCH_CHARS = 400000          # Keep text batches well under request limits
+CUTOVER_MAX_INLINE = 500          # Rows embedded while writers are locked out
+
+
+def _column(source: str) -> tuple[str, str]:
+    """(table, vector column) of a TARGET_COLUMNS entry."""
+    table, _, column = source.partition(".")
+    return table, column or "embedding"
+
+
+def _embed_input(source: str, row: tuple) -> str:
+    """Text (or image data URI) the ingest path embeds for a row."""
+    if source == "document_chunks":
+        chunk = {"content": row[1], "heading": row[2], "page_number": row[3]}
+        return chunk_embedding_text(chunk, row[4])
+    if source not in IMAGE_SOURCES:
+        return row[1]
+    if row[2]:
+        image = base64.b64encode(get_blob(row[2], IMAGE_SOURCES[source])).decode("utf-8")
+    else:
+        image = row[1]
+    return image if image.startswith("data:") else f"data:image/jpeg;base64,{image}"
+
+
+def _embed(co, source: str, inputs: list[str], model: str, output_dimension: Optional[int]) -> tuple[list, int]:
+    """Embed one batch the way the column's ingest path does. Returns (embeddings, tokens)."""
+    kwargs = {"output_dimension": output_dimension} if output_dimension else {}
+    if source == "family_documents.image_embedding":
+        # One image per call with input_type="image" (as in embed_image)
+        embeddings, tokens = [], 0
+        for image in inputs:
+            response = co.embed(
+                images=[image], model=model, input_type="image", embedding_types=["float"], **kwargs
+            )
+            embeddings.append(list(response.embeddings.float_[0]))
+            billed = response.meta.billed_units if response.meta else None
+            tokens += int(getattr(billed, "images", 0) or 1) if billed else 1
+        return embeddings, tokens
+    if source == "document_pages":
+        # Multi-image batches go through `inputs` (as in process_pdf_pages)
+        response = co.embed(
+            inputs=[{"content": [{"type": "image_url", "image_url": {"url": image}}]} for image in inputs],
+            model=model, input_type="search_document", embedding_types=["float"], **kwargs
+        )
+        billed = response.meta.billed_units if response.meta else None
+        tokens = int(getattr(billed, "images", 0) or len(inputs)) if billed else len(inputs)
+    else:
+        response = co.embed(
+            texts=inputs, model=model, input_type="search_document", embedding_types=["float"], **kwargs
+        )
+        billed = response.meta.billed_units if response.meta else None
+        if billed and billed.input_tokens:
+            tokens = int(billed.input_tokens)
+        else:
+            tokens = sum(len(text.split()) for text in inputs)
+    return [list(embedding) for embedding in response.embeddings.float_], tokens
+
+
+def _batches(source: str, rows: list, batch_size: int):
+    """Split fetched rows into embed calls by count and (for text) size."""
+    limit = min(batch_size, IMAGE_BATCH_SIZE) if source in IMAGE_SOURCES else batch_size
+    batch, chars = [], 0
+    for row in rows:
+        text = _embed_input(source, row)
+        if batch and (len(batch) >= limit or chars + len(text) > MAX_BATCH_CHARS):
+            yield batch
+            batch, chars = [], 0
+        batch.append((row[0], text))
+        chars += len(text)
+    if batch:
+        yield batch
+
+
+def _stale_filter(source: str, shadow: bool) -> str:
+    _, column = _column(source)
+    if shadow:
+        return f"t.{column} IS NOT NULL AND t.{column}_next IS NULL"
+    return f"t.{column} IS NOT NULL AND t.{column}_model IS DISTINCT FROM %(model)s"
+
+
+def _registry_row(cursor, target: str, status: str) -> Optional[tuple]:
+    cursor.execute(
+        "SELECT id, model, output_dimension FROM embedding_models WHERE target = %s AND status = %s",
+        (target, status)
+    )
+    return cursor.fetchone()
+
+
+def _embed_rows(
+    co,
+    conn,
+    source: str,
+    rows: list,
+    model: str,
+    output_dimension: Optional[int],
+    shadow: bool
+) -> tuple[int, int]:
+    """Embed rows and write them to the shadow (or live) column. Does not commit.
+
+    Returns:
+        (rows written, billed tokens/images)
+    """
+    table, column = _column(source)
+    vector_column = f"{column}_next" if shadow else column
+    written = 0
+    billed = 0
+    cursor = conn.cursor()
+    for batch in _batches(source, rows, DEFAULT_BATCH_SIZE):
+        embeddings, tokens = _embed(co, source, [text for _, text in batch], model, output_dimension)
+        execute_values(cursor, f"""
+            UPDATE {table} AS t
+            SET {vector_column} = v.embedding::vector, {vector_column}_model = v.model
+            FROM (VALUES %s) AS v(id, embedding, model)
+            WHERE t.id = v.id
+        """, [(row_id, embedding, model) for (row_id, _), embedding in zip(batch, embeddings)])
+        written += len(batch)
+        billed += tokens
+    cursor.close()
+    return written, billed
+
+
+def _count_remaining(cursor, source: str, shadow: bool, model: str) -> int:
+    table, _ = _column(source)
+    _, extra = ROW_SOURCES[source]
+    cursor.execute(
+        f"SELECT COUNT(*) FROM {table} t WHERE {_stale_filter(source, shadow)} {extra}",
+        {"model": model}
+    )
+    return cursor.fetchone()[0]
+
+
+def _index_valid(cursor, index: str) -> Optional[bool]:
+    """True/False for a valid/invalid index, None if it does not exist."""
+    cursor.execute("""
+        SELECT i.indisvalid
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+    """, (index,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _shadow_index_valid(cursor, source: str) -> Optional[bool]:
+    """True/False for a valid/invalid shadow index, None if it does not exist."""
+    table, column = _column(source)
+    return _index_valid(cursor, f"idx_{table}_{column}_next")
+
+
+def _ensure_shadow_index(source: str) -> None:
+    """
+    Build the shadow HNSW index, and a shadow copy of every quantized and
+    bucket index on the live column, without blocking writes (rebuilds a
+    failed build).
+    """
+    table, column = _column(source)
+    shadow_column = f"{column}_next"
+    index = f"idx_{table}_{shadow_column}"
+    with get_connection(register_vector=False, autocommit=True) as conn:
+        cursor = conn.cursor()
+        if _shadow_index_valid(cursor, source) is False:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+        cursor.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table}
+            USING hnsw ({shadow_column} vector_cosine_ops)
+            WHERE {shadow_column} IS NOT NULL
+        """)
+
+        cursor.execute(f"SELECT vector_dims({shadow_column}) FROM {table} WHERE {shadow_column} IS NOT NULL LIMIT 1")
+        row = cursor.fetchone()
+        for precision, (suffix, _) in QUANTIZED_INDEXES.items():
+            if row is None or _index_valid(cursor, f"idx_{table}_{column}_{suffix}") is None:
+                continue
+            shadow_index = f"idx_{table}_{shadow_column}_{suffix}"
+            if _index_valid(cursor, shadow_index) is False:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {shadow_index}")
+            cursor.execute(quantized_index_sql(
+                table, shadow_column, precision, row[0], index_name=shadow_index, concurrently=True
+            ))
+
+        for bucket in live_buckets(cursor, table, column):
+            shadow_index = bucket_index_name(table, bucket, shadow_column)
+            if _index_valid(cursor, shadow_index) is False:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {shadow_index}")
+            cursor.execute(bucket_index_sql(table, bucket, shadow_column, concurrently=True))
+        cursor.close()
+
+
+def start(target: str, model: str, output_dimension: Optional[int]) -> dict:
+    """Register a pending model and add shadow columns to the target's tables."""
+    if not model:
+        raise ValueError("model is required")
+    if not output_dimension:
+        raise ValueError("output_dimension is required (HNSW indexes need a fixed dimension)")
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        if _registry_row(cursor, target, "pending"):
+            raise ValueError(f"A migration is already pending for '{target}'; run, cut over or abort it first")
+        cursor.execute("""
+            INSERT INTO embedding_models (target, model, output_dimension, status)
+            VALUES (%s, %s, %s, 'pending')
+        """, (target, model, output_dimension))
+
+        for source in TARGET_COLUMNS[target]:
+            table, column = _column(source)
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION clear_shadow_{column}()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF NEW.{column} IS DISTINCT FROM OLD.{column} THEN
+                        NEW.{column}_next := NULL;
+                        NEW.{column}_next_model := NULL;
+                    END IF;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}_next vector({int(output_dimension)})")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}_next_model TEXT")
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{column}_next ON {table}")
+            cursor.execute(f"""
+                CREATE TRIGGER trg_{table}_{column}_next
+                    BEFORE UPDATE OF {column} ON {table}
+                    FOR EACH ROW
+                    EXECUTE FUNCTION clear_shadow_{column}()
+            """)
+        conn.commit()
+        cursor.close()
+
+    clear_cache()
+    return {"success": True, "target": target, "pending_model": model, "output_dimension": output_dimension}
+
+
+def run(target: str, batch_size: int = DEFAULT_BATCH_SIZE, max_seconds: int = 240) -> dict:
+    """Backfill the shadow column (or re-embed stale rows in place) within a time budget."""
+    started = time.time()
+    co = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        pending = _registry_row(cursor, target, "pending")
+        cursor.close()
+
+    shadow = pending is not None
+    if shadow:
+        _, model, output_dimension = pending
+    else:
+        model, output_dimension = active_model(target)
+
+    tables = {}
+    for source in TARGET_COLUMNS[target]:
+        select_sql, extra = ROW_SOURCES[source]
+        embedded = 0
+        tokens = 0
+        last_id = 0
+        while time.time() - started < max_seconds:
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    {select_sql}
+                    WHERE {_stale_filter(source, shadow)} {extra} AND t.id > %(last_id)s
+                    ORDER BY t.id
+                    LIMIT %(limit)s
+                """, {"model": model, "last_id": last_id, "limit": batch_size})
+                rows = cursor.fetchall()
+                cursor.close()
+                if not rows:
+                    break
+                written, billed = _embed_rows(co, conn, source, rows, model, output_dimension, shadow)
+                conn.commit()
+            embedded += written
+            tokens += billed
+            last_id = rows[-1][0]
+
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            remaining = _count_remaining(cursor, source, shadow, model)
+            cursor.close()
+
+        if shadow and remaining == 0 and time.time() - started < max_seconds:
+            _ensure_shadow_index(source)
+
+        tables[source] = {"embedded": embedded, "tokens": tokens, "remaining": remaining}
+
+    documents = tables.get("family_documents")
+    if not shadow and documents and documents["embedded"] and documents["remaining"] == 0:
+        # Similarities between re-embedded documents changed
+        rebuild_neighbors()
+
+    result = {"success": True, "target": target, "model": model, "mode": "shadow" if shadow else "in_place", "tables": tables}
+    if shadow:
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            result["ready_for_cutover"] = all(
+                tables[source]["remaining"] <= CUTOVER_MAX_INLINE and _shadow_index_valid(cursor, source)
+                for source in TARGET_COLUMNS[target]
+            )
+            cursor.close()
+    return result
+
+
+def cutover(target: str) -> dict:
+    """Swap the shadow columns in for the live ones and promote the pending model."""
+    co = cohere.ClientV2(api_key=wmill.get_variable("f/chatbot/cohere_api_key"))
+    previous_model, previous_dimension = active_model(target)
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        pending = _registry_row(cursor, target, "pending")
+        if not pending:
+            raise ValueError(f"No pending model for '{target}'")
+        pending_id, model, output_dimension = pending
+
+        for source in TARGET_COLUMNS[target]:
+            if not _shadow_index_valid(cursor, source):
+                raise ValueError(f"Shadow index for {source} is not built yet; keep running action='run'")
+
+        # Readers continue; writers wait until the swap commits
+        for table in dict.fromkeys(_column(source)[0] for source in TARGET_COLUMNS[target]):
+            cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+
+        caught_up = {}
+        for source in TARGET_COLUMNS[target]:
+            select_sql, extra = ROW_SOURCES[source]
+            cursor.execute(f"""
+                {select_sql}
+                WHERE {_stale_filter(source, True)} {extra}
+                ORDER BY t.id
+                LIMIT %(limit)s
+            """, {"limit": CUTOVER_MAX_INLINE + 1})
+            rows = cursor.fetchall()
+            if len(rows) > CUTOVER_MAX_INLINE:
+                raise ValueError(f"{source} has more than {CUTOVER_MAX_INLINE} rows without a shadow vector; run again first")
+            caught_up[source], _ = _embed_rows(co, conn, source, rows, model, output_dimension, True)
+
+        for source in TARGET_COLUMNS[target]:
+            table, column = _column(source)
+            # Triggers with an UPDATE OF <column> list are bound to the old
+            # column; drop them and recreate them on the new one
+            cursor.execute("""
+                SELECT t.tgname, pg_get_triggerdef(t.oid)
+                FROM pg_trigger t
+                JOIN pg_attribute a ON a.attrelid = t.tgrelid AND a.attnum = ANY(t.tgattr)
+                WHERE t.tgrelid = %s::regclass AND a.attname = %s AND NOT t.tgisinternal
+            """, (table, column))
+            column_triggers = [
+                (name, definition) for name, definition in cursor.fetchall()
+                if name != f"trg_{table}_{column}_next"
+            ]
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{column}_next ON {table}")
+            for name, _ in column_triggers:
+                cursor.execute(f"DROP TRIGGER {name} ON {table}")
+
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}_model")
+            cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_next TO {column}")
+            cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_next_model TO {column}_model")
+            cursor.execute(f"ALTER INDEX idx_{table}_{column}_next RENAME TO idx_{table}_{column}")
+            # Quantized and bucket indexes on the old column went with it
+            for suffix, _ in QUANTIZED_INDEXES.values():
+                cursor.execute(
+                    f"ALTER INDEX IF EXISTS idx_{table}_{column}_next_{suffix} RENAME TO idx_{table}_{column}_{suffix}"
+                )
+            for bucket in live_buckets(cursor, table, f"{column}_next"):
+                cursor.execute(
+                    f"ALTER INDEX {bucket_index_name(table, bucket, f'{column}_next')} "
+                    f"RENAME TO {bucket_index_name(table, bucket, column)}"
+                )
+
+            for _, definition in column_triggers:
+                cursor.execute(definition)
+
+        cursor.execute(
+            "UPDATE embedding_models SET status = 'retired', retired_at = NOW() WHERE target = %s AND status = 'active'",
+            (target,)
+        )
+        cursor.execute(
+            "UPDATE embedding_models SET status = 'active', activated_at = NOW() WHERE id = %s",
+            (pending_id,)
+        )
+
+        if target == "text":
+            # Cached question embeddings and centroid sums are old-model vectors
+            cursor.execute("DELETE FROM answer_cache")
+            cursor.execute("DELETE FROM category_centroids")
+            if output_dimension != previous_dimension:
+                cursor.execute(f"ALTER TABLE answer_cache ALTER COLUMN query_embedding TYPE vector({int(output_dimension)})")
+                cursor.execute(f"ALTER TABLE category_centroids ALTER COLUMN embedding_sum TYPE vector({int(output_dimension)})")
+
+        conn.commit()
+        cursor.close()
+
+    clear_cache()
+    centroid_rows = rebuild_centroids() if target == "text" else None
+    neighbor_rows = rebuild_neighbors() if target == "text" else None
+
+    return {
+        "success": True,
+        "target": target,
+        "previous_model": previous_model,
+        "active_model": model,
+        "output_dimension": output_dimension,
+        "caught_up": caught_up,
+        "centroid_rows": centroid_rows,
+        "neighbor_rows": neighbor_rows
+    }
+
+
+def abort(target: str) -> dict:
+    """Drop the shadow columns and forget the pending model."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        for source in TARGET_COLUMNS[target]:
+            table, column = _column(source)
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{column}_next ON {table}")
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {column}_next")
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {column}_next_model")
+        cursor.execute("DELETE FROM embedding_models WHERE target = %s AND status = 'pending'", (target,))
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+
+    clear_cache()
+    return {"success": True, "target": target, "aborted": bool(deleted)}
+
+
+def status(target: str) -> dict:
+    """Active/pending models and how many rows each table still needs."""
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        active = _registry_row(cursor, target, "active")
+        pending = _registry_row(cursor, target, "pending")
+        tables = {}
+        for source in TARGET_COLUMNS[target]:
+            entry = {"stale": _count_remaining(cursor, source, False, active[1] if active else "")}
+            if pending:
+                entry["without_shadow"] = _count_remaining(cursor, source, True, pending[1])
+                entry["shadow_index_valid"] = _shadow_index_valid(cursor, source)
+            tables[source] = entry
+        cursor.close()
+
+    return {
+        "success": True,
+        "target": target,
+        "active_model": {"model": active[1], "output_dimension": active[2]} if active else None,
+        "pending_model": {"model": pending[1], "output_dimension": pending[2]} if pending else None,
+        "tables": tables
+    }
+
+
+def main(
+    action: str = "status",
+    target: str = "text",
+    model: Optional[str] = None,
+    output_dimension: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_seconds: int = 240
+) -> dict:
+    """Run one re-embedding action (see module docstring)."""
+    if target not in TARGETS:
+        raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+
+    if action == "status":
+        return status(target)
+    if action == "start":
+        return start(target, model, output_dimension)
+    if action == "run":
+        return run(target, batch_size=batch_size, max_seconds=max_seconds)
+    if action == "cutover":
+        return cutover(target)
+    if action == "abort":
+        return abort(target)
+    raise ValueError("action must be 'status', 'start', 'run', 'cutover' or 'abort'")
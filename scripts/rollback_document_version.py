@@ -2,10 +2,12 @@
 Rollback a document to a previous version.
 
 Creates a new version from an older version's content, preserving history.
+Versions may be stored as deltas, so the target is rebuilt with version_store.
 """
 
 from typing import TypedDict, Optional
 import wmill
+from version_store import store_version, version_content
 
 
 class RollbackResult(TypedDict):
@@ -88,7 +90,7 @@ def main(
 
         # Get the target version content
         cursor.execute("""
-            SELECT version_number, title, content, content_hash,
+            SELECT version_number, title, content_hash,
                    file_size_bytes, storage_path
             FROM document_versions
             WHERE document_id = %s AND version_number = %s
@@ -105,35 +107,38 @@ def main(
                 'message': f'Version {target_version} not found'
             }
 
+        target_content = version_content(conn, document_id, target_version)
+        if target_content is None:
+            return {
+                'success': False,
+                'document_id': document_id,
+                'new_version_number': 0,
+                'rolled_back_from': current_version,
+                'rolled_back_to': target_version,
+                'message': f'Version {target_version} content could not be rebuilt'
+            }
+
         # Create new version with the old content (preserves history)
         cursor.execute("""
-            INSERT INTO document_versions (
-                document_id, version_number, title, content, content_hash,
-                file_size_bytes, storage_path, change_summary, change_type, created_by
-            )
-            SELECT
-                %s,
-                COALESCE(MAX(version_number), 0) + 1,
-                %s, %s, %s, %s, %s,
-                %s,
-                'correction',
-                %s
+            SELECT COALESCE(MAX(version_number), 0) + 1 AS next_version
             FROM document_versions
             WHERE document_id = %s
-            RETURNING version_number
-        """, (
+        """, (document_id,))
+        new_version = cursor.fetchone()['next_version']
+
+        store_version(
+            conn,
             document_id,
+            new_version,
             target['title'],
-            target['content'],
+            target_content,
             target['content_hash'],
-            target['file_size_bytes'],
-            target['storage_path'],
-            f'Rolled back to version {target_version}',
-            user_id,
-            document_id
-        ))
-
-        new_version = cursor.fetchone()['version_number']
+            file_size_bytes=target['file_size_bytes'],
+            storage_path=target['storage_path'],
+            change_summary=f'Rolled back to version {target_version}',
+            change_type='correction',
+            created_by=user_id
+        )
 
         # Update the main document
         cursor.execute("""
@@ -150,7 +155,7 @@ def main(
             WHERE id = %s
         """, (
             target['title'],
-            target['content'],
+            target_content,
             target['content_hash'],
             target['file_size_bytes'],
             target['storage_path'],
@@ -25,6 +25,9 @@ Args:
     tenant_id (str): UUID of the tenant (family) - REQUIRED for isolation
     category (str, optional): Filter by document category
     limit (int): Maximum number of results (default: 5)
+    precision (str, optional): "full", "half", "binary" or "coarse" - quantized or
+        256-d first-stage search rescored at full precision (default: VECTOR_SEARCH_PRECISION);
+        "exact" is used automatically for tenants with few documents
 
 Returns:
     list: List of matching documents with:
@@ -50,6 +53,8 @@ from pgvector.psycopg2 import register_vector
 from typing import Optional, List
 from datetime import datetime
 import wmill
+from vector_quantization import nearest_sql, resolve_precision, set_search_precision
+from vector_partitions import plan_vector_search
 
 
 def main(
@@ -59,6 +64,7 @@ def main(
     limit: int = 5,
     # Aliases for backward compatibility
     query: str = None,  # Alternative name for search_term
+    precision: Optional[str] = None,
 ) -> List[dict]:
     """
     Perform semantic search for documents in the knowledge base (tenant-scoped).
@@ -91,6 +97,8 @@ def main(
     elif limit > 20:
         limit = 20
 
+    precision = resolve_precision(precision)
+
     # Generate embedding using Cohere SDK with Embed v4
     try:
         co = cohere.ClientV2(api_key=cohere_api_key)
@@ -120,24 +128,22 @@ def main(
 
         # TENANT ISOLATED - Only searches documents belonging to this specific tenant
         # Note: Uses family_documents table (legacy) which has tenant_id column added
-        if category:
-            cursor.execute("""
-                SELECT id, title, content, category, created_at,
-                       1 - (embedding <=> %s::vector) AS relevance_score
-                FROM family_documents
-                WHERE tenant_id = %s::uuid AND category = %s AND embedding IS NOT NULL
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (query_embedding, tenant_id, category, query_embedding, limit))
-        else:
-            cursor.execute("""
-                SELECT id, title, content, category, created_at,
-                       1 - (embedding <=> %s::vector) AS relevance_score
-                FROM family_documents
-                WHERE tenant_id = %s::uuid AND embedding IS NOT NULL
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (query_embedding, tenant_id, query_embedding, limit))
+        category_filter = "AND category = %s" if category else ""
+        precision, bucket_filter = plan_vector_search(
+            cursor, tenant_id, "family_documents", precision, "family_documents"
+        )
+        set_search_precision(cursor, precision, limit)
+        search_sql, search_params = nearest_sql(f"""
+            SELECT id, title, content, category, created_at,
+                   1 - (embedding <=> %s::vector) AS relevance_score,
+                   embedding <=> %s::vector AS distance
+            FROM family_documents
+            WHERE tenant_id = %s::uuid {category_filter} AND embedding IS NOT NULL {bucket_filter}
+        """, "embedding", query_embedding, limit, precision)
+        cursor.execute(
+            search_sql,
+            [query_embedding, query_embedding, tenant_id] + ([category] if category else []) + search_params
+        )
 
         results = cursor.fetchall()
         cursor.close()
@@ -149,7 +155,7 @@ def main(
     # Format results
     documents = []
     for row in results:
-        doc_id, title, content, doc_category, created_at, relevance = row
+        doc_id, title, content, doc_category, created_at, relevance, _ = row
 
         # Create content preview (first 200 chars)
         content_preview = content[:200] + "..." if len(content) > 200 else content
@@ -170,5 +176,6 @@ def main(
     return {
         "success": True,
         "results": documents,
-        "count": len(documents)
+        "count": len(documents),
+        "precision": precision
     }
@@ -4,6 +4,7 @@
 #
 # requirements:
 #   - psycopg2-binary
+#   - pgvector
 #   - wmill
 #   - httpx
 #   - cohere
@@ -11,7 +12,7 @@
 """
 Search documents with advanced filtering options.
 
-Supports semantic search combined with:
+Supports hybrid semantic + keyword search combined with:
 - Date range filtering
 - Category filtering
 - Tag filtering
@@ -28,16 +29,28 @@ Args:
     limit: Max results (default 20)
     offset: Pagination offset (default 0)
     tenant_id: Tenant ID for multi-tenant isolation
+    precision: "full", "half" or "binary" - quantized first-stage vector search
+        rescored at full precision; "coarse" - coarse-to-fine search that
+        shortlists on 256-d Matryoshka prefixes and re-ranks on 1024-d
+        (default: VECTOR_SEARCH_PRECISION). Tenants with few documents are
+        scanned exactly (vector_partitions.py)
 
 Returns:
     dict: Documents, total count, and pagination info
 """
 
-import psycopg2
 import cohere
 from datetime import datetime
 from typing import TypedDict, List
 import wmill
+from db_pool import get_connection
+from embedding_cache import embed_query
+from embedding_registry import active_model
+from hybrid_search import hybrid_cte, DEFAULT_CANDIDATES
+from vector_quantization import resolve_precision, set_search_precision
+from vector_partitions import plan_vector_search
+from document_access import access_filter
+from blob_store import blob_urls
 
 
 class Document(TypedDict):
@@ -73,229 +86,220 @@ def main(
     include_images: bool = True,  # Include documents with image embeddings in search
     # Alias for compatibility
     query: str | None = None,  # Alternative name for search_term
+    # First-stage vector search ('full', 'half', 'binary', 'coarse')
+    precision: str | None = None,
 ) -> SearchResult:
     """Search documents with advanced filters."""
     # Support both 'search_term' and 'query' parameter names
     if not search_term and query:
         search_term = query
-
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-
-    conn = psycopg2.connect(
-        host=postgres_db['host'],
-        port=postgres_db['port'],
-        dbname=postgres_db['dbname'],
-        user=postgres_db['user'],
-        password=postgres_db['password'],
-        sslmode=postgres_db.get('sslmode', 'disable')
-    )
-    cursor = conn.cursor()
-
-    # Enable pgvector iterative scans for filtered queries (pgvector 0.8.0+)
-    # This prevents overfiltering when combining vector search with WHERE clauses
-    cursor.execute("SET hnsw.iterative_scan = strict_order;")
-
-    # Build query with filters
-    conditions = []
-    params = []
-
-    # Tenant isolation (if multi-tenant)
-    if tenant_id:
-        conditions.append("d.tenant_id = %s")
-        params.append(tenant_id)
-
-    # Category filter
-    if category:
-        conditions.append("d.category = %s")
-        params.append(category)
-
-    # Date range filters
-    if date_from:
-        try:
-            from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            conditions.append("d.created_at >= %s")
-            params.append(from_date)
-        except ValueError:
-            pass
-
-    if date_to:
-        try:
-            to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            conditions.append("d.created_at <= %s")
-            params.append(to_date)
-        except ValueError:
-            pass
-
-    # Tag filtering - tags are stored in metadata JSONB
-    if tags and len(tags) > 0:
-        # Filter documents that have ANY of the specified tags in metadata->'tags'
-        conditions.append("d.metadata->'tags' ?| %s")
-        params.append(tags)
-
-    # Family member (person) filter
-    if assigned_to is not None:
-        conditions.append("d.assigned_to = %s")
-        params.append(assigned_to)
-
-    # Visibility filtering based on user's member_type
-    # If no user_member_type provided, default to showing only 'everyone' (most restrictive)
-    if user_member_type:
-        if user_member_type == 'admin':
-            # Admins see everything - no visibility filter needed
-            pass
-        elif user_member_type == 'adult':
-            # Adults see: everyone, adults_only, and private docs assigned to them
-            if user_member_id is not None:
-                conditions.append("""
-                    (d.visibility IN ('everyone', 'adults_only')
-                     OR (d.visibility = 'private' AND d.assigned_to = %s))
-                """)
-                params.append(user_member_id)
-            else:
-                conditions.append("d.visibility IN ('everyone', 'adults_only')")
-        else:
-            # teen/child see: everyone, and private docs assigned to them
-            if user_member_id is not None:
-                conditions.append("""
-                    (d.visibility = 'everyone'
-                     OR (d.visibility = 'private' AND d.assigned_to = %s))
-                """)
-                params.append(user_member_id)
-            else:
-                conditions.append("d.visibility = 'everyone'")
-    else:
-        # No user_member_type provided - show only 'everyone' visibility (safest default)
-        conditions.append("COALESCE(d.visibility, 'everyone') = 'everyone'")
-
-    # If we have a search term, use vector similarity
-    if search_term and search_term.strip():
-        # Get embedding for search term
-        cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
-        co = cohere.ClientV2(api_key=cohere_api_key)
-
-        response = co.embed(
-            texts=[search_term],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024  # Match document embedding dimensions
+    precision = resolve_precision(precision)
+
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+
+        # Enable pgvector iterative scans for filtered queries (pgvector 0.8.0+)
+        # This prevents overfiltering when combining vector search with WHERE clauses
+        cursor.execute("SET hnsw.iterative_scan = strict_order;")
+
+        # Build query with filters
+        conditions = []
+        params = []
+
+        # Tenant isolation (if multi-tenant)
+        if tenant_id:
+            conditions.append("d.tenant_id = %s")
+            params.append(tenant_id)
+
+        # Category filter
+        if category:
+            conditions.append("d.category = %s")
+            params.append(category)
+
+        # Date range filters
+        if date_from:
+            try:
+                from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+                conditions.append("d.created_at >= %s")
+                params.append(from_date)
+            except ValueError:
+                pass
+
+        if date_to:
+            try:
+                to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+                conditions.append("d.created_at <= %s")
+                params.append(to_date)
+            except ValueError:
+                pass
+
+        # Tag filtering - tags are stored in metadata JSONB
+        if tags and len(tags) > 0:
+            # Filter documents that have ANY of the specified tags in metadata->'tags'
+            conditions.append("d.metadata->'tags' ?| %s")
+            params.append(tags)
+
+        # Family member (person) filter
+        if assigned_to is not None:
+            conditions.append("d.assigned_to = %s")
+            params.append(assigned_to)
+
+        # Visibility filtering based on user's member_type (document_access.py);
+        # without a member type only 'everyone' documents are shown
+        visibility_filter, visibility_params, vector_scopes = access_filter(
+            cursor, tenant_id, user_member_type, user_member_id, alias="d",
+            shared_ids=None if tenant_id else []
         )
-        query_embedding = response.embeddings.float_[0]
+        params.extend(visibility_params)
+
+        # If we have a search term, use hybrid vector + full-text ranking
+        if search_term and search_term.strip():
+            # Get embedding for search term
+            cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
+            co = cohere.ClientV2(api_key=cohere_api_key)
+
+            # Active document embedding model; repeated queries hit the cache
+            embed_model, embed_dimension = active_model("text")
+            query_embedding, _, _ = embed_query(
+                co, search_term, model=embed_model, output_dimension=embed_dimension
+            )
 
-        # Build the query with vector similarity
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
+            # Build the query with vector similarity
+            where_clause = f"{' AND '.join(conditions) or '1=1'} {visibility_filter}"
 
-        # First get total count
-        # Note: Uses family_documents table (legacy) which has tenant_id column added
-        # Include documents with either text embedding OR image embedding
-        if include_images:
-            embedding_condition = "(d.embedding IS NOT NULL OR d.image_embedding IS NOT NULL)"
-        else:
-            embedding_condition = "d.embedding IS NOT NULL"
-
-        count_query = f"""
-            SELECT COUNT(*)
-            FROM family_documents d
-            WHERE {where_clause}
-              AND {embedding_condition}
-        """
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-
-        # Then get paginated results with similarity
-        # Use GREATEST to get best score from text OR image embedding
-        if include_images:
-            similarity_expr = """
-                GREATEST(
-                    COALESCE(1 - (d.embedding <=> %s::vector), 0),
-                    COALESCE(1 - (d.image_embedding <=> %s::vector), 0)
-                )
+            # First get total count
+            # Note: Uses family_documents table (legacy) which has tenant_id column added
+            # Include documents with either text embedding OR image embedding
+            if include_images:
+                embedding_condition = "(d.embedding IS NOT NULL OR d.image_embedding IS NOT NULL)"
+            else:
+                embedding_condition = "d.embedding IS NOT NULL"
+
+            count_query = f"""
+                SELECT COUNT(*)
+                FROM family_documents d
+                WHERE {where_clause}
+                  AND {embedding_condition}
             """
-            order_expr = """
-                LEAST(
-                    COALESCE(d.embedding <=> %s::vector, 999),
-                    COALESCE(d.image_embedding <=> %s::vector, 999)
-                )
+            cursor.execute(count_query, params)
+            total = cursor.fetchone()[0]
+
+            # Then get paginated results with similarity
+            # Use GREATEST to get best score from text OR image embedding,
+            # and LEAST distance for the vector leg's ordering
+            if include_images:
+                similarity_expr = """
+                    GREATEST(
+                        COALESCE(1 - (d.embedding <=> %s::vector), 0),
+                        COALESCE(1 - (d.image_embedding <=> %s::vector), 0)
+                    )
+                """
+                order_expr = """
+                    LEAST(
+                        COALESCE(d.embedding <=> %s::vector, 999),
+                        COALESCE(d.image_embedding <=> %s::vector, 999)
+                    )
+                """
+            else:
+                similarity_expr = "1 - (d.embedding <=> %s::vector)"
+                order_expr = "d.embedding <=> %s::vector"
+
+            # Vector and full-text candidates fused with RRF (hybrid_search.py).
+            # Each leg fetches at least offset + limit rows so every page is full.
+            candidates = max(DEFAULT_CANDIDATES, offset + limit)
+            precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "family_documents", precision, "d"
+            )
+            set_search_precision(cursor, precision, candidates)
+            cte_sql, cte_params = hybrid_cte(
+                from_sql="family_documents d",
+                id_expr="d.id",
+                tsv_expr="d.search_tsv",
+                where_sql=where_clause,
+                where_params=params,
+                query_text=search_term.strip(),
+                distance_sql=order_expr,
+                distance_params=[query_embedding] * (2 if include_images else 1),
+                # Bucket indexes cover d.embedding only
+                vector_where=embedding_condition if include_images else f"{embedding_condition} {bucket_filter}",
+                candidates=candidates,
+                precision=precision,
+                vector_columns=["d.embedding", "d.image_embedding"] if include_images else ["d.embedding"],
+                vector_scopes=None if include_images else vector_scopes,
+            )
+
+            search_query = cte_sql + f"""
+                SELECT
+                    d.id,
+                    d.title,
+                    LEFT(d.content, 200) as content_preview,
+                    d.category,
+                    {similarity_expr} as similarity,
+                    d.created_at,
+                    COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d.metadata->'tags') t), ARRAY[]::text[]) as tags,
+                    d.assigned_to,
+                    fm.name as assigned_to_name,
+                    d.visibility,
+                    d.has_image_embedding,
+                    d.image_url,
+                    d.content_type,
+                    d.image_hash
+                FROM fused
+                JOIN family_documents d ON d.id = fused.id
+                LEFT JOIN family_members fm ON d.assigned_to = fm.id
+                ORDER BY fused.rrf_score DESC
+                LIMIT %s OFFSET %s
             """
-        else:
-            similarity_expr = "1 - (d.embedding <=> %s::vector)"
-            order_expr = "d.embedding <=> %s::vector"
-
-        search_query = f"""
-            SELECT
-                d.id,
-                d.title,
-                LEFT(d.content, 200) as content_preview,
-                d.category,
-                {similarity_expr} as similarity,
-                d.created_at,
-                COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d.metadata->'tags') t), ARRAY[]::text[]) as tags,
-                d.assigned_to,
-                fm.name as assigned_to_name,
-                d.visibility,
-                d.has_image_embedding,
-                d.image_url,
-                d.content_type
-            FROM family_documents d
-            LEFT JOIN family_members fm ON d.assigned_to = fm.id
-            WHERE {where_clause}
-              AND {embedding_condition}
-            ORDER BY {order_expr}
-            LIMIT %s OFFSET %s
-        """
-
-        # Build params based on include_images
-        if include_images:
-            # similarity_expr needs 2 embeddings, order_expr needs 2 more
+
+            # similarity_expr needs one embedding per vector column
             cursor.execute(
                 search_query,
-                [query_embedding, query_embedding] + params + [query_embedding, query_embedding, limit, offset]
+                cte_params + [query_embedding] * (2 if include_images else 1) + [limit, offset]
             )
+
         else:
-            cursor.execute(
-                search_query,
-                [query_embedding] + params + [query_embedding, limit, offset]
-            )
+            # No search term - just filter and order by date
+            where_clause = f"{' AND '.join(conditions) or '1=1'} {visibility_filter}"
+
+            # Get total count
+            count_query = f"SELECT COUNT(*) FROM family_documents d WHERE {where_clause}"
+            cursor.execute(count_query, params)
+            total = cursor.fetchone()[0]
+
+            # Get paginated results
+            search_query = f"""
+                SELECT
+                    d.id,
+                    d.title,
+                    LEFT(d.content, 200) as content_preview,
+                    d.category,
+                    0 as similarity,
+                    d.created_at,
+                    COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d.metadata->'tags') t), ARRAY[]::text[]) as tags,
+                    d.assigned_to,
+                    fm.name as assigned_to_name,
+                    d.visibility,
+                    d.has_image_embedding,
+                    d.image_url,
+                    d.content_type,
+                    d.image_hash
+                FROM family_documents d
+                LEFT JOIN family_members fm ON d.assigned_to = fm.id
+                WHERE {where_clause}
+                ORDER BY d.created_at DESC
+                LIMIT %s OFFSET %s
+            """
+            cursor.execute(search_query, params + [limit, offset])
+
+        results = cursor.fetchall()
+        cursor.close()
 
-    else:
-        # No search term - just filter and order by date
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM family_documents d WHERE {where_clause}"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-
-        # Get paginated results
-        search_query = f"""
-            SELECT
-                d.id,
-                d.title,
-                LEFT(d.content, 200) as content_preview,
-                d.category,
-                0 as similarity,
-                d.created_at,
-                COALESCE((SELECT array_agg(t) FROM jsonb_array_elements_text(d.metadata->'tags') t), ARRAY[]::text[]) as tags,
-                d.assigned_to,
-                fm.name as assigned_to_name,
-                d.visibility,
-                d.has_image_embedding,
-                d.image_url,
-                d.content_type
-            FROM family_documents d
-            LEFT JOIN family_members fm ON d.assigned_to = fm.id
-            WHERE {where_clause}
-            ORDER BY d.created_at DESC
-            LIMIT %s OFFSET %s
-        """
-        cursor.execute(search_query, params + [limit, offset])
-
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    # Signed blob URLs; image_url only holds legacy values
+    image_urls = blob_urls([row[13] for row in results], "images")
 
     documents = []
-    for row in results:
+    for row, image_url in zip(results, image_urls):
         documents.append({
             "id": row[0],
             "title": row[1],
@@ -308,7 +312,7 @@ def main(
             "assigned_to_name": row[8],
             "visibility": row[9] or "everyone",
             "has_image_embedding": row[10] or False,
-            "image_url": row[11],
+            "image_url": image_url or row[11],
             "content_type": row[12] or "text"
         })
 
@@ -9,10 +9,10 @@
 #   - wmill
 
 """
-AI Agent Tool: Search family documents using semantic search.
+AI Agent Tool: Search family documents using hybrid semantic + keyword search.
 
 This is designed to be called by a Windmill AI Agent as a tool.
-It handles embedding, vector search, and reranking - returning
+It handles embedding, hybrid vector/full-text search, and reranking - returning
 the most relevant documents for the AI to use as context.
 
 Args:
@@ -21,6 +21,9 @@ Args:
     top_k: Number of results to return (default: 5)
     user_member_type: 'admin', 'adult', 'teen', 'child' for visibility filtering
     user_member_id: family_members.id for private doc access
+    precision: "full", "half", "binary" or "coarse" - quantized or 256-d first-stage vector
+        search rescored at full precision (default: VECTOR_SEARCH_PRECISION);
+        tenants with few documents are scanned exactly
 
 Returns:
     dict: {
@@ -32,7 +35,13 @@ Returns:
 
 import cohere
 import psycopg2
-from pgvector.psycopg2 import register_vector
+from db_pool import get_connection
+from embedding_cache import embed_query
+from embedding_registry import active_model
+from hybrid_search import hybrid_cte, rrf_relevance, DEFAULT_CANDIDATES
+from vector_quantization import resolve_precision, set_search_precision
+from vector_partitions import plan_vector_search
+from document_access import access_filter
 from typing import Optional
 import wmill
 
@@ -43,6 +52,7 @@ def main(
     top_k: int = 5,
     user_member_type: Optional[str] = None,
     user_member_id: Optional[int] = None,
+    precision: Optional[str] = None,
 ) -> dict:
     """
     Search documents using Cohere Embed v4 + pgvector + Rerank v3.5
@@ -55,74 +65,62 @@ def main(
         return {"documents": [], "query": query, "count": 0, "error": "tenant_id required"}
 
     query = query.strip()
+    precision = resolve_precision(precision)
 
     # Fetch resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
     cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
 
     co = cohere.ClientV2(api_key=cohere_api_key)
 
-    # Step 1: Embed query with Cohere Embed v4
+    # Step 1: Embed query with Cohere Embed v4 (cached for repeated queries)
     try:
-        embed_response = co.embed(
-            texts=[query],
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            output_dimension=1024
-        )
-        query_embedding = embed_response.embeddings.float_[0]
+        embed_model, embed_dimension = active_model("text")
+        query_embedding, _, _ = embed_query(co, query, model=embed_model, output_dimension=embed_dimension)
     except Exception as e:
         return {"documents": [], "query": query, "count": 0, "error": f"Embed error: {str(e)}"}
 
     # Step 2: Vector search in PostgreSQL
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Build visibility filter
-        visibility_filter = ""
-        params = [query_embedding, tenant_id]
-
-        if user_member_type:
-            if user_member_type == 'admin':
-                pass  # Admins see everything
-            elif user_member_type == 'adult':
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only') OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') IN ('everyone', 'adults_only')"
-            else:
-                if user_member_id is not None:
-                    visibility_filter = "AND (COALESCE(visibility, 'everyone') = 'everyone' OR (visibility = 'private' AND assigned_to = %s))"
-                    params.append(user_member_id)
-                else:
-                    visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
-        else:
-            visibility_filter = "AND COALESCE(visibility, 'everyone') = 'everyone'"
-
-        # Get more results for reranking
-        cursor.execute(f"""
-            SELECT id, title, content, category, embedding <=> %s::vector AS distance
-            FROM family_documents
-            WHERE tenant_id = %s::uuid AND embedding IS NOT NULL
-            {visibility_filter}
-            ORDER BY distance
-            LIMIT 15
-        """, params)
-
-        search_results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Enable pgvector iterative scans for filtered queries (pgvector 0.8.0+)
+            cursor.execute("SET hnsw.iterative_scan = strict_order;")
+            precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "family_documents", precision, "d"
+            )
+            set_search_precision(cursor, precision, DEFAULT_CANDIDATES)
+
+            # Visibility filter, plus vector scopes for private and shared documents (document_access.py)
+            visibility_filter, visibility_params, vector_scopes = access_filter(
+                cursor, tenant_id, user_member_type, user_member_id, alias="d"
+            )
+
+            # Get more results for reranking: vector + full-text candidates fused with RRF
+            cte_sql, cte_params = hybrid_cte(
+                from_sql="family_documents d",
+                id_expr="d.id",
+                tsv_expr="d.search_tsv",
+                where_sql=f"d.tenant_id = %s::uuid {visibility_filter}",
+                where_params=[tenant_id] + visibility_params,
+                query_text=query,
+                distance_sql="d.embedding <=> %s::vector",
+                distance_params=[query_embedding],
+                vector_where=f"d.embedding IS NOT NULL {bucket_filter}",
+                precision=precision,
+                vector_columns=["d.embedding"],
+                vector_scopes=vector_scopes,
+            )
+            cursor.execute(cte_sql + """
+                SELECT d.id, d.title, d.content, d.category, fused.rrf_score
+                FROM fused
+                JOIN family_documents d ON d.id = fused.id
+                ORDER BY fused.rrf_score DESC
+                LIMIT 15
+            """, cte_params)
+
+            search_results = cursor.fetchall()
+            cursor.close()
 
     except psycopg2.Error as e:
         return {"documents": [], "query": query, "count": 0, "error": f"DB error: {str(e)}"}
@@ -164,17 +162,15 @@ def main(
             })
 
     except Exception as e:
-        # Fallback: use vector search results
+        # Fallback: use fused search order
         documents = []
         for r in search_results[:top_k]:
-            distance = float(r[4])
-            similarity = max(0.0, min(1.0, 1.0 / (1.0 + distance)))
             documents.append({
                 "id": str(r[0]),
                 "title": r[1],
                 "content": r[2][:8000],
                 "category": r[3],
-                "relevance": round(similarity, 3)
+                "relevance": rrf_relevance(r[4])
             })
 
     return {
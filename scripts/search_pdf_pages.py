@@ -7,6 +7,7 @@
 #   - psycopg2-binary
 #   - pgvector
 #   - wmill
+#   - httpx
 
 """
 Search PDF pages by visual similarity using text-to-image embeddings.
@@ -23,6 +24,9 @@ Args:
     document_id (int, optional): Limit search to specific document
     limit (int): Maximum results to return (default: 5)
     min_similarity (float): Minimum similarity threshold (default: 0.25)
+    precision (str, optional): "full", "half", "binary" or "coarse" - quantized or
+        256-d first-stage search rescored at full precision (default: VECTOR_SEARCH_PRECISION);
+        "exact" is used automatically for tenants with few pages
 
 Returns:
     dict: {
@@ -34,7 +38,8 @@ Returns:
                 document_title: str,
                 page_number: int,
                 similarity: float,
-                page_image: str (base64),
+                page_image_url: str (signed blob store URL, valid for BLOB_URL_TTL_SECONDS),
+                page_image: str (legacy base64, until moved to the blob store),
                 ocr_text: str,
                 has_images: bool
             }
@@ -47,7 +52,12 @@ Returns:
 import cohere
 import psycopg2
 import psycopg2.extras
-from pgvector.psycopg2 import register_vector
+from db_pool import get_connection
+from embedding_cache import embed_query
+from embedding_registry import active_model
+from blob_store import blob_urls
+from vector_quantization import nearest_sql, resolve_precision, set_search_precision
+from vector_partitions import plan_vector_search
 import wmill
 
 
@@ -56,116 +66,97 @@ def main(
     tenant_id: str,
     document_id: int = None,
     limit: int = 5,
-    min_similarity: float = 0.25
+    min_similarity: float = 0.25,
+    precision: str = None
 ) -> dict:
     """Search PDF pages by visual similarity."""
 
     if not query or not tenant_id:
         return {"success": False, "error": "query and tenant_id are required"}
+    precision = resolve_precision(precision, "pages")
 
     # Get resources
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
     cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
 
     # Initialize Cohere client
-    co = cohere.Client(cohere_api_key)
+    co = cohere.ClientV2(api_key=cohere_api_key)
 
     try:
         # Create query embedding using text input
-        # Cohere Embed v4 aligns text and image embeddings in the same space
-        response = co.embed(
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            texts=[query]
+        # Cohere Embed v4 aligns text and image embeddings in the same space.
+        # Repeated queries are served from the embedding cache (query_tokens = 0).
+        embed_model, embed_dimension = active_model("pages")
+        query_embedding, query_tokens, _ = embed_query(
+            co, query, model=embed_model, output_dimension=embed_dimension
         )
 
-        query_embedding = response.embeddings.float[0]
-        query_tokens = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else 0
-
-        # Connect to database
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        # Build search query
-        if document_id:
-            # Search within specific document
-            cursor.execute("""
-                SELECT
-                    dp.id as page_id,
-                    dp.document_id,
-                    fd.title as document_title,
-                    dp.page_number,
-                    (1 - (dp.embedding <=> %s::vector)) as similarity,
-                    dp.page_image,
-                    dp.ocr_text,
-                    dp.has_images,
-                    dp.width,
-                    dp.height
-                FROM document_pages dp
-                JOIN family_documents fd ON dp.document_id = fd.id
-                WHERE dp.tenant_id = %s
-                  AND dp.document_id = %s
-                  AND dp.embedding IS NOT NULL
-                  AND (1 - (dp.embedding <=> %s::vector)) >= %s
-                ORDER BY dp.embedding <=> %s::vector
-                LIMIT %s
-            """, (query_embedding, tenant_id, document_id, query_embedding, min_similarity, query_embedding, limit))
-        else:
-            # Search across all tenant documents
-            cursor.execute("""
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+            # Optionally limit the search to one document
+            params = [query_embedding, query_embedding, tenant_id]
+            doc_filter = ""
+            if document_id:
+                doc_filter = "AND dp.document_id = %s"
+                params.append(document_id)
+            params += [query_embedding, min_similarity]
+
+            precision, bucket_filter = plan_vector_search(
+                cursor, tenant_id, "document_pages", precision, "dp"
+            )
+            set_search_precision(cursor, precision, limit)
+            search_sql, search_params = nearest_sql(f"""
                 SELECT
                     dp.id as page_id,
                     dp.document_id,
                     fd.title as document_title,
                     dp.page_number,
                     (1 - (dp.embedding <=> %s::vector)) as similarity,
+                    dp.page_image_hash,
                     dp.page_image,
                     dp.ocr_text,
                     dp.has_images,
                     dp.width,
-                    dp.height
+                    dp.height,
+                    dp.embedding <=> %s::vector AS distance
                 FROM document_pages dp
                 JOIN family_documents fd ON dp.document_id = fd.id
                 WHERE dp.tenant_id = %s
-                  AND dp.embedding IS NOT NULL
+                  {doc_filter}
+                  AND dp.embedding IS NOT NULL {bucket_filter}
                   AND (1 - (dp.embedding <=> %s::vector)) >= %s
-                ORDER BY dp.embedding <=> %s::vector
-                LIMIT %s
-            """, (query_embedding, tenant_id, query_embedding, min_similarity, query_embedding, limit))
-
-        rows = cursor.fetchall()
-
-        results = []
-        for row in rows:
-            results.append({
-                "page_id": row['page_id'],
-                "document_id": row['document_id'],
-                "document_title": row['document_title'],
-                "page_number": row['page_number'],
-                "similarity": round(float(row['similarity']), 4),
-                "page_image": row['page_image'],
-                "ocr_text": row['ocr_text'][:500] if row['ocr_text'] else None,
-                "has_images": row['has_images'],
-                "dimensions": {"width": row['width'], "height": row['height']}
-            })
-
-        cursor.close()
-        conn.close()
+            """, "dp.embedding", query_embedding, limit, precision)
+            cursor.execute(search_sql, params + search_params)
+
+            rows = cursor.fetchall()
+
+            # Short-lived signed URLs, one signing request per result set
+            image_urls = blob_urls([row['page_image_hash'] for row in rows], "pages")
+
+            results = []
+            for row, image_url in zip(rows, image_urls):
+                results.append({
+                    "page_id": row['page_id'],
+                    "document_id": row['document_id'],
+                    "document_title": row['document_title'],
+                    "page_number": row['page_number'],
+                    "similarity": round(float(row['similarity']), 4),
+                    "page_image_url": image_url,
+                    "page_image": row['page_image'],  # Legacy inline thumbnail
+                    "ocr_text": row['ocr_text'][:500] if row['ocr_text'] else None,
+                    "has_images": row['has_images'],
+                    "dimensions": {"width": row['width'], "height": row['height']}
+                })
+
+            cursor.close()
 
         return {
             "success": True,
             "results": results,
             "query_tokens": query_tokens,
-            "result_count": len(results)
+            "result_count": len(results),
+            "precision": precision
         }
 
     except psycopg2.Error as e:
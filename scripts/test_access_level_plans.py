@@ -0,0 +1,115 @@
+# test_access_level_plans.py
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Access Level Plan Test
+EXPLAINs a child's search (access_level = 0) of family_documents and
+document_chunks the way the search scripts build it, for a tenant above
+VECTOR_EXACT_SCAN_MAX_ROWS, and checks that the vector leg uses the
+tenant's bucket index (idx_<table>_embedding_bucket<n>) with the level as
+a filter, not an index spanning every tenant (migration 037).
+
+Windmill Script Configuration:
+- Path: f/chatbot/test_access_level_plans
+- Trigger: Manual test run
+"""
+
+from typing import Optional
+
+from db_pool import get_connection
+from document_access import access_filter
+from hybrid_search import hybrid_cte
+from vector_partitions import EXACT_SCAN_MAX_ROWS, plan_vector_search
+
+# (table, alias, from_sql, id_column) as built by search_documents_tool and
+# document_chunks.search_chunks
+SEARCHES = [
+    ("family_documents", "d", "family_documents d", "id"),
+    ("document_chunks", "dc",
+     "document_chunks dc JOIN family_documents fd ON fd.id = dc.document_id", "document_id"),
+]
+
+
+def index_names(plan: dict) -> list[str]:
+    """Index Name of every node in an EXPLAIN (FORMAT JSON) plan."""
+    names = [plan["Index Name"]] if plan.get("Index Name") else []
+    for child in plan.get("Plans", []):
+        names += index_names(child)
+    return names
+
+
+def main(tenant_id: Optional[str] = None) -> dict:
+    """
+    EXPLAIN one level-0 hybrid search per table.
+
+    Args:
+        tenant_id: Tenant to plan for (default: the tenant with the most
+            embedded documents)
+
+    Returns:
+        dict: {success, checks: {table: {bucket, indexes}}, failures}
+    """
+    checks, failures = {}, []
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        if not tenant_id:
+            cursor.execute("""
+                SELECT tenant_id::text FROM family_documents
+                WHERE embedding IS NOT NULL
+                GROUP BY tenant_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)
+            row = cursor.fetchone()
+            tenant_id = row[0] if row else None
+        if not tenant_id:
+            cursor.close()
+            return {"success": False, "error": "No tenant with embedded documents"}
+
+        cursor.execute("SET hnsw.iterative_scan = strict_order")
+        for table, alias, from_sql, id_column in SEARCHES:
+            precision, bucket_filter = plan_vector_search(cursor, tenant_id, table, "full", alias)
+            if precision == "exact":
+                checks[table] = {"skipped": f"tenant has at most {EXACT_SCAN_MAX_ROWS} vectors (exact scan)"}
+                continue
+
+            # atttypmod of a vector column is its dimension
+            cursor.execute("""
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = %s::regclass AND attname = 'embedding'
+            """, (table,))
+            query_embedding = "[" + ",".join(["0.01"] * int(cursor.fetchone()[0])) + "]"
+
+            # A child without private or shared documents: level filter only
+            visibility, visibility_params, vector_scopes = access_filter(
+                cursor, tenant_id, "child", None, alias=alias, id_column=id_column, shared_ids=[]
+            )
+            cte_sql, cte_params = hybrid_cte(
+                from_sql=from_sql,
+                id_expr=f"{alias}.id",
+                tsv_expr=f"{alias}.search_tsv",
+                where_sql=f"{alias}.tenant_id = %s::uuid {visibility}",
+                where_params=[tenant_id] + visibility_params,
+                query_text="test",
+                distance_sql=f"{alias}.embedding <=> %s::vector",
+                distance_params=[query_embedding],
+                vector_where=f"{alias}.embedding IS NOT NULL {bucket_filter}",
+                precision=precision,
+                vector_scopes=vector_scopes,
+            )
+            cursor.execute(
+                "EXPLAIN (FORMAT JSON) " + cte_sql + " SELECT id FROM fused ORDER BY rrf_score DESC LIMIT 15",
+                cte_params
+            )
+            indexes = index_names(cursor.fetchone()[0][0]["Plan"])
+            bucket = int(bucket_filter.rsplit("=", 1)[1])
+            checks[table] = {"bucket": bucket, "indexes": indexes}
+            if f"idx_{table}_embedding_bucket{bucket}" not in indexes:
+                failures.append(table)
+
+        cursor.close()
+        conn.rollback()
+
+    return {"success": not failures, "tenant_id": tenant_id, "checks": checks, "failures": failures}
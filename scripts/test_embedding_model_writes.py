@@ -0,0 +1,115 @@
+# test_embedding_model_writes.py
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Embedding Model Write Test
+Re-embeds a throwaway document, chunk and page with the same model the way
+the ingest scripts do, and checks that embedding_model is kept (migration
+034 dropped the triggers that reset it to NULL). Also writes an image
+embedding and a voice note and checks their model columns (migration 023).
+Everything runs in one transaction that is rolled back.
+
+Windmill Script Configuration:
+- Path: f/chatbot/test_embedding_model_writes
+- Trigger: Manual test run
+"""
+
+from db_pool import get_connection
+from embedding_registry import active_model
+
+
+def main(tenant_id: str = "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11") -> dict:
+    """
+    Write, re-embed and read back one row per vector table.
+
+    Returns:
+        dict: {success, checks: {column: model column after the re-embed}}
+    """
+    text_model, _ = active_model("text")
+    page_model, _ = active_model("pages")
+    checks = {}
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+
+        def vector_sql(table: str, value: float, column: str = "embedding") -> str:
+            # atttypmod of a vector column is its dimension
+            cursor.execute("""
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = %s::regclass AND attname = %s
+            """, (table, column))
+            return f"array_fill({value}::real, ARRAY[{int(cursor.fetchone()[0])}])::vector"
+
+        cursor.execute(f"""
+            INSERT INTO family_documents (title, content, category, tenant_id, embedding, embedding_model)
+            VALUES ('embedding model test', 'embedding model test', 'general', %s::uuid,
+                    {vector_sql('family_documents', 0.1)}, %s)
+            RETURNING id
+        """, (tenant_id, text_model))
+        document_id = cursor.fetchone()[0]
+
+        # document_chunks.reembed_changed_content
+        cursor.execute(f"""
+            UPDATE family_documents
+            SET embedding = {vector_sql('family_documents', 0.2)}, embedding_model = %s
+            WHERE id = %s
+            RETURNING embedding_model
+        """, (text_model, document_id))
+        checks["family_documents"] = cursor.fetchone()[0]
+
+        # embed_image
+        cursor.execute(f"""
+            UPDATE family_documents
+            SET image_embedding = {vector_sql('family_documents', 0.3, 'image_embedding')},
+                image_embedding_model = %s, has_image_embedding = TRUE
+            WHERE id = %s
+            RETURNING image_embedding_model
+        """, (text_model, document_id))
+        checks["family_documents.image_embedding"] = cursor.fetchone()[0]
+
+        # transcribe_voice_note
+        cursor.execute(f"""
+            INSERT INTO voice_notes (title, transcript, embedding, embedding_model)
+            VALUES ('embedding model test', 'embedding model test', {vector_sql('voice_notes', 0.1)}, %s)
+            RETURNING embedding_model
+        """, (text_model,))
+        checks["voice_notes"] = cursor.fetchone()[0]
+
+        cursor.execute(f"""
+            INSERT INTO document_chunks
+                (document_id, tenant_id, chunk_index, char_start, char_end, content, embedding, embedding_model)
+            VALUES (%s, %s::uuid, 0, 0, 20, 'embedding model test', {vector_sql('document_chunks', 0.1)}, %s)
+            RETURNING id
+        """, (document_id, tenant_id, text_model))
+        chunk_id = cursor.fetchone()[0]
+        cursor.execute(f"""
+            UPDATE document_chunks
+            SET embedding = {vector_sql('document_chunks', 0.2)}, embedding_model = %s
+            WHERE id = %s
+            RETURNING embedding_model
+        """, (text_model, chunk_id))
+        checks["document_chunks"] = cursor.fetchone()[0]
+
+        # process_pdf_pages.write_pages with force=True
+        for value in (0.1, 0.2):
+            cursor.execute(f"""
+                INSERT INTO document_pages (document_id, tenant_id, page_number, embedding, embedding_model)
+                VALUES (%s, %s::uuid, 1, {vector_sql('document_pages', value)}, %s)
+                ON CONFLICT (document_id, page_number)
+                DO UPDATE SET embedding = EXCLUDED.embedding, embedding_model = EXCLUDED.embedding_model
+                RETURNING embedding_model
+            """, (document_id, tenant_id, page_model))
+        checks["document_pages"] = cursor.fetchone()[0]
+
+        cursor.close()
+        conn.rollback()
+
+    expected = {
+        "family_documents": text_model, "family_documents.image_embedding": text_model,
+        "voice_notes": text_model, "document_chunks": text_model, "document_pages": page_model
+    }
+    failures = [table for table, model in checks.items() if model != expected[table]]
+    return {"success": not failures, "checks": checks, "failures": failures}
@@ -42,6 +42,8 @@ import psycopg2
 from pgvector.psycopg2 import register_vector
 from typing import Optional
 import wmill
+from embedding_registry import active_model
+from document_neighbors import update_document_neighbors
 import json
 import re
 import tempfile
@@ -235,13 +237,14 @@ def main(
     tags = extract_tags(transcript, co)
 
     # Generate embedding for the transcript
+    embed_model, embed_dimension = active_model("text")
     try:
         response = co.embed(
             texts=[transcript],
-            model="embed-v4.0",
+            model=embed_model,
             input_type="search_document",
             embedding_types=["float"],
-            output_dimension=1024
+            output_dimension=embed_dimension
         )
         embedding = response.embeddings.float_[0]
         tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(transcript.split())
@@ -274,13 +277,13 @@ def main(
         cursor.execute("""
             INSERT INTO voice_notes (
                 title, transcript, duration_seconds, language,
-                transcription_model, embedding, created_by, metadata
+                transcription_model, embedding, embedding_model, created_by, metadata
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """, (
             final_title, transcript, int(duration), language,
-            "whisper-large-v3-turbo", embedding, created_by, json.dumps(metadata)
+            "whisper-large-v3-turbo", embedding, embed_model, created_by, json.dumps(metadata)
         ))
 
         voice_note_id = cursor.fetchone()[0]
@@ -299,17 +302,18 @@ def main(
 
         cursor.execute("""
             INSERT INTO family_documents (
-                tenant_id, title, content, category, embedding,
+                tenant_id, title, content, category, embedding, embedding_model,
                 created_by, metadata, visibility
             )
-            VALUES (%s::uuid, %s, %s, %s, %s, %s, %s, 'everyone')
+            VALUES (%s::uuid, %s, %s, %s, %s, %s, %s, %s, 'everyone')
             RETURNING id
         """, (
-            tenant_id, final_title, transcript, category, embedding,
+            tenant_id, final_title, transcript, category, embedding, embed_model,
             created_by, json.dumps(doc_metadata)
         ))
 
         document_id = cursor.fetchone()[0]
+        update_document_neighbors(conn, document_id)
 
         # Log API usage
         cursor.execute("""
@@ -12,12 +12,15 @@
 """
 Update a document in the Family Second Brain knowledge base.
 
-If content is changed, the embedding will be regenerated.
+If content is changed, the document is re-chunked and only chunks whose text
+changed are re-embedded; the whole-document vector is refreshed once edits add
+up to DOCUMENT_REEMBED_DRIFT of the text (document_chunks.reembed_changed_content).
+Title, category, assignment and visibility edits embed nothing.
 
 Args:
     document_id (int): ID of the document to update
     title (str, optional): New title
-    content (str, optional): New content (triggers re-embedding)
+    content (str, optional): New content (triggers incremental re-embedding)
     category (str, optional): New category
 
 Returns:
@@ -25,15 +28,21 @@ Returns:
         success: bool,
         message: str,
         document_id: int,
-        re_embedded: bool (true if content was changed)
+        re_embedded: bool (true if anything was embedded),
+        chunks_embedded: int,
+        chunks_reused: int,
+        document_embedded: bool,
+        tokens_used: int
     }
 """
 
 import cohere
 import psycopg2
-from pgvector.psycopg2 import register_vector
 from typing import Optional
 import wmill
+from db_pool import get_connection
+from document_chunks import reembed_changed_content
+from document_fingerprints import compute_content_hash, simhash, store_fingerprint
 
 
 def main(
@@ -67,119 +76,114 @@ def main(
     if visibility and visibility not in valid_visibility:
         return {"success": False, "error": f"Visibility must be one of: {valid_visibility}"}
 
-    # Fetch database resource
-    postgres_db = wmill.get_resource("f/chatbot/postgres_db")
-
     try:
-        conn = psycopg2.connect(
-            host=postgres_db['host'],
-            port=postgres_db['port'],
-            dbname=postgres_db['dbname'],
-            user=postgres_db['user'],
-            password=postgres_db['password'],
-            sslmode=postgres_db.get('sslmode', 'disable')
-        )
-        register_vector(conn)
-        cursor = conn.cursor()
-
-        # Check document exists
-        cursor.execute("""
-            SELECT id, title FROM family_documents WHERE id = %s
-        """, (document_id,))
-
-        row = cursor.fetchone()
-        if not row:
-            cursor.close()
-            conn.close()
-            return {"success": False, "error": "Document not found"}
-
-        old_title = row[1]
-        re_embedded = False
-        tokens_used = 0
-
-        # Build update query dynamically
-        updates = []
-        values = []
-
-        if title:
-            updates.append("title = %s")
-            values.append(title.strip())
-
-        if category:
-            updates.append("category = %s")
-            values.append(category)
-
-        # Handle assigned_to update
-        if clear_assigned_to:
-            updates.append("assigned_to = NULL")
-        elif assigned_to is not None:
-            updates.append("assigned_to = %s")
-            values.append(assigned_to)
-
-        # Handle visibility update
-        if visibility:
-            updates.append("visibility = %s")
-            values.append(visibility)
-
-        if content:
-            # Need to regenerate embedding
-            cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
-            co = cohere.ClientV2(api_key=cohere_api_key)
-
-            try:
-                response = co.embed(
-                    texts=[content],
-                    model="embed-v4.0",
-                    input_type="search_document",
-                    embedding_types=["float"],
-                    output_dimension=1024  # Match document embedding dimensions
-                )
-                embedding = response.embeddings.float_[0]
-                tokens_used = response.meta.billed_units.input_tokens if response.meta and response.meta.billed_units else len(content.split())
-                re_embedded = True
-
-                updates.append("content = %s")
-                values.append(content.strip())
-                updates.append("embedding = %s")
-                values.append(embedding)
+        with get_connection() as conn:
+            cursor = conn.cursor()
 
-            except cohere.errors.CohereAPIError as e:
-                cursor.close()
-                conn.close()
-                return {"success": False, "error": f"Cohere API error: {str(e)}"}
-
-        # Always update updated_at
-        updates.append("updated_at = NOW()")
-
-        # Execute update
-        values.append(document_id)
-        cursor.execute(f"""
-            UPDATE family_documents
-            SET {', '.join(updates)}
-            WHERE id = %s
-            RETURNING title
-        """, values)
-
-        new_title = cursor.fetchone()[0]
-
-        # Log API usage if re-embedded
-        if re_embedded and tokens_used > 0:
-            estimated_cost = tokens_used * 0.0000001
+            # Check document exists
             cursor.execute("""
-                INSERT INTO api_usage_log (operation, tokens_used, cost_usd)
-                VALUES ('embed', %s, %s)
-            """, (tokens_used, estimated_cost))
+                SELECT id, title, content, tenant_id::text FROM family_documents WHERE id = %s
+            """, (document_id,))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            row = cursor.fetchone()
+            if not row:
+                cursor.close()
+                return {"success": False, "error": "Document not found"}
+
+            _, old_title, old_content, tenant_id = row
+            new_title = title.strip() if title else old_title
+            new_content = content.strip() if content else None
+            content_changed = new_content is not None and new_content != (old_content or '')
+            embedding_stats = {
+                "chunks_embedded": 0, "chunks_reused": 0, "document_embedded": False, "tokens_used": 0
+            }
+
+            # Build update query dynamically
+            updates = []
+            values = []
+
+            if title:
+                updates.append("title = %s")
+                values.append(new_title)
+
+            if category:
+                updates.append("category = %s")
+                values.append(category)
+
+            # Handle assigned_to update
+            if clear_assigned_to:
+                updates.append("assigned_to = NULL")
+            elif assigned_to is not None:
+                updates.append("assigned_to = %s")
+                values.append(assigned_to)
+
+            # Handle visibility update
+            if visibility:
+                updates.append("visibility = %s")
+                values.append(visibility)
+
+            if content_changed or (title and new_title != old_title):
+                current_content = new_content if content_changed else (old_content or '')
+                content_hash = compute_content_hash(current_content, new_title or '')
+                updates.append("content_hash = %s")
+                values.append(content_hash)
+            if content_changed:
+                updates.append("content = %s")
+                values.append(new_content)
+
+            # Always update updated_at
+            updates.append("updated_at = NOW()")
+
+            # Execute update
+            values.append(document_id)
+            cursor.execute(f"""
+                UPDATE family_documents
+                SET {', '.join(updates)}
+                WHERE id = %s
+                RETURNING title
+            """, values)
+
+            new_title = cursor.fetchone()[0]
+
+            if content_changed or (title and new_title != old_title):
+                store_fingerprint(conn, document_id, tenant_id, content_hash, simhash(current_content))
+
+            if content_changed:
+                # Embed only the chunks this edit changed
+                cohere_api_key = wmill.get_variable("f/chatbot/cohere_api_key")
+                co = cohere.ClientV2(api_key=cohere_api_key)
+                try:
+                    embedding_stats = reembed_changed_content(
+                        conn, co, document_id, tenant_id, new_title, new_content
+                    )
+                except cohere.errors.CohereAPIError as e:
+                    conn.rollback()
+                    cursor.close()
+                    return {"success": False, "error": f"Cohere API error: {str(e)}"}
+
+            tokens_used = embedding_stats["tokens_used"]
+            re_embedded = embedding_stats["chunks_embedded"] > 0 or embedding_stats["document_embedded"]
+
+            # Log API usage if re-embedded
+            if re_embedded and tokens_used > 0:
+                estimated_cost = tokens_used * 0.0000001
+                cursor.execute("""
+                    INSERT INTO api_usage_log (operation, tokens_used, cost_usd)
+                    VALUES ('embed', %s, %s)
+                """, (tokens_used, estimated_cost))
+
+            conn.commit()
+            cursor.close()
 
         return {
             "success": True,
             "message": f"Document '{new_title}' has been updated",
             "document_id": document_id,
             "re_embedded": re_embedded,
-            "tokens_used": tokens_used if re_embedded else 0
+            "chunks_embedded": embedding_stats["chunks_embedded"],
+            "chunks_reused": embedding_stats["chunks_reused"],
+            "document_embedded": embedding_stats["document_embedded"],
+            "tokens_used": tokens_used
         }
 
     except psycopg2.Error as e:
@@ -0,0 +1,318 @@
+# usage_sink.py
+# Windmill Python library - Buffered API usage writer
+# Path: f/chatbot/usage_sink
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Buffered API Usage Sink for Archevi
+===================================
+
+Queues `api_usage` records in-process and writes them in multi-row
+INSERT batches from a background thread, so cost accounting never sits
+on the answer latency path.
+
+A batch is flushed when:
+- the buffer reaches `flush_size` records
+- `flush_interval` seconds pass since the oldest buffered record
+- the process exits (atexit hook), or `flush()` is called explicitly
+
+Costs are computed at flush time from the `api_pricing` table, which is
+loaded once per process and refreshed every PRICING_TTL_SECONDS.
+
+Usage:
+    from usage_sink import record_usage
+
+    record_usage(
+        tenant_id=tenant_id,
+        provider="cohere",
+        endpoint="embed",
+        model="embed-v4.0",
+        input_tokens=12,
+        latency_ms=180,
+        operation="search_embed"
+    )
+
+Windmill Script Configuration:
+- Path: f/chatbot/usage_sink
+- This is a library module, not a standalone script
+"""
+
+from typing import Optional
+import atexit
+import json
+import os
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection
+
+
+FLUSH_SIZE = int(os.getenv("USAGE_SINK_FLUSH_SIZE", "50"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_SINK_FLUSH_INTERVAL", "2.0"))
+MAX_BUFFER = int(os.getenv("USAGE_SINK_MAX_BUFFER", "5000"))
+PRICING_TTL_SECONDS = 3600
+
+USAGE_COLUMNS = (
+    "tenant_id", "user_id", "provider", "endpoint", "model",
+    "input_tokens", "output_tokens", "cost_cents",
+    "request_id", "latency_ms", "success", "error_message",
+    "operation", "metadata",
+)
+
+_pricing: dict = {}
+_pricing_loaded_at: float = 0.0
+_pricing_lock = threading.Lock()
+
+
+def load_pricing(conn, force: bool = False) -> dict:
+    """
+    Load current rates from api_pricing into a process-wide cache.
+
+    Returns:
+        dict keyed by (provider, model) -> {input, output, per_request}
+        where input/output are cents per million tokens.
+    """
+    global _pricing, _pricing_loaded_at
+
+    with _pricing_lock:
+        if not force and _pricing and time.time() - _pricing_loaded_at < PRICING_TTL_SECONDS:
+            return _pricing
+
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT ON (provider, model)
+                provider, model,
+                input_price_per_million_cents,
+                output_price_per_million_cents,
+                COALESCE(price_per_request_cents, 0)
+            FROM api_pricing
+            WHERE effective_from <= CURRENT_DATE
+              AND (effective_to IS NULL OR effective_to > CURRENT_DATE)
+            ORDER BY provider, model, effective_from DESC
+        """)
+        pricing = {}
+        for provider, model, input_price, output_price, per_request in cursor.fetchall():
+            pricing[(provider, model)] = {
+                'input': input_price or 0,
+                'output': output_price or 0,
+                'per_request': per_request or 0,
+            }
+        cursor.close()
+
+        _pricing = pricing
+        _pricing_loaded_at = time.time()
+        return _pricing
+
+
+def calculate_cost_cents(
+    pricing: dict,
+    provider: str,
+    model: str,
+    input_tokens: int = 0,
+    output_tokens: int = 0
+) -> int:
+    """Calculate cost in cents for one call using a loaded pricing table."""
+    rates = pricing.get((provider, model))
+    if not rates:
+        return 0
+
+    # Per-request pricing (like rerank)
+    if rates['per_request']:
+        return int(rates['per_request'])
+
+    # Same arithmetic the per-call loggers used, so existing api_usage rows
+    # and the cost dashboards stay comparable
+    return int(
+        ((input_tokens or 0) / 1_000_000) * rates['input'] * 100 +
+        ((output_tokens or 0) / 1_000_000) * rates['output'] * 100
+    )
+
+
+class UsageSink:
+    """In-process buffer that batches api_usage rows into multi-row INSERTs."""
+
+    def __init__(
+        self,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_buffer: int = MAX_BUFFER
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer: list = []
+        self._oldest_at: Optional[float] = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="usage-sink-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def record(
+        self,
+        tenant_id: str,
+        provider: str,
+        endpoint: str,
+        model: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        latency_ms: Optional[int] = None,
+        success: bool = True,
+        operation: Optional[str] = None,
+        error_message: Optional[str] = None,
+        user_id: Optional[int] = None,
+        request_id: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> None:
+        """Queue one usage record. Never blocks on the database."""
+        if not tenant_id:
+            return
+
+        row = {
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "provider": provider,
+            "endpoint": endpoint,
+            "model": model,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "request_id": request_id,
+            "latency_ms": latency_ms,
+            "success": success,
+            "error_message": error_message,
+            "operation": operation,
+            "metadata": json.dumps(metadata) if metadata else None,
+        }
+
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._buffer) >= self.max_buffer:
+                # Database unreachable for a long time - shed the oldest record
+                self._buffer.pop(0)
+                self.stats["dropped"] += 1
+            self._buffer.append(row)
+            self.stats["recorded"] += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self._ensure_worker()
+            if len(self._buffer) >= self.flush_size:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        """Background loop: flush on size or when the oldest record is too old."""
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._buffer) >= self.flush_size:
+                        break
+                    if self._oldest_at is not None:
+                        remaining = self.flush_interval - (time.monotonic() - self._oldest_at)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def _drain(self) -> list:
+        with self._cond:
+            batch = self._buffer
+            self._buffer = []
+            self._oldest_at = None
+            return batch
+
+    def flush(self) -> int:
+        """Write all buffered records in one multi-row INSERT. Returns rows written."""
+        with self._flush_lock:
+            batch = self._drain()
+            if not batch:
+                return 0
+
+            try:
+                with get_connection(register_vector=False) as conn:
+                    pricing = load_pricing(conn)
+                    values = []
+                    for row in batch:
+                        row["cost_cents"] = calculate_cost_cents(
+                            pricing, row["provider"], row["model"],
+                            row["input_tokens"], row["output_tokens"]
+                        )
+                        values.append(tuple(row[col] for col in USAGE_COLUMNS))
+
+                    cursor = conn.cursor()
+                    execute_values(
+                        cursor,
+                        f"INSERT INTO api_usage ({', '.join(USAGE_COLUMNS)}) VALUES %s",
+                        values,
+                        template="(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s::uuid, %s, %s, %s, %s, %s::jsonb)",
+                        page_size=500
+                    )
+                    conn.commit()
+                    cursor.close()
+
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return len(batch)
+            except Exception as e:
+                # Fire-and-forget - usage logging must never break the caller
+                self.stats["errors"] += 1
+                print(f"[usage_sink] Failed to write {len(batch)} usage records: {e}")
+                return 0
+
+    def close(self) -> None:
+        """Flush remaining records and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+
+
+_sink: Optional[UsageSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> UsageSink:
+    """Return the process-wide usage sink."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = UsageSink()
+    return _sink
+
+
+def record_usage(**kwargs) -> None:
+    """Queue a usage record on the process-wide sink (see UsageSink.record)."""
+    get_sink().record(**kwargs)
+
+
+def flush_usage() -> int:
+    """Synchronously flush the process-wide sink."""
+    if _sink is None:
+        return 0
+    return _sink.flush()
+
+
+def _close_at_exit() -> None:
+    if _sink is not None:
+        _sink.close()
+
+
+atexit.register(_close_at_exit)
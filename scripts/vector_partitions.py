@@ -0,0 +1,255 @@
+# vector_partitions.py
+# Windmill Python library - Per-tenant vector index buckets and exact-scan fallback
+# Path: f/chatbot/vector_partitions
+#
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Per-Tenant Vector Buckets for Archevi
+=====================================
+
+Migration 031 assigns every tenant a vector bucket (0..NUM_BUCKETS-1 by
+hash of the tenant id) and gives family_documents, document_chunks and
+document_pages one partial HNSW index per bucket:
+
+    idx_<table>_embedding_bucket<n>  WHERE embedding IS NOT NULL AND vector_bucket = <n>
+
+A search that adds "AND <alias>.vector_bucket = <n>" traverses a graph with
+1/16th of the vectors, and recall no longer depends on how many other
+families share the index. The bucket is inlined as a literal so the planner
+can match the partial index.
+
+Tenants with at most EXACT_SCAN_MAX_ROWS vectors in a table skip HNSW and
+are scanned exactly ("exact" precision): reading a few thousand vectors
+through the tenant_id index is cheaper than a graph walk and always
+returns the true nearest neighbours, whatever else the query filters on.
+
+Quantized and coarse searches (migrations 029 and 030) keep using the
+global expression indexes.
+
+A tenant that outgrows its shared bucket can be moved to a dedicated one
+(action="isolate"); its rows follow via trigger. provision_tenant.py calls
+ensure_bucket_indexes() for every new tenant.
+
+Usage:
+    from vector_partitions import plan_vector_search
+
+    precision, bucket_filter = plan_vector_search(cursor, tenant_id, "family_documents", precision, "d")
+    set_search_precision(cursor, precision, limit)
+    # add bucket_filter to the vector WHERE / vector_where; pass precision
+    # to hybrid_cte or nearest_sql ("exact" is handled by both)
+
+Windmill Script Configuration:
+- Path: f/chatbot/vector_partitions
+- main(action="status") reports buckets, action="ensure" builds missing
+  bucket indexes, action="isolate" moves a tenant to a dedicated bucket
+"""
+
+from typing import Optional
+import os
+import time
+
+from db_pool import get_connection
+
+
+NUM_BUCKETS = 16                   # Hashed buckets created by migration 031
+BUCKET_TABLES = ("family_documents", "document_chunks", "document_pages")
+EXACT_SCAN_MAX_ROWS = int(os.getenv("VECTOR_EXACT_SCAN_MAX_ROWS", "2000"))
+PLAN_CACHE_TTL = 300               # Seconds a tenant's bucket and row count are reused
+
+_plan_cache: dict = {}
+
+
+def bucket_index_name(table: str, bucket: int, column: str = "embedding") -> str:
+    return f"idx_{table}_{column}_bucket{int(bucket)}"
+
+
+def bucket_index_sql(
+    table: str,
+    bucket: int,
+    column: str = "embedding",
+    index_name: Optional[str] = None,
+    concurrently: bool = False
+) -> str:
+    """CREATE INDEX statement for one bucket's HNSW index (as in migration 031)."""
+    index_name = index_name or bucket_index_name(table, bucket, column)
+    return f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name} ON {table}
+        USING hnsw ({column} vector_cosine_ops)
+        WHERE {column} IS NOT NULL AND vector_bucket = {int(bucket)}
+    """
+
+
+def live_buckets(cursor, table: str, column: str = "embedding") -> list[int]:
+    """Buckets that have an HNSW index on table.column."""
+    prefix = f"idx_{table}_{column}_bucket"
+    cursor.execute(
+        "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+        (table, f"{prefix}%")
+    )
+    return sorted(
+        int(name[len(prefix):]) for (name,) in cursor.fetchall()
+        if name[len(prefix):].isdigit()
+    )
+
+
+def ensure_bucket_indexes(cursor, bucket: int, concurrently: bool = False) -> list[str]:
+    """
+    Create any missing per-bucket indexes for `bucket`. Existing indexes are
+    checked first so the common case takes no lock on the tables.
+
+    Returns:
+        Names of the indexes created
+    """
+    created = []
+    for table in BUCKET_TABLES:
+        if int(bucket) in live_buckets(cursor, table):
+            continue
+        cursor.execute(bucket_index_sql(table, bucket, concurrently=concurrently))
+        created.append(bucket_index_name(table, bucket))
+    return created
+
+
+def tenant_vector_stats(cursor, tenant_id: str, table: str) -> tuple[Optional[int], int]:
+    """
+    The tenant's bucket and how many rows of `table` have an embedding,
+    counted up to EXACT_SCAN_MAX_ROWS + 1. Cached for PLAN_CACHE_TTL.
+    """
+    key = (str(tenant_id), table)
+    cached = _plan_cache.get(key)
+    if cached and cached[0] > time.time():
+        return cached[1], cached[2]
+
+    cursor.execute(f"""
+        SELECT t.vector_bucket,
+               (SELECT COUNT(*) FROM (
+                    SELECT 1 FROM {table} x
+                    WHERE x.tenant_id = t.id AND x.embedding IS NOT NULL
+                    LIMIT %s
+               ) n)
+        FROM tenants t
+        WHERE t.id = %s::uuid
+    """, (EXACT_SCAN_MAX_ROWS + 1, str(tenant_id)))
+    row = cursor.fetchone()
+    bucket, rows = (row[0], int(row[1])) if row else (None, 0)
+    _plan_cache[key] = (time.time() + PLAN_CACHE_TTL, bucket, rows)
+    return bucket, rows
+
+
+def plan_vector_search(
+    cursor,
+    tenant_id: Optional[str],
+    table: str,
+    precision: str,
+    alias: str
+) -> tuple[str, str]:
+    """
+    Choose how a tenant-scoped vector search on `table` runs.
+
+    Returns:
+        (precision, bucket_filter):
+        - ("exact", "") for tenants with at most EXACT_SCAN_MAX_ROWS vectors
+        - ("full", "AND <alias>.vector_bucket = <n>") to use the bucket index
+        - (precision, "") unchanged for quantized/coarse precisions
+    """
+    if not tenant_id or precision == "exact":
+        return precision, ""
+    bucket, rows = tenant_vector_stats(cursor, tenant_id, table)
+    if rows <= EXACT_SCAN_MAX_ROWS:
+        return "exact", ""
+    if precision == "full" and bucket is not None:
+        return precision, f"AND {alias}.vector_bucket = {int(bucket)}"
+    return precision, ""
+
+
+def clear_cache() -> None:
+    _plan_cache.clear()
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(action: str = "status", tenant_id: Optional[str] = None) -> dict:
+    """
+    Manage vector buckets.
+
+    Args:
+        action: "status" (tenants, vectors and index size per bucket),
+            "ensure" (build missing indexes for every assigned bucket),
+            "isolate" (move tenant_id to a new dedicated bucket)
+        tenant_id: Tenant to isolate
+
+    Returns:
+        dict with the action's results
+    """
+    if action == "status":
+        with get_connection(register_vector=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT t.vector_bucket, COUNT(*),
+                       COALESCE(SUM((SELECT COUNT(*) FROM family_documents d
+                                     WHERE d.tenant_id = t.id AND d.embedding IS NOT NULL)), 0)
+                FROM tenants t
+                GROUP BY t.vector_bucket
+                ORDER BY t.vector_bucket
+            """)
+            buckets = {
+                bucket: {"tenants": tenants, "documents": int(documents), "index_bytes": 0}
+                for bucket, tenants, documents in cursor.fetchall()
+            }
+            cursor.execute("""
+                SELECT c.relname, pg_relation_size(c.oid)
+                FROM pg_class c
+                WHERE c.relkind = 'i' AND c.relname LIKE 'idx_%_embedding_bucket%'
+            """)
+            for name, size in cursor.fetchall():
+                bucket = name.rsplit("_bucket", 1)[1]
+                if bucket.isdigit():
+                    buckets.setdefault(int(bucket), {"tenants": 0, "documents": 0, "index_bytes": 0})
+                    buckets[int(bucket)]["index_bytes"] += size
+            cursor.close()
+        return {
+            "success": True,
+            "exact_scan_max_rows": EXACT_SCAN_MAX_ROWS,
+            "buckets": [{"bucket": b, **v} for b, v in sorted(buckets.items(), key=lambda i: (i[0] is None, i[0]))]
+        }
+
+    if action == "ensure":
+        created = []
+        with get_connection(register_vector=False, autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT vector_bucket FROM tenants WHERE vector_bucket IS NOT NULL")
+            for (bucket,) in cursor.fetchall():
+                created += ensure_bucket_indexes(cursor, bucket, concurrently=True)
+            cursor.close()
+        return {"success": True, "created": created}
+
+    if action == "isolate":
+        if not tenant_id:
+            raise ValueError("tenant_id is required for isolate")
+        with get_connection(register_vector=False, autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT vector_bucket FROM tenants WHERE id = %s::uuid", (tenant_id,))
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError(f"Tenant {tenant_id} not found")
+            if row[0] is not None and row[0] >= NUM_BUCKETS:
+                cursor.close()
+                return {"success": True, "tenant_id": tenant_id, "bucket": row[0], "message": "Already isolated"}
+
+            cursor.execute("SELECT GREATEST(MAX(vector_bucket) + 1, %s) FROM tenants", (NUM_BUCKETS,))
+            bucket = cursor.fetchone()[0]
+            # Build the (empty) indexes first so the moved rows land in them
+            created = ensure_bucket_indexes(cursor, bucket, concurrently=True)
+            cursor.execute(
+                "UPDATE tenants SET vector_bucket = %s WHERE id = %s::uuid", (bucket, tenant_id)
+            )
+            cursor.close()
+        clear_cache()
+        return {"success": True, "tenant_id": tenant_id, "bucket": bucket, "created": created}
+
+    raise ValueError(f"Unknown action: {action}")
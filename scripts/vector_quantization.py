@@ -0,0 +1,233 @@
+# vector_quantization.py
+# Windmill Python library - Quantized and coarse first-stage vector search with full-precision rescoring
+# Path: f/chatbot/vector_quantization
+#
+# requirements:
+#   - psycopg2-binary
+#   - pgvector
+#   - wmill
+
+"""
+Quantized Vector Search for Archevi
+===================================
+
+Every vector column is a float32 vector(1024) with a float HNSW index, so
+the hot index grows at 4 KB per document, chunk and page. Migration 029
+adds HNSW expression indexes over quantized casts of the same columns:
+
+- "half"   - embedding::halfvec(1024), cosine (2x smaller, near-identical ranking)
+- "binary" - binary_quantize(embedding)::bit(1024), Hamming (32x smaller)
+
+Migration 030 adds a coarse-to-fine tier. embed-v4.0 is Matryoshka-trained,
+so the first COARSE_DIMENSION (256) dimensions of a 1024-d embedding are
+themselves a usable embedding:
+
+- "coarse" - subvector(embedding, 1, 256)::vector(256), cosine (4x smaller)
+
+Only valid while the target's active model is Matryoshka-trained (see
+MATRYOSHKA_MODELS); for any other model resolve_precision turns "coarse"
+into "full".
+
+No extra columns are stored: writers are unchanged and the quantized
+indexes always match the float vectors. A first-stage search shortlists
+RESCORE_FACTORS[precision] x the requested rows from the first-stage index,
+then rescores the shortlist with the full float vectors, so returned
+distances and order are exact within the shortlist.
+
+Precision is chosen per query (`precision=` on the search scripts); the
+default is VECTOR_SEARCH_PRECISION ("full" unless set). "exact" skips the
+HNSW indexes and ranks every row that passes the WHERE clause; searches
+switch to it for tenants with few vectors (see vector_partitions.py).
+
+Usage:
+    from vector_quantization import nearest_sql, resolve_precision, set_search_precision
+
+    precision = resolve_precision(precision, "pages")
+    set_search_precision(cursor, precision, limit)
+    sql, params = nearest_sql(
+        "SELECT dp.id, dp.embedding <=> %s::vector AS distance FROM document_pages dp WHERE ...",
+        "dp.embedding", query_embedding, limit, precision
+    )
+    cursor.execute(sql, [query_embedding, ...where params] + params)
+
+    # Hybrid searches pass precision and vector_columns to hybrid_search.hybrid_cte
+
+Windmill Script Configuration:
+- Path: f/chatbot/vector_quantization
+- This is a library module; main() reports vector index sizes per precision
+"""
+
+from typing import Optional
+import os
+
+from db_pool import get_connection
+from embedding_registry import active_model
+
+
+PRECISIONS = ("full", "half", "binary", "coarse", "exact")
+DEFAULT_PRECISION = os.getenv("VECTOR_SEARCH_PRECISION", "full")
+
+# Shortlist size per requested row before rescoring
+RESCORE_FACTORS = {"half": 2, "binary": 8, "coarse": 4}
+MAX_EF_SEARCH = 1000               # pgvector's hnsw.ef_search limit
+
+# Leading dimensions indexed for "coarse" (migration 030)
+COARSE_DIMENSION = 256
+MATRYOSHKA_MODELS = {"embed-v4.0"}
+
+# Index name suffix and operator class per first-stage precision
+QUANTIZED_INDEXES = {
+    "half": ("half", "halfvec_cosine_ops"),
+    "binary": ("bit", "bit_hamming_ops"),
+    "coarse": ("coarse", "vector_cosine_ops"),
+}
+
+
+def resolve_precision(precision: Optional[str] = None, target: str = "text") -> str:
+    """
+    Validate a precision, falling back to VECTOR_SEARCH_PRECISION. "coarse"
+    becomes "full" unless the target's active model is Matryoshka-trained.
+    """
+    precision = (precision or DEFAULT_PRECISION).lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of: {PRECISIONS}")
+    if precision == "coarse" and active_model(target)[0] not in MATRYOSHKA_MODELS:
+        return "full"
+    return precision
+
+
+def quantized_expression(column: str, precision: str, dimension: int) -> str:
+    """First-stage form of a vector column, exactly as indexed in migrations 029 and 030."""
+    if precision == "half":
+        return f"{column}::halfvec({int(dimension)})"
+    if precision == "coarse":
+        return f"subvector({column}, 1, {COARSE_DIMENSION})::vector({COARSE_DIMENSION})"
+    return f"binary_quantize({column})::bit({int(dimension)})"
+
+
+def first_stage_distance(column: str, precision: str, dimension: int) -> str:
+    """First-stage distance to the query (one %s placeholder for the query embedding)."""
+    expression = quantized_expression(column, precision, dimension)
+    if precision == "half":
+        return f"{expression} <=> %s::vector::halfvec({int(dimension)})"
+    if precision == "coarse":
+        return f"{expression} <=> subvector(%s::vector, 1, {COARSE_DIMENSION})::vector({COARSE_DIMENSION})"
+    return f"{expression} <~> binary_quantize(%s::vector)::bit({int(dimension)})"
+
+
+def shortlist_size(limit: int, precision: str) -> int:
+    """Rows taken from the quantized index for `limit` rescored results."""
+    if precision in ("full", "exact"):
+        return limit
+    return max(limit, min(MAX_EF_SEARCH, limit * RESCORE_FACTORS[precision]))
+
+
+def set_search_precision(cursor, precision: str, limit: int) -> None:
+    """
+    Let the quantized index return a whole shortlist (hnsw.ef_search bounds
+    the rows one HNSW scan yields). Transaction-local; no-op for "full"
+    and "exact".
+    """
+    if precision in ("full", "exact"):
+        return
+    cursor.execute(
+        "SELECT set_config('hnsw.ef_search', %s, true)",
+        (str(min(MAX_EF_SEARCH, max(40, shortlist_size(limit, precision)))),)
+    )
+
+
+def nearest_sql(
+    inner_sql: str,
+    vector_column: str,
+    query_embedding,
+    limit: int,
+    precision: str = "full"
+) -> tuple[str, list]:
+    """
+    Nearest-neighbour query around `inner_sql`, a SELECT ... FROM ... WHERE
+    that returns the full-precision distance as `distance` (no ORDER BY or
+    LIMIT). The WHERE must include `<vector_column> IS NOT NULL` so the
+    partial HNSW indexes apply.
+
+    Returns:
+        (sql, params) - params follow inner_sql's own parameters
+    """
+    if precision == "full":
+        return f"{inner_sql} ORDER BY distance LIMIT %s", [limit]
+    if precision == "exact":
+        # OFFSET 0 keeps the ORDER BY out of the subquery, so no index scan
+        return f"SELECT * FROM ({inner_sql} OFFSET 0) exact_scan ORDER BY distance LIMIT %s", [limit]
+    first_stage = first_stage_distance(vector_column, precision, len(query_embedding))
+    return f"""
+        SELECT * FROM (
+            {inner_sql}
+            ORDER BY {first_stage}
+            LIMIT %s
+        ) shortlist
+        ORDER BY distance
+        LIMIT %s
+    """, [query_embedding, shortlist_size(limit, precision), limit]
+
+
+def quantized_index_sql(
+    table: str,
+    column: str,
+    precision: str,
+    dimension: int,
+    index_name: Optional[str] = None,
+    concurrently: bool = False
+) -> str:
+    """CREATE INDEX statement for a first-stage HNSW index (used for re-embedding shadow columns)."""
+    suffix, opclass = QUANTIZED_INDEXES[precision]
+    index_name = index_name or f"idx_{table}_{column}_{suffix}"
+    return f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name} ON {table}
+        USING hnsw (({quantized_expression(column, precision, dimension)}) {opclass})
+        WHERE {column} IS NOT NULL
+    """
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main() -> dict:
+    """
+    Report the size of every HNSW index by precision.
+
+    Returns:
+        dict: {indexes: [{table, index, precision, size_bytes, valid}], totals: {precision: bytes}}
+    """
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT t.relname, c.relname, pg_relation_size(c.oid), i.indisvalid,
+                   pg_get_indexdef(c.oid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE am.amname = 'hnsw'
+            ORDER BY t.relname, c.relname
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    indexes = []
+    totals = {precision: 0 for precision in PRECISIONS}
+    for table, index, size, valid, definition in rows:
+        if "subvector(" in definition:
+            precision = "coarse"
+        elif "bit_hamming_ops" in definition:
+            precision = "binary"
+        elif "halfvec_cosine_ops" in definition:
+            precision = "half"
+        else:
+            precision = "full"
+        totals[precision] += size
+        indexes.append({
+            "table": table, "index": index, "precision": precision,
+            "size_bytes": size, "valid": valid
+        })
+
+    return {"success": True, "default_precision": DEFAULT_PRECISION, "indexes": indexes, "totals": totals}
@@ -0,0 +1,293 @@
+# version_store.py
+# Windmill Python library - Delta-encoded document versions
+# Path: f/chatbot/version_store
+#
+# requirements:
+#   - psycopg2-binary
+#   - wmill
+
+"""
+Delta-Encoded Document Versions for Archevi
+===========================================
+
+document_versions used to hold a full copy of the content for every
+version, so a long policy edited ten times was stored eleven times. A
+version is now stored as a zlib-compressed line delta against the previous
+version (content_delta + base_version, migration 028), with a full snapshot
+in content:
+
+- for a document's first version
+- every VERSION_SNAPSHOT_INTERVAL versions, so reading any version replays
+  at most that many deltas
+- when the delta would not be clearly smaller than the text
+
+Delta format (JSON list, then zlib): a positive int copies that many lines
+from the base, a negative int skips that many base lines, a string is
+inserted as-is.
+
+Usage:
+    from version_store import store_version, version_content
+
+    store_version(conn, document_id, version_number, title, content, content_hash, ...)
+    content = version_content(conn, document_id, version_number)
+
+Windmill Script Configuration:
+- Path: f/chatbot/version_store
+- This is a library module; main(action="compact") delta-encodes full copies written before migration 028
+"""
+
+from difflib import SequenceMatcher
+from typing import Optional
+import json
+import os
+import time
+import zlib
+
+from db_pool import get_connection
+
+
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", "10"))
+MAX_DELTA_RATIO = 0.5  # Store a snapshot when the delta is at least half the text's size
+
+
+def make_delta(base: str, content: str) -> bytes:
+    """Compressed line delta that turns base into content."""
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, lines).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Rebuild content from its base and a make_delta() delta."""
+    base_lines = base.splitlines(keepends=True)
+    position = 0
+    parts = []
+    for op in json.loads(zlib.decompress(bytes(delta)).decode("utf-8")):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.extend(base_lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(parts)
+
+
+def _replay(rows: list) -> dict:
+    """{version_number: (content, deltas since snapshot)} for rows in version order."""
+    contents = {}
+    for version_number, content, delta, base_version in rows:
+        if content is not None:
+            contents[version_number] = (content, 0)
+        elif base_version in contents:
+            base, depth = contents[base_version]
+            contents[version_number] = (apply_delta(base, delta), depth + 1)
+    return contents
+
+
+def _chain(conn, document_id, version_number: int) -> tuple[Optional[str], int]:
+    """Content of a version and how many deltas it took to rebuild it."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT version_number, content, content_delta, base_version
+        FROM document_versions
+        WHERE document_id = %s AND version_number <= %s
+          AND version_number >= (
+              SELECT COALESCE(MAX(version_number), 0) FROM document_versions
+              WHERE document_id = %s AND version_number <= %s AND content IS NOT NULL
+          )
+        ORDER BY version_number
+    """, (document_id, version_number, document_id, version_number))
+    rows = cursor.fetchall()
+    cursor.close()
+    return _replay(rows).get(version_number, (None, 0))
+
+
+def version_content(conn, document_id, version_number: int) -> Optional[str]:
+    """Full content of one version (None if it doesn't exist)."""
+    return _chain(conn, document_id, version_number)[0]
+
+
+def version_contents(conn, document_id) -> dict:
+    """Full content of every version of a document: {version_number: content}."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT version_number, content, content_delta, base_version
+        FROM document_versions
+        WHERE document_id = %s
+        ORDER BY version_number
+    """, (document_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    return {v: content for v, (content, _) in _replay(rows).items()}
+
+
+def encode_version(content: str, base: Optional[str], base_depth: int) -> tuple[Optional[str], Optional[bytes]]:
+    """(content, None) for a snapshot or (None, delta) against base."""
+    if base is None or base_depth + 1 >= VERSION_SNAPSHOT_INTERVAL:
+        return content, None
+    delta = make_delta(base, content)
+    if len(delta) >= MAX_DELTA_RATIO * len(content.encode("utf-8")):
+        return content, None
+    return None, delta
+
+
+def store_version(
+    conn,
+    document_id,
+    version_number: int,
+    title: str,
+    content: str,
+    content_hash: str,
+    file_size_bytes: Optional[int] = None,
+    storage_path: Optional[str] = None,
+    change_summary: Optional[str] = None,
+    change_type: str = 'update',
+    created_by=None
+) -> bool:
+    """
+    Insert a version row inside the caller's transaction (no commit),
+    delta-encoded against the previous version where that pays off.
+
+    Returns:
+        True if the row was stored as a delta
+    """
+    base, depth = (None, 0)
+    if version_number > 1:
+        base, depth = _chain(conn, document_id, version_number - 1)
+    stored_content, delta = encode_version(content, base, depth)
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO document_versions (
+            document_id, version_number, title, content, content_delta, base_version,
+            content_length, content_hash, file_size_bytes, storage_path,
+            change_summary, change_type, created_by
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        document_id, version_number, title, stored_content,
+        delta, version_number - 1 if delta is not None else None,
+        len(content), content_hash, file_size_bytes, storage_path,
+        change_summary, change_type, created_by
+    ))
+    cursor.close()
+    return delta is not None
+
+
+def compact_versions(
+    after_document_id: Optional[str] = None,
+    batch_size: int = 50,
+    max_seconds: int = 240
+) -> dict:
+    """
+    Delta-encode version rows written as full copies, one document at a
+    time (one commit per document) in document_id order. Snapshots are kept
+    where encode_version would keep them, matching store_version's layout.
+
+    Returns:
+        dict with counts and next_after_document_id (None when done)
+    """
+    deadline = time.time() + max_seconds
+    documents = rows_encoded = bytes_before = bytes_after = 0
+    last_document_id = after_document_id
+
+    with get_connection(register_vector=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT document_id FROM document_versions
+            WHERE content IS NOT NULL AND (%s::text IS NULL OR document_id::text > %s)
+            GROUP BY document_id
+            HAVING COUNT(*) > 1
+            ORDER BY document_id::text
+            LIMIT %s
+        """, (after_document_id, after_document_id, batch_size))
+        document_ids = [row[0] for row in cursor.fetchall()]
+
+        for document_id in document_ids:
+            if time.time() >= deadline:
+                break
+            cursor.execute("""
+                SELECT version_number, content, content_delta, base_version
+                FROM document_versions
+                WHERE document_id = %s
+                ORDER BY version_number
+            """, (document_id,))
+            rows = cursor.fetchall()
+            contents = _replay(rows)
+
+            previous, depth = None, 0
+            for version_number, stored, _, _ in rows:
+                content = contents.get(version_number, (None, 0))[0]
+                if content is None:
+                    previous, depth = None, 0
+                    continue
+                if stored is None:
+                    # Already a delta against the previous version
+                    previous, depth = content, depth + 1
+                    continue
+
+                _, delta = encode_version(content, previous, depth)
+                if delta is None:
+                    depth = 0
+                else:
+                    cursor.execute("""
+                        UPDATE document_versions
+                        SET content = NULL, content_delta = %s, base_version = %s,
+                            content_length = %s
+                        WHERE document_id = %s AND version_number = %s
+                    """, (delta, version_number - 1, len(content), document_id, version_number))
+                    rows_encoded += 1
+                    bytes_before += len(stored.encode("utf-8"))
+                    bytes_after += len(delta)
+                    depth += 1
+                previous = content
+            conn.commit()
+            documents += 1
+            last_document_id = str(document_id)
+        cursor.close()
+
+    done = documents == len(document_ids) and len(document_ids) < batch_size
+    return {
+        "documents": documents,
+        "rows_encoded": rows_encoded,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "next_after_document_id": None if done else last_document_id
+    }
+
+
+# =========================================================================
+# Standalone function for Windmill direct calls
+# =========================================================================
+
+def main(
+    action: str = "compact",
+    after_document_id: Optional[str] = None,
+    batch_size: int = 50,
+    max_seconds: int = 240
+) -> dict:
+    """
+    Maintain delta-encoded versions.
+
+    Args:
+        action: "compact" (delta-encode full copies; call again with the
+            returned next_after_document_id until it is None)
+        after_document_id: Resume point from the previous compact run
+        batch_size: Documents per run
+        max_seconds: Time budget
+
+    Returns:
+        dict with counts
+    """
+    if action == "compact":
+        return {"success": True, **compact_versions(after_document_id, batch_size, max_seconds)}
+    raise ValueError("action must be 'compact'")